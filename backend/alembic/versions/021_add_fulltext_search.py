@@ -0,0 +1,53 @@
+"""add tsvector search columns and GIN indexes for posts, requests, market items
+
+Revision ID: 021_add_fulltext_search
+Revises: 020_show_tg_id_default_true
+Create Date: 2026-05-04
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = "021_add_fulltext_search"
+down_revision: Union[str, Sequence[str], None] = "020_show_tg_id_default_true"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Выражения должны совпадать с *_SEARCH_VECTOR_SQL в app/models.py
+POST_VECTOR = (
+    "setweight(to_tsvector('russian', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(tags::text, '')), 'B') || "
+    "setweight(to_tsvector('russian', coalesce(body, '')), 'C')"
+)
+MARKET_ITEM_VECTOR = (
+    "setweight(to_tsvector('russian', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(description, '')), 'C')"
+)
+
+TABLES = (
+    ("posts", POST_VECTOR, "ix_posts_search_vector"),
+    ("requests", POST_VECTOR, "ix_requests_search_vector"),
+    ("market_items", MARKET_ITEM_VECTOR, "ix_market_items_search_vector"),
+)
+
+
+def upgrade() -> None:
+    for table, expression, index_name in TABLES:
+        # STORED-колонка заполняется для существующих строк прямо в ALTER TABLE
+        op.execute(
+            f"""
+            ALTER TABLE {table}
+            ADD COLUMN IF NOT EXISTS search_vector tsvector
+            GENERATED ALWAYS AS ({expression}) STORED;
+            """
+        )
+        op.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} USING gin (search_vector);")
+
+
+def downgrade() -> None:
+    for table, _, index_name in TABLES:
+        op.execute(f"DROP INDEX IF EXISTS {index_name};")
+        op.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector;")
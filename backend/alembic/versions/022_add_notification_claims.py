@@ -0,0 +1,27 @@
+"""add claimed_at lease column to notifications
+
+Revision ID: 022_add_notification_claims
+Revises: 021_add_fulltext_search
+Create Date: 2026-05-08
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "022_add_notification_claims"
+down_revision: Union[str, Sequence[str], None] = "021_add_fulltext_search"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("notifications", sa.Column("claimed_at", sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    # Выданные, но не подтверждённые ботом — вернуть в очередь
+    op.execute("UPDATE notifications SET status = 'pending' WHERE status = 'sending'")
+    op.drop_column("notifications", "claimed_at")
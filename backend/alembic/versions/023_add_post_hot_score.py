@@ -0,0 +1,54 @@
+"""add generated hot_score column and feed ordering indexes for posts
+
+Revision ID: 023_add_post_hot_score
+Revises: 022_add_notification_claims
+Create Date: 2026-05-10
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = "023_add_post_hot_score"
+down_revision: Union[str, Sequence[str], None] = "022_add_notification_claims"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Должно совпадать с POST_HOT_SCORE_SQL в app/models.py
+HOT_SCORE = (
+    "ln(1 + greatest(coalesce(likes_count, 0), 0)::double precision) + "
+    "coalesce(extract(epoch from created_at)::double precision, 0) / 62324.43"
+)
+
+
+def upgrade() -> None:
+    # STORED-колонка заполняется для существующих строк прямо в ALTER TABLE
+    op.execute(
+        f"""
+        ALTER TABLE posts
+        ADD COLUMN IF NOT EXISTS hot_score double precision
+        GENERATED ALWAYS AS ({HOT_SCORE}) STORED;
+        """
+    )
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS ix_posts_feed_popular ON posts
+        (is_resolved, coalesce(is_important, false) DESC, hot_score DESC, created_at DESC, id DESC)
+        WHERE is_deleted = false;
+        """
+    )
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS ix_posts_feed_discussed ON posts
+        (is_resolved, coalesce(is_important, false) DESC, coalesce(comments_count, 0) DESC, created_at DESC, id DESC)
+        WHERE is_deleted = false;
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_posts_feed_discussed;")
+    op.execute("DROP INDEX IF EXISTS ix_posts_feed_popular;")
+    op.execute("ALTER TABLE posts DROP COLUMN IF EXISTS hot_score;")
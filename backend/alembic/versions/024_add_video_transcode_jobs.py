@@ -0,0 +1,49 @@
+"""add video_transcode_jobs queue table
+
+Revision ID: 024_add_video_transcode_jobs
+Revises: 023_add_post_hot_score
+Create Date: 2026-05-12
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision: str = "024_add_video_transcode_jobs"
+down_revision: Union[str, Sequence[str], None] = "023_add_post_hot_score"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "video_transcode_jobs",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("owner_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("source_path", sa.String(500), nullable=False),
+        sa.Column("target_type", sa.String(30), nullable=True),
+        sa.Column("target_id", sa.Integer(), nullable=True),
+        sa.Column("status", sa.String(20), nullable=False, server_default="pending"),
+        sa.Column("progress", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("error", sa.String(500), nullable=True),
+        sa.Column("result", postgresql.JSONB(), nullable=True),
+        sa.Column("claimed_at", sa.DateTime(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_video_transcode_jobs_id", "video_transcode_jobs", ["id"])
+    op.create_index("ix_video_transcode_jobs_owner_id", "video_transcode_jobs", ["owner_id"])
+    op.create_index("ix_video_jobs_status_created", "video_transcode_jobs", ["status", "created_at"])
+    op.create_index("ix_video_jobs_target", "video_transcode_jobs", ["target_type", "target_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_video_jobs_target", table_name="video_transcode_jobs")
+    op.drop_index("ix_video_jobs_status_created", table_name="video_transcode_jobs")
+    op.drop_index("ix_video_transcode_jobs_owner_id", table_name="video_transcode_jobs")
+    op.drop_index("ix_video_transcode_jobs_id", table_name="video_transcode_jobs")
+    op.drop_table("video_transcode_jobs")
@@ -0,0 +1,80 @@
+"""add comment thread roots, keyset indexes and anonymous index counter
+
+Revision ID: 025_add_comment_threads
+Revises: 024_add_video_transcode_jobs
+Create Date: 2026-05-14
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "025_add_comment_threads"
+down_revision: Union[str, Sequence[str], None] = "024_add_video_transcode_jobs"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "comments",
+        sa.Column("thread_root_id", sa.Integer(), sa.ForeignKey("comments.id", ondelete="CASCADE"), nullable=True),
+    )
+    op.execute(
+        """
+        WITH RECURSIVE tree AS (
+            SELECT id, id AS root_id FROM comments WHERE parent_id IS NULL
+            UNION ALL
+            SELECT c.id, tree.root_id FROM comments c JOIN tree ON c.parent_id = tree.id
+        )
+        UPDATE comments SET thread_root_id = tree.root_id
+        FROM tree
+        WHERE comments.id = tree.id AND comments.parent_id IS NOT NULL;
+        """
+    )
+    op.create_index(
+        "ix_comments_post_roots", "comments", ["post_id", "created_at", "id"],
+        postgresql_where=sa.text("parent_id IS NULL"),
+    )
+    op.create_index("ix_comments_thread", "comments", ["thread_root_id", "created_at", "id"])
+
+    op.add_column(
+        "posts",
+        sa.Column("anonymous_comment_seq", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.create_table(
+        "comment_anonymous_indexes",
+        sa.Column("post_id", sa.Integer(), sa.ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("anonymous_index", sa.Integer(), nullable=False),
+    )
+    op.execute(
+        """
+        INSERT INTO comment_anonymous_indexes (post_id, user_id, anonymous_index)
+        SELECT post_id, author_id, min(anonymous_index)
+        FROM comments
+        WHERE is_anonymous = true AND anonymous_index > 0
+        GROUP BY post_id, author_id;
+        """
+    )
+    op.execute(
+        """
+        UPDATE posts SET anonymous_comment_seq = seq.max_index
+        FROM (
+            SELECT post_id, max(anonymous_index) AS max_index
+            FROM comment_anonymous_indexes
+            GROUP BY post_id
+        ) seq
+        WHERE posts.id = seq.post_id;
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("comment_anonymous_indexes")
+    op.drop_column("posts", "anonymous_comment_seq")
+    op.drop_index("ix_comments_thread", table_name="comments")
+    op.drop_index("ix_comments_post_roots", table_name="comments")
+    op.drop_column("comments", "thread_root_id")
@@ -0,0 +1,49 @@
+"""add unique key to ad clicks for idempotent batch flush
+
+Revision ID: 026_add_ad_click_dedup
+Revises: 025_add_comment_threads
+Create Date: 2026-05-20
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = "026_add_ad_click_dedup"
+down_revision: Union[str, Sequence[str], None] = "025_add_comment_threads"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Повторно записанные пачки из Redis: оставляем первую строку, счётчик пересчитываем
+    op.execute(
+        """
+        DELETE FROM ad_clicks a
+        USING ad_clicks b
+        WHERE a.ad_post_id = b.ad_post_id
+          AND a.user_id = b.user_id
+          AND a.clicked_at = b.clicked_at
+          AND a.id > b.id;
+        """
+    )
+    op.execute(
+        """
+        UPDATE ad_posts SET clicks_count = COALESCE(cnt.total, 0)
+        FROM (
+            SELECT ap.id, count(c.id) AS total
+            FROM ad_posts ap
+            LEFT JOIN ad_clicks c ON c.ad_post_id = ap.id
+            GROUP BY ap.id
+        ) cnt
+        WHERE ad_posts.id = cnt.id;
+        """
+    )
+    op.create_unique_constraint(
+        "unique_ad_click", "ad_clicks", ["ad_post_id", "user_id", "clicked_at"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint("unique_ad_click", "ad_clicks", type_="unique")
@@ -0,0 +1,31 @@
+"""add per-day distinct module users for online time rollups
+
+Revision ID: 027_add_analytics_daily_module_users
+Revises: 026_add_ad_click_dedup
+Create Date: 2026-05-22
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "027_add_analytics_daily_module_users"
+down_revision: Union[str, Sequence[str], None] = "026_add_ad_click_dedup"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Заполняется nightly-бэкфиллом: дни без строк здесь считаются по сырым событиям
+    op.create_table(
+        "analytics_daily_module_users",
+        sa.Column("date_msk", sa.Date(), primary_key=True),
+        sa.Column("module", sa.String(length=32), primary_key=True),
+        sa.Column("user_hash", sa.String(length=64), primary_key=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("analytics_daily_module_users")
@@ -0,0 +1,202 @@
+# ===== 📄 ФАЙЛ: backend/app/auth_cache.py =====
+#
+# Кэш аутентифицированного пользователя для require_user / optional_user.
+#
+# Два уровня, ключ — (telegram_id, sid):
+#   L1 — dict в памяти воркера, TTL AUTH_CACHE_LOCAL_TTL_SECONDS (секунды);
+#   L2 — Redis hash auth_user:{telegram_id}, поле = sid, TTL AUTH_CACHE_REDIS_TTL_SECONDS.
+# В записи лежат колонки строки users и expires_at проверенной AuthSession.
+#
+# Инвалидация:
+#   - любой UPDATE/DELETE строки users через ORM (update_user, теневые баны,
+#     смена роли, auto_expire_shadow_bans) — mapper-события + after_commit;
+#   - отзыв сессии — явный invalidate() в revoke/refresh_auth_session.
+# Redis недоступен → работаем как без кэша (fail-open).
+
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Set, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy import DateTime, event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session
+
+from app import models
+from app.config import get_settings
+from app.rate_limiter import get_redis
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = "auth_user"
+# Защита памяти воркера: при переполнении L1 просто очищается целиком
+MAX_LOCAL_ENTRIES = 50_000
+
+_SESSION_INFO_KEY = "auth_cache_dirty_telegram_ids"
+
+_local: Dict[Tuple[int, int], Tuple[float, Dict[str, Any]]] = {}
+_background_tasks: Set[asyncio.Task] = set()
+
+_USER_COLUMNS = list(models.User.__table__.columns)
+
+
+def _redis_key(telegram_id: int) -> str:
+    return f"{REDIS_KEY_PREFIX}:{telegram_id}"
+
+
+# ===== СЕРИАЛИЗАЦИЯ =====
+
+def _dump_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def user_to_row(user: models.User) -> Dict[str, Any]:
+    return {column.key: _dump_value(getattr(user, column.key)) for column in _USER_COLUMNS}
+
+
+def _row_to_user(row: Dict[str, Any]) -> models.User:
+    values = {}
+    for column in _USER_COLUMNS:
+        value = row.get(column.key)
+        if value is not None and isinstance(column.type, DateTime):
+            value = datetime.fromisoformat(value)
+        values[column.key] = value
+    user = models.User(**values)
+    # Объект выглядит как только что загруженный из БД: без истории изменений
+    make_transient_to_detached(user)
+    return user
+
+
+async def attach_user(db: AsyncSession, row: Dict[str, Any]) -> models.User:
+    """Собрать User из кэша и привязать к сессии запроса без SELECT.
+
+    merge(load=False) кладёт объект в identity map, поэтому изменения,
+    которые роут делает с user, коммитятся как обычно.
+    """
+    return await db.merge(_row_to_user(row), load=False)
+
+
+def session_expires_at(entry: Dict[str, Any]) -> Optional[datetime]:
+    raw = entry.get("session_expires_at")
+    return datetime.fromisoformat(raw) if raw else None
+
+
+# ===== ЧТЕНИЕ / ЗАПИСЬ =====
+
+async def get_entry(telegram_id: int, session_id: int) -> Optional[Dict[str, Any]]:
+    settings = get_settings()
+    if not settings.auth_cache_enabled:
+        return None
+
+    key = (telegram_id, session_id)
+    cached = _local.get(key)
+    if cached is not None:
+        expires, entry = cached
+        if expires > time.monotonic():
+            return entry
+        _local.pop(key, None)
+
+    try:
+        redis = await get_redis()
+        raw = await redis.hget(_redis_key(telegram_id), str(session_id))
+    except (RedisError, OSError) as exc:
+        logger.warning("Auth cache lookup failed: %s", exc)
+        return None
+    if not raw:
+        return None
+
+    try:
+        entry = json.loads(raw)
+    except ValueError:
+        return None
+    _remember_local(key, entry, settings.auth_cache_local_ttl_seconds)
+    return entry
+
+
+async def store_entry(telegram_id: int, session_id: int, entry: Dict[str, Any]) -> None:
+    settings = get_settings()
+    if not settings.auth_cache_enabled:
+        return
+
+    _remember_local((telegram_id, session_id), entry, settings.auth_cache_local_ttl_seconds)
+    try:
+        redis = await get_redis()
+        pipe = redis.pipeline(transaction=True)
+        pipe.hset(_redis_key(telegram_id), str(session_id), json.dumps(entry))
+        pipe.expire(_redis_key(telegram_id), settings.auth_cache_redis_ttl_seconds)
+        await pipe.execute()
+    except (RedisError, OSError) as exc:
+        logger.warning("Auth cache store failed: %s", exc)
+
+
+def _remember_local(key: Tuple[int, int], entry: Dict[str, Any], ttl: int) -> None:
+    if len(_local) >= MAX_LOCAL_ENTRIES:
+        _local.clear()
+    _local[key] = (time.monotonic() + ttl, entry)
+
+
+# ===== ИНВАЛИДАЦИЯ =====
+
+def _drop_local(telegram_id: int, session_id: Optional[int] = None) -> None:
+    if session_id is not None:
+        _local.pop((telegram_id, session_id), None)
+        return
+    for key in [key for key in _local if key[0] == telegram_id]:
+        _local.pop(key, None)
+
+
+async def invalidate(telegram_id: int, session_id: Optional[int] = None) -> None:
+    """Сбросить кэш юзера целиком или одной его сессии (sid)."""
+    _drop_local(telegram_id, session_id)
+    try:
+        redis = await get_redis()
+        if session_id is None:
+            await redis.delete(_redis_key(telegram_id))
+        else:
+            await redis.hdel(_redis_key(telegram_id), str(session_id))
+    except (RedisError, OSError) as exc:
+        logger.warning("Auth cache invalidation failed: %s", exc)
+
+
+def clear_local() -> None:
+    _local.clear()
+
+
+def _mark_dirty(mapper, connection, target) -> None:
+    session = object_session(target)
+    if session is None or target.telegram_id is None:
+        return
+    session.info.setdefault(_SESSION_INFO_KEY, set()).add(target.telegram_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session) -> None:
+    telegram_ids = session.info.pop(_SESSION_INFO_KEY, None)
+    if not telegram_ids:
+        return
+
+    for telegram_id in telegram_ids:
+        _drop_local(telegram_id)
+
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    for telegram_id in telegram_ids:
+        task = loop.create_task(invalidate(telegram_id))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session: Session) -> None:
+    session.info.pop(_SESSION_INFO_KEY, None)
+
+
+event.listen(models.User, "after_update", _mark_dirty)
+event.listen(models.User, "after_delete", _mark_dirty)
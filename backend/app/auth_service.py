@@ -21,7 +21,7 @@ from fastapi import Depends, Header, HTTPException, Request
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app import models
+from app import auth_cache, models
 from app.config import get_settings
 from app.database import get_db
 
@@ -193,6 +193,7 @@ async def refresh_auth_session(
 
     session.revoked_at = now
     await db.commit()
+    await auth_cache.invalidate(session.telegram_id, session.id)
 
     return await create_auth_session(
         db=db,
@@ -219,6 +220,7 @@ async def revoke_auth_session(db: AsyncSession, raw_refresh_token: Optional[str]
     if session and session.revoked_at is None:
         session.revoked_at = _utcnow()
         await db.commit()
+        await auth_cache.invalidate(session.telegram_id, session.id)
 
 
 # ===== IDENTITY EXTRACTION (чистый Python, без DB) =====
@@ -257,40 +259,67 @@ def require_identity(request: Request) -> AuthIdentity:
     return get_identity_from_request(request)
 
 
+async def _load_user(
+    db: AsyncSession,
+    identity: AuthIdentity,
+) -> tuple[Optional[models.User], Optional[Dict[str, Any]]]:
+    """User по telegram_id: из auth_cache, при промахе — SELECT.
+
+    Возвращает (user, entry); entry is None → строки в кэше не было.
+    """
+    entry = await auth_cache.get_entry(identity.telegram_id, identity.session_id)
+    if entry is not None:
+        return await auth_cache.attach_user(db, entry["user"]), entry
+
+    result = await db.execute(
+        select(models.User).where(models.User.telegram_id == identity.telegram_id)
+    )
+    return result.scalar_one_or_none(), None
+
+
 async def require_user(
     request: Request,
     db: AsyncSession = Depends(get_db),
 ) -> models.User:
-    """✅ Async: select() + await db.execute()"""
+    """✅ Async: user и активная сессия берутся из auth_cache, SELECT только при промахе."""
     settings = get_settings()
     identity = get_identity_from_request(request)
 
-    result = await db.execute(
-        select(models.User).where(models.User.telegram_id == identity.telegram_id)
-    )
-    user = result.scalar_one_or_none()
+    user, entry = await _load_user(db, identity)
 
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
+    dirty = entry is None
+    if entry is None:
+        entry = {"session_expires_at": None}
+
     if settings.is_prod and settings.auth_session_binding_enabled:
         if identity.session_id <= 0:
             raise HTTPException(status_code=401, detail="Invalid token session")
 
         now = _utcnow()
-        session_result = await db.execute(
-            select(models.AuthSession).where(
-                models.AuthSession.id == identity.session_id,
-                models.AuthSession.telegram_id == identity.telegram_id,
-                models.AuthSession.revoked_at.is_(None),
-                models.AuthSession.expires_at > now,
+        cached_expires_at = auth_cache.session_expires_at(entry)
+        if cached_expires_at is None or cached_expires_at <= now:
+            session_result = await db.execute(
+                select(models.AuthSession).where(
+                    models.AuthSession.id == identity.session_id,
+                    models.AuthSession.telegram_id == identity.telegram_id,
+                    models.AuthSession.revoked_at.is_(None),
+                    models.AuthSession.expires_at > now,
+                )
             )
-        )
-        session = session_result.scalar_one_or_none()
-        if not session:
-            raise HTTPException(status_code=401, detail="Session is not active")
-        if session.user_id is not None and session.user_id != user.id:
-            raise HTTPException(status_code=401, detail="Session user mismatch")
+            session = session_result.scalar_one_or_none()
+            if not session:
+                raise HTTPException(status_code=401, detail="Session is not active")
+            if session.user_id is not None and session.user_id != user.id:
+                raise HTTPException(status_code=401, detail="Session user mismatch")
+            entry["session_expires_at"] = session.expires_at.isoformat()
+            dirty = True
+
+    if dirty and isinstance(user, models.User):
+        entry["user"] = auth_cache.user_to_row(user)
+        await auth_cache.store_entry(identity.telegram_id, identity.session_id, entry)
 
     return user
 
@@ -307,10 +336,15 @@ async def optional_user(
         identity = get_identity_from_request(request)
     except HTTPException:
         return None
-    result = await db.execute(
-        select(models.User).where(models.User.telegram_id == identity.telegram_id)
-    )
-    return result.scalar_one_or_none()
+
+    user, entry = await _load_user(db, identity)
+    if user is not None and entry is None and isinstance(user, models.User):
+        await auth_cache.store_entry(
+            identity.telegram_id,
+            identity.session_id,
+            {"user": auth_cache.user_to_row(user), "session_expires_at": None},
+        )
+    return user
 
 
 # ===== HEADER UTILS (чистый Python) =====
@@ -84,6 +84,9 @@ class Settings(BaseModel):
     refresh_ttl_days: int = Field(default=30)
     auth_max_skew_seconds: int = Field(default=300)
     auth_session_binding_enabled: bool = Field(default=False)
+    auth_cache_enabled: bool = Field(default=True)
+    auth_cache_local_ttl_seconds: int = Field(default=5)
+    auth_cache_redis_ttl_seconds: int = Field(default=60)
 
     cors_origins: List[str] = Field(default_factory=list)
     cookie_secure: bool = Field(default=False)
@@ -94,6 +97,20 @@ class Settings(BaseModel):
     sql_echo: bool = Field(default=True)
 
     redis_url: str = Field(default="redis://localhost:6379/0")
+    feed_cache_enabled: bool = Field(default=True)
+    feed_cache_ttl_seconds: int = Field(default=30)
+    view_flush_interval_seconds: int = Field(default=5)
+    admin_stats_refresh_seconds: int = Field(default=60)
+    admin_stats_usage_refresh_seconds: int = Field(default=900)
+    notification_push_enabled: bool = Field(default=True)
+    ads_index_refresh_seconds: int = Field(default=60)
+    ads_counter_flush_seconds: int = Field(default=5)
+    dating_feed_cache_ttl_seconds: int = Field(default=600)
+    video_transcode_queue_enabled: bool = Field(default=True)
+    video_transcode_workers: int = Field(default=2)
+    image_workers: int = Field(default=2)
+    image_queue_limit: int = Field(default=32)
+    image_variant_widths: List[int] = Field(default_factory=lambda: [320, 640, 1280])
 
     analytics_salt: str = Field(default="dev-analytics-salt")
     analytics_reports_dir: str = Field(default="reports")
@@ -101,6 +118,10 @@ class Settings(BaseModel):
     analytics_nightly_hour_msk: int = Field(default=3)
     analytics_raw_retention_days: int = Field(default=180)
     analytics_agg_retention_days: int = Field(default=730)
+    analytics_buffer_enabled: bool = Field(default=True)
+    analytics_flush_interval_seconds: int = Field(default=2)
+    analytics_flush_batch_size: int = Field(default=500)
+    analytics_redis_stream_enabled: bool = Field(default=False)
 
     deal_flow_v2_enabled: bool = Field(default=False)
     market_expiry_worker_enabled: bool = Field(default=False)
@@ -124,6 +145,13 @@ def get_settings() -> Settings:
     cors_raw = os.getenv("CORS_ORIGINS", "http://localhost:3000")
     cors_list = [value.strip() for value in cors_raw.split(",") if value.strip()]
 
+    variant_widths_raw = os.getenv("IMAGE_VARIANT_WIDTHS", "320,640,1280")
+    variant_widths = sorted({
+        max(64, min(2048, int(value.strip())))
+        for value in variant_widths_raw.split(",")
+        if value.strip().isdigit()
+    })
+
     dev_ids_raw = os.getenv("DEV_TELEGRAM_IDS", "")
     dev_ids_set = {int(value.strip()) for value in dev_ids_raw.split(",") if value.strip().isdigit()}
 
@@ -205,6 +233,9 @@ def get_settings() -> Settings:
         auth_session_binding_enabled=_truthy(
             os.getenv("AUTH_SESSION_BINDING_ENABLED", "true" if is_prod_env else "false")
         ),
+        auth_cache_enabled=_truthy(os.getenv("AUTH_CACHE_ENABLED", "true")),
+        auth_cache_local_ttl_seconds=max(1, min(60, int(os.getenv("AUTH_CACHE_LOCAL_TTL_SECONDS", "5")))),
+        auth_cache_redis_ttl_seconds=max(1, min(3600, int(os.getenv("AUTH_CACHE_REDIS_TTL_SECONDS", "60")))),
         cors_origins=cors_list,
         cookie_secure=cookie_secure,
         cookie_samesite=cookie_samesite,
@@ -212,12 +243,30 @@ def get_settings() -> Settings:
         dev_telegram_ids=dev_ids_set,
         sql_echo=sql_echo,
         redis_url=redis_url,
+        feed_cache_enabled=_truthy(os.getenv("FEED_CACHE_ENABLED", "true")),
+        feed_cache_ttl_seconds=max(1, min(600, int(os.getenv("FEED_CACHE_TTL_SECONDS", "30")))),
+        view_flush_interval_seconds=max(1, int(os.getenv("VIEW_FLUSH_INTERVAL_SECONDS", "5"))),
+        admin_stats_refresh_seconds=max(10, int(os.getenv("ADMIN_STATS_REFRESH_SECONDS", "60"))),
+        admin_stats_usage_refresh_seconds=max(60, int(os.getenv("ADMIN_STATS_USAGE_REFRESH_SECONDS", "900"))),
+        notification_push_enabled=_truthy(os.getenv("NOTIFICATION_PUSH_ENABLED", "true")),
+        ads_index_refresh_seconds=max(5, int(os.getenv("ADS_INDEX_REFRESH_SECONDS", "60"))),
+        ads_counter_flush_seconds=max(1, int(os.getenv("ADS_COUNTER_FLUSH_SECONDS", "5"))),
+        dating_feed_cache_ttl_seconds=max(30, int(os.getenv("DATING_FEED_CACHE_TTL_SECONDS", "600"))),
+        video_transcode_queue_enabled=_truthy(os.getenv("VIDEO_TRANSCODE_QUEUE_ENABLED", "true")),
+        video_transcode_workers=max(1, min(8, int(os.getenv("VIDEO_TRANSCODE_WORKERS", "2")))),
+        image_workers=max(0, min(16, int(os.getenv("IMAGE_WORKERS", "2")))),
+        image_queue_limit=max(1, int(os.getenv("IMAGE_QUEUE_LIMIT", "32"))),
+        image_variant_widths=variant_widths,
         analytics_salt=analytics_salt,
         analytics_reports_dir=os.getenv("ANALYTICS_REPORTS_DIR", str(REPORTS_ROOT / "reports")),
         analytics_nightly_enabled=_truthy(os.getenv("ANALYTICS_NIGHTLY_ENABLED", "true")),
         analytics_nightly_hour_msk=max(0, min(23, int(os.getenv("ANALYTICS_NIGHTLY_HOUR_MSK", "3")))),
         analytics_raw_retention_days=max(1, int(os.getenv("ANALYTICS_RAW_RETENTION_DAYS", "180"))),
         analytics_agg_retention_days=max(1, int(os.getenv("ANALYTICS_AGG_RETENTION_DAYS", "730"))),
+        analytics_buffer_enabled=_truthy(os.getenv("ANALYTICS_BUFFER_ENABLED", "true")),
+        analytics_flush_interval_seconds=max(1, int(os.getenv("ANALYTICS_FLUSH_INTERVAL_SECONDS", "2"))),
+        analytics_flush_batch_size=max(1, min(2000, int(os.getenv("ANALYTICS_FLUSH_BATCH_SIZE", "500")))),
+        analytics_redis_stream_enabled=_truthy(os.getenv("ANALYTICS_REDIS_STREAM_ENABLED", "false")),
         deal_flow_v2_enabled=_truthy(os.getenv("DEAL_FLOW_V2_ENABLED", "false")),
         market_expiry_worker_enabled=_truthy(
             os.getenv("MARKET_EXPIRY_WORKER_ENABLED", "true" if is_prod_env else "false")
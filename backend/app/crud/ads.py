@@ -5,15 +5,19 @@
 # ✅ Фаза 3.8: async/await + select() + AsyncSession
 # ✅ Фаза 3.8: joinedload → selectinload
 # ✅ Фаза 4.3: track_ad_impression → INSERT ON CONFLICT (атомарная дедупликация)
+# Изменения активных кампаний и hide/unhide синхронизируют индекс services/ad_serving.
 
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
-from sqlalchemy import select, func, or_, update as sa_update
-from typing import Optional, List
+from sqlalchemy import bindparam, select, func, or_, update as sa_update
+from collections import Counter
+from typing import Iterable, Optional, List, Tuple
 from datetime import datetime, timedelta
 
 from app import models, schemas
 from app.crud.helpers import sanitize_json_field
+from app.services import ad_serving
 
 
 # ===== СОЗДАНИЕ И УПРАВЛЕНИЕ =====
@@ -64,6 +68,8 @@ async def create_ad_post(
     )
     db.add(db_ad)
     await db.commit()
+    if initial_status == 'active':
+        await ad_serving.bump_generation()
     loaded = await get_ad_post(db, db_ad.id)
     return loaded or db_ad
 
@@ -152,6 +158,7 @@ async def update_ad_post(db: AsyncSession, ad_id: int, update_data: schemas.AdPo
 
     db_ad.updated_at = datetime.utcnow()
     await db.commit()
+    await ad_serving.bump_generation()
     return await get_ad_post(db, ad_id)
 
 
@@ -177,6 +184,7 @@ async def approve_ad_post(db: AsyncSession, ad_id: int, reviewer_id: int) -> Opt
         db_ad.status = 'approved'
 
     await db.commit()
+    await ad_serving.bump_generation()
     return await get_ad_post(db, ad_id)
 
 
@@ -214,6 +222,7 @@ async def pause_ad_post(db: AsyncSession, ad_id: int) -> Optional[models.AdPost]
         return None
     db_ad.status = 'paused'
     await db.commit()
+    await ad_serving.bump_generation()
     return await get_ad_post(db, ad_id)
 
 
@@ -230,6 +239,7 @@ async def resume_ad_post(db: AsyncSession, ad_id: int) -> Optional[models.AdPost
         return None
     db_ad.status = 'active'
     await db.commit()
+    await ad_serving.bump_generation()
     return await get_ad_post(db, ad_id)
 
 
@@ -244,6 +254,7 @@ async def delete_ad_post(db: AsyncSession, ad_id: int) -> bool:
         await db.delete(db_post)  # CASCADE удалит и ad_post
 
     await db.commit()
+    await ad_serving.bump_generation()
     return True
 
 
@@ -257,7 +268,10 @@ async def get_active_ads_for_user(
     exclude_seen_by_user_id: Optional[int] = None,
     include_all_for_dev: bool = False,
 ) -> List[models.AdPost]:
-    """Выбрать активные рекламные посты для подмешивания в ленту."""
+    """
+    Выбрать активные рекламные посты для подмешивания в ленту прямо из БД.
+    Основной путь — services/ad_serving; сюда попадаем в dev и без Redis.
+    """
     now = datetime.utcnow()
 
     query = (
@@ -350,6 +364,7 @@ async def track_ad_impression(db: AsyncSession, ad_post_id: int, user_id: int) -
     )
     result = await db.execute(stmt)
     is_new_unique = result.scalar_one_or_none() is not None
+    await ad_serving.mark_seen(user_id, ad_post_id)
 
     # Атомарные счётчики: инкрементируем только при первом показе
     if not is_new_unique:
@@ -368,7 +383,8 @@ async def track_ad_impression(db: AsyncSession, ad_post_id: int, user_id: int) -
     )
 
     # Автозавершение при достижении лимита
-    if db_ad.impression_limit and (db_ad.impressions_count + 1) >= db_ad.impression_limit:
+    completed = bool(db_ad.impression_limit and (db_ad.impressions_count + 1) >= db_ad.impression_limit)
+    if completed:
         await db.execute(
             sa_update(models.AdPost)
             .where(models.AdPost.id == ad_post_id)
@@ -376,6 +392,8 @@ async def track_ad_impression(db: AsyncSession, ad_post_id: int, user_id: int) -
         )
 
     await db.commit()
+    if completed:
+        await ad_serving.bump_generation()
     return True
 
 
@@ -401,6 +419,87 @@ async def track_ad_click(db: AsyncSession, ad_post_id: int, user_id: int) -> boo
     return True
 
 
+async def _existing_ad_ids(db: AsyncSession, ad_ids: Iterable[int]) -> set:
+    result = await db.execute(select(models.AdPost.id).where(models.AdPost.id.in_(set(ad_ids))))
+    return set(result.scalars().all())
+
+
+async def apply_ad_impressions(db: AsyncSession, impressions: List[Tuple[int, int, datetime]]) -> int:
+    """
+    Записать пачку показов из services/ad_counter_service.
+    impressions: [(ad_post_id, user_id, viewed_at), ...]
+    Счётчики растут только на реально вставленные строки (RETURNING), поэтому
+    повторная запись той же пачки ничего не удваивает.
+    """
+    if not impressions:
+        return 0
+    existing = await _existing_ad_ids(db, (ad_id for ad_id, _, _ in impressions))
+    rows = [
+        {'ad_post_id': ad_id, 'user_id': user_id, 'viewed_at': viewed_at}
+        for ad_id, user_id, viewed_at in impressions
+        if ad_id in existing
+    ]
+    if not rows:
+        return 0
+
+    result = await db.execute(
+        pg_insert(models.AdImpression)
+        .values(rows)
+        .on_conflict_do_nothing(constraint='unique_ad_impression')
+        .returning(models.AdImpression.ad_post_id)
+    )
+    deltas = Counter(result.scalars().all())
+    if deltas:
+        ads_table = models.AdPost.__table__
+        await db.execute(
+            sa_update(ads_table)
+            .where(ads_table.c.id == bindparam('b_ad_id'))
+            .values(
+                impressions_count=func.coalesce(ads_table.c.impressions_count, 0) + bindparam('b_delta'),
+                unique_views_count=func.coalesce(ads_table.c.unique_views_count, 0) + bindparam('b_delta'),
+            ),
+            [{'b_ad_id': ad_id, 'b_delta': delta} for ad_id, delta in deltas.items()],
+        )
+    await db.commit()
+    return sum(deltas.values())
+
+
+async def apply_ad_clicks(db: AsyncSession, clicks: List[Tuple[int, int, datetime]]) -> int:
+    """
+    Записать пачку кликов: clicks — [(ad_post_id, user_id, clicked_at), ...].
+    Как и для показов, clicks_count растёт только на вставленные строки:
+    (ad_post_id, user_id, clicked_at) уникален, повтор пачки ничего не удваивает.
+    """
+    if not clicks:
+        return 0
+    existing = await _existing_ad_ids(db, (ad_id for ad_id, _, _ in clicks))
+    rows = [
+        {'ad_post_id': ad_id, 'user_id': user_id, 'clicked_at': clicked_at}
+        for ad_id, user_id, clicked_at in clicks
+        if ad_id in existing
+    ]
+    if not rows:
+        return 0
+
+    result = await db.execute(
+        pg_insert(models.AdClick)
+        .values(rows)
+        .on_conflict_do_nothing(constraint='unique_ad_click')
+        .returning(models.AdClick.ad_post_id)
+    )
+    deltas = Counter(result.scalars().all())
+    if deltas:
+        ads_table = models.AdPost.__table__
+        await db.execute(
+            sa_update(ads_table)
+            .where(ads_table.c.id == bindparam('b_ad_id'))
+            .values(clicks_count=func.coalesce(ads_table.c.clicks_count, 0) + bindparam('b_delta')),
+            [{'b_ad_id': ad_id, 'b_delta': delta} for ad_id, delta in deltas.items()],
+        )
+    await db.commit()
+    return sum(deltas.values())
+
+
 # ===== СКРЫТИЕ РЕКЛАМЫ =====
 
 async def hide_ad(db: AsyncSession, ad_post_id: int, user_id: int) -> bool:
@@ -414,6 +513,7 @@ async def hide_ad(db: AsyncSession, ad_post_id: int, user_id: int) -> bool:
     )
     await db.execute(stmt)
     await db.commit()
+    await ad_serving.set_hidden(user_id, ad_post_id, True)
     return True
 
 
@@ -428,6 +528,7 @@ async def unhide_ad(db: AsyncSession, ad_post_id: int, user_id: int) -> bool:
         )
     )
     await db.commit()
+    await ad_serving.set_hidden(user_id, ad_post_id, False)
     return True
 
 
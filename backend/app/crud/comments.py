@@ -1,14 +1,20 @@
 # ===== FILE: backend/app/crud/comments.py =====
 # Comments CRUD: create, update, delete, likes
+#
+# Чтение — страницами корневых комментариев (keyset по created_at, id) с первыми
+# ответами каждой ветки; остальные ответы ветки — get_comment_replies по курсору.
+# Ветка = корень + все ответы любой глубины (comments.thread_root_id).
 
 import logging
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 from sqlalchemy import func, or_, select, update as sa_update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
 from app import models, schemas
+from app.crud.helpers import encode_cursor, fetch_keyset_page
 from app.services import notification_service as notif
 from app.utils import delete_images
 
@@ -65,47 +71,149 @@ async def toggle_comment_like(db: AsyncSession, comment_id: int, user_id: int) -
 
 # ===== READ =====
 
-async def get_post_comments(db: AsyncSession, post_id: int, user_id: Optional[int] = None) -> List[models.Comment]:
-    query = (
-        select(models.Comment)
-        .options(selectinload(models.Comment.author))
-        .where(models.Comment.post_id == post_id)
-    )
+COMMENTS_PAGE_SIZE = 30
+COMMENT_REPLIES_PREVIEW = 3
+
+_COMMENT_KEYS = [(models.Comment.created_at, False), (models.Comment.id, False)]
 
-    # Shadow ban: banned user sees own comments only.
+
+def _visible_comments(query, user_id: Optional[int]):
+    """Shadow ban: забаненный видит свои комментарии, остальные — нет."""
+    query = query.join(models.User, models.Comment.author_id == models.User.id)
     if user_id:
-        query = query.join(models.User, models.Comment.author_id == models.User.id).where(
+        return query.where(
             or_(
                 models.User.is_shadow_banned_comments == False,
                 models.Comment.author_id == user_id,
             )
         )
-    else:
-        query = query.join(models.User, models.Comment.author_id == models.User.id).where(
-            models.User.is_shadow_banned_comments == False
-        )
+    return query.where(models.User.is_shadow_banned_comments == False)
 
-    query = query.order_by(models.Comment.created_at)
-    result = await db.execute(query)
-    comments = result.scalars().all()
 
-    # Batch load likes for current user.
+async def _mark_liked(db: AsyncSession, comments: List[models.Comment], user_id: Optional[int]) -> None:
+    """Batch load likes for current user."""
+    liked_ids = set()
     if user_id and comments:
-        comment_ids = [c.id for c in comments]
         liked_result = await db.execute(
             select(models.CommentLike.comment_id).where(
-                models.CommentLike.comment_id.in_(comment_ids),
+                models.CommentLike.comment_id.in_([c.id for c in comments]),
                 models.CommentLike.user_id == user_id,
             )
         )
         liked_ids = {row[0] for row in liked_result.all()}
-        for comment in comments:
-            comment.is_liked = comment.id in liked_ids
-    else:
-        for comment in comments:
-            comment.is_liked = False
+    for comment in comments:
+        comment.is_liked = comment.id in liked_ids
+
+
+async def _load_reply_previews(
+    db: AsyncSession,
+    roots: List[models.Comment],
+    user_id: Optional[int],
+    replies_limit: int,
+) -> List[models.Comment]:
+    """
+    Первые replies_limit ответов каждой ветки одним запросом (row_number по ветке).
+    Корням проставляет replies_count и replies_cursor (None — ответы показаны все).
+    """
+    Comment = models.Comment
+    ranked = _visible_comments(
+        select(
+            Comment.id.label("reply_id"),
+            func.row_number().over(
+                partition_by=Comment.thread_root_id,
+                order_by=(Comment.created_at, Comment.id),
+            ).label("position"),
+            func.count().over(partition_by=Comment.thread_root_id).label("thread_total"),
+        ).where(Comment.thread_root_id.in_([root.id for root in roots])),
+        user_id,
+    ).subquery()
 
-    return comments
+    result = await db.execute(
+        select(Comment, ranked.c.thread_total)
+        .options(selectinload(Comment.author))
+        .join(ranked, ranked.c.reply_id == Comment.id)
+        .where(ranked.c.position <= replies_limit)
+        .order_by(Comment.thread_root_id, Comment.created_at, Comment.id)
+    )
+
+    replies: List[models.Comment] = []
+    totals: Dict[int, int] = {}
+    last_shown: Dict[int, models.Comment] = {}
+    for reply, thread_total in result.all():
+        replies.append(reply)
+        totals[reply.thread_root_id] = thread_total
+        last_shown[reply.thread_root_id] = reply
+
+    for root in roots:
+        root.replies_count = totals.get(root.id, 0)
+        shown = last_shown.get(root.id)
+        root.replies_cursor = (
+            encode_cursor({"k": [shown.created_at, shown.id]})
+            if shown is not None and root.replies_count > replies_limit
+            else None
+        )
+    return replies
+
+
+async def get_post_comments(
+    db: AsyncSession,
+    post_id: int,
+    user_id: Optional[int] = None,
+    *,
+    limit: int = COMMENTS_PAGE_SIZE,
+    cursor_payload: Optional[Dict[str, Any]] = None,
+    replies_limit: int = COMMENT_REPLIES_PREVIEW,
+) -> Tuple[List[models.Comment], bool, Optional[str]]:
+    """
+    Страница корневых комментариев поста и первые ответы их веток.
+
+    Returns:
+        (корни и ответы плоским списком, has_more, next_cursor)
+    """
+    query = _visible_comments(
+        select(models.Comment)
+        .options(selectinload(models.Comment.author))
+        .where(
+            models.Comment.post_id == post_id,
+            models.Comment.parent_id.is_(None),
+        ),
+        user_id,
+    )
+    roots, has_more, next_cursor = await fetch_keyset_page(
+        db, query, _COMMENT_KEYS, limit=limit, cursor_payload=cursor_payload,
+    )
+
+    replies = await _load_reply_previews(db, roots, user_id, replies_limit) if roots else []
+    comments = [*roots, *replies]
+    await _mark_liked(db, comments, user_id)
+    return comments, has_more, next_cursor
+
+
+async def get_comment_replies(
+    db: AsyncSession,
+    comment_id: int,
+    user_id: Optional[int] = None,
+    *,
+    limit: int = COMMENTS_PAGE_SIZE,
+    cursor_payload: Optional[Dict[str, Any]] = None,
+) -> Optional[Tuple[List[models.Comment], bool, Optional[str]]]:
+    """Следующие ответы ветки комментария (replies_cursor из get_post_comments). None — нет комментария."""
+    comment = await db.get(models.Comment, comment_id)
+    if not comment:
+        return None
+    root_id = comment.thread_root_id or comment.id
+
+    query = _visible_comments(
+        select(models.Comment)
+        .options(selectinload(models.Comment.author))
+        .where(models.Comment.thread_root_id == root_id),
+        user_id,
+    )
+    replies, has_more, next_cursor = await fetch_keyset_page(
+        db, query, _COMMENT_KEYS, limit=limit, cursor_payload=cursor_payload,
+    )
+    await _mark_liked(db, replies, user_id)
+    return replies, has_more, next_cursor
 
 
 async def count_post_comments(db: AsyncSession, post_id: int) -> int:
@@ -120,6 +228,36 @@ async def count_post_comments(db: AsyncSession, post_id: int) -> int:
 
 # ===== CREATE =====
 
+async def _get_anonymous_index(db: AsyncSession, post_id: int, author_id: int) -> int:
+    """
+    Номер «Аноним #N» автора в комментариях поста: поиск по PK, новый номер —
+    инкремент posts.anonymous_comment_seq (без выборки всех анонимных комментариев).
+    """
+    Alias = models.CommentAnonymousIndex
+    existing_query = select(Alias.anonymous_index).where(Alias.post_id == post_id, Alias.user_id == author_id)
+    existing = await db.scalar(existing_query)
+    if existing is not None:
+        return existing
+
+    # UPDATE берёт блокировку строки поста — параллельные комментарии не получат один номер
+    next_index = await db.scalar(
+        sa_update(models.Post)
+        .where(models.Post.id == post_id)
+        .values(anonymous_comment_seq=models.Post.anonymous_comment_seq + 1)
+        .returning(models.Post.anonymous_comment_seq)
+    )
+    inserted = await db.scalar(
+        pg_insert(Alias)
+        .values(post_id=post_id, user_id=author_id, anonymous_index=next_index)
+        .on_conflict_do_nothing(index_elements=[Alias.post_id, Alias.user_id])
+        .returning(Alias.anonymous_index)
+    )
+    if inserted is not None:
+        return inserted
+    # Тот же автор параллельным запросом успел первым — берём его номер
+    return await db.scalar(existing_query)
+
+
 async def create_comment(db: AsyncSession, comment: schemas.CommentCreate, author_id: int):
     result = await db.execute(select(models.Post).where(models.Post.id == comment.post_id))
     post = result.scalar_one_or_none()
@@ -135,50 +273,33 @@ async def create_comment(db: AsyncSession, comment: schemas.CommentCreate, autho
         if post.is_anonymous and post.author_id == author_id:
             anonymous_index = 0
         else:
-            anon_result = await db.execute(
-                select(models.Comment).where(
-                    models.Comment.post_id == comment.post_id,
-                    models.Comment.is_anonymous == True,
-                )
-            )
-            existing_anon_comments = anon_result.scalars().all()
-
-            for existing in existing_anon_comments:
-                if existing.author_id == author_id:
-                    anonymous_index = existing.anonymous_index
-                    break
-
-            if anonymous_index is None:
-                max_index = max(
-                    [c.anonymous_index for c in existing_anon_comments if c.anonymous_index and c.anonymous_index > 0],
-                    default=0,
-                )
-                anonymous_index = max_index + 1
+            anonymous_index = await _get_anonymous_index(db, comment.post_id, author_id)
 
     payload_images = [
         (img.model_dump() if hasattr(img, "model_dump") else img)
         for img in (comment.images or [])
     ]
 
+    # Валидация parent_id: должен принадлежать тому же посту
+    parent_comment = None
+    if comment.parent_id:
+        parent_comment = await db.get(models.Comment, comment.parent_id)
+        if not parent_comment:
+            raise ValueError("Родительский комментарий не найден")
+        if parent_comment.post_id != comment.post_id:
+            raise ValueError("Родительский комментарий принадлежит другому посту")
+
     db_comment = models.Comment(
         post_id=comment.post_id,
         author_id=author_id,
         body=(comment.body or "").strip(),
         parent_id=comment.parent_id,
+        thread_root_id=(parent_comment.thread_root_id or parent_comment.id) if parent_comment else None,
         is_anonymous=is_anonymous,
         anonymous_index=anonymous_index,
         images=payload_images,
     )
 
-    # Валидация parent_id: должен принадлежать тому же посту
-    parent_comment = None
-    if comment.parent_id:
-        parent_comment = await db.get(models.Comment, comment.parent_id)
-        if not parent_comment:
-            raise ValueError("Родительский комментарий не найден")
-        if parent_comment.post_id != comment.post_id:
-            raise ValueError("Родительский комментарий принадлежит другому посту")
-
     db.add(db_comment)
     await db.execute(
         sa_update(models.Post)
@@ -10,7 +10,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 from sqlalchemy import select, func, or_
 from sqlalchemy.exc import IntegrityError
-from typing import Optional, List
+from typing import Dict, Optional, List
 from datetime import datetime, timedelta, timezone
 
 from app import models
@@ -29,6 +29,16 @@ async def get_dating_profile(db: AsyncSession, user_id: int) -> Optional[models.
     return result.scalar_one_or_none()
 
 
+async def get_dating_profiles_by_user_ids(db: AsyncSession, user_ids: List[int]) -> Dict[int, models.DatingProfile]:
+    """Анкеты нескольких пользователей одним запросом: {user_id: profile}"""
+    if not user_ids:
+        return {}
+    result = await db.execute(
+        select(models.DatingProfile).where(models.DatingProfile.user_id.in_(user_ids))
+    )
+    return {profile.user_id: profile for profile in result.scalars().all()}
+
+
 async def update_dating_profile_activity(db: AsyncSession, user_id: int, is_active: bool):
     """Скрыть/показать анкету"""
     profile = await get_dating_profile(db, user_id)
@@ -39,6 +49,60 @@ async def update_dating_profile_activity(db: AsyncSession, user_id: int, is_acti
 
 # ===== ЛЕНТА =====
 
+def _feed_card(context, profile: models.DatingProfile) -> dict:
+    from app.services.dating_scoring import describe_match, get_match_reason_label
+
+    user = profile.user  # ✅ selectinload загрузил user
+    match = describe_match(context, user, profile)
+
+    photos_raw = profile.photos
+    photos = get_image_urls(photos_raw) if photos_raw else []
+    if not photos and user.avatar:
+        photos = [{"url": user.avatar, "w": 500, "h": 500}]
+
+    return {
+        "id": user.id,
+        "name": user.name,
+        "age": user.age,
+        "bio": profile.bio or user.bio,
+        "university": user.university,
+        "institute": user.institute,
+        "course": user.course,
+        "photos": photos,
+        "goals": profile.goals or [],
+        "interests": user.interests or [],
+        "looking_for": profile.looking_for,
+        "match_reason": get_match_reason_label(match["match_reason"]),
+        "common_interests": match["common_interests"],
+        "common_goals": match["common_goals"],
+    }
+
+
+async def _load_feed_page(db: AsyncSession, current_user_id: int, user_ids: List[int]) -> List[models.DatingProfile]:
+    """Анкеты страницы из сессии — в порядке ранжирования, без ставших неактивными и уже оценённых."""
+    if not user_ids:
+        return []
+    acted_ids = (
+        select(models.DatingLike.whom_liked_id)
+        .where(
+            models.DatingLike.who_liked_id == current_user_id,
+            models.DatingLike.whom_liked_id.in_(user_ids),
+        )
+        .scalar_subquery()
+    )
+    result = await db.execute(
+        select(models.DatingProfile)
+        .options(selectinload(models.DatingProfile.user))
+        .where(
+            models.DatingProfile.user_id.in_(user_ids),
+            models.DatingProfile.is_active == True,
+            models.DatingProfile.user_id.notin_(acted_ids),
+        )
+    )
+    by_user_id = {profile.user_id: profile for profile in result.scalars().all()}
+    return [by_user_id[user_id] for user_id in user_ids if user_id in by_user_id]
+
+
 async def get_dating_feed(
     db: AsyncSession,
     current_user_id: int,
@@ -52,11 +116,12 @@ async def get_dating_feed(
 
     Pipeline:
     1. SQL "Грубое сито" — базовые фильтры (пол, активность, не лайкнут)
-    2. Python scoring — расчёт баллов совместимости для каждого кандидата
-    3. Сортировка по score, выдача top-N
+    2. Векторный scoring всего пула (NumPy), сортировка по score
+    3. Ранжированный пул — в сессию ленты (Redis), следующие страницы берутся из неё
     """
+    from app.services import dating_feed_cache
     from app.services.dating_scoring import (
-        calculate_score, get_match_reason_label,
+        MatchContext, calculate_score, rank_candidates, score_candidates,
         SCORING_POOL_SIZE, MIN_CANDIDATES_BEFORE_FALLBACK,
         INACTIVE_HARD_CUTOFF_DAYS
     )
@@ -66,6 +131,15 @@ async def get_dating_feed(
         return []
 
     me_profile = await get_dating_profile(db, current_user_id)
+    context = MatchContext(me_user, me_profile)
+
+    # Следующие страницы — из сессии, без повторного скоринга
+    if offset > 0 and not debug:
+        ranked = await dating_feed_cache.get_ranked(current_user_id, looking_for)
+        if ranked is not None:
+            page_ids = [user_id for user_id, _ in ranked[offset:offset + limit]]
+            profiles = await _load_feed_page(db, current_user_id, page_ids)
+            return [_feed_card(context, profile) for profile in profiles]
 
     # ID тех, кого я уже лайкнул/скипнул
     already_acted_ids = (
@@ -135,58 +209,30 @@ async def get_dating_feed(
     )
     incoming_like_ids = {row[0] for row in incoming_result.all()}
 
-    # === ШАГ 3: Python Scoring (чистый Python, без DB) ===
-    scored_candidates = []
-    for profile in candidates:
-        user = profile.user  # ✅ selectinload загрузил user
-        result_score = calculate_score(
-            me_user=me_user,
-            me_profile=me_profile,
-            candidate_user=user,
-            candidate_profile=profile,
-            incoming_like_ids=incoming_like_ids
-        )
+    # === ШАГ 3: Векторный scoring всего пула ===
+    scores = score_candidates(
+        me_user, me_profile,
+        [(profile.user, profile) for profile in candidates],
+        incoming_like_ids,
+    )
+    order = rank_candidates(scores)
 
-        photos_raw = profile.photos
-        photos = get_image_urls(photos_raw) if photos_raw else []
-        if not photos and user.avatar:
-            photos = [{"url": user.avatar, "w": 500, "h": 500}]
-
-        interests = user.interests or []
-        goals = profile.goals or []
-
-        candidate_data = {
-            "id": user.id,
-            "name": user.name,
-            "age": user.age,
-            "bio": profile.bio or user.bio,
-            "university": user.university,
-            "institute": user.institute,
-            "course": user.course,
-            "photos": photos,
-            "goals": goals,
-            "interests": interests,
-            "looking_for": profile.looking_for,
-            "match_reason": get_match_reason_label(result_score["match_reason"]),
-            "common_interests": result_score["breakdown"].get("common_interests", []),
-            "common_goals": result_score["breakdown"].get("common_goals", []),
-        }
+    if not debug:
+        await dating_feed_cache.store_ranked(
+            current_user_id, looking_for,
+            [[candidates[i].user_id, int(scores[i])] for i in order],
+        )
 
+    # === ШАГ 4: Страница ===
+    page = []
+    for i in order[offset:offset + limit]:
+        profile = candidates[i]
+        card = _feed_card(context, profile)
         if debug:
-            candidate_data["_debug_score"] = result_score["breakdown"]
-
-        candidate_data["_sort_score"] = result_score["score"]
-        scored_candidates.append(candidate_data)
-
-    # === ШАГ 4: Сортировка и пагинация ===
-    scored_candidates.sort(key=lambda x: x["_sort_score"], reverse=True)
-    page = scored_candidates[offset:offset + limit]
-
-    for item in page:
-        if not debug:
-            item.pop("_sort_score", None)
-        else:
-            item["_debug_score"]["final_score"] = item.pop("_sort_score", 0)
+            breakdown = calculate_score(me_user, me_profile, profile.user, profile, incoming_like_ids)["breakdown"]
+            breakdown["final_score"] = int(scores[i])
+            card["_debug_score"] = breakdown
+        page.append(card)
 
     return page
 
@@ -5,9 +5,26 @@
 #    для совместимости с JSONB-колонками.
 # ✅ Фаза 3: Без изменений — чистый Python, нет DB-вызовов.
 # ✅ Фаза 5.2: merge_images() — единая логика слияния изображений
+# ✅ Keyset-пагинация: encode_cursor/decode_cursor + fetch_keyset_page для лент
+# ✅ Полнотекстовый поиск: build_search_tsquery / search_rank (tsvector + GIN)
 
 from typing import Any, Optional, Union, List, Dict, Tuple
+from datetime import datetime
+import base64
+import binascii
 import json
+import re
+
+from sqlalchemy import Float, and_, false, func, literal, literal_column, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.elements import ColumnElement
+
+from app.models import SEARCH_TS_CONFIG
+
+# Postgres/asyncpg принимают не больше 32767 параметров на запрос:
+# пачки просмотров (3 колонки) пишем multi-row INSERT'ами не длиннее этого
+VIEW_INSERT_CHUNK_ROWS = 5000
 
 
 def sanitize_json_field(value: Any) -> Optional[Union[list, dict]]:
@@ -139,3 +156,149 @@ def merge_images(
     files_to_delete = [meta for url, meta in old_images_map.items() if url not in kept_urls]
 
     return final_images_meta, files_to_delete
+
+
+# ===== KEYSET (CURSOR) PAGINATION =====
+
+# (SQL-выражение, descending). Последним ключом всегда должен идти уникальный id.
+KeysetKey = Tuple[ColumnElement, bool]
+
+
+def _cursor_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"$dt": value.isoformat()}
+    raise TypeError(f"Unsupported cursor value: {type(value).__name__}")
+
+
+def _cursor_object_hook(value: dict) -> Any:
+    if set(value) == {"$dt"}:
+        return datetime.fromisoformat(value["$dt"])
+    return value
+
+
+def encode_cursor(payload: Dict[str, Any]) -> str:
+    """Упаковать состояние страницы в непрозрачный url-safe курсор."""
+    raw = json.dumps(payload, default=_cursor_default, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Распаковать курсор. ValueError — если курсор битый или подделан."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode("ascii"))
+        payload = json.loads(raw.decode("utf-8"), object_hook=_cursor_object_hook)
+    except (binascii.Error, UnicodeError, ValueError) as exc:
+        raise ValueError("Invalid cursor") from exc
+    if not isinstance(payload, dict) or not isinstance(payload.get("k"), list):
+        raise ValueError("Invalid cursor")
+    return payload
+
+
+def _keyset_value(expr: ColumnElement, value: Any) -> ColumnElement:
+    # bool нельзя сравнивать через > / < напрямую — оборачиваем в типизированный literal
+    return literal(value, type_=expr.type)
+
+
+def _keyset_after_one(expr: ColumnElement, descending: bool, value: Any) -> ColumnElement:
+    # PostgreSQL: ASC → NULLS LAST, DESC → NULLS FIRST
+    if descending:
+        return expr.isnot(None) if value is None else expr < _keyset_value(expr, value)
+    if value is None:
+        return false()
+    return or_(expr > _keyset_value(expr, value), expr.is_(None))
+
+
+def _keyset_equal(expr: ColumnElement, value: Any) -> ColumnElement:
+    return expr.is_(None) if value is None else expr == _keyset_value(expr, value)
+
+
+def keyset_after(keys: List[KeysetKey], values: List[Any]) -> ColumnElement:
+    """
+    Условие «строка идёт после values» для ORDER BY со смешанными направлениями.
+
+    Раскрывается в OR-цепочку (k0 > v0) OR (k0 = v0 AND k1 > v1) OR ...,
+    т.к. row-value сравнение (a, b) > (x, y) работает только при одинаковом направлении.
+    """
+    if len(keys) != len(values):
+        raise ValueError("Invalid cursor")
+    branches = []
+    for idx, (expr, descending) in enumerate(keys):
+        prefix = [_keyset_equal(keys[i][0], values[i]) for i in range(idx)]
+        branches.append(and_(*prefix, _keyset_after_one(expr, descending, values[idx])))
+    return or_(*branches)
+
+
+async def fetch_keyset_page(
+    db: AsyncSession,
+    query: Select,
+    keys: List[KeysetKey],
+    *,
+    limit: int,
+    cursor_payload: Optional[Dict[str, Any]] = None,
+    skip: int = 0,
+    cursor_state: Optional[Dict[str, Any]] = None,
+) -> Tuple[List[Any], bool, Optional[str]]:
+    """
+    Выполнить страницу ленты с сортировкой keys.
+
+    С курсором — keyset (WHERE после последней строки), без — legacy OFFSET skip.
+    has_more определяется выборкой limit+1 строк, без count(*).
+    cursor_state — доп. поля курсора (sort, опорное время и т.п.), попадают в next_cursor.
+
+    Returns:
+        (items, has_more, next_cursor)
+    """
+    key_columns = [expr.label(f"_keyset_{idx}") for idx, (expr, _) in enumerate(keys)]
+    query = query.add_columns(*key_columns)
+
+    if cursor_payload is not None:
+        query = query.where(keyset_after(keys, cursor_payload["k"]))
+    elif skip:
+        query = query.offset(skip)
+
+    query = query.order_by(*[expr.desc() if descending else expr.asc() for expr, descending in keys])
+    result = await db.execute(query.limit(limit + 1))
+    rows = result.all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    items = [row[0] for row in rows]
+
+    next_cursor = None
+    if has_more and rows:
+        last_values = list(rows[-1][1:])
+        next_cursor = encode_cursor({**(cursor_state or {}), "k": last_values})
+
+    return items, has_more, next_cursor
+
+
+# ===== FULL-TEXT SEARCH =====
+
+# Слова без «_» и пунктуации: всё остальное — операторы tsquery
+_SEARCH_TOKEN_RE = re.compile(r"[^\W_]+", re.UNICODE)
+_SEARCH_MAX_TOKENS = 8
+_TS_CONFIG = literal_column(f"'{SEARCH_TS_CONFIG}'::regconfig")
+
+
+def build_search_tsquery(search: Optional[str]) -> Optional[ColumnElement]:
+    """
+    tsquery для строки поиска: каждое слово — префикс, слова через AND.
+
+    «Лекции по матан» → to_tsquery('russian', 'лекции:* & по:* & матан:*').
+    Русский стеммер применяется и к префиксам, так что «лекции» находит «лекция».
+    None — если в строке нет ни одного слова.
+    """
+    if not search:
+        return None
+    tokens = _SEARCH_TOKEN_RE.findall(search.lower())[:_SEARCH_MAX_TOKENS]
+    if not tokens:
+        return None
+    return func.to_tsquery(_TS_CONFIG, " & ".join(f"{token}:*" for token in tokens))
+
+
+def search_rank(search_vector: ColumnElement, tsquery: ColumnElement) -> ColumnElement:
+    """Релевантность для ORDER BY (ts_rank_cd, нормализация по длине документа)."""
+    return func.ts_rank_cd(search_vector, tsquery, 1, type_=Float)
@@ -1,18 +1,21 @@
 from __future__ import annotations
 
+from collections import Counter
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 import logging
 
-from sqlalchemy import func, or_, select, update as sa_update
+from sqlalchemy import bindparam, func, or_, select, update as sa_update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
 from app import models, schemas
 from app.config import get_settings
+from app.crud.helpers import VIEW_INSERT_CHUNK_ROWS, build_search_tsquery, fetch_keyset_page, search_rank
 from app.crud.users import get_user_by_id
-from app.services import notification_service
+from app.services import feed_cache, inbox_counter, notification_service
 from app.utils import delete_all_media, delete_images, process_base64_images
 
 logger = logging.getLogger(__name__)
@@ -386,12 +389,14 @@ async def create_market_item(
         db.add(db_item)
         await db.commit()
         await db.refresh(db_item)
-        return db_item
     except SQLAlchemyError:
         if saved_images_meta:
             delete_all_media(saved_images_meta)
         raise
 
+    await feed_cache.bump_generation(feed_cache.SCOPE_MARKET)
+    return db_item
+
 
 async def update_market_item(
     db: AsyncSession,
@@ -468,6 +473,7 @@ async def update_market_item(
     if files_to_delete:
         delete_images(files_to_delete)
 
+    await feed_cache.bump_generation(feed_cache.SCOPE_MARKET)
     await db.refresh(db_item)
     return db_item
 
@@ -488,6 +494,7 @@ async def delete_market_item(db: AsyncSession, item_id: int, seller_id: int) ->
     db_item.status = 'archived'
     db_item.pause_reason = None
     await db.commit()
+    await feed_cache.bump_generation(feed_cache.SCOPE_MARKET)
     return True
 
 
@@ -510,6 +517,8 @@ async def get_market_items(
     sort: str = 'newest',
     search: Optional[str] = None,
     current_user_id: Optional[int] = None,
+    cursor_payload: Optional[Dict] = None,
+    include_total: bool = False,
 ) -> Dict:
     query = (
         select(models.MarketItem)
@@ -520,14 +529,9 @@ async def get_market_items(
         )
     )
 
-    if search:
-        search_term = f'%{search}%'
-        query = query.where(
-            or_(
-                models.MarketItem.title.ilike(search_term),
-                models.MarketItem.description.ilike(search_term),
-            )
-        )
+    tsquery = build_search_tsquery(search)
+    if tsquery is not None:
+        query = query.where(models.MarketItem.search_vector.op('@@')(tsquery))
 
     if item_type and item_type in ('product', 'service'):
         query = query.where(models.MarketItem.item_type == item_type)
@@ -560,28 +564,52 @@ async def get_market_items(
     if institute and institute != 'all':
         query = query.where(models.MarketItem.institute == institute)
 
-    total = await db.scalar(select(func.count()).select_from(query.subquery()))
-
-    if sort == 'price_asc':
-        query = query.order_by(models.MarketItem.price.asc())
+    total = None
+    if include_total:
+        total = await db.scalar(select(func.count()).select_from(query.subquery())) or 0
+
+    # Поиск без явной сортировки — по релевантности
+    if tsquery is not None and sort in (None, 'newest'):
+        sort = 'relevance'
+
+    if cursor_payload is not None and cursor_payload.get('s') != sort:
+        raise ValueError('Invalid cursor')
+
+    # id — тай-брейкер: у товаров часто одинаковая цена
+    if sort == 'relevance':
+        keys = [
+            (search_rank(models.MarketItem.search_vector, tsquery), True),
+            (models.MarketItem.created_at, True),
+            (models.MarketItem.id, True),
+        ]
+    elif sort == 'price_asc':
+        keys = [(models.MarketItem.price, False), (models.MarketItem.id, False)]
     elif sort == 'price_desc':
-        query = query.order_by(models.MarketItem.price.desc())
+        keys = [(models.MarketItem.price, True), (models.MarketItem.id, True)]
     elif sort == 'oldest':
-        query = query.order_by(models.MarketItem.created_at.asc())
+        keys = [(models.MarketItem.created_at, False), (models.MarketItem.id, False)]
     else:
-        query = query.order_by(models.MarketItem.created_at.desc())
+        keys = [(models.MarketItem.created_at, True), (models.MarketItem.id, True)]
 
-    result = await db.execute(query.offset(skip).limit(limit))
-    items = result.scalars().all()
+    items, has_more, next_cursor = await fetch_keyset_page(
+        db,
+        query,
+        keys,
+        limit=limit,
+        cursor_payload=cursor_payload,
+        skip=skip,
+        cursor_state={'s': sort},
+    )
 
     return {
         'items': items,
-        'total': total or 0,
-        'has_more': skip + limit < (total or 0),
+        'total': total,
+        'has_more': has_more,
+        'next_cursor': next_cursor,
     }
 
 
-async def get_market_item(db: AsyncSession, item_id: int, user_id: Optional[int] = None) -> Optional[models.MarketItem]:
+async def get_market_item(db: AsyncSession, item_id: int) -> Optional[models.MarketItem]:
     result = await db.execute(
         select(models.MarketItem)
         .options(selectinload(models.MarketItem.seller))
@@ -590,29 +618,53 @@ async def get_market_item(db: AsyncSession, item_id: int, user_id: Optional[int]
             models.MarketItem.is_deleted == False,
         )
     )
-    item = result.scalar_one_or_none()
+    return result.scalar_one_or_none()
 
-    if item and user_id and item.seller_id != user_id:
-        view_check = await db.execute(
-            select(models.MarketItemView).where(
-                models.MarketItemView.item_id == item_id,
-                models.MarketItemView.user_id == user_id,
-            )
+
+async def apply_market_item_views(db: AsyncSession, views: Iterable[Tuple[int, int]]) -> int:
+    """
+    Записать пачку просмотров (item_id, user_id) из буфера view_counter_service.
+
+    ON CONFLICT по unique_market_view — views_count растёт только на новые строки.
+    Пачка пишется кусками по VIEW_INSERT_CHUNK_ROWS, коммит один.
+    """
+    views = sorted(set(views))
+    if not views:
+        return 0
+
+    viewed_at = _utcnow()
+    deltas: Counter = Counter()
+    for start in range(0, len(views), VIEW_INSERT_CHUNK_ROWS):
+        chunk = views[start:start + VIEW_INSERT_CHUNK_ROWS]
+        result = await db.execute(
+            select(models.MarketItem.id).where(models.MarketItem.id.in_({item_id for item_id, _ in chunk}))
         )
-        if not view_check.scalar_one_or_none():
-            try:
-                db.add(models.MarketItemView(item_id=item_id, user_id=user_id))
-                await db.execute(
-                    sa_update(models.MarketItem)
-                    .where(models.MarketItem.id == item_id)
-                    .values(views_count=models.MarketItem.views_count + 1)
-                )
-                await db.commit()
-                await db.refresh(item)
-            except SQLAlchemyError:
-                await db.rollback()
+        existing_ids = set(result.scalars().all())
+        rows = [
+            {'item_id': item_id, 'user_id': user_id, 'viewed_at': viewed_at}
+            for item_id, user_id in chunk
+            if item_id in existing_ids
+        ]
+        if not rows:
+            continue
+        inserted = await db.execute(
+            pg_insert(models.MarketItemView)
+            .values(rows)
+            .on_conflict_do_nothing(constraint='unique_market_view')
+            .returning(models.MarketItemView.item_id)
+        )
+        deltas.update(inserted.scalars().all())
 
-    return item
+    if deltas:
+        items_table = models.MarketItem.__table__
+        await db.execute(
+            sa_update(items_table)
+            .where(items_table.c.id == bindparam('b_item_id'))
+            .values(views_count=func.coalesce(items_table.c.views_count, 0) + bindparam('b_delta')),
+            [{'b_item_id': item_id, 'b_delta': delta} for item_id, delta in deltas.items()],
+        )
+    await db.commit()
+    return sum(deltas.values())
 
 # ===== FAVORITES =====
 
@@ -1376,6 +1428,7 @@ async def create_review(
         )
         .values(is_read=True, read_at=_utcnow())
     )
+    inbox_counter.mark_dirty(db, reviewer_id)
 
     if source == 'app':
         if deal_id:
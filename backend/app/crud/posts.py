@@ -9,15 +9,20 @@
 
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import Float, String, and_, cast, func, or_, select, update as sa_update
+from sqlalchemy import and_, bindparam, cast, func, or_, select, update as sa_update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import selectinload
-from typing import Optional, List, Dict
+from typing import Any, Optional, Iterable, List, Dict, Tuple
+from collections import Counter
 from datetime import datetime, timedelta, timezone
 import logging
 
 from app import models, schemas
-from app.crud.helpers import sanitize_json_field
+from app.crud.helpers import (
+    VIEW_INSERT_CHUNK_ROWS, build_search_tsquery, fetch_keyset_page, sanitize_json_field, search_rank,
+)
 from app.utils import delete_images, delete_all_media, process_base64_images
+from app.services import feed_cache
 from app.services import notification_service as notif
 
 logger = logging.getLogger(__name__)
@@ -40,13 +45,22 @@ async def get_posts(
     sort: str = 'newest',
     current_user_id: Optional[int] = None,
     viewer_city: Optional[str] = None,
-) -> List[models.Post]:
-    """Получение постов с фильтрацией + soft delete + shadow ban"""
+    cursor_payload: Optional[Dict[str, Any]] = None,
+    include_total: bool = False,
+) -> Dict[str, Any]:
+    """
+    Получение постов с фильтрацией + soft delete + shadow ban.
+
+    Пагинация: cursor_payload (из decode_cursor) → keyset, иначе legacy skip.
+    ValueError — если курсор не от этой сортировки.
+    """
+    # Голоса опроса не грузим целиком: голос зрителя подтягивается batch-запросом
+    # в get_posts_viewer_state().
     query = (
         select(models.Post)
         .options(
             selectinload(models.Post.author),
-            selectinload(models.Post.poll).selectinload(models.Poll.votes),
+            selectinload(models.Post.poll),
         )
     )
 
@@ -139,15 +153,10 @@ async def get_posts(
             tag_conditions = [models.Post.tags.op('@>')(cast([tag], JSONB_TYPE)) for tag in tags_list]
             query = query.where(or_(*tag_conditions))
 
-    if search and search.strip():
-        search_term = f'%{search.strip()}%'
-        query = query.where(
-            or_(
-                models.Post.title.ilike(search_term),
-                models.Post.body.ilike(search_term),
-                cast(models.Post.tags, String).ilike(search_term),
-            )
-        )
+    # Полнотекстовый поиск по GIN-индексу (заголовок, теги, текст)
+    tsquery = build_search_tsquery(search)
+    if tsquery is not None:
+        query = query.where(models.Post.search_vector.op('@@')(tsquery))
 
     # Фильтр по дате
     if date_range:
@@ -162,40 +171,72 @@ async def get_posts(
             start_date = now - timedelta(days=30)
             query = query.where(models.Post.created_at >= start_date)
 
-    # Считаем total до добавления ORDER BY и LIMIT
-    count_subq = query.with_only_columns(models.Post.id).subquery()
-    total_count = await db.scalar(select(func.count()).select_from(count_subq)) or 0
+    # total — только по запросу: count(*) по всей ленте дороже самой страницы
+    total_count = None
+    if include_total:
+        count_subq = query.with_only_columns(models.Post.id).subquery()
+        total_count = await db.scalar(select(func.count()).select_from(count_subq)) or 0
+
+    # Поиск без явной сортировки — по релевантности
+    if tsquery is not None and sort in (None, 'newest'):
+        sort = 'relevance'
 
-    # Сортировка: resolved-посты всегда в конце, потом обычная сортировка
+    # Курсор привязан к сортировке: чужой курсор — ошибка, а не «пустая страница»
+    if cursor_payload is not None and cursor_payload.get("s") != sort:
+        raise ValueError("Invalid cursor")
+
+    # Сортировка: resolved-посты всегда в конце, потом обычная сортировка.
+    # Последний ключ — id, чтобы keyset был однозначным.
+    cursor_state = {"s": sort}
+    is_important = func.coalesce(models.Post.is_important, False)
     if sort == 'popular':
-        hours_ago = func.extract('epoch', func.now() - models.Post.created_at) / 3600.0
-        trending_score = cast(models.Post.likes_count, Float) / func.power(hours_ago + 2, 1.5)
-        query = query.order_by(
-            models.Post.is_resolved.asc(),
-            models.Post.is_important.desc(),
-            trending_score.desc(),
-            models.Post.created_at.desc()
-        )
+        # Курсоры старого trending-порядка (с опорным временем) несовместимы с hot_score
+        if cursor_payload is not None and "t" in cursor_payload:
+            raise ValueError("Invalid cursor")
+        # hot_score поддерживает Postgres (см. POST_HOT_SCORE_SQL) — ORDER BY идёт по индексу
+        keys = [
+            (models.Post.is_resolved, False),
+            (is_important, True),
+            (models.Post.hot_score, True),
+            (models.Post.created_at, True),
+            (models.Post.id, True),
+        ]
+    elif sort == 'relevance':
+        keys = [
+            (search_rank(models.Post.search_vector, tsquery), True),
+            (models.Post.created_at, True),
+            (models.Post.id, True),
+        ]
     elif sort == 'discussed':
-        query = query.order_by(
-            models.Post.is_resolved.asc(),
-            models.Post.is_important.desc(),
-            models.Post.comments_count.desc(),
-            models.Post.created_at.desc()
-        )
+        keys = [
+            (models.Post.is_resolved, False),
+            (is_important, True),
+            (func.coalesce(models.Post.comments_count, 0), True),
+            (models.Post.created_at, True),
+            (models.Post.id, True),
+        ]
     else:
-        query = query.order_by(
-            models.Post.is_resolved.asc(),
-            models.Post.is_important.desc(),
-            models.Post.created_at.desc()
-        )
+        keys = [
+            (models.Post.is_resolved, False),
+            (is_important, True),
+            (models.Post.created_at, True),
+            (models.Post.id, True),
+        ]
 
-    result = await db.execute(query.offset(skip).limit(limit))
-    items = result.scalars().all()
+    items, has_more, next_cursor = await fetch_keyset_page(
+        db,
+        query,
+        keys,
+        limit=limit,
+        cursor_payload=cursor_payload,
+        skip=skip,
+        cursor_state=cursor_state,
+    )
     return {
         "items": items,
         "total_count": total_count,
-        "has_more": skip + limit < total_count,
+        "has_more": has_more,
+        "next_cursor": next_cursor,
     }
 
 
@@ -220,7 +261,7 @@ async def get_user_posts(db: AsyncSession, user_id: int, limit: int = 5, offset:
         select(models.Post)
         .options(
             selectinload(models.Post.author),
-            selectinload(models.Post.poll).selectinload(models.Poll.votes),
+            selectinload(models.Post.poll),
         )
         .where(
             models.Post.author_id == user_id,
@@ -291,12 +332,14 @@ async def create_post(
         db.add(db_post)
         await db.commit()
         await db.refresh(db_post)
-        return db_post
     except SQLAlchemyError as e:
         if saved_images_meta:
             delete_all_media(saved_images_meta)
         raise e
 
+    await feed_cache.bump_generation(feed_cache.SCOPE_POSTS)
+    return db_post
+
 
 async def update_post(
     db: AsyncSession,
@@ -345,6 +388,7 @@ async def update_post(
     if files_to_delete:
         delete_images(files_to_delete)
 
+    await feed_cache.bump_generation(feed_cache.SCOPE_POSTS)
     await db.refresh(db_post)
     return db_post
 
@@ -363,42 +407,62 @@ async def delete_post(db: AsyncSession, post_id: int) -> bool:
 
     await db.delete(db_post)
     await db.commit()
+    await feed_cache.bump_generation(feed_cache.SCOPE_POSTS)
     return True
 
 
 # ===== ПРОСМОТРЫ =====
 
-async def increment_post_views(db: AsyncSession, post_id: int, user_id: int):
-    """Увеличить счётчик просмотров поста (уникальные по юзеру)."""
-    # Пропускаем рекламу (у неё свои views в AdPost)
-    ad_check = await db.execute(
-        select(models.AdPost.id).where(models.AdPost.post_id == post_id)
-    )
-    if ad_check.scalar_one_or_none():
-        return
+async def apply_post_views(db: AsyncSession, views: Iterable[Tuple[int, int]]) -> int:
+    """
+    Записать пачку просмотров (post_id, user_id) из буфера view_counter_service.
 
-    view_check = await db.execute(
-        select(models.PostView).where(
-            models.PostView.post_id == post_id,
-            models.PostView.user_id == user_id
-        )
-    )
-    if view_check.scalar_one_or_none():
-        return
+    Уникальность — через ON CONFLICT по unique_post_view: views_count растёт
+    только на реально вставленные строки. Реклама и удалённые посты отбрасываются.
+    Пачка пишется кусками по VIEW_INSERT_CHUNK_ROWS, коммит один.
+    Возвращает число засчитанных просмотров.
+    """
+    views = sorted(set(views))
+    if not views:
+        return 0
 
-    try:
-        new_view = models.PostView(post_id=post_id, user_id=user_id)
-        db.add(new_view)
+    ad_post_ids = select(models.AdPost.post_id).scalar_subquery()
+    viewed_at = datetime.utcnow()
+    deltas: Counter = Counter()
+    for start in range(0, len(views), VIEW_INSERT_CHUNK_ROWS):
+        chunk = views[start:start + VIEW_INSERT_CHUNK_ROWS]
+        result = await db.execute(
+            select(models.Post.id).where(
+                models.Post.id.in_({post_id for post_id, _ in chunk}),
+                ~models.Post.id.in_(ad_post_ids),
+            )
+        )
+        countable_ids = set(result.scalars().all())
+        rows = [
+            {"post_id": post_id, "user_id": user_id, "viewed_at": viewed_at}
+            for post_id, user_id in chunk
+            if post_id in countable_ids
+        ]
+        if not rows:
+            continue
+        inserted = await db.execute(
+            pg_insert(models.PostView)
+            .values(rows)
+            .on_conflict_do_nothing(constraint='unique_post_view')
+            .returning(models.PostView.post_id)
+        )
+        deltas.update(inserted.scalars().all())
 
+    if deltas:
+        posts_table = models.Post.__table__
         await db.execute(
-            sa_update(models.Post)
-            .where(models.Post.id == post_id)
-            .values(views_count=models.Post.views_count + 1)
+            sa_update(posts_table)
+            .where(posts_table.c.id == bindparam('b_post_id'))
+            .values(views_count=func.coalesce(posts_table.c.views_count, 0) + bindparam('b_delta')),
+            [{"b_post_id": post_id, "b_delta": delta} for post_id, delta in deltas.items()],
         )
-
-        await db.commit()
-    except SQLAlchemyError:
-        await db.rollback()
+    await db.commit()
+    return sum(deltas.values())
 
 
 # ===== ЛАЙКИ ПОСТОВ =====
@@ -414,6 +478,43 @@ async def is_post_liked_by_user(db: AsyncSession, post_id: int, user_id: int) ->
     return result.scalar_one_or_none() is not None
 
 
+async def get_posts_viewer_state(
+    db: AsyncSession,
+    posts: List[models.Post],
+    user_id: Optional[int],
+) -> Dict[str, Any]:
+    """
+    Batch-загрузка состояния зрителя для страницы ленты.
+
+    Один IN-запрос на post_likes и один на poll_votes вместо пары запросов на каждый пост.
+    Возвращает {"liked_post_ids": set[int], "poll_votes": {poll_id: [option_indices]}}.
+    """
+    state: Dict[str, Any] = {"liked_post_ids": set(), "poll_votes": {}}
+    if not user_id or not posts:
+        return state
+
+    post_ids = [post.id for post in posts]
+    liked_result = await db.execute(
+        select(models.PostLike.post_id).where(
+            models.PostLike.post_id.in_(post_ids),
+            models.PostLike.user_id == user_id,
+        )
+    )
+    state["liked_post_ids"] = {row[0] for row in liked_result.all()}
+
+    poll_ids = [post.poll.id for post in posts if post.poll is not None]
+    if poll_ids:
+        votes_result = await db.execute(
+            select(models.PollVote.poll_id, models.PollVote.option_indices).where(
+                models.PollVote.poll_id.in_(poll_ids),
+                models.PollVote.user_id == user_id,
+            )
+        )
+        state["poll_votes"] = {poll_id: indices or [] for poll_id, indices in votes_result.all()}
+
+    return state
+
+
 async def toggle_post_like(db: AsyncSession, post_id: int, user_id: int) -> dict:
     """Toggle лайка (добавить или убрать)"""
     result = await db.execute(
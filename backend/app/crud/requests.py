@@ -14,8 +14,9 @@ from typing import Optional, List, Dict
 from datetime import datetime, timedelta, timezone
 
 from app import models, schemas
-from app.crud.helpers import sanitize_json_field
+from app.crud.helpers import build_search_tsquery, fetch_keyset_page, sanitize_json_field, search_rank
 from app.utils import delete_images, get_image_urls, process_base64_images
+from app.services import feed_cache
 from app.services import notification_service as notif
 
 
@@ -70,12 +71,14 @@ async def create_request(
         db.add(db_request)
         await db.commit()
         await db.refresh(db_request)
-        return db_request
     except SQLAlchemyError as e:
         if saved_images_meta:
             delete_images(saved_images_meta)
         raise e
 
+    await feed_cache.bump_generation(feed_cache.SCOPE_REQUESTS)
+    return db_request
+
 
 async def get_requests_feed(
     db: AsyncSession,
@@ -91,8 +94,11 @@ async def get_requests_feed(
     has_reward: Optional[str] = None,
     urgency: Optional[str] = None,
     sort: str = 'newest',
+    search: Optional[str] = None,
+    cursor_payload: Optional[Dict] = None,
+    include_total: bool = False,
 ) -> Dict:
-    """Лента запросов с фильтрацией"""
+    """Лента запросов с фильтрацией (keyset по cursor_payload, иначе offset)"""
     now = datetime.utcnow()
     urgent_threshold = now + timedelta(hours=24)
 
@@ -168,36 +174,66 @@ async def get_requests_feed(
     elif urgency == 'later':
         query = query.where(models.Request.expires_at > urgent_threshold)
 
-    # Total count (subquery)
-    total = await db.scalar(
-        select(func.count()).select_from(query.subquery())
-    )
-
-    # Сортировка
-    if sort == 'expires_soon':
-        query = query.where(models.Request.expires_at > now).order_by(
-            models.Request.expires_at.asc()
-        )
+    tsquery = build_search_tsquery(search)
+    if tsquery is not None:
+        query = query.where(models.Request.search_vector.op('@@')(tsquery))
+
+    total = None
+    if include_total:
+        total = await db.scalar(
+            select(func.count()).select_from(query.subquery())
+        ) or 0
+
+    # Поиск без явной сортировки — по релевантности
+    if tsquery is not None and sort in (None, 'newest'):
+        sort = 'relevance'
+
+    if cursor_payload is not None and cursor_payload.get('s') != sort:
+        raise ValueError('Invalid cursor')
+
+    # Сортировка (id — тай-брейкер для keyset)
+    cursor_state = {'s': sort}
+    if sort == 'relevance':
+        keys = [
+            (search_rank(models.Request.search_vector, tsquery), True),
+            (models.Request.created_at, True),
+            (models.Request.id, True),
+        ]
+    elif sort == 'expires_soon':
+        query = query.where(models.Request.expires_at > now)
+        keys = [
+            (models.Request.expires_at, False),
+            (models.Request.id, False),
+        ]
     elif sort == 'most_responses':
-        query = query.order_by(
-            models.Request.responses_count.desc(),
-            models.Request.created_at.desc()
-        )
+        keys = [
+            (func.coalesce(models.Request.responses_count, 0), True),
+            (models.Request.created_at, True),
+            (models.Request.id, True),
+        ]
     else:
-        query = query.order_by(
-            case(
-                (models.Request.expires_at <= urgent_threshold, 0),
-                else_=1
-            ),
-            case(
-                (models.Request.expires_at <= urgent_threshold, models.Request.expires_at),
-                else_=None
-            ),
-            models.Request.created_at.desc()
-        )
-
-    result = await db.execute(query.offset(offset).limit(limit))
-    requests = result.scalars().all()
+        # Граница «срочных» фиксируется в курсоре, чтобы корзины не съезжали между страницами
+        ref_time = cursor_payload.get('t') if cursor_payload else None
+        if not isinstance(ref_time, datetime):
+            ref_time = now.replace(microsecond=0)
+        cursor_state['t'] = ref_time
+        sort_threshold = ref_time + timedelta(hours=24)
+        keys = [
+            (case((models.Request.expires_at <= sort_threshold, 0), else_=1), False),
+            (case((models.Request.expires_at <= sort_threshold, models.Request.expires_at), else_=None), False),
+            (models.Request.created_at, True),
+            (models.Request.id, True),
+        ]
+
+    requests, has_more, next_cursor = await fetch_keyset_page(
+        db,
+        query,
+        keys,
+        limit=limit,
+        cursor_payload=cursor_payload,
+        skip=offset,
+        cursor_state=cursor_state,
+    )
 
     items = []
     for req in requests:
@@ -226,8 +262,9 @@ async def get_requests_feed(
 
     return {
         'items': items,
-        'total': total or 0,
-        'has_more': offset + limit < (total or 0)
+        'total': total,
+        'has_more': has_more,
+        'next_cursor': next_cursor,
     }
 
 
@@ -303,6 +340,7 @@ async def update_request(db: AsyncSession, request_id: int, user_id: int, data:
 
     request.updated_at = datetime.utcnow()
     await db.commit()
+    await feed_cache.bump_generation(feed_cache.SCOPE_REQUESTS)
     await db.refresh(request)
     return request
 
@@ -325,6 +363,7 @@ async def delete_request(db: AsyncSession, request_id: int, user_id: int) -> boo
     request.status = 'closed'
 
     await db.commit()
+    await feed_cache.bump_generation(feed_cache.SCOPE_REQUESTS)
     return True
 
 
@@ -21,7 +21,6 @@ from app.utils import (
     parse_keep_file_list,
     process_uploaded_files,
 )
-from app.video_utils import process_uploaded_video
 from app.auth_service import decode_authorization_header, require_user, optional_user
 from app.config import get_settings
 from app.rate_limiter import check_rate_limit, close_redis
@@ -30,8 +29,8 @@ from app.time_utils import ensure_utc, normalize_datetime_payload
 import json
 import re
 from pydantic import ValidationError
-from app.routers import dating, moderation, ads, notifications, auth_router, dev_auth_router, analytics
-from app.services import analytics_service, market_expiry_service, notification_service
+from app.routers import dating, moderation, ads, notifications, auth_router, dev_auth_router, analytics, media
+from app.services import ad_counter_service, admin_stats_service, image_engine, analytics_event_buffer, analytics_service, feed_cache, market_expiry_service, notification_service, video_transcode_service, view_counter_service
 import os
 import logging
 from datetime import datetime, timedelta, timezone
@@ -129,7 +128,23 @@ async def _build_poll_response(
         )
         user_vote = user_vote_result.scalar_one_or_none()
 
-    user_votes_indices = user_vote.option_indices if user_vote else []
+    return _serialize_poll(poll, user_vote.option_indices if user_vote else [])
+
+
+def _decode_feed_cursor(cursor: Optional[str]) -> Optional[dict]:
+    """Feed cursor from query string; a malformed cursor is a client error."""
+    try:
+        return crud.decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _serialize_poll(poll: Optional[models.Poll], user_votes_indices: Optional[List[int]] = None) -> Optional[dict]:
+    """Poll payload without DB access; the viewer's vote is resolved by the caller."""
+    if not poll:
+        return None
+
+    user_votes_indices = user_votes_indices or []
     options_data = poll.options or []
     options_response = []
     for opt in options_data:
@@ -170,13 +185,25 @@ async def lifespan(app: FastAPI):
     stop_event = asyncio.Event()
     nightly_task = None
     market_expiry_task = None
+    video_transcode_task = None
     if runtime_settings.analytics_nightly_enabled:
         nightly_task = asyncio.create_task(analytics_service.run_nightly_rebuild_loop(stop_event))
     if runtime_settings.is_prod and runtime_settings.deal_flow_v2_enabled and runtime_settings.market_expiry_worker_enabled:
         market_expiry_task = asyncio.create_task(market_expiry_service.run_market_expiry_loop(stop_event))
+    if runtime_settings.video_transcode_queue_enabled:
+        video_transcode_task = asyncio.create_task(video_transcode_service.run_video_transcode_loop(stop_event))
+    view_flush_task = asyncio.create_task(view_counter_service.run_view_flush_loop(stop_event))
+    analytics_flush_task = asyncio.create_task(analytics_event_buffer.run_analytics_flush_loop(stop_event))
+    admin_stats_task = asyncio.create_task(admin_stats_service.run_admin_stats_refresh_loop(stop_event))
+    ad_counters_task = asyncio.create_task(ad_counter_service.run_ad_counters_flush_loop(stop_event))
     app.state.analytics_stop_event = stop_event
     app.state.analytics_nightly_task = nightly_task
     app.state.market_expiry_task = market_expiry_task
+    app.state.view_flush_task = view_flush_task
+    app.state.analytics_flush_task = analytics_flush_task
+    app.state.admin_stats_task = admin_stats_task
+    app.state.ad_counters_task = ad_counters_task
+    app.state.video_transcode_task = video_transcode_task
     yield
     stop_event.set()
     if nightly_task:
@@ -189,6 +216,29 @@ async def lifespan(app: FastAPI):
             await asyncio.wait_for(market_expiry_task, timeout=5)
         except asyncio.TimeoutError:
             market_expiry_task.cancel()
+    if video_transcode_task:
+        try:
+            await asyncio.wait_for(video_transcode_task, timeout=5)
+        except asyncio.TimeoutError:
+            video_transcode_task.cancel()
+    try:
+        await asyncio.wait_for(admin_stats_task, timeout=5)
+    except asyncio.TimeoutError:
+        admin_stats_task.cancel()
+    # Последний сброс буферов просмотров, рекламы и аналитики — до закрытия пула БД
+    try:
+        await asyncio.wait_for(view_flush_task, timeout=5)
+    except asyncio.TimeoutError:
+        view_flush_task.cancel()
+    try:
+        await asyncio.wait_for(ad_counters_task, timeout=5)
+    except asyncio.TimeoutError:
+        ad_counters_task.cancel()
+    try:
+        await asyncio.wait_for(analytics_flush_task, timeout=5)
+    except asyncio.TimeoutError:
+        analytics_flush_task.cancel()
+    image_engine.shutdown()
     await engine.dispose()
     await close_redis()
     logger.info("Engines disposed")
@@ -212,6 +262,7 @@ app.include_router(moderation.router)
 app.include_router(ads.router)
 app.include_router(notifications.router)
 app.include_router(analytics.router)
+app.include_router(media.router)
 app.include_router(auth_router.router)
 if not settings.is_prod and settings.app_env.lower() == "dev" and settings.dev_auth_enabled:
     app.include_router(dev_auth_router.router)
@@ -247,6 +298,7 @@ PUBLIC_PREFIXES = tuple(public_prefixes)
 PUBLIC_READ_GET_PATTERNS = (
     re.compile(r"^/posts/\d+$"),
     re.compile(r"^/posts/\d+/comments$"),
+    re.compile(r"^/comments/\d+/replies$"),
     re.compile(r"^/api/requests/\d+$"),
     re.compile(r"^/market/\d+$"),
     re.compile(r"^/users/\d+/rating$"),
@@ -396,11 +448,14 @@ async def get_user_posts_endpoint(
         raise HTTPException(status_code=404, detail="User not found")
     
     posts = await crud.get_user_posts(db, user_id, limit, offset)
+    viewer_state = await crud.get_posts_viewer_state(db, posts, user.id if user else None)
+    liked_post_ids = viewer_state["liked_post_ids"]
+    poll_votes = viewer_state["poll_votes"]
     
     result = []
     for post in posts:
         tags = post.tags or []
-        is_liked = await crud.is_post_liked_by_user(db, post.id, user.id) if user else False
+        is_liked = post.id in liked_post_ids
         images = get_image_urls(post.images) if post.images else []
         
         if post.is_anonymous:
@@ -408,7 +463,7 @@ async def get_user_posts_endpoint(
         else:
             author_data = public_user_short(target_user, viewer_id=user.id if user else None)
 
-        poll_response = await _build_poll_response(db, post.poll, user.id if user else None)
+        poll_response = _serialize_poll(post.poll, poll_votes.get(post.poll.id) if post.poll else None)
         
         # === LOGIC FOR AD FIELDS ===
         ad_data = {}
@@ -514,6 +569,8 @@ async def get_posts_feed(
     date_range: Optional[str] = Query(None),      # 'today' | 'week' | 'month'
     sort: Optional[str] = Query('newest'),        # 'newest' | 'popular' | 'discussed'
     viewer_city: Optional[str] = Query(None),     # Город просматривающего (для scope='city')
+    cursor: Optional[str] = Query(None),          # next_cursor предыдущей страницы (вместо skip)
+    include_total: bool = Query(False),           # count(*) только по запросу
 
     user: Optional[models.User] = Depends(optional_user),
     db: AsyncSession = Depends(get_db)
@@ -531,28 +588,51 @@ async def get_posts_feed(
             properties_json={"surface": "posts_feed"},
         )
 
+    cursor_payload = _decode_feed_cursor(cursor)
+
+    # Анонимная лента одинакова для всех — отдаём из Redis, если есть
+    cache_entry = None
+    if user is None:
+        cache_entry = await feed_cache.lookup("posts_feed", feed_cache.SCOPE_POSTS, {
+            "skip": skip, "limit": limit, "category": category, "university": university,
+            "institute": institute, "campus_id": campus_id, "city": city, "tags": tags,
+            "search": search, "date_range": date_range, "sort": sort, "viewer_city": viewer_city,
+            "cursor": cursor, "include_total": include_total,
+        })
+        if cache_entry and cache_entry.hit:
+            return cache_entry.payload
+
     # Pass all filter params into CRUD
-    posts_data = await crud.get_posts(
-        db,
-        skip=skip,
-        limit=limit,
-        category=category,
-        university=university,
-        institute=institute,
-        campus_id=campus_id,
-        city=city,
-        tags=tags,
-        search=search,
-        date_range=date_range,
-        sort=sort,
-        current_user_id=current_user_id,
-        viewer_city=viewer_city,
-    )
+    try:
+        posts_data = await crud.get_posts(
+            db,
+            skip=skip,
+            limit=limit,
+            category=category,
+            university=university,
+            institute=institute,
+            campus_id=campus_id,
+            city=city,
+            tags=tags,
+            search=search,
+            date_range=date_range,
+            sort=sort,
+            current_user_id=current_user_id,
+            viewer_city=viewer_city,
+            cursor_payload=cursor_payload,
+            include_total=include_total,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    viewer_state = await crud.get_posts_viewer_state(db, posts_data["items"], current_user_id)
+    liked_post_ids = viewer_state["liked_post_ids"]
+    poll_votes = viewer_state["poll_votes"]
 
     result = []
     for post in posts_data["items"]:
         tags = post.tags or []
-        is_liked = await crud.is_post_liked_by_user(db, post.id, user.id) if user else False
+        is_liked = post.id in liked_post_ids
         images = get_image_urls(post.images) if post.images else []
 
         author_id_data = post.author_id if post.is_anonymous else post.author_id
@@ -562,7 +642,7 @@ async def get_posts_feed(
         else:
             author_data = public_user_short(post.author, viewer_id=user.id if user else None)
 
-        poll_response = await _build_poll_response(db, post.poll, user.id if user else None)
+        poll_response = _serialize_poll(post.poll, poll_votes.get(post.poll.id) if post.poll else None)
 
         post_dict = {
             "id": post.id,
@@ -601,12 +681,15 @@ async def get_posts_feed(
         }
         result.append(post_dict)
 
-    return normalize_datetime_payload({
+    payload = normalize_datetime_payload({
         "items": result,
         "total": len(result),
         "total_count": posts_data["total_count"],
         "has_more": posts_data["has_more"],
+        "next_cursor": posts_data["next_cursor"],
     })
+    await feed_cache.store(cache_entry, payload)
+    return payload
 
 @app.post("/posts/create", response_model=schemas.PostResponse)
 async def create_post_endpoint(
@@ -741,9 +824,10 @@ async def create_post_endpoint(
         # valid_images instead of images
         images_meta = await process_uploaded_files(valid_images) if valid_images else []
         if valid_video:
-            video_meta = await process_uploaded_video(valid_video)
+            video_meta = await video_transcode_service.prepare_video(db, valid_video, user.id)
             images_meta.append(video_meta)
         post = await crud.create_post(db, post_data, user.id, images_meta=images_meta)
+        await video_transcode_service.attach_pending(db, images_meta, "post", post.id)
         
         if poll_data:
             try:
@@ -778,7 +862,7 @@ async def get_post_endpoint(
         raise HTTPException(status_code=404, detail="Post not found")
     
     if user:
-        await crud.increment_post_views(db, post_id, user.id)
+        view_counter_service.record_post_view(post_id, user.id)
         await analytics_service.record_server_event(
             db,
             user.id,
@@ -972,7 +1056,7 @@ async def update_post_endpoint(
 
         # Если загружено новое видео — добавляем его; старое удалится в merge_images
         if valid_new_video:
-            video_meta = await process_uploaded_video(valid_new_video)
+            video_meta = await video_transcode_service.prepare_video(db, valid_new_video, user.id)
             new_images_meta.append(video_meta)
 
         # keep_video=False + нет нового видео → merge_images удалит старое само
@@ -982,6 +1066,7 @@ async def update_post_endpoint(
             keep_filenames=keep_images_list,
             keep_video=keep_video if not valid_new_video else False,
         )
+        await video_transcode_service.attach_pending(db, new_images_meta, "post", updated_post.id)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     
@@ -1021,61 +1106,114 @@ async def vote_poll_endpoint(
 
 # ===== COMMENT ENDPOINTS =====
 
+def _serialize_comment(comment: models.Comment, user: Optional[models.User]) -> dict:
+    author_data = None
+    author_id_data = comment.author_id
+
+    if comment.is_anonymous:
+        if comment.anonymous_index == 0 or comment.anonymous_index is None:
+            author_name = "Автор"
+        else:
+            author_name = f"Аноним #{comment.anonymous_index}"
+
+        author_data = {
+            "name": author_name,
+            "id": None,
+            "telegram_id": None,
+            "avatar": None,
+            "university": None,
+            "institute": None,
+            "course": None
+        }
+        author_id_data = comment.author_id
+    else:
+        if comment.author:
+            short = public_user_short(
+                comment.author,
+                viewer_id=user.id if user else None,
+            )
+            author_data = short.model_dump() if short else None
+
+    comment_dict = {
+        "id": comment.id,
+        "post_id": comment.post_id,
+        "author_id": author_id_data,
+        "author": author_data,
+        "body": comment.body,
+        "parent_id": comment.parent_id,
+        "is_anonymous": comment.is_anonymous,
+        "anonymous_index": comment.anonymous_index,
+        "is_deleted": comment.is_deleted,
+        "likes": comment.likes_count,
+        "is_liked": comment.is_liked,
+        "images": get_image_urls(comment.images) if comment.images else [],
+        "created_at": comment.created_at
+    }
+    if comment.parent_id is None and hasattr(comment, "replies_count"):
+        comment_dict["replies_count"] = comment.replies_count
+        comment_dict["replies_cursor"] = comment.replies_cursor
+    return comment_dict
+
+
 @app.get("/posts/{post_id}/comments", response_model=schemas.CommentsFeedResponse)
 async def get_post_comments_endpoint(
     post_id: int,
+    limit: int = Query(crud.COMMENTS_PAGE_SIZE, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+    replies_limit: int = Query(crud.COMMENT_REPLIES_PREVIEW, ge=1, le=20),
     user: Optional[models.User] = Depends(optional_user),
     db: AsyncSession = Depends(get_db)
 ):
-    comments = await crud.get_post_comments(db, post_id, user.id if user else None)
-    
-    result = []
-    for comment in comments:
-        author_data = None
-        author_id_data = comment.author_id
-        
-        if comment.is_anonymous:
-            if comment.anonymous_index == 0 or comment.anonymous_index is None:
-                author_name = "Автор"
-            else:
-                author_name = f"Аноним #{comment.anonymous_index}"
-            
-            author_data = {
-                "name": author_name,
-                "id": None,
-                "telegram_id": None,
-                "avatar": None,
-                "university": None,
-                "institute": None,
-                "course": None
-            }
-            author_id_data = comment.author_id
-        else:
-            if comment.author:
-                short = public_user_short(
-                    comment.author,
-                    viewer_id=user.id if user else None,
-                )
-                author_data = short.model_dump() if short else None
-
-        comment_dict = {
-            "id": comment.id,
-            "post_id": comment.post_id,
-            "author_id": author_id_data,
-            "author": author_data,
-            "body": comment.body,
-            "parent_id": comment.parent_id,
-            "is_anonymous": comment.is_anonymous,
-            "anonymous_index": comment.anonymous_index,
-            "is_deleted": comment.is_deleted,
-            "likes": comment.likes_count,
-            "is_liked": comment.is_liked,
-            "images": get_image_urls(comment.images) if comment.images else [],
-            "created_at": comment.created_at
-        }
-        result.append(comment_dict)
-    
-    return normalize_datetime_payload({"items": result, "total": len(result)})
+    """Страница корневых комментариев (next_cursor) и первые replies_limit ответов каждой ветки."""
+    cursor_payload = _decode_feed_cursor(cursor)
+    try:
+        comments, has_more, next_cursor = await crud.get_post_comments(
+            db,
+            post_id,
+            user.id if user else None,
+            limit=limit,
+            cursor_payload=cursor_payload,
+            replies_limit=replies_limit,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    result = [_serialize_comment(comment, user) for comment in comments]
+    return normalize_datetime_payload({
+        "items": result,
+        "has_more": has_more,
+        "next_cursor": next_cursor,
+    })
+
+
+@app.get("/comments/{comment_id}/replies", response_model=schemas.CommentsFeedResponse)
+async def get_comment_replies_endpoint(
+    comment_id: int,
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(crud.COMMENTS_PAGE_SIZE, ge=1, le=100),
+    user: Optional[models.User] = Depends(optional_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Следующие ответы ветки: cursor — replies_cursor корня или next_cursor прошлой страницы."""
+    cursor_payload = _decode_feed_cursor(cursor)
+    try:
+        page = await crud.get_comment_replies(
+            db,
+            comment_id,
+            user.id if user else None,
+            limit=limit,
+            cursor_payload=cursor_payload,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if page is None:
+        raise HTTPException(status_code=404, detail="Comment not found")
+    replies, has_more, next_cursor = page
+    result = [_serialize_comment(reply, user) for reply in replies]
+    return normalize_datetime_payload({
+        "items": result,
+        "has_more": has_more,
+        "next_cursor": next_cursor,
+    })
 
 @app.post("/posts/{post_id}/comments", response_model=schemas.CommentResponse)
 async def create_comment_endpoint(
@@ -1326,6 +1464,9 @@ async def get_requests_feed_endpoint(
     has_reward: Optional[str] = Query(None),      # 'with' | 'without'
     urgency: Optional[str] = Query(None),         # 'soon' (<24h) | 'later'
     sort: Optional[str] = Query('newest'),        # 'newest' | 'expires_soon' | 'most_responses'
+    search: Optional[str] = Query(None),          # полнотекстовый поиск (при sort=newest — по релевантности)
+    cursor: Optional[str] = Query(None),          # next_cursor предыдущей страницы (вместо offset)
+    include_total: bool = Query(False),
 
     user: Optional[models.User] = Depends(optional_user),
     db: AsyncSession = Depends(get_db)
@@ -1334,22 +1475,41 @@ async def get_requests_feed_endpoint(
     await check_rate_limit(request, "feed_requests", limit=60, window_sec=60)
     current_user_id = user.id if user else None
 
+    cursor_payload = _decode_feed_cursor(cursor)
+
+    cache_entry = None
+    if user is None:
+        cache_entry = await feed_cache.lookup("requests_feed", feed_cache.SCOPE_REQUESTS, {
+            "category": category, "limit": limit, "offset": offset, "university": university,
+            "institute": institute, "campus_id": campus_id, "city": city, "status": status,
+            "has_reward": has_reward, "urgency": urgency, "sort": sort, "search": search,
+            "cursor": cursor, "include_total": include_total,
+        })
+        if cache_entry and cache_entry.hit:
+            return cache_entry.payload
+
     # Pass all filter params into CRUD
-    feed_data = await crud.get_requests_feed(
-        db, 
-        category, 
-        limit, 
-        offset, 
-        current_user_id,
-        university=university,
-        institute=institute,
-        campus_id=campus_id,
-        city=city,
-        status=status,
-        has_reward=has_reward,
-        urgency=urgency,
-        sort=sort
-    )
+    try:
+        feed_data = await crud.get_requests_feed(
+            db,
+            category,
+            limit,
+            offset,
+            current_user_id,
+            university=university,
+            institute=institute,
+            campus_id=campus_id,
+            city=city,
+            status=status,
+            has_reward=has_reward,
+            urgency=urgency,
+            sort=sort,
+            search=search,
+            cursor_payload=cursor_payload,
+            include_total=include_total,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     items = []
     for req_dict in feed_data['items']:
@@ -1377,11 +1537,14 @@ async def get_requests_feed_endpoint(
             images=req_dict.get('images', [])
         ))
 
-    return schemas.RequestsFeedResponse(
+    response = schemas.RequestsFeedResponse(
         items=items,
         total=feed_data['total'],
-        has_more=feed_data['has_more']
+        has_more=feed_data['has_more'],
+        next_cursor=feed_data['next_cursor'],
     )
+    await feed_cache.store(cache_entry, response)
+    return response
 
 @app.get("/api/requests/my-items", response_model=List[schemas.RequestResponse])
 async def get_my_requests_endpoint(
@@ -1668,7 +1831,14 @@ async def get_market_categories_endpoint(
     item_type: Optional[str] = Query(None),
     db: AsyncSession = Depends(get_db)
 ):
-    return await crud.get_market_categories(db, item_type=item_type)
+    # Ответ не зависит от пользователя — кэшируем для всех
+    cache_entry = await feed_cache.lookup("market_categories", feed_cache.SCOPE_MARKET, {"item_type": item_type})
+    if cache_entry and cache_entry.hit:
+        return cache_entry.payload
+
+    categories = await crud.get_market_categories(db, item_type=item_type)
+    await feed_cache.store(cache_entry, categories)
+    return categories
 
 @app.get("/market/feed", response_model=schemas.MarketFeedResponse)
 async def get_market_feed_endpoint(
@@ -1686,29 +1856,48 @@ async def get_market_feed_endpoint(
     institute: Optional[str] = Query(None),
     campus_id: Optional[str] = Query(None),
     city: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None),
+    include_total: bool = Query(False),
     user: Optional[models.User] = Depends(optional_user),
     db: AsyncSession = Depends(get_db)
 ):
     await check_rate_limit(request, "feed_market", limit=60, window_sec=60)
     current_user_id = user.id if user else None
+    cursor_payload = _decode_feed_cursor(cursor)
+
+    cache_entry = None
+    if user is None:
+        cache_entry = await feed_cache.lookup("market_feed", feed_cache.SCOPE_MARKET, {
+            "skip": skip, "limit": limit, "category": category, "item_type": item_type, "sort": sort,
+            "search": search, "price_min": price_min, "price_max": price_max, "condition": condition,
+            "university": university, "institute": institute, "campus_id": campus_id, "city": city,
+            "cursor": cursor, "include_total": include_total,
+        })
+        if cache_entry and cache_entry.hit:
+            return cache_entry.payload
 
-    feed_data = await crud.get_market_items(
-        db,
-        skip=skip,
-        limit=limit,
-        category=category,
-        item_type=item_type,
-        sort=sort,
-        search=search,
-        price_min=price_min,
-        price_max=price_max,
-        condition=condition,
-        university=university,
-        institute=institute,
-        campus_id=campus_id,
-        city=city,
-        current_user_id=current_user_id
-    )
+    try:
+        feed_data = await crud.get_market_items(
+            db,
+            skip=skip,
+            limit=limit,
+            category=category,
+            item_type=item_type,
+            sort=sort,
+            search=search,
+            price_min=price_min,
+            price_max=price_max,
+            condition=condition,
+            university=university,
+            institute=institute,
+            campus_id=campus_id,
+            city=city,
+            current_user_id=current_user_id,
+            cursor_payload=cursor_payload,
+            include_total=include_total,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     items = []
     for item in feed_data['items']:
@@ -1750,11 +1939,14 @@ async def get_market_feed_endpoint(
         }
         items.append(item_dict)
     
-    return normalize_datetime_payload({
+    payload = normalize_datetime_payload({
         "items": items,
         "total": feed_data['total'],
-        "has_more": feed_data['has_more']
+        "has_more": feed_data['has_more'],
+        "next_cursor": feed_data['next_cursor'],
     })
+    await feed_cache.store(cache_entry, payload)
+    return payload
 
 @app.get("/market/favorites", response_model=List[schemas.MarketItemResponse])
 async def get_market_favorites_endpoint(
@@ -1855,7 +2047,7 @@ async def get_market_item_endpoint(
     user: Optional[models.User] = Depends(optional_user),
     db: AsyncSession = Depends(get_db)
 ):
-    item = await crud.get_market_item(db, item_id, user.id if user else None)
+    item = await crud.get_market_item(db, item_id)
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
     if item.status == 'archived':
@@ -1877,6 +2069,9 @@ async def get_market_item_endpoint(
         if not can_view_hidden:
             raise HTTPException(status_code=404, detail="Item not found")
 
+    if user and item.seller_id != user.id:
+        view_counter_service.record_market_item_view(item.id, user.id)
+
     if user:
         await analytics_service.record_server_event(
             db,
@@ -2258,9 +2453,10 @@ async def create_market_item_endpoint(
     try:
         images_meta = await process_uploaded_files(valid_images) if valid_images else []
         if valid_video:
-            video_meta = await process_uploaded_video(valid_video)
+            video_meta = await video_transcode_service.prepare_video(db, valid_video, user.id)
             images_meta.append(video_meta)
         item = await crud.create_market_item(db, item_data, user.id, images_meta=images_meta)
+        await video_transcode_service.attach_pending(db, images_meta, "market_item", item.id)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -2350,7 +2546,7 @@ async def update_market_item_endpoint(
     try:
         new_images_meta = await process_uploaded_files(valid_new_images) if valid_new_images else []
         if valid_new_video:
-            video_meta = await process_uploaded_video(valid_new_video)
+            video_meta = await video_transcode_service.prepare_video(db, valid_new_video, user.id)
             new_images_meta.append(video_meta)
         updated_item = await crud.update_market_item(
             db, item_id, user.id, item_update,
@@ -2358,6 +2554,8 @@ async def update_market_item_endpoint(
             keep_filenames=keep_images_list,
             keep_video=keep_video if not valid_new_video else False,
         )
+        if updated_item:
+            await video_transcode_service.attach_pending(db, new_images_meta, "market_item", updated_item.id)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     
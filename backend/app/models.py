@@ -4,13 +4,43 @@
 # ✅ Фаза 1.3: MarketItem.institute → nullable=True
 # ✅ Фаза 1.4: JSON (Text) → JSONB для всех JSON-полей
 
-from sqlalchemy import Column, Integer, BigInteger, String, Text, Boolean, DateTime, Date, Float, ForeignKey, Enum, CheckConstraint, UniqueConstraint, Index, text as sa_text
-from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Computed, Integer, BigInteger, String, Text, Boolean, DateTime, Date, Float, ForeignKey, Enum, CheckConstraint, UniqueConstraint, Index, text as sa_text
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
+from sqlalchemy.orm import deferred, relationship
 from datetime import datetime, timezone 
 from .database import Base
 
 
+# ===== ПОЛНОТЕКСТОВЫЙ ПОИСК =====
+# Генерируемые tsvector-колонки (русская морфология) + GIN-индексы.
+# Веса: A — заголовок, B — теги, C — текст. Те же выражения — в миграции 021.
+SEARCH_TS_CONFIG = 'russian'
+
+POST_SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('russian', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(tags::text, '')), 'B') || "
+    "setweight(to_tsvector('russian', coalesce(body, '')), 'C')"
+)
+REQUEST_SEARCH_VECTOR_SQL = POST_SEARCH_VECTOR_SQL
+MARKET_ITEM_SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('russian', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(description, '')), 'C')"
+)
+
+# ===== TRENDING (sort=popular) =====
+# hot_score = ln(1 + лайки) + created_at / T, где T = период полураспада / ln 2.
+# Экспоненциальное затухание с половиной веса за POST_HOT_HALF_LIFE_HOURS:
+# «сдвиг» ln 2 на каждый период одинаков для всех постов, поэтому порядок
+# не зависит от момента запроса и пересчитывать score по таймеру не нужно —
+# его пишет сам Postgres при каждом изменении likes_count.
+# То же выражение — в миграции 023.
+POST_HOT_HALF_LIFE_HOURS = 12
+POST_HOT_SCORE_SQL = (
+    "ln(1 + greatest(coalesce(likes_count, 0), 0)::double precision) + "
+    "coalesce(extract(epoch from created_at)::double precision, 0) / 62324.43"  # 12 * 3600 / ln 2
+)
+
+
 class User(Base):
     __tablename__ = 'users'
     
@@ -225,6 +255,8 @@ class Post(Base):
     likes_count = Column(Integer, default=0)
     comments_count = Column(Integer, default=0)
     views_count = Column(Integer, default=0)
+    # Последний выданный номер «Аноним #N» в комментариях (см. CommentAnonymousIndex)
+    anonymous_comment_seq = Column(Integer, default=0, nullable=False, server_default='0')
     
     created_at = Column(DateTime, default=lambda: datetime.utcnow(), index=True)
     updated_at = Column(DateTime, default=lambda: datetime.utcnow(), onupdate=lambda: datetime.utcnow())
@@ -234,10 +266,35 @@ class Post(Base):
     comments = relationship('Comment', back_populates='post', cascade='all, delete-orphan')
     poll = relationship("Poll", back_populates="post", uselist=False, cascade="all, delete-orphan")
 
+    # Полнотекстовый поиск (пишет сам Postgres, в ORM-объекты не грузим)
+    search_vector = deferred(Column(TSVECTOR, Computed(POST_SEARCH_VECTOR_SQL, persisted=True)))
+    # Trending-score для sort=popular (тоже пишет Postgres)
+    hot_score = deferred(Column(Float, Computed(POST_HOT_SCORE_SQL, persisted=True)))
+
     # ✅ Фаза 1.2: Составные индексы
     __table_args__ = (
         Index('ix_post_author_deleted', 'author_id', 'is_deleted'),
         Index('ix_post_category_deleted_created', 'category', 'is_deleted', 'created_at'),
+        Index('ix_posts_search_vector', 'search_vector', postgresql_using='gin'),
+        # Порядок ключей = ORDER BY ленты в crud.posts.get_posts (popular / discussed)
+        Index(
+            'ix_posts_feed_popular',
+            'is_resolved',
+            sa_text('coalesce(is_important, false) DESC'),
+            sa_text('hot_score DESC'),
+            sa_text('created_at DESC'),
+            sa_text('id DESC'),
+            postgresql_where=sa_text('is_deleted = false'),
+        ),
+        Index(
+            'ix_posts_feed_discussed',
+            'is_resolved',
+            sa_text('coalesce(is_important, false) DESC'),
+            sa_text('coalesce(comments_count, 0) DESC'),
+            sa_text('created_at DESC'),
+            sa_text('id DESC'),
+            postgresql_where=sa_text('is_deleted = false'),
+        ),
     )
 
 
@@ -348,10 +405,13 @@ class Request(Base):
     author = relationship('User', foreign_keys=[author_id], back_populates='requests')
     responses = relationship('RequestResponse', back_populates='request', cascade='all, delete-orphan')
 
+    search_vector = deferred(Column(TSVECTOR, Computed(REQUEST_SEARCH_VECTOR_SQL, persisted=True)))
+
     # ✅ Фаза 1.2: Составные индексы
     __table_args__ = (
         Index('ix_request_author_status', 'author_id', 'status'),
         Index('ix_request_status_expires', 'status', 'expires_at'),
+        Index('ix_requests_search_vector', 'search_vector', postgresql_using='gin'),
     )
 
 
@@ -415,6 +475,8 @@ class Comment(Base):
     post_id = Column(Integer, ForeignKey('posts.id', ondelete='CASCADE'), nullable=False)
     author_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     parent_id = Column(Integer, ForeignKey('comments.id', ondelete='CASCADE'), nullable=True)
+    # Корневой комментарий ветки (для ответов любой глубины); у корня — NULL
+    thread_root_id = Column(Integer, ForeignKey('comments.id', ondelete='CASCADE'), nullable=True)
     body = Column(Text, nullable=False)
     images = Column(JSONB, nullable=False, default=list)
     
@@ -441,9 +503,21 @@ class Comment(Base):
     # ✅ Фаза 1.2: Составной индекс
     __table_args__ = (
         Index('ix_comment_post_created', 'post_id', 'created_at'),
+        # Страницы корневых комментариев и ответов ветки — keyset по (created_at, id)
+        Index('ix_comments_post_roots', 'post_id', 'created_at', 'id', postgresql_where=sa_text('parent_id IS NULL')),
+        Index('ix_comments_thread', 'thread_root_id', 'created_at', 'id'),
     )
 
 
+class CommentAnonymousIndex(Base):
+    """Номер «Аноним #N» автора в комментариях поста — выдаётся один раз через posts.anonymous_comment_seq"""
+    __tablename__ = 'comment_anonymous_indexes'
+
+    post_id = Column(Integer, ForeignKey('posts.id', ondelete='CASCADE'), primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    anonymous_index = Column(Integer, nullable=False)
+
+
 class CommentLike(Base):
     """Лайки для комментариев"""
     __tablename__ = 'comment_likes'
@@ -553,10 +627,13 @@ class MarketItem(Base):
     leads = relationship('MarketLead', back_populates='item', cascade='all, delete-orphan')
     deals = relationship('MarketDeal', back_populates='item', cascade='all, delete-orphan')
 
+    search_vector = deferred(Column(TSVECTOR, Computed(MARKET_ITEM_SEARCH_VECTOR_SQL, persisted=True)))
+
     # ✅ Фаза 1.2: Составные индексы
     __table_args__ = (
         Index('ix_market_seller_status', 'seller_id', 'status'),
         Index('ix_market_status_deleted_created', 'status', 'is_deleted', 'created_at'),
+        Index('ix_market_items_search_vector', 'search_vector', postgresql_using='gin'),
     )
 
 
@@ -1033,6 +1110,8 @@ class AdClick(Base):
 
     __table_args__ = (
         Index('ix_ad_click_ad_user', 'ad_post_id', 'user_id'),
+        # Ключ записи из ads:pending:clicks — повторный сброс пачки не дублирует клики
+        UniqueConstraint('ad_post_id', 'user_id', 'clicked_at', name='unique_ad_click'),
     )
 
 
@@ -1116,6 +1195,18 @@ class AnalyticsDailyMetric(Base):
     )
 
 
+class AnalyticsDailyModuleUser(Base):
+    """
+    Distinct users per MSK day and module for the online_time_daily rollup.
+    Window-wide unique users are counted over these rows instead of raw events.
+    """
+    __tablename__ = 'analytics_daily_module_users'
+
+    date_msk = Column(Date, primary_key=True)
+    module = Column(String(32), primary_key=True)
+    user_hash = Column(String(64), primary_key=True)
+
+
 # ========================================
 # УВЕДОМЛЕНИЯ (NOTIFICATIONS)
 # ========================================
@@ -1155,9 +1246,12 @@ class Notification(Base):
     type = Column(String(50), nullable=False, index=True)
     payload = Column(Text, nullable=False)
 
+    # pending → sending (выдано боту через /queue/claim) → sent | failed | skipped
     status = Column(String(20), default='pending', nullable=False, index=True)
     sent_at = Column(DateTime, nullable=True)
     error = Column(String(500), nullable=True)
+    # Время выдачи боту; протухшую аренду (бот упал до ack) выдаём повторно
+    claimed_at = Column(DateTime, nullable=True)
 
     is_read = Column(Boolean, default=False, nullable=False, server_default='false')
     read_at = Column(DateTime, nullable=True)
@@ -1198,3 +1292,35 @@ class Followup(Base):
         Index('ix_followup_scheduled', 'status', 'scheduled_at'),
         Index('ix_followup_target', 'target_type', 'target_id', 'user_id'),
     )
+
+
+class VideoTranscodeJob(Base):
+    """Очередь перекодирования загруженных видео (services/video_transcode_service)"""
+    __tablename__ = 'video_transcode_jobs'
+
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+
+    # Сырой файл загрузки в UPLOADS_DIR/.incoming — удаляется после обработки
+    source_path = Column(String(500), nullable=False)
+
+    # Куда подставить результат: 'post' | 'market_item'. Пока не задано — задачу не берём
+    target_type = Column(String(30), nullable=True)
+    target_id = Column(Integer, nullable=True)
+
+    # pending → processing → done | failed
+    status = Column(String(20), default='pending', nullable=False)
+    progress = Column(Integer, default=0, nullable=False, server_default='0')
+    attempts = Column(Integer, default=0, nullable=False, server_default='0')
+    error = Column(String(500), nullable=True)
+    result = Column(JSONB, nullable=True)  # ImageMeta готового видео
+
+    # Время выдачи воркеру; протухшую аренду (воркер упал) выдаём повторно
+    claimed_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=lambda: datetime.utcnow())
+    updated_at = Column(DateTime, default=lambda: datetime.utcnow(), onupdate=lambda: datetime.utcnow())
+
+    __table_args__ = (
+        Index('ix_video_jobs_status_created', 'status', 'created_at'),
+        Index('ix_video_jobs_target', 'target_type', 'target_id'),
+    )
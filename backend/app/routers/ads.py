@@ -12,7 +12,8 @@ from app import crud, schemas, models
 from pydantic import ValidationError
 from sqlalchemy.exc import SQLAlchemyError
 from app.config import get_settings
-from app.time_utils import normalize_datetime_payload, to_iso_z
+from app.time_utils import normalize_datetime_payload
+from app.services import ad_counter_service, ad_serving
 from app.services.analytics_service import record_server_event
 from app.utils import process_uploaded_files, delete_images, get_image_urls
 
@@ -265,42 +266,26 @@ async def get_ads_for_feed(
     db: AsyncSession = Depends(get_db),
 ):
     is_dev = get_settings().app_env.lower() == "dev"
-    ads = await crud.get_active_ads_for_user(
-        db=db,
-        user_university=user.university,
-        user_city=None,
-        limit=limit,
-        exclude_seen_by_user_id=None if is_dev else user.id,
-        include_all_for_dev=is_dev,
-    )
+    result = None
+    if not is_dev:
+        result = await ad_serving.get_ads_for_user(
+            db,
+            user.id,
+            user_university=user.university,
+            user_city=None,
+            limit=limit,
+        )
 
-    result = []
-    for ad in ads:
-        post = ad.post
-        images_raw = get_image_urls(post.images) if post and post.images else []
-
-        result.append({
-            'ad_id': ad.id,
-            'post_id': post.id,
-            'title': post.title,
-            'body': post.body,
-            'images': images_raw,
-            'author': {
-                'id': post.author.id if post.author else None,
-                'name': ad.advertiser_name,
-                'avatar': ad.advertiser_logo,
-                'university': post.author.university if post.author else None,
-            },
-            'advertiser_name': ad.advertiser_name,
-            'advertiser_logo': ad.advertiser_logo,
-            'cta_text': ad.cta_text,
-            'cta_url': ad.cta_url,
-            'is_ad': True,
-            'created_at': to_iso_z(post.created_at),
-            'likes_count': post.likes_count,
-            'comments_count': post.comments_count,
-            'views_count': post.views_count,
-        })
+    if result is None:
+        ads = await crud.get_active_ads_for_user(
+            db=db,
+            user_university=user.university,
+            user_city=None,
+            limit=limit,
+            exclude_seen_by_user_id=None if is_dev else user.id,
+            include_all_for_dev=is_dev,
+        )
+        result = [ad_serving.serialize_ad(ad) for ad in ads]
 
     return normalize_datetime_payload(result)
 
@@ -316,7 +301,9 @@ async def track_impression(
     user: models.User = Depends(require_user),
     db: AsyncSession = Depends(get_db),
 ):
-    success = await crud.track_ad_impression(db, ad_id, user.id)
+    success = await ad_counter_service.record_impression(db, ad_id, user.id)
+    if success is None:
+        success = await crud.track_ad_impression(db, ad_id, user.id)
     if success:
         await record_server_event(
             db,
@@ -334,7 +321,9 @@ async def track_click(
     user: models.User = Depends(require_user),
     db: AsyncSession = Depends(get_db),
 ):
-    success = await crud.track_ad_click(db, ad_id, user.id)
+    success = await ad_counter_service.record_click(db, ad_id, user.id)
+    if success is None:
+        success = await crud.track_ad_click(db, ad_id, user.id)
     if success:
         await record_server_event(
             db,
@@ -336,23 +336,19 @@ async def get_likes_received(
     user: models.User = Depends(require_user),
     db: AsyncSession = Depends(get_db),
 ):
-    from app.services.dating_scoring import (
-        _parse_json_safe, _determine_match_reason, get_match_reason_label,
-        WEIGHT_SAME_UNIVERSITY, WEIGHT_SAME_INSTITUTE
-    )
+    from app.services.dating_scoring import MatchContext, describe_match, get_match_reason_label
 
     users = await crud.get_who_liked_me(db, user.id, limit, offset)
+    profiles = await crud.get_dating_profiles_by_user_ids(db, [u.id for u in users])
 
-    # Загружаем свой профиль один раз для вычисления совместимости
+    # Свой профиль и нормализованные интересы/цели — один раз на страницу
     my_profile = await crud.get_dating_profile(db, user.id)
-    my_interests = set(
-        i.lower().strip() for i in _parse_json_safe(user.interests)
-    )
+    context = MatchContext(user, my_profile)
 
     result = []
 
     for u in users:
-        dp = await crud.get_dating_profile(db, u.id)
+        dp = profiles.get(u.id)
         photos = get_image_urls(dp.photos) if (dp and dp.photos) else []
         if not photos and u.avatar:
             photos = [{"url": u.avatar, "w": 500, "h": 500}]
@@ -360,36 +356,8 @@ async def get_likes_received(
         interests_list = u.interests or []
         goals_list = dp.goals or [] if dp else []
 
-        # Вычисляем общие интересы
-        their_interests = set(
-            i.lower().strip() for i in _parse_json_safe(u.interests)
-        )
-        common_interests = list(my_interests & their_interests)
-
-        # Вычисляем match_reason по тем же правилам, что и в ленте
-        uni_score = 0
-        if user.university and u.university:
-            if user.university.strip().lower() == u.university.strip().lower():
-                uni_score += WEIGHT_SAME_UNIVERSITY
-                if user.institute and u.institute:
-                    if user.institute.strip().lower() == u.institute.strip().lower():
-                        uni_score += WEIGHT_SAME_INSTITUTE
-
-        my_goals_raw = _parse_json_safe(my_profile.goals) if my_profile else []
-        my_goals = set(g.lower().strip() for g in my_goals_raw)
-        their_goals_raw = _parse_json_safe(dp.goals) if dp else []
-        their_goals = set(g.lower().strip() for g in their_goals_raw)
-        common_goals_set = my_goals & their_goals
-        common_goals = [
-            goal for goal in their_goals_raw
-            if str(goal).lower().strip() in common_goals_set
-        ]
-        goal_score = 25 if (my_goals and their_goals and common_goals_set) else 0
-
-        reason_code = _determine_match_reason(
-            {}, uni_score, set(common_interests), goal_score
-        )
-        match_reason = get_match_reason_label(reason_code)
+        # match_reason и общие интересы/цели — по тем же правилам, что и в ленте
+        match = describe_match(context, u, dp)
 
         result.append({
             "id": u.id,
@@ -403,9 +371,9 @@ async def get_likes_received(
             "group": None if u.hide_course_group else u.group,
             "interests": interests_list,
             "goals": goals_list,
-            "match_reason": match_reason,
-            "common_interests": common_interests,
-            "common_goals": common_goals,
+            "match_reason": get_match_reason_label(match["match_reason"]),
+            "common_interests": match["common_interests"],
+            "common_goals": match["common_goals"],
             "user_id": u.id
         })
 
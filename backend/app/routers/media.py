@@ -0,0 +1,35 @@
+# ===== 📄 ФАЙЛ: backend/app/routers/media.py =====
+#
+# Статус фоновой обработки медиа.
+# GET /media/jobs/{id} — прогресс перекодирования видео (только автору загрузки).
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models, schemas
+from app.auth_service import require_user
+from app.database import get_db
+from app.services import video_transcode_service
+from app.utils import get_image_urls
+
+router = APIRouter(prefix="/media", tags=["media"])
+
+
+@router.get("/jobs/{job_id}", response_model=schemas.VideoJobStatus)
+async def get_video_job(
+    job_id: int,
+    user: models.User = Depends(require_user),
+    db: AsyncSession = Depends(get_db),
+):
+    job = await video_transcode_service.get_job(db, job_id)
+    if not job or job.owner_id != user.id:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+
+    media = get_image_urls([job.result]) if job.result else []
+    return {
+        "id": job.id,
+        "status": job.status,
+        "progress": job.progress or 0,
+        "error": job.error,
+        "media": media[0] if media else None,
+    }
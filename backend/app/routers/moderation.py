@@ -6,7 +6,7 @@
 #    - legacy_query_api(Model).get(id) → await db.get(Model, id)
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Body
-from sqlalchemy import select, func, or_, desc
+from sqlalchemy import select, func, or_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 from typing import Optional, List
@@ -16,7 +16,7 @@ from app.database import get_db
 from app.auth_service import require_user
 from app import models, schemas
 from app.serialization import public_user_short
-from app.services import analytics_service
+from app.services import admin_stats_service, feed_cache
 from app.services import notification_service as notif
 from app.services.analytics_service import record_server_event
 from app.utils import delete_images
@@ -153,6 +153,7 @@ async def moderate_delete_post(
     )
 
     await db.commit()
+    await feed_cache.bump_generation(feed_cache.SCOPE_POSTS)
     return {"success": True, "moderation_log_id": log.id}
 
 
@@ -239,6 +240,7 @@ async def moderate_delete_request(
     )
 
     await db.commit()
+    await feed_cache.bump_generation(feed_cache.SCOPE_REQUESTS)
     return {"success": True, "moderation_log_id": log.id}
 
 
@@ -277,6 +279,7 @@ async def moderate_delete_market_item(
     )
 
     await db.commit()
+    await feed_cache.bump_generation(feed_cache.SCOPE_MARKET)
     return {"success": True, "moderation_log_id": log.id}
 
 
@@ -320,6 +323,7 @@ async def toggle_pin_post(
         )
 
         await db.commit()
+        await feed_cache.bump_generation(feed_cache.SCOPE_POSTS)
         return {"success": True, "pinned": False}
     else:
         pinned_count = await db.scalar(
@@ -350,6 +354,7 @@ async def toggle_pin_post(
         )
 
         await db.commit()
+        await feed_cache.bump_generation(feed_cache.SCOPE_POSTS)
         return {"success": True, "pinned": True}
 
 
@@ -390,6 +395,7 @@ async def shadow_ban_user(
     )
 
     await db.commit()
+    await feed_cache.bump_generation(feed_cache.SCOPE_POSTS)
     return {
         "success": True,
         "ban": {
@@ -427,6 +433,7 @@ async def shadow_unban_user(
     )
 
     await db.commit()
+    await feed_cache.bump_generation(feed_cache.SCOPE_POSTS)
     return {"success": True}
 
 
@@ -759,6 +766,11 @@ async def review_appeal(
     )
 
     await db.commit()
+    if status == 'approved':
+        # Откат модерации мог вернуть контент в любую из лент
+        await feed_cache.bump_generation(
+            feed_cache.SCOPE_POSTS, feed_cache.SCOPE_REQUESTS, feed_cache.SCOPE_MARKET,
+        )
     return {"success": True}
 
 
@@ -998,89 +1010,13 @@ async def get_moderation_logs(
 
 @router.get("/admin/stats")
 async def get_admin_stats(
+    refresh: bool = Query(False),
     user: models.User = Depends(require_user),
     db: AsyncSession = Depends(get_db),
 ):
     require_superadmin(user)
-
-    now = datetime.utcnow()
-    day_ago = now - timedelta(days=1)
-    today_msk = datetime.now(analytics_service.MSK_TZ).date()
-    today_start_utc, today_end_utc = analytics_service.msk_day_bounds_utc(today_msk)
-
-    total_users = await db.scalar(select(func.count(models.User.id)))
-    usage_summary = await analytics_service.build_admin_usage_summary(db, today_msk)
-
-    total_posts = await db.scalar(select(func.count(models.Post.id)).where(models.Post.is_deleted == False))
-    total_comments = await db.scalar(select(func.count(models.Comment.id)).where(models.Comment.is_deleted == False))
-    total_requests = await db.scalar(select(func.count(models.Request.id)).where(models.Request.is_deleted == False))
-    total_market = await db.scalar(select(func.count(models.MarketItem.id)).where(models.MarketItem.is_deleted == False))
-
-    reports_today = await db.scalar(
-        select(func.count(models.Report.id)).where(
-            models.Report.created_at >= today_start_utc,
-            models.Report.created_at < today_end_utc,
-        )
-    )
-    reports_processed = await db.scalar(
-        select(func.count(models.Report.id)).where(
-            models.Report.reviewed_at.is_not(None),
-            models.Report.reviewed_at >= today_start_utc,
-            models.Report.reviewed_at < today_end_utc,
-        )
-    )
-    reports_overdue = await db.scalar(
-        select(func.count(models.Report.id)).where(
-            models.Report.status == 'pending',
-            models.Report.created_at < day_ago,
-        )
-    )
-    pending_reports = await db.scalar(select(func.count(models.Report.id)).where(models.Report.status == 'pending'))
-    pending_appeals = await db.scalar(select(func.count(models.Appeal.id)).where(models.Appeal.status == 'pending'))
-    ambassadors_count = await db.scalar(select(func.count(models.User.id)).where(models.User.role == 'ambassador'))
-    actions_today = await db.scalar(
-        select(func.count(models.ModerationLog.id)).where(
-            models.ModerationLog.created_at >= today_start_utc,
-            models.ModerationLog.created_at < today_end_utc,
-        )
-    )
-
-    top_unis_result = await db.execute(
-        select(models.User.university, func.count(models.User.id).label('count'))
-        .group_by(models.User.university)
-        .order_by(desc('count'))
-        .limit(10)
-    )
-    top_unis = top_unis_result.all()
-
-    return {
-        "total_users": total_users,
-        "dau": usage_summary["real_dau"],
-        "wau": usage_summary["real_wau"],
-        "mau": usage_summary["real_mau"],
-        "real_dau": usage_summary["real_dau"],
-        "real_wau": usage_summary["real_wau"],
-        "real_mau": usage_summary["real_mau"],
-        "stickiness_pct": usage_summary["stickiness_pct"],
-        "activity_events_today": usage_summary["activity_events_today"],
-        "action_usage_today": usage_summary["action_usage_today"],
-        "online_time_30d": usage_summary["online_time_30d"],
-        "activity_windows": usage_summary["activity_windows"],
-        "reports_today": reports_today,
-        "reports_processed": reports_processed,
-        "reports_overdue": reports_overdue,
-        "total_posts": total_posts,
-        "total_comments": total_comments,
-        "total_requests": total_requests,
-        "total_market_items": total_market,
-        "total_reports_pending": pending_reports,
-        "total_appeals_pending": pending_appeals,
-        "ambassadors_count": ambassadors_count,
-        "moderation_actions_today": actions_today,
-        "top_universities": [
-            {"university": uni, "users_count": cnt} for uni, cnt in top_unis
-        ],
-    }
+    # Снимок пересчитывается фоновым циклом; refresh=true — пересчитать сейчас
+    return await admin_stats_service.get_admin_stats(db, force_refresh=refresh)
 
 
 # ========================================
@@ -8,9 +8,11 @@
 import json
 import logging
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Header, Query
-from sqlalchemy import select, func, update
+from sqlalchemy import and_, or_, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import get_db
@@ -18,12 +20,14 @@ from app import models, schemas, crud
 from app.auth_service import require_user
 from app.config import get_settings
 from app.services.analytics_service import record_server_event
-from app.services import notification_service
+from app.services import inbox_counter, notification_service
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/notifications", tags=["notifications"])
 
+INBOX_PAGE_SIZE = 50
+
 
 def _verify_bot(x_bot_secret: str = Header(..., alias="X-Bot-Secret")):
     """Проверка авторизации бота через заголовок (✅ Фаза 0.3)"""
@@ -35,60 +39,90 @@ def _verify_bot(x_bot_secret: str = Header(..., alias="X-Bot-Secret")):
 # INBOX (для фронтенда)
 # =============================================
 
+@lru_cache(maxsize=4096)
+def _parse_inbox_payload(raw_payload: str) -> dict:
+    # Текст payload неизменен для одной версии уведомления — парсим один раз на воркер
+    return _load_payload(raw_payload)
+
+
+async def _load_reviewed_targets(db: AsyncSession, user_id: int, payloads: list[dict]) -> tuple[set, set]:
+    """Один запрос на страницу: по каким сделкам и товарам юзер уже оставил отзыв."""
+    deal_ids = {p["deal_id"] for p in payloads if p.get("deal_id")}
+    item_ids = {p["item_id"] for p in payloads if not p.get("deal_id") and p.get("item_id")}
+    if not deal_ids and not item_ids:
+        return set(), set()
+
+    conditions = []
+    if deal_ids:
+        conditions.append(models.MarketReview.deal_id.in_(deal_ids))
+    if item_ids:
+        conditions.append(and_(
+            models.MarketReview.item_id.in_(item_ids),
+            models.MarketReview.deal_id.is_(None),
+        ))
+    res = await db.execute(
+        select(models.MarketReview.deal_id, models.MarketReview.item_id).where(
+            models.MarketReview.reviewer_id == user_id,
+            or_(*conditions),
+        )
+    )
+    reviewed_deals, reviewed_items = set(), set()
+    for deal_id, item_id in res.all():
+        if deal_id is not None:
+            reviewed_deals.add(deal_id)
+        else:
+            reviewed_items.add(item_id)
+    return reviewed_deals, reviewed_items
+
+
 @router.get("/inbox")
 async def get_inbox(
+    limit: int = Query(INBOX_PAGE_SIZE, ge=1, le=100),
+    cursor: Optional[str] = Query(None),   # next_cursor предыдущей страницы
     user: models.User = Depends(require_user),
     db: AsyncSession = Depends(get_db),
 ):
-    res = await db.execute(
-        select(models.Notification)
-        .where(
-            models.Notification.recipient_id == user.id,
-            models.Notification.status.in_(['sent', 'pending']),
-        )
-        .order_by(models.Notification.created_at.desc())
-        .limit(50)
+    try:
+        cursor_payload = crud.decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    query = select(models.Notification).where(
+        models.Notification.recipient_id == user.id,
+        models.Notification.status.in_(inbox_counter.INBOX_STATUSES),
     )
-    notifications = res.scalars().all()
-
-    result = []
-    for n in notifications:
-        try:
-            payload = json.loads(n.payload) if isinstance(n.payload, str) else n.payload
-        except json.JSONDecodeError:
-            payload = {}
-
-        # Для review_request добавить is_review_done — чтобы фронт не показывал кнопку повторно
-        if n.type == 'review_request':
-            deal_id = payload.get("deal_id")
-            item_id = payload.get("item_id")
-            if deal_id:
-                review_check = await db.execute(
-                    select(models.MarketReview).where(
-                        models.MarketReview.reviewer_id == user.id,
-                        models.MarketReview.deal_id == deal_id,
-                    )
-                )
-                payload["is_review_done"] = review_check.scalar_one_or_none() is not None
-            elif item_id:
-                review_check = await db.execute(
-                    select(models.MarketReview).where(
-                        models.MarketReview.reviewer_id == user.id,
-                        models.MarketReview.item_id == item_id,
-                        models.MarketReview.deal_id.is_(None),
-                    )
-                )
-                payload["is_review_done"] = review_check.scalar_one_or_none() is not None
-
-        result.append({
+    notifications, has_more, next_cursor = await crud.fetch_keyset_page(
+        db,
+        query,
+        [(models.Notification.created_at, True), (models.Notification.id, True)],
+        limit=limit,
+        cursor_payload=cursor_payload,
+    )
+    payloads = [
+        dict(_parse_inbox_payload(n.payload)) if isinstance(n.payload, str) else _load_payload(n.payload)
+        for n in notifications
+    ]
+
+    # Для review_request добавить is_review_done — чтобы фронт не показывал кнопку повторно
+    review_payloads = [p for n, p in zip(notifications, payloads) if n.type == 'review_request']
+    reviewed_deals, reviewed_items = await _load_reviewed_targets(db, user.id, review_payloads)
+    for payload in review_payloads:
+        if payload.get("deal_id"):
+            payload["is_review_done"] = payload["deal_id"] in reviewed_deals
+        elif payload.get("item_id"):
+            payload["is_review_done"] = payload["item_id"] in reviewed_items
+
+    items = [
+        {
             "id": n.id,
             "type": n.type,
             "payload": payload,
             "is_read": n.is_read,
             "created_at": n.created_at.isoformat() if n.created_at else None,
-        })
-
-    return result
+        }
+        for n, payload in zip(notifications, payloads)
+    ]
+    return {"items": items, "has_more": has_more, "next_cursor": next_cursor}
 
 
 @router.get("/inbox/unread-count")
@@ -96,14 +130,7 @@ async def get_inbox_unread_count(
     user: models.User = Depends(require_user),
     db: AsyncSession = Depends(get_db),
 ):
-    res = await db.execute(
-        select(func.count()).where(
-            models.Notification.recipient_id == user.id,
-            models.Notification.is_read == False,  # noqa: E712
-            models.Notification.status.in_(['sent', 'pending']),
-        )
-    )
-    count = res.scalar() or 0
+    count = await inbox_counter.get_unread_count(db, user.id)
     return {"count": count}
 
 
@@ -122,6 +149,7 @@ async def mark_inbox_read_all(
         .values(is_read=True, read_at=now)
     )
     await db.commit()
+    await inbox_counter.reset(user.id)
     if (res.rowcount or 0) > 0:
         await record_server_event(
             db,
@@ -207,6 +235,11 @@ NOTIF_TYPE_TO_SETTING = {
     'admin_report': None,
 }
 
+# Сколько уведомление может висеть в 'sending' без ack от бота
+NOTIFICATION_CLAIM_LEASE_SECONDS = 300
+# На сколько откладываем выданный боту follow-up, пока не придёт /sent
+FOLLOWUP_CLAIM_LEASE_SECONDS = 300
+
 
 def _load_payload(raw_payload) -> dict:
     if isinstance(raw_payload, dict):
@@ -336,48 +369,154 @@ async def decide_contact_request(
     return contact_request
 
 
-@router.get("/queue")
-async def get_notification_queue(
-    limit: int = Query(50, ge=1, le=100),
-    _=Depends(_verify_bot),
-    db: AsyncSession = Depends(get_db),
-):
+async def _claim_notifications(
+    db: AsyncSession,
+    *,
+    limit: int,
+    ids: list[int] | None = None,
+    min_age_seconds: int = 0,
+) -> list[dict]:
+    """
+    Выдать боту до limit уведомлений одним запросом.
+    Строки блокируются FOR UPDATE SKIP LOCKED — параллельные инстансы бота
+    получают непересекающиеся пачки. Получатель и его NotificationSettings
+    приходят JOIN'ом, решение skipped/failed принимается в памяти.
+    Выданные переходят в 'sending' с claimed_at; если ack не пришёл
+    за NOTIFICATION_CLAIM_LEASE_SECONDS, уведомление выдаётся снова.
+    """
+    now = datetime.utcnow()
+    lease_expired_before = now - timedelta(seconds=NOTIFICATION_CLAIM_LEASE_SECONDS)
+
+    query = (
+        select(models.Notification, models.User.telegram_id, models.NotificationSettings)
+        .outerjoin(models.User, models.User.id == models.Notification.recipient_id)
+        .outerjoin(
+            models.NotificationSettings,
+            models.NotificationSettings.user_id == models.Notification.recipient_id,
+        )
+        .where(
+            or_(
+                models.Notification.status == 'pending',
+                and_(
+                    models.Notification.status == 'sending',
+                    models.Notification.claimed_at < lease_expired_before,
+                ),
+            )
+        )
+    )
+    if ids:
+        query = query.where(models.Notification.id.in_(ids[:limit]))
+    if min_age_seconds:
+        query = query.where(models.Notification.created_at <= now - timedelta(seconds=min_age_seconds))
+
     res = await db.execute(
-        select(models.Notification)
-        .where(models.Notification.status == 'pending')
+        query
         .order_by(models.Notification.created_at.asc())
         .limit(limit)
+        .with_for_update(of=models.Notification, skip_locked=True)
     )
-    notifications = res.scalars().all()
 
     result = []
-    for n in notifications:
-        recipient = await db.get(models.User, n.recipient_id)
-        if not recipient:
+    for n, telegram_id, settings in res.all():
+        if telegram_id is None:
             n.status = 'failed'
             n.error = 'Recipient not found'
             continue
 
-        if await _should_skip_notification(db, n.recipient_id, n.type):
+        if _is_muted(settings, n.type):
             n.status = 'skipped'
             continue
 
-        try:
-            payload = json.loads(n.payload) if isinstance(n.payload, str) else n.payload
-        except json.JSONDecodeError:
-            payload = {}
-
+        n.status = 'sending'
+        n.claimed_at = now
         result.append({
             "id": n.id,
-            "telegram_id": recipient.telegram_id,
+            "telegram_id": telegram_id,
             "type": n.type,
-            "payload": payload,
+            "payload": _load_payload(n.payload),
         })
 
     await db.commit()
     return result
 
 
+@router.post("/queue/claim")
+async def claim_notification_queue(
+    data: schemas.NotificationClaimRequest,
+    _=Depends(_verify_bot),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Арендовать пачку уведомлений.
+    ids — конкретные уведомления из stream notifications:outbox;
+    min_age_seconds — fallback-опрос берёт только те, что stream не доставил.
+    """
+    return await _claim_notifications(
+        db,
+        limit=data.limit,
+        ids=data.ids,
+        min_age_seconds=data.min_age_seconds,
+    )
+
+
+@router.get("/queue")
+async def get_notification_queue(
+    limit: int = Query(50, ge=1, le=100),
+    ids: list[int] | None = Query(None),
+    min_age_seconds: int = Query(0, ge=0, le=86400),
+    _=Depends(_verify_bot),
+    db: AsyncSession = Depends(get_db),
+):
+    """Старый вариант /queue/claim для ботов, которые ещё ходят GET'ом."""
+    return await _claim_notifications(db, limit=limit, ids=ids, min_age_seconds=min_age_seconds)
+
+
+@router.post("/queue/ack")
+async def ack_notification_queue(
+    data: schemas.NotificationAckRequest,
+    _=Depends(_verify_bot),
+    db: AsyncSession = Depends(get_db),
+):
+    """Итоги отправки пачки: sent — список id, failed — [{id, error}]."""
+    now = datetime.utcnow()
+    sent_count = 0
+    failed_count = 0
+
+    if data.sent:
+        res = await db.execute(
+            update(models.Notification)
+            .where(
+                models.Notification.id.in_(set(data.sent)),
+                models.Notification.status.in_(['pending', 'sending']),
+            )
+            .values(status='sent', sent_at=now, claimed_at=None)
+        )
+        sent_count = res.rowcount or 0
+
+    # Один UPDATE на каждый текст ошибки (обычно их 1–2 на пачку)
+    failed_by_error: dict[str, set[int]] = {}
+    for failure in data.failed:
+        failed_by_error.setdefault(failure.error[:500], set()).add(failure.id)
+    for error, notification_ids in failed_by_error.items():
+        res = await db.execute(
+            update(models.Notification)
+            .where(
+                models.Notification.id.in_(notification_ids),
+                models.Notification.status.in_(['pending', 'sending']),
+            )
+            .values(status='failed', error=error, claimed_at=None)
+            .returning(models.Notification.recipient_id)
+        )
+        # failed пропадает из входящих — бейдж получателя надо пересчитать
+        recipient_ids = res.scalars().all()
+        failed_count += len(recipient_ids)
+        for recipient_id in recipient_ids:
+            inbox_counter.mark_dirty(db, recipient_id)
+
+    await db.commit()
+    return {"ok": True, "sent": sent_count, "failed": failed_count}
+
+
 @router.post("/queue/{notification_id}/sent")
 async def mark_notification_sent(
     notification_id: int,
@@ -390,6 +529,7 @@ async def mark_notification_sent(
 
     n.status = 'sent'
     n.sent_at = datetime.utcnow()
+    n.claimed_at = None
     await db.commit()
     return {"ok": True}
 
@@ -407,6 +547,7 @@ async def mark_notification_failed(
 
     n.status = 'failed'
     n.error = error[:500]
+    n.claimed_at = None
     await db.commit()
     return {"ok": True}
 
@@ -417,51 +558,69 @@ async def mark_notification_failed(
 
 @router.get("/followups/pending")
 async def get_pending_followups(
+    limit: int = Query(50, ge=1, le=200),
+    claim: bool = Query(False),
     _=Depends(_verify_bot),
     db: AsyncSession = Depends(get_db),
 ):
+    """
+    Follow-up'ы, которые пора отправить.
+    Юзер и его NotificationSettings приходят JOIN'ом, цели (товар/сделка/запрос)
+    — одним IN-запросом на target_type; статусы решаются в памяти.
+    claim=true — строки блокируются SKIP LOCKED, а выданным scheduled_at
+    сдвигается на FOLLOWUP_CLAIM_LEASE_SECONDS: параллельные инстансы бота
+    их не увидят, а если бот упал до /sent — follow-up снова станет due.
+    """
     now = datetime.utcnow()
 
-    res = await db.execute(
-        select(models.Followup)
+    query = (
+        select(models.Followup, models.User.telegram_id, models.NotificationSettings)
+        .outerjoin(models.User, models.User.id == models.Followup.user_id)
+        .outerjoin(
+            models.NotificationSettings,
+            models.NotificationSettings.user_id == models.Followup.user_id,
+        )
         .where(
             models.Followup.status == 'pending',
             models.Followup.scheduled_at <= now,
         )
         .order_by(models.Followup.scheduled_at.asc())
-        .limit(50)
+        .limit(limit)
     )
-    followups = res.scalars().all()
+    if claim:
+        query = query.with_for_update(of=models.Followup, skip_locked=True)
+    rows = (await db.execute(query)).all()
+
+    targets = await _load_followup_targets(db, [f for f, _, _ in rows if f.type != 'review_request'])
 
     result = []
-    for f in followups:
-        user = await db.get(models.User, f.user_id)
-        if not user:
+    for f, telegram_id, settings in rows:
+        if telegram_id is None:
             f.status = 'expired'
             continue
 
         setting_field = 'market_enabled' if f.target_type in ('market_item', 'market_deal') else 'requests_enabled'
-        if await _should_skip_by_setting(db, f.user_id, setting_field):
+        if _is_disabled(settings, setting_field):
             f.status = 'skipped'
             continue
 
-        if f.type != 'review_request' and not await _is_target_active(db, f.target_type, f.target_id):
+        if f.type != 'review_request' and not _is_target_active(
+            f.target_type, targets.get((f.target_type, f.target_id))
+        ):
             f.status = 'expired'
             continue
 
-        try:
-            payload = json.loads(f.payload) if isinstance(f.payload, str) else f.payload
-        except json.JSONDecodeError:
-            payload = {}
+        if claim:
+            f.scheduled_at = now + timedelta(seconds=FOLLOWUP_CLAIM_LEASE_SECONDS)
 
         result.append({
             "id": f.id,
-            "telegram_id": user.telegram_id,
+            "telegram_id": telegram_id,
             "type": f.type,
             "target_type": f.target_type,
             "target_id": f.target_id,
             "attempt": f.attempt,
-            "payload": payload,
+            "payload": _load_payload(f.payload),
         })
 
     await db.commit()
@@ -554,56 +713,49 @@ async def answer_followup(
 # Приватные хелперы (async)
 # =============================================
 
-async def _should_skip_notification(db: AsyncSession, user_id: int, notif_type: str) -> bool:
-    result = await db.execute(
-        select(models.NotificationSettings).where(
-            models.NotificationSettings.user_id == user_id
-        )
-    )
-    settings = result.scalar_one_or_none()
-
+def _is_disabled(settings, setting_field: str | None) -> bool:
     if not settings:
         return False
     if settings.mute_all:
         return True
-
-    setting_field = NOTIF_TYPE_TO_SETTING.get(notif_type)
     if setting_field is None:
         return False
 
     return not getattr(settings, setting_field, True)
 
 
-async def _should_skip_by_setting(db: AsyncSession, user_id: int, setting_field: str) -> bool:
-    result = await db.execute(
-        select(models.NotificationSettings).where(
-            models.NotificationSettings.user_id == user_id
-        )
-    )
-    settings = result.scalar_one_or_none()
+def _is_muted(settings, notif_type: str) -> bool:
+    return _is_disabled(settings, NOTIF_TYPE_TO_SETTING.get(notif_type))
 
-    if not settings:
-        return False
-    if settings.mute_all:
-        return True
 
-    return not getattr(settings, setting_field, True)
+FOLLOWUP_TARGET_MODELS = {
+    'market_item': models.MarketItem,
+    'market_deal': models.MarketDeal,
+    'request': models.Request,
+}
 
 
-async def _is_target_active(db: AsyncSession, target_type: str, target_id: int) -> bool:
-    if target_type == 'market_item':
-        item = await db.get(models.MarketItem, target_id)
-        if not item or item.status != 'active' or item.is_deleted:
-            return False
-        return True
-    elif target_type == 'market_deal':
-        deal = await db.get(models.MarketDeal, target_id)
-        if not deal or deal.status in ('completed', 'cancelled', 'expired'):
-            return False
-        return True
-    elif target_type == 'request':
-        req = await db.get(models.Request, target_id)
-        if not req or req.status != 'active' or req.is_deleted:
-            return False
+async def _load_followup_targets(db: AsyncSession, followups) -> dict:
+    """Цели follow-up'ов: один IN-запрос на target_type → {(type, id): obj}."""
+    ids_by_type: dict[str, set[int]] = {}
+    for f in followups:
+        if f.target_type in FOLLOWUP_TARGET_MODELS:
+            ids_by_type.setdefault(f.target_type, set()).add(f.target_id)
+
+    targets = {}
+    for target_type, target_ids in ids_by_type.items():
+        model = FOLLOWUP_TARGET_MODELS[target_type]
+        res = await db.execute(select(model).where(model.id.in_(target_ids)))
+        for obj in res.scalars().all():
+            targets[(target_type, obj.id)] = obj
+    return targets
+
+
+def _is_target_active(target_type: str, target) -> bool:
+    if target_type not in FOLLOWUP_TARGET_MODELS:
         return True
-    return True
+    if target is None:
+        return False
+    if target_type == 'market_deal':
+        return target.status not in ('completed', 'cancelled', 'expired')
+    return target.status == 'active' and not target.is_deleted
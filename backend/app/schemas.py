@@ -277,6 +277,12 @@ class PollResponse(BaseModel):
 
 # ===== POST SCHEMAS =====
 
+class ImageVariant(BaseModel):
+    """Уменьшенная копия изображения фиксированной ширины"""
+    url: str
+    w: int
+    h: int
+
 class ImageMeta(BaseModel):
     """Model for image/video metadata"""
     type: str = "image"                    # "image" | "video"
@@ -290,6 +296,20 @@ class ImageMeta(BaseModel):
     thumbnail_url: Optional[str] = None
     thumbnail_w: Optional[int] = None
     thumbnail_h: Optional[int] = None
+    # Варианты по ширине (по возрастанию) — клиент берёт наименьший подходящий
+    variants: Optional[List[ImageVariant]] = None
+    # Видео ещё в очереди перекодирования: status="processing", прогресс — /media/jobs/{job_id}
+    status: Optional[str] = None
+    job_id: Optional[int] = None
+
+
+class VideoJobStatus(BaseModel):
+    """Статус задачи перекодирования видео"""
+    id: int
+    status: str                            # pending | processing | done | failed
+    progress: int = 0
+    error: Optional[str] = None
+    media: Optional[ImageMeta] = None
 
 class PostCreate(BaseModel):
     category: str
@@ -479,8 +499,9 @@ class PostsFeedResponse(BaseModel):
     """Лента постов"""
     items: List[PostResponse]
     total: int
-    total_count: int = 0
+    total_count: Optional[int] = None  # только при include_total=true
     has_more: bool
+    next_cursor: Optional[str] = None
 
 # ===== COMMENT SCHEMAS =====
 
@@ -522,6 +543,9 @@ class CommentResponse(BaseModel):
     images: List[ImageMeta] = []
     created_at: datetime
     updated_at: Optional[datetime] = None
+    # Только у корневых комментариев в ленте: всего ответов в ветке и курсор «ещё ответы»
+    replies_count: Optional[int] = None
+    replies_cursor: Optional[str] = None
 
     @field_validator('images', mode='before')
     @classmethod
@@ -531,9 +555,14 @@ class CommentResponse(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 class CommentsFeedResponse(BaseModel):
-    """Лента комментариев"""
+    """
+    Страница комментариев (keyset). Поля total больше нет: размер страницы
+    не равен размеру ветки, число комментариев поста — PostResponse.comments_count.
+    """
     items: List[CommentResponse]
-    total: int
+    has_more: bool = False
+    next_cursor: Optional[str] = None
+
 # ===== REQUEST SCHEMAS =====
 
 class RequestCreate(BaseModel):
@@ -608,8 +637,9 @@ class RequestResponse(BaseModel):
 class RequestsFeedResponse(BaseModel):
     """Лента запросов"""
     items: List[RequestResponse]
-    total: int
+    total: Optional[int] = None  # только при include_total=true
     has_more: bool
+    next_cursor: Optional[str] = None
 
 # ===== RESPONSE SCHEMAS =====
 
@@ -1008,8 +1038,9 @@ class MarketItemResponse(BaseModel):
 class MarketFeedResponse(BaseModel):
     """Лента товаров"""
     items: List[MarketItemResponse]
-    total: int
+    total: Optional[int] = None  # только при include_total=true
     has_more: bool
+    next_cursor: Optional[str] = None
 
 class MarketCategoriesResponse(BaseModel):
     """Список категорий"""
@@ -1390,6 +1421,22 @@ class FollowupAnswer(BaseModel):
     answer: str = Field(..., pattern="^(yes|no|in_progress)$")
 
 
+class NotificationClaimRequest(BaseModel):
+    limit: int = Field(50, ge=1, le=200)
+    ids: Optional[List[int]] = Field(None, max_length=200)
+    min_age_seconds: int = Field(0, ge=0, le=86400)
+
+
+class NotificationAckFailure(BaseModel):
+    id: int
+    error: str = Field("unknown", max_length=500)
+
+
+class NotificationAckRequest(BaseModel):
+    sent: List[int] = Field(default_factory=list, max_length=1000)
+    failed: List[NotificationAckFailure] = Field(default_factory=list, max_length=1000)
+
+
 # ===== ANALYTICS SCHEMAS =====
 
 class AnalyticsEventIn(BaseModel):
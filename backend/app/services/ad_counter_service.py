@@ -0,0 +1,320 @@
+# ===== 📄 ФАЙЛ: backend/app/services/ad_counter_service.py =====
+#
+# Показы и клики рекламы через Redis, в Postgres — пачками.
+#
+# POST /ads/{id}/impression выполняет один Lua-скрипт, который атомарно:
+#   - отсекает повторный показ тому же юзеру (set ads:cnt:{ad}:users);
+#   - проверяет impression_limit (ads:cnt:{ad}:total) и daily_impression_cap
+#     (ads:cnt:{ad}:day:{YYYYMMDD}, сутки по UTC, как viewed_at);
+#   - увеличивает оба счётчика и кладёт показ в список ads:pending:impressions.
+# Уникальных считаем точно (set, а не HyperLogLog): он же нужен для дедупа,
+# и уникальный показ = показ, как и в unique_ad_impression.
+# Клик — RPUSH в ads:pending:clicks.
+#
+# Лимиты кампании кешируются в hash ads:meta:{ad} вместе с поколением индекса
+# рекламы (ad_serving.GEN_KEY): любое изменение кампании бампает поколение,
+# и при следующем показе метаданные и счётчики перечитываются из БД.
+#
+# Фоновый цикл раз в ADS_COUNTER_FLUSH_SECONDS под локом дочищает оба списка
+# (пачками по очереди, пока не опустеют или не выйдет FLUSH_TICK_BUDGET_SECONDS)
+# и пишет их через crud.apply_ad_impressions / apply_ad_clicks. Пачка удаляется
+# из списка только после COMMIT, упавшая — повторится на следующем тике. Это
+# безопасно: и показы, и клики вставляются с ON CONFLICT DO NOTHING, а счётчики
+# растут только на реально вставленные строки.
+# Redis недоступен → роутер идёт старым путём через crud.track_ad_*.
+
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy import func, select, update as sa_update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.config import get_settings
+from app.crud import ads as ads_crud
+from app.database import AsyncSessionLocal
+from app.rate_limiter import get_redis
+from app.services import ad_serving
+
+logger = logging.getLogger(__name__)
+
+PENDING_IMPRESSIONS_KEY = "ads:pending:impressions"
+PENDING_CLICKS_KEY = "ads:pending:clicks"
+FLUSH_LOCK_KEY = "ads:flush_lock"
+FLUSH_LOCK_TTL_SECONDS = 30
+FLUSH_BATCH_SIZE = 1000
+# Сколько максимум дочищаем за тик: с запасом меньше TTL лока, чтобы
+# другой воркер не перехватил его посреди сброса
+FLUSH_TICK_BUDGET_SECONDS = 20
+FLUSH_MAX_ROUNDS = 100
+
+META_TTL_SECONDS = 60
+# Счётчики кампании живут, пока к ней обращаются; TTL продлевается при перечитывании мета
+COUNTER_TTL_SECONDS = 30 * 24 * 3600
+DAY_TTL_SECONDS = 2 * 24 * 3600
+# Маркер «set уже заполнен из БД» — id юзера с нулём не бывает
+_LOADED_MARKER = "0"
+
+# Результаты скрипта: >0 — новый показ (значение total), 0 — повтор,
+# -1 — достигнут impression_limit, -2 — достигнут daily_impression_cap
+_TRACK_IMPRESSION = """
+if redis.call('SISMEMBER', KEYS[1], ARGV[1]) == 1 then
+    return 0
+end
+local limit = tonumber(ARGV[2])
+if limit > 0 and tonumber(redis.call('GET', KEYS[2]) or '0') >= limit then
+    return -1
+end
+local cap = tonumber(ARGV[3])
+if cap > 0 and tonumber(redis.call('GET', KEYS[3]) or '0') >= cap then
+    return -2
+end
+redis.call('SADD', KEYS[1], ARGV[1])
+local total = redis.call('INCR', KEYS[2])
+redis.call('INCR', KEYS[3])
+redis.call('EXPIRE', KEYS[3], ARGV[4])
+redis.call('RPUSH', KEYS[4], ARGV[5])
+return total
+"""
+
+_RELEASE_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def meta_key(ad_post_id: int) -> str:
+    return f"ads:meta:{ad_post_id}"
+
+
+def users_key(ad_post_id: int) -> str:
+    return f"ads:cnt:{ad_post_id}:users"
+
+
+def total_key(ad_post_id: int) -> str:
+    return f"ads:cnt:{ad_post_id}:total"
+
+
+def day_key(ad_post_id: int, now: datetime) -> str:
+    return f"ads:cnt:{ad_post_id}:day:{now:%Y%m%d}"
+
+
+def _pending_entry(ad_post_id: int, user_id: int, at: datetime) -> str:
+    # viewed_at хранится наивным UTC
+    return f"{ad_post_id}:{user_id}:{at.replace(tzinfo=timezone.utc).timestamp():.3f}"
+
+
+def parse_pending(raw: List[str]) -> List[Tuple[int, int, datetime]]:
+    rows = []
+    for entry in raw:
+        try:
+            ad_id, user_id, ts = entry.split(":")
+            rows.append((int(ad_id), int(user_id), datetime.utcfromtimestamp(float(ts))))
+        except ValueError:
+            logger.warning("Broken pending ad counter entry dropped: %r", entry)
+    return rows
+
+
+# ===== МЕТАДАННЫЕ И ЗАСЕВ СЧЁТЧИКОВ =====
+
+async def _seed_counters(db: AsyncSession, redis, ad: models.AdPost, now: datetime) -> None:
+    keys = (users_key(ad.id), total_key(ad.id), day_key(ad.id, now))
+    pipe = redis.pipeline(transaction=False)
+    for key in keys:
+        pipe.exists(key)
+    has_users, has_total, has_day = await pipe.execute()
+
+    pipe = redis.pipeline(transaction=False)
+    if not has_users:
+        result = await db.execute(
+            select(models.AdImpression.user_id).where(models.AdImpression.ad_post_id == ad.id)
+        )
+        pipe.sadd(keys[0], _LOADED_MARKER, *[str(user_id) for user_id in result.scalars().all()])
+    if not has_total:
+        # NX: параллельный показ мог успеть засеять и увеличить счётчик
+        pipe.set(keys[1], ad.impressions_count or 0, nx=True)
+    if not has_day:
+        today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        today_count = await db.scalar(
+            select(func.count(models.AdImpression.id)).where(
+                models.AdImpression.ad_post_id == ad.id,
+                models.AdImpression.viewed_at >= today_start,
+            )
+        )
+        pipe.set(keys[2], today_count or 0, ex=DAY_TTL_SECONDS, nx=True)
+    pipe.expire(keys[0], COUNTER_TTL_SECONDS)
+    pipe.expire(keys[1], COUNTER_TTL_SECONDS)
+    await pipe.execute()
+
+
+async def _load_meta(db: AsyncSession, redis, ad_post_id: int, now: datetime) -> Optional[Dict[str, int]]:
+    """{'limit', 'cap'} кампании (0 — без ограничения) или None, если её нет."""
+    pipe = redis.pipeline(transaction=False)
+    pipe.hgetall(meta_key(ad_post_id))
+    pipe.get(ad_serving.GEN_KEY)
+    cached, generation = await pipe.execute()
+    generation = generation or "0"
+
+    if cached and cached.get("gen") == generation:
+        if cached.get("missing"):
+            return None
+        return {"limit": int(cached["limit"]), "cap": int(cached["cap"])}
+
+    ad = await db.get(models.AdPost, ad_post_id)
+    if ad is None:
+        meta = {"gen": generation, "missing": "1"}
+    else:
+        await _seed_counters(db, redis, ad, now)
+        meta = {
+            "gen": generation,
+            "limit": int(ad.impression_limit or 0),
+            "cap": int(ad.daily_impression_cap or 0),
+        }
+
+    pipe = redis.pipeline(transaction=True)
+    pipe.delete(meta_key(ad_post_id))
+    pipe.hset(meta_key(ad_post_id), mapping=meta)
+    pipe.expire(meta_key(ad_post_id), META_TTL_SECONDS)
+    await pipe.execute()
+
+    if ad is None:
+        return None
+    return {"limit": meta["limit"], "cap": meta["cap"]}
+
+
+async def _complete_ad(db: AsyncSession, ad_post_id: int) -> None:
+    await db.execute(
+        sa_update(models.AdPost)
+        .where(models.AdPost.id == ad_post_id, models.AdPost.status == 'active')
+        .values(status='completed')
+    )
+    await db.commit()
+    await ad_serving.bump_generation()
+
+
+# ===== ТРЕКИНГ =====
+
+async def record_impression(db: AsyncSession, ad_post_id: int, user_id: int) -> Optional[bool]:
+    """
+    Засчитать показ. True — новый уникальный показ, False — повтор, лимит
+    или нет такой рекламы, None — Redis недоступен (вызывающий идёт через crud).
+    """
+    now = datetime.utcnow()
+    try:
+        redis = await get_redis()
+        meta = await _load_meta(db, redis, ad_post_id, now)
+        if meta is None:
+            return False
+        result = int(await redis.eval(
+            _TRACK_IMPRESSION, 4,
+            users_key(ad_post_id), total_key(ad_post_id), day_key(ad_post_id, now), PENDING_IMPRESSIONS_KEY,
+            str(user_id), meta["limit"], meta["cap"], DAY_TTL_SECONDS,
+            _pending_entry(ad_post_id, user_id, now),
+        ))
+    except (RedisError, OSError) as exc:
+        logger.warning("Ad impression counter unavailable, falling back to DB: %s", exc)
+        return None
+
+    if result >= 0:
+        await ad_serving.mark_seen(user_id, ad_post_id)
+    if result > 0 and meta["limit"] and result >= meta["limit"]:
+        # Статус меняем сразу, не дожидаясь сброса счётчиков
+        await _complete_ad(db, ad_post_id)
+    return result > 0
+
+
+async def record_click(db: AsyncSession, ad_post_id: int, user_id: int) -> Optional[bool]:
+    """Засчитать клик по CTA. None — Redis недоступен."""
+    now = datetime.utcnow()
+    try:
+        redis = await get_redis()
+        if await _load_meta(db, redis, ad_post_id, now) is None:
+            return False
+        await redis.rpush(PENDING_CLICKS_KEY, _pending_entry(ad_post_id, user_id, now))
+    except (RedisError, OSError) as exc:
+        logger.warning("Ad click counter unavailable, falling back to DB: %s", exc)
+        return None
+    return True
+
+
+# ===== СБРОС В БД =====
+
+async def _flush_list(redis, key: str, apply) -> Tuple[int, bool]:
+    """Записать одну пачку из списка. -> (записано, остались ли ещё записи)."""
+    raw = await redis.lrange(key, 0, FLUSH_BATCH_SIZE - 1)
+    if not raw:
+        return 0, False
+
+    written = 0
+    rows = parse_pending(raw)
+    if rows:
+        async with AsyncSessionLocal() as db:
+            try:
+                written = await apply(db, rows)
+            except SQLAlchemyError:
+                await db.rollback()
+                logger.exception("Ad counters flush failed for %s (%s entries kept)", key, len(raw))
+                return 0, False
+
+    await redis.ltrim(key, len(raw), -1)
+    return written, len(raw) == FLUSH_BATCH_SIZE
+
+
+async def flush_pending_counters(
+    max_rounds: int = FLUSH_MAX_ROUNDS,
+    budget_seconds: float = FLUSH_TICK_BUDGET_SECONDS,
+) -> Dict[str, int]:
+    """
+    Сбросить накопленные показы и клики в БД. Списки дочищаются по пачке
+    по очереди, пока не опустеют, но не дольше max_rounds пачек и budget_seconds.
+    """
+    flushed = {"impressions": 0, "clicks": 0}
+    redis = await get_redis()
+    token = uuid.uuid4().hex
+    if not await redis.set(FLUSH_LOCK_KEY, token, nx=True, ex=FLUSH_LOCK_TTL_SECONDS):
+        # Сбрасывает другой воркер
+        return flushed
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + budget_seconds
+    pending = {
+        "impressions": (PENDING_IMPRESSIONS_KEY, ads_crud.apply_ad_impressions),
+        "clicks": (PENDING_CLICKS_KEY, ads_crud.apply_ad_clicks),
+    }
+    try:
+        for _ in range(max_rounds):
+            for name, (key, apply) in list(pending.items()):
+                written, has_more = await _flush_list(redis, key, apply)
+                flushed[name] += written
+                if not has_more:
+                    del pending[name]
+            if not pending or loop.time() >= deadline:
+                break
+    finally:
+        await redis.eval(_RELEASE_LOCK, 1, FLUSH_LOCK_KEY, token)
+    return flushed
+
+
+async def run_ad_counters_flush_loop(stop_event: asyncio.Event) -> None:
+    settings = get_settings()
+    interval = max(1, int(settings.ads_counter_flush_seconds))
+
+    while not stop_event.is_set():
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+        try:
+            await flush_pending_counters()
+        except (RedisError, OSError) as exc:
+            logger.warning("Ad counters flush skipped, Redis unavailable: %s", exc)
+        except Exception:
+            logger.exception("Ad counters flush tick failed")
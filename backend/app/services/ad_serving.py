@@ -0,0 +1,330 @@
+# ===== 📄 ФАЙЛ: backend/app/services/ad_serving.py =====
+#
+# Подбор рекламы для /ads/feed/active без похода в Postgres.
+#
+# Индекс активных кампаний живёт в памяти воркера, разложенный по таргетингу:
+#   "all" / ("university", вуз) / ("city", город) → список кандидатов
+# с готовым payload'ом для ленты. Пересборка (один SELECT) — если в Redis
+# сменилось поколение ads:index:gen (approve/pause/resume/update/delete/
+# автозавершение делают bump_generation после commit) или индекс старше
+# ADS_INDEX_REFRESH_SECONDS. Поколение читаем не чаще раза в секунду.
+#
+# Что юзер уже видел сегодня и что скрыл — Redis set'ы:
+#   ads:seen:{user_id}:{YYYYMMDD}  — живёт до конца суток (UTC, как viewed_at);
+#   ads:hidden:{user_id}           — пополняется hide/unhide.
+# Пустой ключ при первом обращении заполняется из БД один раз (маркер "0").
+#
+# Выбор — взвешенная выборка без возвращения по priority
+# (ключ random() ** (1 / priority), Efraimidis–Spirakis).
+# Redis недоступен → вызывающий откатывается на crud.get_active_ads_for_user.
+
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from app import models
+from app.config import get_settings
+from app.rate_limiter import get_redis
+from app.time_utils import to_iso_z
+from app.utils import get_image_urls
+
+logger = logging.getLogger(__name__)
+
+GEN_KEY = "ads:index:gen"
+# Маркер «set уже заполнен из БД» — id рекламы с нулём не бывает
+_LOADED_MARKER = "0"
+HIDDEN_TTL_SECONDS = 30 * 24 * 3600
+# Как часто воркер сверяет поколение индекса с Redis
+GEN_CHECK_INTERVAL_SECONDS = 1.0
+
+ScopeKey = Any  # "all" | ("university", str) | ("city", str)
+
+
+class _AdIndex:
+    def __init__(self):
+        self.by_scope: Dict[ScopeKey, List[Dict[str, Any]]] = {}
+        self.generation: Optional[str] = None
+        self.built_at = 0.0
+        self.gen_checked_at = 0.0
+
+    def is_built(self) -> bool:
+        return self.built_at > 0
+
+
+_index = _AdIndex()
+
+
+def serialize_ad(ad: models.AdPost) -> Dict[str, Any]:
+    """Карточка рекламы для ленты."""
+    post = ad.post
+    images_raw = get_image_urls(post.images) if post and post.images else []
+
+    return {
+        'ad_id': ad.id,
+        'post_id': post.id,
+        'title': post.title,
+        'body': post.body,
+        'images': images_raw,
+        'author': {
+            'id': post.author.id if post.author else None,
+            'name': ad.advertiser_name,
+            'avatar': ad.advertiser_logo,
+            'university': post.author.university if post.author else None,
+        },
+        'advertiser_name': ad.advertiser_name,
+        'advertiser_logo': ad.advertiser_logo,
+        'cta_text': ad.cta_text,
+        'cta_url': ad.cta_url,
+        'is_ad': True,
+        'created_at': to_iso_z(post.created_at),
+        'likes_count': post.likes_count,
+        'comments_count': post.comments_count,
+        'views_count': post.views_count,
+    }
+
+
+def _scope_key(ad: models.AdPost) -> Optional[ScopeKey]:
+    if ad.scope == 'all':
+        return "all"
+    if ad.scope == 'university' and ad.target_university:
+        return ("university", ad.target_university)
+    if ad.scope == 'city' and ad.target_city:
+        return ("city", ad.target_city)
+    return None
+
+
+# ===== ИНДЕКС =====
+
+async def _load_active_ads(db: AsyncSession) -> List[models.AdPost]:
+    result = await db.execute(
+        select(models.AdPost)
+        .join(models.Post, models.AdPost.post_id == models.Post.id)
+        .options(selectinload(models.AdPost.post).selectinload(models.Post.author))
+        .where(
+            models.AdPost.status == 'active',
+            models.Post.is_deleted.is_(False),
+        )
+    )
+    return result.scalars().all()
+
+
+async def rebuild_index(db: AsyncSession, generation: Optional[str] = None) -> None:
+    by_scope: Dict[ScopeKey, List[Dict[str, Any]]] = {}
+    for ad in await _load_active_ads(db):
+        scope_key = _scope_key(ad)
+        if scope_key is None:
+            continue
+        by_scope.setdefault(scope_key, []).append({
+            "id": ad.id,
+            "priority": max(int(ad.priority or 1), 1),
+            "starts_at": ad.starts_at,
+            "ends_at": ad.ends_at,
+            "impression_limit": ad.impression_limit,
+            "impressions_count": ad.impressions_count or 0,
+            "payload": serialize_ad(ad),
+        })
+
+    _index.by_scope = by_scope
+    _index.generation = generation
+    _index.built_at = time.monotonic()
+
+
+async def _current_generation(redis) -> Optional[str]:
+    now = time.monotonic()
+    if now - _index.gen_checked_at < GEN_CHECK_INTERVAL_SECONDS:
+        return _index.generation
+    _index.gen_checked_at = now
+    return await redis.get(GEN_KEY) or "0"
+
+
+async def _ensure_index(db: AsyncSession, redis) -> None:
+    generation = await _current_generation(redis)
+    max_age = get_settings().ads_index_refresh_seconds
+    stale = time.monotonic() - _index.built_at >= max_age
+    if not _index.is_built() or stale or generation != _index.generation:
+        await rebuild_index(db, generation)
+
+
+async def bump_generation() -> None:
+    """Пересобрать индекс во всех воркерах: вызывать ПОСЛЕ commit."""
+    _index.built_at = 0.0
+    try:
+        redis = await get_redis()
+        await redis.incr(GEN_KEY)
+    except (RedisError, OSError) as exc:
+        logger.warning("Ads index invalidation failed: %s", exc)
+
+
+def reset_local_index() -> None:
+    global _index
+    _index = _AdIndex()
+
+
+# ===== SEEN / HIDDEN =====
+
+def seen_key(user_id: int, now: Optional[datetime] = None) -> str:
+    now = now or datetime.utcnow()
+    return f"ads:seen:{user_id}:{now:%Y%m%d}"
+
+
+def hidden_key(user_id: int) -> str:
+    return f"ads:hidden:{user_id}"
+
+
+def _seconds_until_day_end(now: datetime) -> int:
+    tomorrow = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    # Небольшой запас, чтобы ключ не умер раньше смены даты в seen_key
+    return int((tomorrow - now).total_seconds()) + 60
+
+
+async def _fill_from_db(redis, key: str, ids: Iterable[int], ttl: int) -> Set[int]:
+    ids = {int(ad_id) for ad_id in ids}
+    pipe = redis.pipeline(transaction=True)
+    pipe.sadd(key, _LOADED_MARKER, *[str(ad_id) for ad_id in ids])
+    pipe.expire(key, ttl)
+    await pipe.execute()
+    return ids
+
+
+def _members(raw: Iterable[str]) -> Set[int]:
+    return {int(value) for value in raw if value != _LOADED_MARKER}
+
+
+async def _load_excluded(db: AsyncSession, redis, user_id: int, now: datetime) -> Set[int]:
+    seen_k, hidden_k = seen_key(user_id, now), hidden_key(user_id)
+    pipe = redis.pipeline(transaction=False)
+    pipe.smembers(seen_k)
+    pipe.smembers(hidden_k)
+    seen_raw, hidden_raw = await pipe.execute()
+
+    if seen_raw:
+        seen = _members(seen_raw)
+    else:
+        today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        result = await db.execute(
+            select(models.AdImpression.ad_post_id).where(
+                models.AdImpression.user_id == user_id,
+                models.AdImpression.viewed_at >= today_start,
+            )
+        )
+        seen = await _fill_from_db(redis, seen_k, result.scalars().all(), _seconds_until_day_end(now))
+
+    if hidden_raw:
+        hidden = _members(hidden_raw)
+    else:
+        result = await db.execute(
+            select(models.AdHidden.ad_post_id).where(models.AdHidden.user_id == user_id)
+        )
+        hidden = await _fill_from_db(redis, hidden_k, result.scalars().all(), HIDDEN_TTL_SECONDS)
+
+    return seen | hidden
+
+
+async def mark_seen(user_id: int, ad_post_id: int) -> None:
+    now = datetime.utcnow()
+    key = seen_key(user_id, now)
+    try:
+        redis = await get_redis()
+        pipe = redis.pipeline(transaction=False)
+        pipe.sadd(key, str(ad_post_id))
+        pipe.expire(key, _seconds_until_day_end(now))
+        await pipe.execute()
+    except (RedisError, OSError) as exc:
+        logger.warning("Ads seen set update failed: %s", exc)
+
+
+async def set_hidden(user_id: int, ad_post_id: int, hidden: bool) -> None:
+    key = hidden_key(user_id)
+    try:
+        redis = await get_redis()
+        if hidden:
+            # Только если set уже заполнен из БД — иначе заполнится при чтении
+            if await redis.exists(key):
+                await redis.sadd(key, str(ad_post_id))
+        else:
+            await redis.srem(key, str(ad_post_id))
+    except (RedisError, OSError) as exc:
+        logger.warning("Ads hidden set update failed: %s", exc)
+        try:
+            redis = await get_redis()
+            await redis.delete(key)
+        except (RedisError, OSError):
+            pass
+
+
+# ===== ВЫБОР =====
+
+def _eligible(candidate: Dict[str, Any], now: datetime, excluded: Set[int]) -> bool:
+    if candidate["id"] in excluded:
+        return False
+    if candidate["starts_at"] and candidate["starts_at"] > now:
+        return False
+    if candidate["ends_at"] and candidate["ends_at"] <= now:
+        return False
+    limit = candidate["impression_limit"]
+    if limit and candidate["impressions_count"] >= limit:
+        return False
+    return True
+
+
+def weighted_sample(
+    candidates: List[Dict[str, Any]],
+    limit: int,
+    rng: random.Random = random,
+) -> List[Dict[str, Any]]:
+    """Взвешенная выборка без возвращения: больше priority — чаще в ленте."""
+    keyed: List[Tuple[float, Dict[str, Any]]] = [
+        (rng.random() ** (1.0 / candidate["priority"]), candidate) for candidate in candidates
+    ]
+    keyed.sort(key=lambda pair: pair[0], reverse=True)
+    return [candidate for _, candidate in keyed[:limit]]
+
+
+def select_candidates(
+    user_university: Optional[str],
+    user_city: Optional[str],
+    excluded: Set[int],
+    limit: int,
+    now: Optional[datetime] = None,
+) -> List[Dict[str, Any]]:
+    now = now or datetime.utcnow()
+    pools = [_index.by_scope.get("all", [])]
+    if user_university:
+        pools.append(_index.by_scope.get(("university", user_university), []))
+    if user_city:
+        pools.append(_index.by_scope.get(("city", user_city), []))
+
+    candidates = [c for pool in pools for c in pool if _eligible(c, now, excluded)]
+    return weighted_sample(candidates, limit)
+
+
+async def get_ads_for_user(
+    db: AsyncSession,
+    user_id: int,
+    user_university: Optional[str],
+    user_city: Optional[str] = None,
+    limit: int = 3,
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Карточки рекламы для ленты юзера.
+    None — Redis недоступен, вызывающий идёт старым путём через БД.
+    """
+    now = datetime.utcnow()
+    try:
+        redis = await get_redis()
+        await _ensure_index(db, redis)
+        excluded = await _load_excluded(db, redis, user_id, now)
+    except (RedisError, OSError) as exc:
+        logger.warning("Ads index unavailable, falling back to DB: %s", exc)
+        return None
+
+    return [candidate["payload"] for candidate in select_candidates(
+        user_university, user_city, excluded, limit, now,
+    )]
@@ -0,0 +1,277 @@
+# ===== 📄 ФАЙЛ: backend/app/services/admin_stats_service.py =====
+#
+# Снимок статистики для /admin/stats — две части с разной ценой.
+#
+# Счётчики (юзеры, контент, жалобы, апелляции, лог модерации) и топ вузов —
+# дешёвые: фоновый цикл пересчитывает их раз в ADMIN_STATS_REFRESH_SECONDS
+# в Redis hash admin_stats:snapshot. Из нескольких воркеров считает один —
+# кто взял короткий lock в Redis.
+#
+# build_admin_usage_summary (DAU/WAU/MAU, окна активности) сканирует
+# 30 дней событий, поэтому в цикле его нет: он считается только когда
+# дашборд открывают (stale-while-revalidate). Снимок admin_stats:usage
+# отдаётся сразу; если он старше ADMIN_STATS_USAGE_REFRESH_SECONDS —
+# один воркер под lock'ом admin_stats:usage_lock пересчитывает его в фоне.
+#
+# Эндпоинт отдаёт обе части вместе со временем расчёта более старой
+# (stats_generated_at / stats_age_seconds). Снимка нет или Redis
+# недоступен → считаем на месте, как раньше.
+
+import asyncio
+import json
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Set, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from redis.exceptions import RedisError
+from sqlalchemy import desc, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.config import get_settings
+from app.database import AsyncSessionLocal
+from app.rate_limiter import get_redis
+from app.services import analytics_service
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_KEY = "admin_stats:snapshot"
+USAGE_KEY = "admin_stats:usage"
+REFRESH_LOCK_KEY = "admin_stats:refresh_lock"
+USAGE_LOCK_KEY = "admin_stats:usage_lock"
+# Верхняя граница на пересчёт usage: упавший воркер не держит lock дольше
+USAGE_LOCK_SECONDS = 300
+# Устаревший usage всё равно лучше пустого экрана — держим сутки
+USAGE_SNAPSHOT_TTL_SECONDS = 24 * 3600
+
+# DEL только своего lock'а: пересчёт мог пережить TTL, и lock уже у другого воркера
+_RELEASE_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_USAGE_FIELDS = (
+    "real_dau", "real_wau", "real_mau", "stickiness_pct", "activity_events_today",
+    "action_usage_today", "online_time_30d", "activity_windows",
+)
+
+# Ссылки на фоновые пересчёты usage, чтобы задачи не собрал GC
+_usage_tasks: Set[asyncio.Task] = set()
+
+
+def _count(model: Any, *filters: Any) -> Any:
+    return select(func.count(model.id)).where(*filters).scalar_subquery()
+
+
+async def compute_usage_stats(db: AsyncSession) -> Dict[str, Any]:
+    """Тяжёлая часть: активность за 1/7/30 дней по analytics_events."""
+    today_msk = datetime.now(analytics_service.MSK_TZ).date()
+    usage_summary = await analytics_service.build_admin_usage_summary(db, today_msk)
+    usage = {field: usage_summary[field] for field in _USAGE_FIELDS}
+    usage.update(dau=usage["real_dau"], wau=usage["real_wau"], mau=usage["real_mau"])
+    return usage
+
+
+async def compute_counter_stats(db: AsyncSession) -> Dict[str, Any]:
+    """Дешёвая часть: счётчики одним запросом + топ вузов."""
+    now = datetime.utcnow()
+    day_ago = now - timedelta(days=1)
+    today_msk = datetime.now(analytics_service.MSK_TZ).date()
+    today_start_utc, today_end_utc = analytics_service.msk_day_bounds_utc(today_msk)
+
+    # Все счётчики — одним запросом из скалярных подзапросов
+    counters = (
+        await db.execute(
+            select(
+                _count(models.User).label("total_users"),
+                _count(models.Post, models.Post.is_deleted == False).label("total_posts"),  # noqa: E712
+                _count(models.Comment, models.Comment.is_deleted == False).label("total_comments"),  # noqa: E712
+                _count(models.Request, models.Request.is_deleted == False).label("total_requests"),  # noqa: E712
+                _count(models.MarketItem, models.MarketItem.is_deleted == False).label("total_market"),  # noqa: E712
+                _count(
+                    models.Report,
+                    models.Report.created_at >= today_start_utc,
+                    models.Report.created_at < today_end_utc,
+                ).label("reports_today"),
+                _count(
+                    models.Report,
+                    models.Report.reviewed_at.is_not(None),
+                    models.Report.reviewed_at >= today_start_utc,
+                    models.Report.reviewed_at < today_end_utc,
+                ).label("reports_processed"),
+                _count(
+                    models.Report,
+                    models.Report.status == 'pending',
+                    models.Report.created_at < day_ago,
+                ).label("reports_overdue"),
+                _count(models.Report, models.Report.status == 'pending').label("pending_reports"),
+                _count(models.Appeal, models.Appeal.status == 'pending').label("pending_appeals"),
+                _count(models.User, models.User.role == 'ambassador').label("ambassadors_count"),
+                _count(
+                    models.ModerationLog,
+                    models.ModerationLog.created_at >= today_start_utc,
+                    models.ModerationLog.created_at < today_end_utc,
+                ).label("actions_today"),
+            )
+        )
+    ).mappings().one()
+
+    top_unis_result = await db.execute(
+        select(models.User.university, func.count(models.User.id).label('count'))
+        .group_by(models.User.university)
+        .order_by(desc('count'))
+        .limit(10)
+    )
+    top_unis = top_unis_result.all()
+
+    return {
+        "total_users": counters["total_users"],
+        "reports_today": counters["reports_today"],
+        "reports_processed": counters["reports_processed"],
+        "reports_overdue": counters["reports_overdue"],
+        "total_posts": counters["total_posts"],
+        "total_comments": counters["total_comments"],
+        "total_requests": counters["total_requests"],
+        "total_market_items": counters["total_market"],
+        "total_reports_pending": counters["pending_reports"],
+        "total_appeals_pending": counters["pending_appeals"],
+        "ambassadors_count": counters["ambassadors_count"],
+        "moderation_actions_today": counters["actions_today"],
+        "top_universities": [
+            {"university": uni, "users_count": cnt} for uni, cnt in top_unis
+        ],
+    }
+
+
+async def compute_admin_stats(db: AsyncSession) -> Dict[str, Any]:
+    return {**await compute_counter_stats(db), **await compute_usage_stats(db)}
+
+
+def _with_staleness(payload: Dict[str, Any], generated_at: datetime) -> Dict[str, Any]:
+    age = (datetime.now(timezone.utc) - generated_at).total_seconds()
+    return {
+        **payload,
+        "stats_generated_at": generated_at,
+        "stats_age_seconds": max(int(age), 0),
+    }
+
+
+async def _load(key: str) -> Optional[Tuple[Dict[str, Any], datetime]]:
+    try:
+        redis = await get_redis()
+        raw = await redis.hgetall(key)
+    except (RedisError, OSError) as exc:
+        logger.warning("Admin stats snapshot read failed: %s", exc)
+        return None
+    if not raw or "payload" not in raw or "generated_at" not in raw:
+        return None
+    try:
+        return json.loads(raw["payload"]), datetime.fromisoformat(raw["generated_at"])
+    except ValueError:
+        return None
+
+
+async def _store(key: str, payload: Dict[str, Any], ttl_seconds: int) -> Tuple[Dict[str, Any], datetime]:
+    payload = jsonable_encoder(payload)
+    generated_at = datetime.now(timezone.utc)
+    try:
+        redis = await get_redis()
+        pipe = redis.pipeline(transaction=True)
+        pipe.hset(key, mapping={"payload": json.dumps(payload), "generated_at": generated_at.isoformat()})
+        pipe.expire(key, ttl_seconds)
+        await pipe.execute()
+    except (RedisError, OSError) as exc:
+        logger.warning("Admin stats snapshot store failed: %s", exc)
+    return payload, generated_at
+
+
+async def refresh_snapshot(db: AsyncSession) -> Tuple[Dict[str, Any], datetime]:
+    """Пересчитать счётчики и сохранить снимок (если Redis доступен)."""
+    # Снимок живёт несколько интервалов: если цикл встал, эндпоинт пересчитает сам
+    ttl = get_settings().admin_stats_refresh_seconds * 5
+    return await _store(SNAPSHOT_KEY, await compute_counter_stats(db), ttl)
+
+
+async def refresh_usage(db: AsyncSession) -> Tuple[Dict[str, Any], datetime]:
+    """Пересчитать DAU/WAU/MAU и окна активности и сохранить снимок."""
+    return await _store(USAGE_KEY, await compute_usage_stats(db), USAGE_SNAPSHOT_TTL_SECONDS)
+
+
+async def _acquire_lock(key: str, ttl_seconds: int) -> Optional[str]:
+    """Токен взятого lock'а или None, если он занят (или Redis недоступен)."""
+    token = uuid.uuid4().hex
+    try:
+        redis = await get_redis()
+        if await redis.set(key, token, nx=True, ex=ttl_seconds):
+            return token
+    except (RedisError, OSError) as exc:
+        logger.warning("Admin stats lock %s failed: %s", key, exc)
+    return None
+
+
+async def _release_lock(key: str, token: str) -> None:
+    try:
+        redis = await get_redis()
+        await redis.eval(_RELEASE_LOCK, 1, key, token)
+    except (RedisError, OSError) as exc:
+        logger.warning("Admin stats lock %s release failed: %s", key, exc)
+
+
+async def _refresh_usage_in_background(lock_token: str) -> None:
+    try:
+        async with AsyncSessionLocal() as db:
+            await refresh_usage(db)
+    except Exception:
+        logger.exception("Admin usage stats refresh failed")
+    finally:
+        await _release_lock(USAGE_LOCK_KEY, lock_token)
+
+
+async def _schedule_usage_refresh() -> None:
+    """Устаревший usage: пересчитать в фоне, если этим ещё не занят другой воркер."""
+    lock_token = await _acquire_lock(USAGE_LOCK_KEY, USAGE_LOCK_SECONDS)
+    if lock_token is None:
+        return
+    task = asyncio.create_task(_refresh_usage_in_background(lock_token))
+    _usage_tasks.add(task)
+    task.add_done_callback(_usage_tasks.discard)
+
+
+async def get_admin_stats(db: AsyncSession, *, force_refresh: bool = False) -> Dict[str, Any]:
+    if force_refresh:
+        counters, counters_at = await refresh_snapshot(db)
+        usage, usage_at = await refresh_usage(db)
+    else:
+        counters, counters_at = await _load(SNAPSHOT_KEY) or await refresh_snapshot(db)
+        cached_usage = await _load(USAGE_KEY)
+        if cached_usage is None:
+            usage, usage_at = await refresh_usage(db)
+        else:
+            usage, usage_at = cached_usage
+            usage_age = (datetime.now(timezone.utc) - usage_at).total_seconds()
+            if usage_age > get_settings().admin_stats_usage_refresh_seconds:
+                await _schedule_usage_refresh()
+    return _with_staleness({**counters, **usage}, min(counters_at, usage_at))
+
+
+async def run_admin_stats_refresh_loop(stop_event: asyncio.Event) -> None:
+    settings = get_settings()
+    interval = max(10, int(settings.admin_stats_refresh_seconds))
+
+    while not stop_event.is_set():
+        try:
+            # Только дешёвые счётчики; usage считается по запросу (см. get_admin_stats)
+            if await _acquire_lock(REFRESH_LOCK_KEY, interval):
+                async with AsyncSessionLocal() as db:
+                    await refresh_snapshot(db)
+        except Exception:
+            logger.exception("Admin stats refresh failed")
+
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,260 @@
+# ===== 📄 ФАЙЛ: backend/app/services/analytics_event_buffer.py =====
+#
+# Буфер серверных аналитических событий (record_server_event).
+#
+# Хендлеры (/posts/feed, /posts/{id}, лайки, ...) больше не делают
+# INSERT + COMMIT в analytics_events: строка уходит в буфер, а фоновый цикл
+# пишет её пачкой — один pg_insert(...).values(rows).on_conflict_do_nothing
+# на батч. Сброс — по таймеру (ANALYTICS_FLUSH_INTERVAL_SECONDS) или раньше,
+# как только набралось ANALYTICS_FLUSH_BATCH_SIZE событий.
+#
+# Режимы:
+#   - память воркера (по умолчанию): события теряются только при падении процесса,
+#     при штатной остановке lifespan сливает буфер до конца;
+#   - Redis stream (ANALYTICS_REDIS_STREAM_ENABLED): события переживают рестарт
+#     воркера, любой воркер группы дочитывает чужие зависшие сообщения.
+#     За тик stream дочитывается полными пачками, пока не опустеет или не выйдет
+#     STREAM_TICK_BUDGET_SECONDS: иначе XADD MAXLEN ~ обрезал бы непрочитанное.
+#     Если Redis недоступен — пишем в память.
+
+import asyncio
+import json
+import logging
+import os
+import socket
+from collections import deque
+from datetime import date, datetime
+from typing import Any, Deque, Dict, List, Sequence, Tuple
+
+from redis.exceptions import RedisError, ResponseError
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import models
+from app.config import get_settings
+from app.database import AsyncSessionLocal
+from app.rate_limiter import get_redis
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = "analytics:events"
+STREAM_GROUP = "analytics_ingest"
+# Ограничение длины stream (приблизительное, XADD MAXLEN ~)
+STREAM_MAXLEN = 200_000
+# Сообщения, которые висят в PEL дольше, считаем брошенными упавшим воркером
+STREAM_CLAIM_IDLE_MS = 60_000
+# Сколько максимум дочитываем stream за один тик цикла сброса
+STREAM_TICK_BUDGET_SECONDS = 5.0
+# Защита памяти, если БД надолго недоступна: лишние события теряем, а не копим
+MAX_BUFFERED_EVENTS = 50_000
+# Postgres/asyncpg принимают не больше 32767 параметров на запрос,
+# у analytics_events ~16 колонок → не больше 2000 строк в одном INSERT
+INSERT_CHUNK_ROWS = 2000
+
+_DATETIME_FIELDS = ("event_ts_utc", "created_at")
+_DATE_FIELDS = ("event_date_msk",)
+
+_buffer: Deque[Dict[str, Any]] = deque()
+_flush_wakeup = asyncio.Event()
+_stream_group_ready = False
+
+
+def _consumer_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+# ===== СЕРИАЛИЗАЦИЯ ДЛЯ STREAM =====
+
+def _encode_row(row: Dict[str, Any]) -> str:
+    payload = dict(row)
+    for field in _DATETIME_FIELDS + _DATE_FIELDS:
+        value = payload.get(field)
+        if isinstance(value, (datetime, date)):
+            payload[field] = value.isoformat()
+    return json.dumps(payload, ensure_ascii=False)
+
+
+def _decode_row(raw: str) -> Dict[str, Any]:
+    row = json.loads(raw)
+    for field in _DATETIME_FIELDS:
+        if row.get(field):
+            row[field] = datetime.fromisoformat(row[field])
+    for field in _DATE_FIELDS:
+        if row.get(field):
+            row[field] = date.fromisoformat(row[field])
+    return row
+
+
+# ===== ПРИЁМ =====
+
+def _buffer_row(row: Dict[str, Any]) -> bool:
+    if len(_buffer) >= MAX_BUFFERED_EVENTS:
+        return False
+    _buffer.append(row)
+    if len(_buffer) >= get_settings().analytics_flush_batch_size:
+        _flush_wakeup.set()
+    return True
+
+
+async def enqueue(row: Dict[str, Any]) -> bool:
+    """Поставить строку analytics_events в очередь на запись. Без обращения к БД."""
+    if get_settings().analytics_redis_stream_enabled:
+        try:
+            redis = await get_redis()
+            await redis.xadd(STREAM_KEY, {"row": _encode_row(row)}, maxlen=STREAM_MAXLEN, approximate=True)
+            return True
+        except (RedisError, OSError) as exc:
+            logger.warning("Analytics stream append failed, buffering in memory: %s", exc)
+    return _buffer_row(row)
+
+
+def pending_count() -> int:
+    return len(_buffer)
+
+
+# ===== ЗАПИСЬ =====
+
+async def insert_rows(rows: Sequence[Dict[str, Any]]) -> None:
+    """Multi-row INSERT ... ON CONFLICT (dedup_key) DO NOTHING по INSERT_CHUNK_ROWS строк, один коммит."""
+    if not rows:
+        return
+    async with AsyncSessionLocal() as db:
+        for start in range(0, len(rows), INSERT_CHUNK_ROWS):
+            await db.execute(
+                pg_insert(models.AnalyticsEvent)
+                .values(list(rows[start:start + INSERT_CHUNK_ROWS]))
+                .on_conflict_do_nothing(index_elements=["dedup_key"])
+            )
+        await db.commit()
+
+
+async def _flush_memory_batch(batch_size: int) -> int:
+    batch = [_buffer.popleft() for _ in range(min(batch_size, len(_buffer)))]
+    if not batch:
+        return 0
+    try:
+        await insert_rows(batch)
+    except SQLAlchemyError:
+        logger.exception("Analytics events flush failed (%s events dropped)", len(batch))
+        return 0
+    return len(batch)
+
+
+async def _ensure_stream_group(redis) -> None:
+    global _stream_group_ready
+    if _stream_group_ready:
+        return
+    try:
+        await redis.xgroup_create(STREAM_KEY, STREAM_GROUP, id="0", mkstream=True)
+    except ResponseError as exc:
+        if "BUSYGROUP" not in str(exc):
+            raise
+    _stream_group_ready = True
+
+
+async def _read_stream_batch(redis, batch_size: int) -> List[Tuple[str, Dict[str, str]]]:
+    # Сначала подбираем сообщения упавших воркеров, потом новые
+    claimed = await redis.xautoclaim(
+        STREAM_KEY, STREAM_GROUP, _consumer_name(),
+        min_idle_time=STREAM_CLAIM_IDLE_MS, start_id="0-0", count=batch_size,
+    )
+    messages = list(claimed[1]) if claimed else []
+    if len(messages) < batch_size:
+        response = await redis.xreadgroup(
+            STREAM_GROUP, _consumer_name(), {STREAM_KEY: ">"}, count=batch_size - len(messages),
+        )
+        for _, stream_messages in response or []:
+            messages.extend(stream_messages)
+    return messages
+
+
+async def _flush_stream_batch(batch_size: int) -> Tuple[int, bool]:
+    """Записать одну пачку из stream. -> (записано, пришла ли полная пачка)."""
+    global _stream_group_ready
+    try:
+        redis = await get_redis()
+        await _ensure_stream_group(redis)
+        messages = await _read_stream_batch(redis, batch_size)
+    except ResponseError as exc:
+        # NOGROUP: stream удалили вместе с группой — пересоздадим на следующем тике
+        _stream_group_ready = False
+        logger.warning("Analytics stream read failed: %s", exc)
+        return 0, False
+    except (RedisError, OSError) as exc:
+        logger.warning("Analytics stream read failed: %s", exc)
+        return 0, False
+    if not messages:
+        return 0, False
+
+    message_ids = [message_id for message_id, _ in messages]
+    rows = []
+    for _, fields in messages:
+        try:
+            rows.append(_decode_row(fields["row"]))
+        except (KeyError, TypeError, ValueError):
+            logger.warning("Skipping malformed analytics stream message")
+
+    try:
+        await insert_rows(rows)
+    except SQLAlchemyError:
+        # Не ACK-аем: сообщения останутся в PEL и будут подобраны через xautoclaim
+        logger.exception("Analytics stream flush failed (%s events kept)", len(rows))
+        return 0, False
+
+    try:
+        await redis.xack(STREAM_KEY, STREAM_GROUP, *message_ids)
+        await redis.xdel(STREAM_KEY, *message_ids)
+    except (RedisError, OSError) as exc:
+        # Повторная вставка безопасна: дубликаты отсекает dedup_key
+        logger.warning("Analytics stream ack failed: %s", exc)
+    return len(rows), len(messages) >= batch_size
+
+
+async def flush_pending_events(*, drain: bool = False) -> int:
+    """Записать накопленные события. drain=True — до опустошения буфера памяти."""
+    settings = get_settings()
+    batch_size = settings.analytics_flush_batch_size
+    flushed = 0
+
+    if settings.analytics_redis_stream_enabled:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + STREAM_TICK_BUDGET_SECONDS
+        while True:
+            written, has_more = await _flush_stream_batch(batch_size)
+            flushed += written
+            if not has_more:
+                break
+            if loop.time() >= deadline:
+                # Stream отстаёт — следующий тик без ожидания интервала
+                _flush_wakeup.set()
+                break
+
+    while _buffer:
+        written = await _flush_memory_batch(batch_size)
+        flushed += written
+        if not drain and (written == 0 or len(_buffer) < batch_size):
+            break
+    return flushed
+
+
+async def run_analytics_flush_loop(stop_event: asyncio.Event) -> None:
+    settings = get_settings()
+    interval = max(1, int(settings.analytics_flush_interval_seconds))
+
+    while not stop_event.is_set():
+        waiters = [
+            asyncio.create_task(stop_event.wait()),
+            asyncio.create_task(_flush_wakeup.wait()),
+        ]
+        try:
+            await asyncio.wait(waiters, timeout=interval, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+        # Сбрасываем после пробуждения: сигнал, пришедший во время сброса, не теряется
+        _flush_wakeup.clear()
+
+        try:
+            await flush_pending_events(drain=stop_event.is_set())
+        except Exception:
+            logger.exception("Analytics events flush tick failed")
@@ -15,7 +15,7 @@ from pathlib import Path
 from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
 from zoneinfo import ZoneInfo
 
-from sqlalchemy import cast, delete, func, or_, select
+from sqlalchemy import and_, case, cast, delete, func, literal, or_, select, union_all
 from sqlalchemy.dialects.postgresql import JSONB as JSONB_TYPE
 from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -23,6 +23,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app import models
 from app.config import get_settings
 from app.database import AsyncSessionLocal
+from app.services import analytics_event_buffer
 
 logger = logging.getLogger(__name__)
 
@@ -87,8 +88,16 @@ EVENT_MODULES: Dict[str, str] = {
     "ad_click": "ads",
 }
 
+SCREEN_MODULE_KEYWORDS: Tuple[str, ...] = ("feed", "market", "dating", "notifications", "moderation", "ads")
+
 SESSION_GAP_SECONDS = 30 * 60
 SINGLE_EVENT_SESSION_SECONDS = 15
+# Дневные роллапы онлайн-времени лежат в analytics_daily_metrics под этим срезом
+ONLINE_TIME_SLICE = "online_time_daily"
+ONLINE_TIME_METRIC_KEYS: Tuple[str, ...] = ("active_seconds", "events_count", "sessions_count", "users_count")
+ONLINE_TIME_STREAM_CHUNK = 5000
+# 3 колонки на строку — с запасом под лимит 32767 bind-параметров Postgres
+ONLINE_USERS_INSERT_CHUNK = 5000
 
 ACTION_USAGE_DEFINITIONS: Tuple[Dict[str, Any], ...] = (
     {
@@ -254,7 +263,7 @@ def event_module(event_name: Optional[str], screen: Optional[str] = None) -> str
     if screen:
         normalized_screen = str(screen).strip().lower()
         if normalized_screen:
-            for known in ("feed", "market", "dating", "notifications", "moderation", "ads"):
+            for known in SCREEN_MODULE_KEYWORDS:
                 if known in normalized_screen:
                     return known
             if "post" in normalized_screen:
@@ -385,6 +394,10 @@ async def record_server_event(
         "created_at": datetime.utcnow(),
     }
 
+    if settings.analytics_buffer_enabled:
+        # Запись пачкой в фоне (analytics_event_buffer), хендлер не платит за транзакцию
+        return await analytics_event_buffer.enqueue(row)
+
     try:
         await db.execute(
             pg_insert(models.AnalyticsEvent)
@@ -906,147 +919,364 @@ async def build_activity_window_detail(
     }
 
 
-async def estimate_online_time_between_dates(
+def _event_module_expr() -> Any:
+    """SQL-версия event_module(): CASE по screen, затем по event_name."""
+    event = models.AnalyticsEvent
+    screen = func.lower(func.trim(func.coalesce(event.screen, "")))
+    whens: List[Tuple[Any, str]] = [(screen.contains(known), known) for known in SCREEN_MODULE_KEYWORDS]
+    whens.append((screen.contains("post"), "feed"))
+    whens.append((screen.contains("create"), "content"))
+    whens.extend((event.event_name == name, module) for name, module in EVENT_MODULES.items())
+    return case(*whens, else_=literal("other"))
+
+
+def _empty_module_stats() -> Dict[str, int]:
+    return {key: 0 for key in ONLINE_TIME_METRIC_KEYS}
+
+
+class OnlineTimeAccumulator:
+    """Сессионизация потока событий, упорядоченного по (event_date_msk, user_hash, event_ts_utc).
+
+    Память — O(юзеров одного дня), а не O(событий). Сессия рвётся на паузе
+    > SESSION_GAP_SECONDS и на границе МСК-суток, поэтому сумма дневных
+    роллапов совпадает с расчётом по сырым событиям за то же окно.
+    keep_users=True сохраняет юзеров по модулям (для роллапа одного дня).
+    """
+
+    def __init__(self, keep_users: bool = False) -> None:
+        self.modules: Dict[str, Dict[str, int]] = {}
+        self.user_days = 0
+        self.module_users: Optional[Dict[str, set]] = {} if keep_users else None
+        self._day: Optional[date] = None
+        self._day_users: set = set()
+        self._day_module_users: Dict[str, set] = {}
+        self._user: Optional[str] = None
+        self._session_events = 0
+        self._previous_ts: Optional[datetime] = None
+        self._previous_module: Optional[str] = None
+
+    def _stats(self, module: str) -> Dict[str, int]:
+        if module not in self.modules:
+            self.modules[module] = _empty_module_stats()
+        return self.modules[module]
+
+    def _close_session(self) -> None:
+        if self._session_events == 1 and self._previous_module:
+            self._stats(self._previous_module)["active_seconds"] += SINGLE_EVENT_SESSION_SECONDS
+        self._session_events = 0
+
+    def _close_day(self) -> None:
+        self._close_session()
+        self.user_days += len(self._day_users)
+        for module, users in self._day_module_users.items():
+            self._stats(module)["users_count"] += len(users)
+            if self.module_users is not None:
+                self.module_users.setdefault(module, set()).update(users)
+        self._day_users = set()
+        self._day_module_users = {}
+        self._user = None
+
+    def _start_session(self, module: str) -> None:
+        self._session_events = 1
+        self._stats(module)["sessions_count"] += 1
+
+    def add(
+        self,
+        user_hash: str,
+        event_ts: Optional[datetime],
+        event_date_msk: date,
+        event_name: str,
+        screen: Optional[str],
+    ) -> None:
+        if event_ts is None:
+            return
+        if event_date_msk != self._day:
+            self._close_day()
+            self._day = event_date_msk
+
+        module = event_module(event_name, screen)
+        self._day_users.add(user_hash)
+        self._day_module_users.setdefault(module, set()).add(user_hash)
+        self._stats(module)["events_count"] += 1
+
+        if self._user != user_hash:
+            self._close_session()
+            self._user = user_hash
+            self._start_session(module)
+        else:
+            gap_seconds = max(int((event_ts - self._previous_ts).total_seconds()), 0)
+            if gap_seconds > SESSION_GAP_SECONDS:
+                self._close_session()
+                self._start_session(module)
+            else:
+                if gap_seconds > 0 and self._previous_module:
+                    self._stats(self._previous_module)["active_seconds"] += gap_seconds
+                self._session_events += 1
+
+        self._previous_ts = event_ts
+        self._previous_module = module
+
+    def finish(self) -> "OnlineTimeAccumulator":
+        self._close_day()
+        return self
+
+    def merge_rollup(self, day_rows: Dict[str, Dict[str, int]]) -> None:
+        """Добавить готовый дневной роллап (dimension_key → метрики)."""
+        for module, stats in day_rows.items():
+            if module == "all":
+                self.user_days += int(stats.get("users_count", 0))
+                continue
+            target = self._stats(module)
+            for key in ONLINE_TIME_METRIC_KEYS:
+                target[key] += int(stats.get(key, 0))
+
+    def rollup_rows(self) -> List[Dict[str, Any]]:
+        """Строки среза online_time_daily для persist_daily_metrics (один день)."""
+        totals = _empty_module_stats()
+        rows: List[Dict[str, Any]] = []
+        for module, stats in sorted(self.modules.items()):
+            for key in ONLINE_TIME_METRIC_KEYS:
+                if key != "users_count":
+                    totals[key] += stats[key]
+                rows.append({"module": module, "metric_key": key, "value": stats[key]})
+        # "all" есть всегда — по нему видно, что день уже свёрнут
+        totals["users_count"] = self.user_days
+        rows.extend({"module": "all", "metric_key": key, "value": totals[key]} for key in ONLINE_TIME_METRIC_KEYS)
+        return rows
+
+
+async def stream_online_time(
     db: AsyncSession,
-    start_date: date,
-    end_date: date,
+    days: Sequence[date],
     names: Sequence[str] = REAL_ACTIVITY_EVENT_NAMES,
-) -> Dict[str, Any]:
-    if not names or end_date < start_date:
-        return {
-            "users_count": 0,
-            "sessions_count": 0,
-            "total_active_seconds": 0,
-            "avg_session_seconds": 0,
-            "avg_daily_user_seconds": 0,
-            "places": [],
-        }
+    *,
+    keep_users: bool = False,
+) -> OnlineTimeAccumulator:
+    """Сессионизация по server-side курсору: события читаются чанками по ONLINE_TIME_STREAM_CHUNK."""
+    accumulator = OnlineTimeAccumulator(keep_users=keep_users)
+    if not days or not names:
+        return accumulator.finish()
+
+    event = models.AnalyticsEvent
+    stmt = (
+        select(event.user_hash, event.event_ts_utc, event.event_date_msk, event.event_name, event.screen)
+        .where(
+            event.event_date_msk.in_(list(days)),
+            event.event_name.in_(list(names)),
+        )
+        .order_by(event.event_date_msk, event.user_hash, event.event_ts_utc)
+        .execution_options(yield_per=ONLINE_TIME_STREAM_CHUNK)
+    )
+    result = await db.stream(stmt)
+    async for user_hash, event_ts, event_date_msk, event_name, screen in result:
+        accumulator.add(user_hash, event_ts, event_date_msk, event_name, screen)
+    return accumulator.finish()
 
-    result = await db.execute(
+
+async def _load_online_time_rollups(
+    db: AsyncSession,
+    start_date: date,
+    end_date: date,
+) -> Dict[date, Dict[str, Dict[str, int]]]:
+    if end_date < start_date:
+        return {}
+    rows = await db.execute(
         select(
-            models.AnalyticsEvent.user_hash,
-            models.AnalyticsEvent.event_ts_utc,
-            models.AnalyticsEvent.event_date_msk,
-            models.AnalyticsEvent.event_name,
-            models.AnalyticsEvent.screen,
+            models.AnalyticsDailyMetric.date_msk,
+            models.AnalyticsDailyMetric.dimension_key,
+            models.AnalyticsDailyMetric.metric_key,
+            models.AnalyticsDailyMetric.value_num,
+        ).where(
+            models.AnalyticsDailyMetric.slice_name == ONLINE_TIME_SLICE,
+            models.AnalyticsDailyMetric.date_msk >= start_date,
+            models.AnalyticsDailyMetric.date_msk <= end_date,
         )
+    )
+    rollups: Dict[date, Dict[str, Dict[str, int]]] = {}
+    for day, module, metric_key, value in rows.all():
+        rollups.setdefault(day, {}).setdefault(module, {})[metric_key] = int(value or 0)
+    if not rollups:
+        return {}
+
+    user_days = await db.execute(
+        select(models.AnalyticsDailyModuleUser.date_msk)
         .where(
-            models.AnalyticsEvent.event_date_msk >= start_date,
-            models.AnalyticsEvent.event_date_msk <= end_date,
-            models.AnalyticsEvent.event_name.in_(list(names)),
+            models.AnalyticsDailyModuleUser.date_msk >= start_date,
+            models.AnalyticsDailyModuleUser.date_msk <= end_date,
         )
-        .order_by(models.AnalyticsEvent.user_hash, models.AnalyticsEvent.event_ts_utc)
+        .distinct()
     )
+    days_with_users = set(user_days.scalars().all())
+    # День без строки "all" или без юзеров по модулям свёрнут не до конца — считаем его по событиям
+    return {
+        day: modules for day, modules in rollups.items()
+        if "all" in modules and (day in days_with_users or not modules["all"].get("users_count"))
+    }
 
-    rows = result.all()
-    if not rows:
-        return {
-            "users_count": 0,
-            "sessions_count": 0,
-            "total_active_seconds": 0,
-            "avg_session_seconds": 0,
-            "avg_daily_user_seconds": 0,
-            "places": [],
-        }
 
-    users = set()
-    active_user_days = set()
-    sessions_count = 0
-    total_active_seconds = 0
-    place_map: Dict[str, Dict[str, Any]] = {}
+async def store_online_time_users(db: AsyncSession, day: date, accumulator: OnlineTimeAccumulator) -> None:
+    """Заменить юзеров дня по модулям (без COMMIT — вместе с роллапом дня)."""
+    await db.execute(
+        delete(models.AnalyticsDailyModuleUser).where(models.AnalyticsDailyModuleUser.date_msk == day)
+    )
+    rows = [
+        {"date_msk": day, "module": module, "user_hash": user_hash}
+        for module, users in sorted((accumulator.module_users or {}).items())
+        for user_hash in sorted(users)
+    ]
+    for offset in range(0, len(rows), ONLINE_USERS_INSERT_CHUNK):
+        await db.execute(
+            pg_insert(models.AnalyticsDailyModuleUser)
+            .values(rows[offset:offset + ONLINE_USERS_INSERT_CHUNK])
+            .on_conflict_do_nothing()
+        )
 
-    current_user: Optional[str] = None
-    current_session_events = 0
-    previous_ts: Optional[datetime] = None
-    previous_module: Optional[str] = None
 
-    def ensure_place(module: str) -> Dict[str, Any]:
-        if module not in place_map:
-            place_map[module] = {
-                "module": module,
-                "active_seconds": 0,
-                "events_count": 0,
-                "users": set(),
-            }
-        return place_map[module]
+async def backfill_online_time_rollups(db: AsyncSession, today_msk: date, *, days: int = 30) -> int:
+    """Свернуть закрытые дни окна, для которых ещё нет роллапа online_time_daily."""
+    start_date = today_msk - timedelta(days=days)
+    end_date = today_msk - timedelta(days=1)
+    existing = await _load_online_time_rollups(db, start_date, end_date)
+    missing = [
+        start_date + timedelta(days=offset)
+        for offset in range((end_date - start_date).days + 1)
+        if start_date + timedelta(days=offset) not in existing
+    ]
+    for day in missing:
+        accumulator = await stream_online_time(db, [day], keep_users=True)
+        await store_online_time_users(db, day, accumulator)
+        await db.execute(
+            delete(models.AnalyticsDailyMetric).where(
+                models.AnalyticsDailyMetric.date_msk == day,
+                models.AnalyticsDailyMetric.slice_name == ONLINE_TIME_SLICE,
+            )
+        )
+        for row in _build_flat_metrics(
+            kpi_metrics=(), funnel_rows=(), modules_rows=(), quality_rows=(), retention_rows=(),
+            online_time_rows=accumulator.rollup_rows(),
+        ):
+            db.add(
+                models.AnalyticsDailyMetric(
+                    date_msk=day,
+                    slice_name=row["slice_name"],
+                    metric_key=row["metric_key"],
+                    dimension_key=row["dimension_key"],
+                    value_num=row["value_num"],
+                    calc_status=row["calc_status"],
+                    computed_at=datetime.utcnow(),
+                )
+            )
+        await db.commit()
+    return len(missing)
 
-    def close_session() -> None:
-        nonlocal sessions_count, total_active_seconds, current_session_events, previous_module
-        if current_session_events <= 0:
-            return
-        sessions_count += 1
-        if current_session_events == 1 and previous_module:
-            place = ensure_place(previous_module)
-            place["active_seconds"] += SINGLE_EVENT_SESSION_SECONDS
-            total_active_seconds += SINGLE_EVENT_SESSION_SECONDS
-        current_session_events = 0
-
-    for user_hash, event_ts, event_date_msk, event_name, screen in rows:
-        if event_ts is None:
-            continue
-        module = event_module(event_name, screen)
-        users.add(user_hash)
-        active_user_days.add((user_hash, event_date_msk))
-
-        place = ensure_place(module)
-        place["events_count"] += 1
-        place["users"].add(user_hash)
-
-        if current_user != user_hash:
-            close_session()
-            current_user = user_hash
-            current_session_events = 1
-            previous_ts = event_ts
-            previous_module = module
-            continue
 
-        gap_seconds = int((event_ts - previous_ts).total_seconds()) if previous_ts else 0
-        if gap_seconds < 0:
-            gap_seconds = 0
+async def _count_online_users_by_module(
+    db: AsyncSession,
+    rollup_days: Sequence[date],
+    live_days: Sequence[date],
+    names: Sequence[str],
+) -> Tuple[int, Dict[str, int]]:
+    """
+    Уникальные юзеры окна: всего и по модулям (GROUP BY ROLLUP, один запрос).
+    Закрытые дни — из analytics_daily_module_users, сырые события — только за live_days.
+    """
+    parts = []
+    if rollup_days:
+        rolled = models.AnalyticsDailyModuleUser
+        parts.append(
+            select(rolled.user_hash, rolled.module).where(rolled.date_msk.in_(list(rollup_days)))
+        )
+    if live_days:
+        event = models.AnalyticsEvent
+        parts.append(
+            select(event.user_hash, _event_module_expr().label("module")).where(
+                event.event_date_msk.in_(list(live_days)),
+                event.event_name.in_(list(names)),
+                event.event_ts_utc.isnot(None),
+            )
+        )
+    if not parts:
+        return 0, {}
 
-        if gap_seconds > SESSION_GAP_SECONDS:
-            close_session()
-            current_session_events = 1
+    users = (parts[0] if len(parts) == 1 else union_all(*parts)).subquery()
+    rows = await db.execute(
+        select(users.c.module, func.count(func.distinct(users.c.user_hash))).group_by(func.rollup(users.c.module))
+    )
+    total = 0
+    by_module: Dict[str, int] = {}
+    for module, users in rows.all():
+        if module is None:
+            total = int(users or 0)
         else:
-            duration = gap_seconds
-            if duration > 0 and previous_module:
-                prev_place = ensure_place(previous_module)
-                prev_place["active_seconds"] += duration
-                total_active_seconds += duration
-            current_session_events += 1
+            by_module[module] = int(users or 0)
+    return total, by_module
+
+
+async def estimate_online_time_between_dates(
+    db: AsyncSession,
+    start_date: date,
+    end_date: date,
+    names: Sequence[str] = REAL_ACTIVITY_EVENT_NAMES,
+) -> Dict[str, Any]:
+    empty = {
+        "users_count": 0,
+        "sessions_count": 0,
+        "total_active_seconds": 0,
+        "avg_session_seconds": 0,
+        "avg_daily_user_seconds": 0,
+        "places": [],
+    }
+    if not names or end_date < start_date:
+        return empty
+
+    window_days = [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+
+    # Закрытые дни берём из роллапов nightly-отчёта, остальные досчитываем потоком
+    rollups: Dict[date, Dict[str, Dict[str, int]]] = {}
+    if tuple(names) == REAL_ACTIVITY_EVENT_NAMES:
+        last_closed_day = min(end_date, datetime.now(MSK_TZ).date() - timedelta(days=1))
+        rollups = await _load_online_time_rollups(db, start_date, last_closed_day)
 
-        previous_ts = event_ts
-        previous_module = module
+    live_days = [day for day in window_days if day not in rollups]
+    accumulator = await stream_online_time(db, live_days, names)
+    for day_rows in rollups.values():
+        accumulator.merge_rollup(day_rows)
 
-    close_session()
+    if not any(stats["events_count"] for stats in accumulator.modules.values()):
+        return empty
 
-    denominator_days = max(len(active_user_days), 1)
+    users_count, module_users = await _count_online_users_by_module(db, list(rollups), live_days, names)
+
+    total_active_seconds = sum(stats["active_seconds"] for stats in accumulator.modules.values())
+    sessions_count = sum(stats["sessions_count"] for stats in accumulator.modules.values())
     places: List[Dict[str, Any]] = []
-    for row in place_map.values():
-        users_set = row.pop("users")
-        active_seconds = int(row["active_seconds"])
+    for module, stats in accumulator.modules.items():
+        if not stats["events_count"]:
+            continue
+        place_users = module_users.get(module, 0)
         places.append(
             {
-                "module": row["module"],
-                "active_seconds": active_seconds,
-                "avg_user_seconds": int(round(active_seconds / max(len(users_set), 1))),
-                "events_count": int(row["events_count"]),
-                "users_count": len(users_set),
+                "module": module,
+                "active_seconds": int(stats["active_seconds"]),
+                "avg_user_seconds": int(round(stats["active_seconds"] / max(place_users, 1))),
+                "events_count": int(stats["events_count"]),
+                "users_count": place_users,
             }
         )
 
     places.sort(key=lambda item: item["active_seconds"], reverse=True)
 
     return {
-        "users_count": len(users),
+        "users_count": users_count,
         "sessions_count": sessions_count,
         "total_active_seconds": int(total_active_seconds),
         "avg_session_seconds": int(round(total_active_seconds / max(sessions_count, 1))),
-        "avg_daily_user_seconds": int(round(total_active_seconds / denominator_days)),
+        "avg_daily_user_seconds": int(round(total_active_seconds / max(accumulator.user_days, 1))),
         "places": places,
         "method": {
             "session_gap_seconds": SESSION_GAP_SECONDS,
             "single_event_session_seconds": SINGLE_EVENT_SESSION_SECONDS,
+            "rollup_days": len(rollups),
         },
     }
 
@@ -1101,24 +1331,6 @@ async def build_admin_usage_summary(db: AsyncSession, today_msk: date) -> Dict[s
     }
 
 
-async def _count_returned_users_for_cohort(
-    db: AsyncSession,
-    *,
-    target_date: date,
-    cohort_user_hashes: Iterable[str],
-) -> int:
-    hashes = list(cohort_user_hashes)
-    if not hashes:
-        return 0
-    value = await db.scalar(
-        select(func.count(func.distinct(models.AnalyticsEvent.user_hash))).where(
-            models.AnalyticsEvent.event_date_msk == target_date,
-            models.AnalyticsEvent.user_hash.in_(hashes),
-        )
-    )
-    return int(value or 0)
-
-
 async def _count_market_favorites(db: AsyncSession, day_start_utc: datetime, day_end_utc: datetime) -> int:
     value = await db.scalar(
         select(func.count(models.MarketFavorite.id)).where(
@@ -1129,8 +1341,7 @@ async def _count_market_favorites(db: AsyncSession, day_start_utc: datetime, day
     return int(value or 0)
 
 
-async def _count_market_favorite_users(db: AsyncSession, report_date: date, day_start_utc: datetime, day_end_utc: datetime) -> int:
-    event_users = await _count_distinct_users_for_event(db, report_date, ["market_favorite"])
+async def _count_market_favorite_users(db: AsyncSession, event_users: int, day_start_utc: datetime, day_end_utc: datetime) -> int:
     if event_users:
         return event_users
 
@@ -1153,8 +1364,7 @@ async def _count_market_opens_from_views(db: AsyncSession, day_start_utc: dateti
     return int(value or 0)
 
 
-async def _count_market_open_users(db: AsyncSession, report_date: date, day_start_utc: datetime, day_end_utc: datetime) -> int:
-    event_users = await _count_distinct_users_for_event(db, report_date, ["market_item_open"])
+async def _count_market_open_users(db: AsyncSession, event_users: int, day_start_utc: datetime, day_end_utc: datetime) -> int:
     if event_users:
         return event_users
 
@@ -1199,21 +1409,6 @@ async def _count_notifications_read(db: AsyncSession, day_start_utc: datetime, d
     return int(value or 0)
 
 
-async def _count_notification_actions(db: AsyncSession, report_date: date) -> int:
-    rows = await db.execute(
-        select(models.AnalyticsEvent.properties_json).where(
-            models.AnalyticsEvent.event_date_msk == report_date,
-            models.AnalyticsEvent.event_name == "notification_open",
-        )
-    )
-    acted = 0
-    for props in rows.scalars().all():
-        payload = props if isinstance(props, dict) else {}
-        if bool(payload.get("acted") or payload.get("action_taken") or payload.get("clicked")):
-            acted += 1
-    return acted
-
-
 async def _count_reports_reviewed(db: AsyncSession, day_start_utc: datetime, day_end_utc: datetime) -> Tuple[int, int]:
     rows = await db.execute(
         select(models.Report.created_at, models.Report.reviewed_at).where(
@@ -1284,13 +1479,111 @@ async def _load_wow_for_metrics(
     return {key: wow_change(current_map.get(key), prev_map.get(key)) for key in metric_keys}
 
 
-async def _load_event_name_counts(db: AsyncSession, report_date: date) -> Dict[str, int]:
-    rows = await db.execute(
-        select(models.AnalyticsEvent.event_name, func.count(models.AnalyticsEvent.id)).where(
-            models.AnalyticsEvent.event_date_msk == report_date
-        ).group_by(models.AnalyticsEvent.event_name)
+# ===== ДНЕВНЫЕ СЧЁТЧИКИ СОБЫТИЙ: ОДИН ПРОХОД ПО analytics_events =====
+#
+# Все счётчики отчёта за день считаются одним SELECT с агрегатами
+# COUNT(DISTINCT user_hash) / COUNT(*) FILTER (WHERE ...) по партиции event_date_msk,
+# дальше метрики и воронки собираются в памяти.
+
+DAILY_USER_COUNTS: Dict[str, Tuple[str, ...]] = {
+    "active_users": REAL_ACTIVITY_EVENT_NAMES,
+    "onboarding_step_users": ("onboarding_step_completed",),
+    "onboarding_completed_users": ("onboarding_completed",),
+    "feed_view_users": ("feed_open",),
+    "engaged_feed_users": ("post_like", "comment_create"),
+    "post_open_users": ("post_open",),
+    "post_impression_users": ("post_impression",),
+    "create_open_users": ("create_open",),
+    "create_submit_users": ("create_submit",),
+    "create_success_users": ("create_success",),
+    "market_favorite_event_users": ("market_favorite",),
+    "market_item_open_event_users": ("market_item_open",),
+}
+
+NOTIFICATION_ACTION_FLAGS: Tuple[str, ...] = ("acted", "action_taken", "clicked")
+# Текстовые представления JSON-значений, которые в Python были бы falsy
+_FALSY_JSON_TEXT: Tuple[str, ...] = ("false", "0", "0.0", "", "[]", "{}")
+
+
+def _event_count_label(event_name: str) -> str:
+    return f"events__{event_name}"
+
+
+def _json_flag_truthy(key: str) -> Any:
+    value = models.AnalyticsEvent.properties_json[key].astext
+    return and_(value.isnot(None), value.notin_(_FALSY_JSON_TEXT))
+
+
+async def load_daily_event_counts(
+    db: AsyncSession,
+    report_date: date,
+    *,
+    new_user_hashes: Iterable[str] = (),
+) -> Dict[str, int]:
+    """Счётчики analytics_events за report_date одним запросом.
+
+    Ключи: DAILY_USER_COUNTS, activated_users, notifications_acted и
+    events__<event_name> для каждого встреченного в отчёте события.
+    """
+    event = models.AnalyticsEvent
+    hashes = list(new_user_hashes)
+    counted_event_names = sorted(set(REQUIRED_EVENT_NAMES))
+
+    columns: List[Any] = [
+        func.count(func.distinct(event.user_hash)).filter(event.event_name.in_(list(names))).label(key)
+        for key, names in DAILY_USER_COUNTS.items()
+    ]
+    columns.extend(
+        func.count(event.id).filter(event.event_name == name).label(_event_count_label(name))
+        for name in counted_event_names
+    )
+    columns.append(
+        func.count(event.id).filter(
+            event.event_name == "notification_open",
+            or_(*[_json_flag_truthy(flag) for flag in NOTIFICATION_ACTION_FLAGS]),
+        ).label("notifications_acted")
     )
-    return {name: int(count) for name, count in rows.all()}
+    if hashes:
+        columns.append(
+            func.count(func.distinct(event.user_hash)).filter(
+                event.event_name.in_(list(REAL_ACTIVITY_EVENT_NAMES)),
+                event.user_hash.in_(hashes),
+            ).label("activated_users")
+        )
+
+    row = (await db.execute(select(*columns).where(event.event_date_msk == report_date))).mappings().one()
+    counts = {key: int(value or 0) for key, value in row.items()}
+    if not hashes:
+        # Как и раньше: без когорты новых юзеров фильтр по ней не применяется
+        counts["activated_users"] = counts["active_users"]
+    return counts
+
+
+async def _count_returned_users_by_date(
+    db: AsyncSession,
+    *,
+    target_dates: Sequence[date],
+    cohort_user_hashes: Iterable[str],
+) -> Dict[date, int]:
+    hashes = list(cohort_user_hashes)
+    dates = list(target_dates)
+    if not hashes or not dates:
+        return {target: 0 for target in dates}
+
+    event = models.AnalyticsEvent
+    columns = [
+        func.count(func.distinct(event.user_hash)).filter(event.event_date_msk == target).label(f"d{idx}")
+        for idx, target in enumerate(dates)
+    ]
+    row = (
+        await db.execute(
+            select(*columns).where(
+                event.event_date_msk.in_(dates),
+                event.user_hash.in_(hashes),
+            )
+        )
+    ).one()
+    return {target: int(row[idx] or 0) for idx, target in enumerate(dates)}
 
 
 async def _compute_late_events_rate(db: AsyncSession, day_start_utc: datetime, day_end_utc: datetime) -> Optional[float]:
@@ -1420,6 +1713,7 @@ def _build_flat_metrics(
     modules_rows: Sequence[Dict[str, Any]],
     quality_rows: Sequence[Dict[str, Any]],
     retention_rows: Sequence[Dict[str, Any]],
+    online_time_rows: Sequence[Dict[str, Any]] = (),
 ) -> List[Dict[str, Any]]:
     rows: List[Dict[str, Any]] = []
 
@@ -1493,6 +1787,20 @@ def _build_flat_metrics(
             }
         )
 
+    for row in online_time_rows:
+        rows.append(
+            {
+                "slice_name": ONLINE_TIME_SLICE,
+                "metric_key": row["metric_key"],
+                "dimension_key": row["module"],
+                "value_num": float(row["value"] or 0.0),
+                "numerator": None,
+                "denominator": None,
+                "pct_value": None,
+                "calc_status": OK_STATUS,
+            }
+        )
+
     return rows
 
 
@@ -1503,42 +1811,42 @@ async def compute_daily_report_metrics(db: AsyncSession, report_date: date) -> D
     new_users_count, new_user_ids = await _load_new_users(db, day_start_utc, day_end_utc)
     new_user_hashes = {hash_user_id(uid, get_settings().analytics_salt) for uid in new_user_ids}
 
-    active_users = await _count_distinct_users_for_event(db, report_date, REAL_ACTIVITY_EVENT_NAMES)
-    activated_users = await _count_distinct_users_for_event(
-        db,
-        report_date,
-        REAL_ACTIVITY_EVENT_NAMES,
-        allowed_user_hashes=new_user_hashes if new_user_hashes else None,
-    )
+    counts = await load_daily_event_counts(db, report_date, new_user_hashes=new_user_hashes)
+    active_users = counts["active_users"]
+    activated_users = counts["activated_users"]
 
-    onboarding_step_users = await _count_distinct_users_for_event(db, report_date, ["onboarding_step_completed"])
-    onboarding_completed_users = await _count_distinct_users_for_event(db, report_date, ["onboarding_completed"])
+    onboarding_step_users = counts["onboarding_step_users"]
+    onboarding_completed_users = counts["onboarding_completed_users"]
 
-    feed_view_users = await _count_distinct_users_for_event(db, report_date, ["feed_open"])
-    engaged_feed_users = await _count_distinct_users_for_event(db, report_date, ["post_like", "comment_create"])
+    feed_view_users = counts["feed_view_users"]
+    engaged_feed_users = counts["engaged_feed_users"]
 
-    post_open_users = await _count_distinct_users_for_event(db, report_date, ["post_open"])
-    post_impression_users = await _count_distinct_users_for_event(db, report_date, ["post_impression"])
+    post_open_users = counts["post_open_users"]
+    post_impression_users = counts["post_impression_users"]
     post_open_denominator_users = post_impression_users or feed_view_users
 
-    create_open_users = await _count_distinct_users_for_event(db, report_date, ["create_open"])
-    create_submit_users = await _count_distinct_users_for_event(db, report_date, ["create_submit"])
-    create_success_users = await _count_distinct_users_for_event(db, report_date, ["create_success"])
+    create_open_users = counts["create_open_users"]
+    create_submit_users = counts["create_submit_users"]
+    create_success_users = counts["create_success_users"]
 
     help_post_response = await build_help_post_response_summary_between_dates(db, report_date, report_date)
 
     market_favorites = await _count_market_favorites(db, day_start_utc, day_end_utc)
-    market_item_opens = await _count_events(db, report_date, ["market_item_open"])
+    market_item_opens = counts[_event_count_label("market_item_open")]
     if market_item_opens == 0:
         market_item_opens = await _count_market_opens_from_views(db, day_start_utc, day_end_utc)
-    market_favorite_users = await _count_market_favorite_users(db, report_date, day_start_utc, day_end_utc)
-    market_item_open_users = await _count_market_open_users(db, report_date, day_start_utc, day_end_utc)
+    market_favorite_users = await _count_market_favorite_users(
+        db, counts["market_favorite_event_users"], day_start_utc, day_end_utc,
+    )
+    market_item_open_users = await _count_market_open_users(
+        db, counts["market_item_open_event_users"], day_start_utc, day_end_utc,
+    )
 
     dating_likes = await _count_dating_likes(db, day_start_utc, day_end_utc)
     matches = await _count_matches(db, day_start_utc, day_end_utc)
 
-    notifications_opened = await _count_events(db, report_date, ["notification_open"])
-    notifications_acted = await _count_notification_actions(db, report_date)
+    notifications_opened = counts[_event_count_label("notification_open")]
+    notifications_acted = counts["notifications_acted"]
     if notifications_opened == 0:
         notifications_opened = await _count_notifications_read(db, day_start_utc, day_end_utc)
         notifications_acted = notifications_opened
@@ -1549,6 +1857,18 @@ async def compute_daily_report_metrics(db: AsyncSession, report_date: date) -> D
     ad_impressions = await _count_ad_impressions(db, day_start_utc, day_end_utc)
     ad_clicks = await _count_ad_clicks(db, day_start_utc, day_end_utc)
 
+    # Дневной роллап онлайн-времени: окна админки читают его вместо сырых событий
+    online_time = await stream_online_time(db, [report_date], keep_users=True)
+
+    matured_targets = [
+        report_date + timedelta(days=window)
+        for window in (1, 7, 30)
+        if report_date + timedelta(days=window) <= today_msk
+    ]
+    returned_by_date = await _count_returned_users_by_date(
+        db, target_dates=matured_targets, cohort_user_hashes=new_user_hashes,
+    )
+
     retention_metrics: List[PercentMetric] = []
     retention_rows: List[Dict[str, Any]] = []
     for window in (1, 7, 30):
@@ -1560,7 +1880,7 @@ async def compute_daily_report_metrics(db: AsyncSession, report_date: date) -> D
             metric = PercentMetric(metric_key=metric_key, label=label, numerator=0.0, denominator=float(new_users_count), pct_value=None, calc_status=WINDOW_NOT_MATURED)
             returned = 0
         else:
-            returned = await _count_returned_users_for_cohort(db, target_date=target_date, cohort_user_hashes=new_user_hashes)
+            returned = returned_by_date[target_date]
             metric = percentage_metric(metric_key, label, returned, new_users_count)
 
         retention_metrics.append(metric)
@@ -1609,8 +1929,7 @@ async def compute_daily_report_metrics(db: AsyncSession, report_date: date) -> D
     ]
     wow_map = await _load_wow_for_metrics(db, report_date, wow_keys, kpi_metrics)
 
-    event_name_counts = await _load_event_name_counts(db, report_date)
-    missing_events = [name for name in REQUIRED_EVENT_NAMES if event_name_counts.get(name, 0) == 0]
+    missing_events = [name for name in REQUIRED_EVENT_NAMES if counts[_event_count_label(name)] == 0]
     missing_events_rate = round((len(missing_events) / len(REQUIRED_EVENT_NAMES)) * 100, 4)
     late_events_rate = await _compute_late_events_rate(db, day_start_utc, day_end_utc)
     metric_drift_rate = await _compute_metric_drift_rate(db, kpi_metrics, report_date)
@@ -1691,12 +2010,14 @@ async def compute_daily_report_metrics(db: AsyncSession, report_date: date) -> D
         "moderation": moderation_rows,
         "quality_checks": quality_rows,
         "anomalies": anomalies,
+        "online_time": online_time,
         "flat_metrics": _build_flat_metrics(
             kpi_metrics=kpi_metrics,
             funnel_rows=funnel_rows,
             modules_rows=modules_rows,
             quality_rows=quality_rows,
             retention_rows=retention_rows,
+            online_time_rows=online_time.rollup_rows(),
         ),
     }
 
@@ -1848,6 +2169,8 @@ def get_latest_report_metadata() -> Optional[Dict[str, Any]]:
 
 async def rebuild_daily_report(db: AsyncSession, report_date: date, *, generated_by: str = "system") -> Dict[str, Any]:
     metrics = await compute_daily_report_metrics(db, report_date)
+    # Юзеры по модулям пишутся в той же транзакции, что и срез online_time_daily
+    await store_online_time_users(db, report_date, metrics["online_time"])
     await persist_daily_metrics(db, report_date, metrics["flat_metrics"])
     await apply_retention_policies(db)
     report_payload = build_report_payload(report_date, metrics, generated_by=generated_by)
@@ -1910,6 +2233,9 @@ async def apply_retention_policies(db: AsyncSession) -> None:
 
     await db.execute(delete(models.AnalyticsEvent).where(models.AnalyticsEvent.event_ts_utc < raw_cutoff))
     await db.execute(delete(models.AnalyticsDailyMetric).where(models.AnalyticsDailyMetric.date_msk < agg_cutoff))
+    await db.execute(
+        delete(models.AnalyticsDailyModuleUser).where(models.AnalyticsDailyModuleUser.date_msk < agg_cutoff)
+    )
     await db.commit()
 
 
@@ -1935,6 +2261,7 @@ async def run_nightly_rebuild_loop(stop_event: asyncio.Event) -> None:
             report_date = (datetime.now(MSK_TZ) - timedelta(days=1)).date()
             async with AsyncSessionLocal() as db:
                 await rebuild_daily_report(db, report_date, generated_by="nightly")
+                await backfill_online_time_rollups(db, report_date + timedelta(days=1))
             logger.info("Nightly analytics rebuild completed for %s", report_date.isoformat())
         except Exception:
             logger.exception("Nightly analytics rebuild failed")
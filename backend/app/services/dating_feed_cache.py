@@ -0,0 +1,54 @@
+# ===== 📄 ФАЙЛ: backend/app/services/dating_feed_cache.py =====
+#
+# Сессия дейтинг-ленты: ранжированный пул кандидатов в Redis.
+#
+# Первая страница (offset=0) заново собирает пул из SQL и скорит его
+# (dating_scoring.score_candidates), а ранжированный список [[user_id, score], ...]
+# кладётся в dating_feed:{user_id}:{looking_for} на DATING_FEED_CACHE_TTL_SECONDS.
+# Следующие страницы режут этот список и догружают из БД только свои анкеты.
+# Сессия истекла или Redis недоступен — пул пересобирается, как раньше.
+
+import json
+import logging
+from typing import List, Optional
+
+from redis.exceptions import RedisError
+
+from app.config import get_settings
+from app.rate_limiter import get_redis
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = "dating_feed"
+
+
+def _redis_key(user_id: int, looking_for: Optional[str]) -> str:
+    return f"{REDIS_KEY_PREFIX}:{user_id}:{looking_for or 'all'}"
+
+
+async def get_ranked(user_id: int, looking_for: Optional[str]) -> Optional[List[List[int]]]:
+    """Ранжированный пул текущей сессии или None, если сессии нет."""
+    try:
+        redis = await get_redis()
+        raw = await redis.get(_redis_key(user_id, looking_for))
+    except (RedisError, OSError) as exc:
+        logger.warning("Dating feed cache read failed: %s", exc)
+        return None
+    if raw is None:
+        return None
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return None
+
+
+async def store_ranked(user_id: int, looking_for: Optional[str], ranked: List[List[int]]) -> None:
+    try:
+        redis = await get_redis()
+        await redis.set(
+            _redis_key(user_id, looking_for),
+            json.dumps(ranked, separators=(",", ":")),
+            ex=get_settings().dating_feed_cache_ttl_seconds,
+        )
+    except (RedisError, OSError) as exc:
+        logger.warning("Dating feed cache store failed: %s", exc)
@@ -5,7 +5,9 @@
 import json
 import random
 from datetime import datetime, timezone, timedelta
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Sequence, Tuple
+
+import numpy as np
 
 
 # ========================================
@@ -54,7 +56,7 @@ JITTER_RANGE = 10                 # ±10 баллов
 
 # --- Fallback ---
 MIN_CANDIDATES_BEFORE_FALLBACK = 5  # Если кандидатов < 5, убираем фильтр вуза
-SCORING_POOL_SIZE = 200             # Сколько кандидатов забирать из SQL для скоринга
+SCORING_POOL_SIZE = 1000            # Сколько кандидатов забирать из SQL для скоринга
 
 
 # ========================================
@@ -76,6 +78,26 @@ def _parse_json_safe(value: Any) -> list:
     return []
 
 
+def _norm(value: Any) -> str:
+    return str(value).strip().lower() if value else ""
+
+
+class MatchContext:
+    """
+    Нормализованные вуз/интересы/цели смотрящего.
+    Собирается один раз на запрос и переиспользуется для всех кандидатов.
+    """
+
+    __slots__ = ("user", "university", "institute", "interests", "goals")
+
+    def __init__(self, me_user, me_profile):
+        self.user = me_user
+        self.university = _norm(me_user.university)
+        self.institute = _norm(me_user.institute)
+        self.interests = {_norm(i) for i in _parse_json_safe(me_user.interests)}
+        self.goals = {_norm(g) for g in (_parse_json_safe(me_profile.goals) if me_profile else [])}
+
+
 def calculate_age_penalty(my_age: int, their_age: int) -> int:
     """
     Динамический штраф за разницу в возрасте.
@@ -157,6 +179,71 @@ def calculate_activity_penalty(last_active_at: Optional[datetime]) -> int:
         return PENALTY_INACTIVE_7D
 
 
+def _match_parts(context: MatchContext, candidate_user, candidate_profile) -> Dict:
+    """Вуз, общие интересы и цели — то, из чего складываются score и match_reason."""
+    me_user = context.user
+    uni_score = 0
+    same_institute = False
+    if context.university and context.university == _norm(candidate_user.university):
+        uni_score += WEIGHT_SAME_UNIVERSITY
+
+        # Бонус за кампус
+        if me_user.campus_id and candidate_user.campus_id:
+            if me_user.campus_id == candidate_user.campus_id:
+                uni_score += WEIGHT_SAME_CAMPUS
+
+        # Бонус за факультет
+        if context.institute and context.institute == _norm(candidate_user.institute):
+            same_institute = True
+            uni_score += WEIGHT_SAME_INSTITUTE
+
+        # Бонус за курс
+        if me_user.course and candidate_user.course:
+            if me_user.course == candidate_user.course:
+                uni_score += WEIGHT_SAME_COURSE
+
+    their_interests = {_norm(i) for i in _parse_json_safe(candidate_user.interests)}
+    common_interests = context.interests & their_interests
+
+    their_goals_raw = _parse_json_safe(candidate_profile.goals) if candidate_profile else []
+    their_goals = {_norm(g) for g in their_goals_raw}
+    common_goals = context.goals & their_goals
+    goal_score = 0
+    if context.goals and their_goals:
+        if common_goals:
+            goal_score = WEIGHT_GOAL_MATCH
+        else:
+            goal_score = WEIGHT_GOAL_CONFLICT
+
+    # Для match_reason кампус и курс не в счёт: «faculty» — только при общем факультете
+    reason_uni_score = 0
+    if uni_score:
+        reason_uni_score = WEIGHT_SAME_UNIVERSITY + (WEIGHT_SAME_INSTITUTE if same_institute else 0)
+
+    return {
+        "uni_score": uni_score,
+        "reason_uni_score": reason_uni_score,
+        "common_interests": common_interests,
+        "goal_score": goal_score,
+        "common_goals": [
+            goal for goal in their_goals_raw
+            if _norm(goal) in common_goals
+        ],
+    }
+
+
+def describe_match(context: MatchContext, candidate_user, candidate_profile) -> Dict:
+    """match_reason и общие интересы/цели для карточки (без расчёта score)."""
+    parts = _match_parts(context, candidate_user, candidate_profile)
+    return {
+        "match_reason": _determine_match_reason(
+            {}, parts["reason_uni_score"], parts["common_interests"], parts["goal_score"],
+        ),
+        "common_interests": list(parts["common_interests"]),
+        "common_goals": parts["common_goals"],
+    }
+
+
 def calculate_score(
     me_user,
     me_profile,
@@ -169,55 +256,21 @@ def calculate_score(
     Возвращает dict с итоговым баллом и breakdown для дебага.
     """
     breakdown = {}
-
-    # --- Социальная близость ---
-    uni_score = 0
-    if me_user.university and candidate_user.university:
-        if me_user.university.strip().lower() == candidate_user.university.strip().lower():
-            uni_score += WEIGHT_SAME_UNIVERSITY
-
-            # Бонус за кампус
-            if me_user.campus_id and candidate_user.campus_id:
-                if me_user.campus_id == candidate_user.campus_id:
-                    uni_score += WEIGHT_SAME_CAMPUS
-
-            # Бонус за факультет
-            if me_user.institute and candidate_user.institute:
-                if me_user.institute.strip().lower() == candidate_user.institute.strip().lower():
-                    uni_score += WEIGHT_SAME_INSTITUTE
-
-            # Бонус за курс
-            if me_user.course and candidate_user.course:
-                if me_user.course == candidate_user.course:
-                    uni_score += WEIGHT_SAME_COURSE
+    parts = _match_parts(MatchContext(me_user, me_profile), candidate_user, candidate_profile)
+    uni_score = parts["uni_score"]
+    common_interests = parts["common_interests"]
+    goal_score = parts["goal_score"]
 
     breakdown["university"] = uni_score
 
     # --- Интересы ---
-    my_interests = set(i.lower().strip() for i in _parse_json_safe(me_user.interests))
-    their_interests = set(i.lower().strip() for i in _parse_json_safe(candidate_user.interests))
-    common_interests = my_interests & their_interests
     interest_score = min(len(common_interests) * WEIGHT_PER_INTEREST, WEIGHT_INTERESTS_MAX)
     breakdown["interests"] = interest_score
     breakdown["common_interests"] = list(common_interests)
 
     # --- Цели ---
-    my_goals_raw = _parse_json_safe(me_profile.goals) if me_profile else []
-    their_goals_raw = _parse_json_safe(candidate_profile.goals)
-    my_goals = set(g.lower().strip() for g in my_goals_raw)
-    their_goals = set(g.lower().strip() for g in their_goals_raw)
-    common_goals = my_goals & their_goals
-    goal_score = 0
-    if my_goals and their_goals:
-        if common_goals:
-            goal_score = WEIGHT_GOAL_MATCH
-        else:
-            goal_score = WEIGHT_GOAL_CONFLICT
     breakdown["goals"] = goal_score
-    breakdown["common_goals"] = [
-        goal for goal in their_goals_raw
-        if str(goal).lower().strip() in common_goals
-    ]
+    breakdown["common_goals"] = parts["common_goals"]
 
     # --- Входящий лайк ---
     like_score = WEIGHT_INCOMING_LIKE if candidate_user.id in incoming_like_ids else 0
@@ -261,10 +314,153 @@ def calculate_score(
     return {
         "score": final_score,
         "breakdown": breakdown,
-        "match_reason": _determine_match_reason(breakdown, uni_score, common_interests, goal_score)
+        "match_reason": _determine_match_reason(
+            breakdown, parts["reason_uni_score"], common_interests, goal_score,
+        )
     }
 
 
+# ========================================
+# ⚡ ВЕКТОРНЫЙ СКОРИНГ ПУЛА
+# ========================================
+# Тот же расчёт, что calculate_score, но для всего пула сразу: признаки
+# кандидатов собираются в массивы за один проход, арифметика — в NumPy.
+# Интересы и цели — битовые матрицы «кандидат × мой интерес/цель»:
+# общие = сумма по строке. Словарь строится только из моих значений,
+# поэтому ширина матрицы не зависит от размера пула.
+
+
+def _epoch(value: Optional[datetime]) -> float:
+    if not value:
+        return np.nan
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _membership_matrix(vocab: Dict[str, int], rows: List[list]) -> np.ndarray:
+    matrix = np.zeros((len(rows), len(vocab)), dtype=bool)
+    if vocab:
+        for i, items in enumerate(rows):
+            for item in items:
+                j = vocab.get(_norm(item))
+                if j is not None:
+                    matrix[i, j] = True
+    return matrix
+
+
+def score_candidates(
+    me_user,
+    me_profile,
+    candidates: Sequence[Tuple[Any, Any]],
+    incoming_like_ids: set,
+    rng: Optional[np.random.Generator] = None,
+    now: Optional[datetime] = None,
+) -> np.ndarray:
+    """
+    Score совместимости для пула [(candidate_user, candidate_profile), ...].
+    Возвращает int64-массив в порядке candidates.
+    """
+    n = len(candidates)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    rng = rng if rng is not None else np.random.default_rng()
+    now_ts = (now or datetime.now(timezone.utc)).timestamp()
+    users = [user for user, _ in candidates]
+    profiles = [profile for _, profile in candidates]
+    context = MatchContext(me_user, me_profile)
+
+    # --- Социальная близость ---
+    uni_score = np.zeros(n, dtype=np.int64)
+    if context.university:
+        same_uni = np.array([_norm(u.university) == context.university for u in users])
+        if me_user.campus_id:
+            same_campus = np.array([u.campus_id == me_user.campus_id for u in users])
+            uni_score += np.where(same_uni & same_campus, WEIGHT_SAME_CAMPUS, 0)
+        if context.institute:
+            same_institute = np.array([_norm(u.institute) == context.institute for u in users])
+            uni_score += np.where(same_uni & same_institute, WEIGHT_SAME_INSTITUTE, 0)
+        if me_user.course:
+            same_course = np.array([u.course == me_user.course for u in users])
+            uni_score += np.where(same_uni & same_course, WEIGHT_SAME_COURSE, 0)
+        uni_score += np.where(same_uni, WEIGHT_SAME_UNIVERSITY, 0)
+
+    # --- Интересы ---
+    interest_vocab = {value: j for j, value in enumerate(sorted(context.interests))}
+    interest_bits = _membership_matrix(interest_vocab, [_parse_json_safe(u.interests) for u in users])
+    interest_score = np.minimum(interest_bits.sum(axis=1) * WEIGHT_PER_INTEREST, WEIGHT_INTERESTS_MAX)
+
+    # --- Цели ---
+    goal_score = np.zeros(n, dtype=np.int64)
+    if context.goals:
+        their_goals = [_parse_json_safe(p.goals) for p in profiles]
+        goal_bits = _membership_matrix({value: j for j, value in enumerate(sorted(context.goals))}, their_goals)
+        has_goals = np.array([bool(goals) for goals in their_goals])
+        goal_score = np.where(
+            has_goals,
+            np.where(goal_bits.any(axis=1), WEIGHT_GOAL_MATCH, WEIGHT_GOAL_CONFLICT),
+            0,
+        )
+
+    # --- Входящий лайк ---
+    ids = np.array([u.id for u in users], dtype=np.int64)
+    like_score = np.where(np.isin(ids, list(incoming_like_ids)), WEIGHT_INCOMING_LIKE, 0)
+
+    # --- Новичок (NaN → ни одно условие не выполнится → 0) ---
+    with np.errstate(invalid="ignore"):
+        age_hours = (now_ts - np.array([_epoch(p.created_at) for p in profiles])) / 3600
+        fresh_score = np.select(
+            [age_hours <= 24, age_hours <= 48, age_hours <= 72],
+            [WEIGHT_FRESH_24H, WEIGHT_FRESH_48H, WEIGHT_FRESH_72H],
+            default=0,
+        )
+
+    # --- Возраст ---
+    age_score = np.zeros(n, dtype=np.int64)
+    if me_user.age:
+        their_ages = np.array([u.age or 0 for u in users], dtype=np.float64)
+        comfort_zone = max(AGE_COMFORT_MIN, me_user.age / AGE_COMFORT_DIVISOR)
+        over = np.abs(me_user.age - their_ages) - comfort_zone
+        mild = np.trunc(over * AGE_PENALTY_MILD)
+        harsh = np.trunc(
+            AGE_PENALTY_MILD_RANGE * AGE_PENALTY_MILD + (over - AGE_PENALTY_MILD_RANGE) * AGE_PENALTY_HARSH
+        )
+        penalty = np.where(over <= AGE_PENALTY_MILD_RANGE, mild, harsh)
+        age_score = np.where((their_ages > 0) & (over > 0), penalty, 0).astype(np.int64)
+
+    # --- Активность (нет last_active_at → как >7 дней) ---
+    with np.errstate(invalid="ignore"):
+        days_inactive = (now_ts - np.array([_epoch(u.last_active_at) for u in users])) / 86400
+        activity_score = np.select(
+            [days_inactive <= 3, days_inactive <= 7],
+            [0, PENALTY_INACTIVE_3D],
+            default=PENALTY_INACTIVE_7D,
+        )
+
+    # --- Полнота профиля ---
+    has_photos = np.array([len(_parse_json_safe(p.photos)) > 0 for p in profiles])
+    has_bio = np.array([bool(p.bio and len(p.bio.strip()) >= 10) for p in profiles])
+    completeness = np.where(
+        has_photos,
+        np.where(has_bio, COMPLETENESS_FULL, COMPLETENESS_NO_BIO),
+        COMPLETENESS_NO_PHOTO,
+    )
+
+    # --- Jitter ---
+    jitter = rng.integers(-JITTER_RANGE, JITTER_RANGE, size=n, endpoint=True)
+
+    raw_score = (
+        uni_score + interest_score + goal_score + like_score
+        + fresh_score + age_score + activity_score + jitter
+    )
+    return np.trunc(raw_score * completeness).astype(np.int64)
+
+
+def rank_candidates(scores: np.ndarray) -> np.ndarray:
+    """Индексы по убыванию score; при равенстве — в исходном порядке (как list.sort)."""
+    return np.argsort(-scores, kind="stable")
+
+
 def _determine_match_reason(
     breakdown: dict,
     uni_score: int,
@@ -0,0 +1,109 @@
+# ===== 📄 ФАЙЛ: backend/app/services/feed_cache.py =====
+#
+# Кэш ответов публичных лент для анонимных запросов (Redis).
+#
+# Ключ: feed_cache:{name}:{generation}:{sha1(нормализованные query-параметры)}.
+# Инвалидация — через счётчики поколений feed_cache:gen:{scope}: запись в ленту
+# делает INCR, старые ключи просто перестают читаться и умирают по TTL.
+# Redis недоступен → кэш молча пропускается, лента отдаётся из БД.
+
+import hashlib
+import json
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from fastapi.encoders import jsonable_encoder
+from redis.exceptions import RedisError
+
+from app.config import get_settings
+from app.rate_limiter import get_redis
+
+logger = logging.getLogger(__name__)
+
+SCOPE_POSTS = "posts"
+SCOPE_MARKET = "market"
+SCOPE_REQUESTS = "requests"
+
+_GEN_KEY = "feed_cache:gen:{scope}"
+
+
+@dataclass
+class FeedCacheEntry:
+    key: str
+    payload: Optional[Any] = None
+
+    @property
+    def hit(self) -> bool:
+        return self.payload is not None
+
+
+def _normalize_params(params: Dict[str, Any]) -> str:
+    normalized = {}
+    for name, value in params.items():
+        if isinstance(value, str):
+            value = value.strip()
+        if value is None or value == "":
+            continue
+        normalized[name] = value
+    return json.dumps(normalized, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+async def lookup(name: str, scope: str, params: Dict[str, Any]) -> Optional[FeedCacheEntry]:
+    """
+    Найти закэшированный ответ.
+
+    Поколение читается ДО похода в БД: если во время сборки ответа лента изменится,
+    ответ запишется под старым поколением и никогда не будет прочитан.
+    None — кэш выключен или Redis недоступен.
+    """
+    settings = get_settings()
+    if not settings.feed_cache_enabled:
+        return None
+
+    try:
+        r = await get_redis()
+        generation = await r.get(_GEN_KEY.format(scope=scope)) or "0"
+        digest = hashlib.sha1(_normalize_params(params).encode("utf-8")).hexdigest()
+        key = f"feed_cache:{name}:{generation}:{digest}"
+        raw = await r.get(key)
+    except (RedisError, OSError) as e:
+        logger.warning("Feed cache lookup failed (%s): %s", name, e)
+        return None
+
+    payload = None
+    if raw:
+        try:
+            payload = json.loads(raw)
+        except ValueError:
+            payload = None
+    return FeedCacheEntry(key=key, payload=payload)
+
+
+async def store(entry: Optional[FeedCacheEntry], payload: Any) -> None:
+    """Сохранить ответ под ключом, полученным в lookup()."""
+    if entry is None or entry.hit:
+        return
+
+    settings = get_settings()
+    try:
+        raw = json.dumps(jsonable_encoder(payload), ensure_ascii=False, separators=(",", ":"))
+        r = await get_redis()
+        await r.set(entry.key, raw, ex=settings.feed_cache_ttl_seconds)
+    except (RedisError, OSError, TypeError, ValueError) as e:
+        logger.warning("Feed cache store failed (%s): %s", entry.key, e)
+
+
+async def bump_generation(*scopes: str) -> None:
+    """Инвалидировать ленты: вызывать ПОСЛЕ commit, иначе кэш успеет прочитать старые данные."""
+    if not scopes or not get_settings().feed_cache_enabled:
+        return
+
+    try:
+        r = await get_redis()
+        pipe = r.pipeline(transaction=False)
+        for scope in scopes:
+            pipe.incr(_GEN_KEY.format(scope=scope))
+        await pipe.execute()
+    except (RedisError, OSError) as e:
+        logger.warning("Feed cache invalidation failed (%s): %s", ",".join(scopes), e)
@@ -0,0 +1,89 @@
+# ===== 📄 ФАЙЛ: backend/app/services/image_engine.py =====
+#
+# Пул процессов для обработки изображений (декод + LANCZOS + WebP method=6).
+#
+# Раньше каждая картинка шла через run_in_threadpool и держала GIL на общем
+# threadpool Starlette — десять фото товара обрабатывались по очереди.
+# Теперь файлы одного запроса параллельно уходят в ProcessPoolExecutor
+# (IMAGE_WORKERS процессов), а reserve() ограничивает число картинок
+# в работе на процесс бэкенда (IMAGE_QUEUE_LIMIT): переполнено — 429,
+# клиент повторит позже, вместо того чтобы копить очередь и память.
+#
+# IMAGE_WORKERS=0 — старое поведение (threadpool), удобно для dev и тестов.
+
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from functools import partial
+from typing import Callable, Iterator, Optional
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+RETRY_AFTER_SECONDS = 2
+
+_executor: Optional[ProcessPoolExecutor] = None
+_in_flight = 0
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn: форк процесса с запущенным event loop и потоками небезопасен
+        _executor = ProcessPoolExecutor(
+            max_workers=get_settings().image_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+@contextmanager
+def reserve(count: int) -> Iterator[None]:
+    """Занять count мест в очереди на время обработки или ответить 429."""
+    global _in_flight
+    limit = get_settings().image_queue_limit
+    # Пустой пул принимает пачку любого размера, иначе большой альбом не пройдёт никогда
+    if _in_flight and _in_flight + count > limit:
+        raise HTTPException(
+            status_code=429,
+            detail="Сервер обрабатывает много изображений, попробуйте ещё раз",
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+        )
+    _in_flight += count
+    try:
+        yield
+    finally:
+        _in_flight -= count
+
+
+async def run(fn: Callable, *args, **kwargs):
+    """Выполнить CPU-задачу в пуле процессов (или в threadpool при IMAGE_WORKERS=0)."""
+    if get_settings().image_workers <= 0:
+        return await run_in_threadpool(fn, *args, **kwargs)
+
+    global _executor
+    executor = _get_executor()
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(executor, partial(fn, *args, **kwargs))
+    except BrokenProcessPool as exc:
+        # Процесс убит (OOM на огромной картинке) — пул больше не принимает задач, пересоздаём
+        logger.error("Image worker pool broken, restarting")
+        if _executor is executor:
+            _executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+        raise ValueError("Failed to process image") from exc
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,259 @@
+# ===== 📄 ФАЙЛ: backend/app/services/inbox_counter.py =====
+#
+# Счётчик непрочитанных во входящих (бейдж Mini App) в Redis.
+#
+# Ключ inbox_unread:{user_id} — число непрочитанных уведомлений со статусом
+# из INBOX_STATUSES. /inbox/unread-count читает его одним GET; нет ключа —
+# считаем COUNT(*) и кладём результат на UNREAD_TTL_SECONDS.
+#
+# Поддержка после COMMIT:
+#   - новое уведомление (create_notification, poll_vote, ...) — INCR, если ключ есть;
+#   - UPDATE через ORM, после которого уведомление перестало или снова стало
+#     непрочитанным во входящих (прочтение, skipped/failed при выдаче боту,
+#     повторная активация poll_vote) — INCRBY ±1; pending → sending счётчик не трогает;
+#   - DELETE через ORM и массовые UPDATE мимо ORM (mark_dirty()) — ключ сбрасывается;
+#   - /inbox/read-all выставляет 0.
+#
+# Засев из БД не должен затереть изменения, случившиеся между COUNT(*) и SET:
+# INCR по отсутствующему ключу и сброс бампают поколение inbox_unread_gen:{user_id},
+# а SET засева проходит только при том же поколении, что было до COUNT(*).
+# Redis недоступен → считаем из БД, как раньше.
+
+import asyncio
+import logging
+from collections import Counter
+from typing import Iterable, Optional, Set
+
+from redis.exceptions import RedisError
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, object_session
+
+from app import models
+from app.rate_limiter import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Что показываем во входящих: 'sending' — уже выдано боту, но ещё не подтверждено
+INBOX_STATUSES = ('sent', 'pending', 'sending')
+
+REDIS_KEY_PREFIX = "inbox_unread"
+GEN_KEY_PREFIX = "inbox_unread_gen"
+# Страховка от дрейфа: даже без инвалидации счётчик пересчитывается раз в TTL
+UNREAD_TTL_SECONDS = 600
+GEN_TTL_SECONDS = 2 * UNREAD_TTL_SECONDS
+
+_INCR_INFO_KEY = "inbox_counter_incr"
+_DIRTY_INFO_KEY = "inbox_counter_dirty"
+
+# INCR только для существующего ключа: иначе создали бы счётчик «с единицы».
+# Ключа нет — бампаем поколение, чтобы идущий засев не записал устаревший COUNT(*)
+_INCR_IF_EXISTS = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('INCRBY', KEYS[1], ARGV[1])
+end
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return nil
+"""
+
+_INVALIDATE = """
+redis.call('DEL', KEYS[1])
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[1])
+return 1
+"""
+
+# SET NX только если поколение не менялось с момента чтения перед COUNT(*)
+_SEED_IF_GENERATION = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[3] then
+    return nil
+end
+return redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2], 'NX')
+"""
+
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def _redis_key(user_id: int) -> str:
+    return f"{REDIS_KEY_PREFIX}:{user_id}"
+
+
+def _gen_key(user_id: int) -> str:
+    return f"{GEN_KEY_PREFIX}:{user_id}"
+
+
+async def count_unread_in_db(db: AsyncSession, user_id: int) -> int:
+    res = await db.execute(
+        select(func.count()).where(
+            models.Notification.recipient_id == user_id,
+            models.Notification.is_read == False,  # noqa: E712
+            models.Notification.status.in_(INBOX_STATUSES),
+        )
+    )
+    return res.scalar() or 0
+
+
+async def get_unread_count(db: AsyncSession, user_id: int) -> int:
+    key = _redis_key(user_id)
+    try:
+        redis = await get_redis()
+        pipe = redis.pipeline(transaction=False)
+        pipe.get(key)
+        pipe.get(_gen_key(user_id))
+        cached, generation = await pipe.execute()
+    except (RedisError, OSError) as exc:
+        logger.warning("Inbox counter read failed: %s", exc)
+        return await count_unread_in_db(db, user_id)
+
+    if cached is not None:
+        try:
+            return max(int(cached), 0)
+        except ValueError:
+            pass
+
+    count = await count_unread_in_db(db, user_id)
+    try:
+        # NX: если параллельно уже успели засеять/reset — их значение свежее;
+        # поколение: если после чтения был INCR мимо ключа или сброс — COUNT(*) устарел
+        await redis.eval(
+            _SEED_IF_GENERATION, 2, key, _gen_key(user_id),
+            count, UNREAD_TTL_SECONDS, generation or "0",
+        )
+    except (RedisError, OSError) as exc:
+        logger.warning("Inbox counter store failed: %s", exc)
+    return count
+
+
+async def reset(user_id: int, value: int = 0) -> None:
+    try:
+        redis = await get_redis()
+        await redis.set(_redis_key(user_id), value, ex=UNREAD_TTL_SECONDS)
+    except (RedisError, OSError) as exc:
+        logger.warning("Inbox counter reset failed: %s", exc)
+
+
+async def invalidate(user_ids: Iterable[int]) -> None:
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    try:
+        redis = await get_redis()
+        pipe = redis.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.eval(_INVALIDATE, 2, _redis_key(user_id), _gen_key(user_id), GEN_TTL_SECONDS)
+        await pipe.execute()
+    except (RedisError, OSError) as exc:
+        logger.warning("Inbox counter invalidation failed: %s", exc)
+
+
+async def increment(counts: Counter) -> None:
+    if not counts:
+        return
+    try:
+        redis = await get_redis()
+        pipe = redis.pipeline(transaction=False)
+        for user_id, amount in counts.items():
+            pipe.eval(_INCR_IF_EXISTS, 2, _redis_key(user_id), _gen_key(user_id), amount, GEN_TTL_SECONDS)
+        await pipe.execute()
+    except (RedisError, OSError) as exc:
+        logger.warning("Inbox counter increment failed: %s", exc)
+        # Счётчик мог разойтись с БД — пусть пересчитается
+        await invalidate(counts)
+
+
+def mark_dirty(db: AsyncSession | Session, user_id: Optional[int]) -> None:
+    """Сбросить счётчик юзера после COMMIT (для UPDATE мимо ORM-объектов)."""
+    if user_id is None:
+        return
+    db.info.setdefault(_DIRTY_INFO_KEY, set()).add(user_id)
+
+
+# ===== ORM-СОБЫТИЯ =====
+
+def _counts_as_unread(notification: models.Notification) -> bool:
+    # Колоночные default'ы (pending / false) могли не попасть в атрибуты объекта
+    return not notification.is_read and (notification.status or 'pending') in INBOX_STATUSES
+
+
+def _remember_insert(mapper, connection, target) -> None:
+    session = object_session(target)
+    if session is None or not _counts_as_unread(target):
+        return
+    session.info.setdefault(_INCR_INFO_KEY, Counter())[target.recipient_id] += 1
+
+
+_UNKNOWN = object()
+
+
+def _previous_value(history, current):
+    if history.deleted:
+        return history.deleted[0]
+    # Значение присвоено незагруженному атрибуту — прежнее неизвестно
+    return _UNKNOWN if history.added else current
+
+
+def _remember_update(mapper, connection, target) -> None:
+    session = object_session(target)
+    if session is None:
+        return
+    state = inspect(target)
+    is_read_history = state.attrs.is_read.history
+    status_history = state.attrs.status.history
+    if not (is_read_history.has_changes() or status_history.has_changes()):
+        return
+
+    was_read = _previous_value(is_read_history, target.is_read)
+    old_status = _previous_value(status_history, target.status)
+    if was_read is _UNKNOWN or old_status is _UNKNOWN:
+        mark_dirty(session, target.recipient_id)
+        return
+
+    was_unread = not was_read and (old_status or 'pending') in INBOX_STATUSES
+    is_unread = _counts_as_unread(target)
+    if was_unread != is_unread:
+        session.info.setdefault(_INCR_INFO_KEY, Counter())[target.recipient_id] += 1 if is_unread else -1
+
+
+def _remember_delete(mapper, connection, target) -> None:
+    session = object_session(target)
+    if session is not None:
+        mark_dirty(session, target.recipient_id)
+
+
+def _spawn(coro) -> None:
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        coro.close()
+        return
+    task = loop.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_after_commit(session: Session) -> None:
+    increments = session.info.pop(_INCR_INFO_KEY, None)
+    dirty = session.info.pop(_DIRTY_INFO_KEY, None)
+    if dirty:
+        _spawn(invalidate(dirty))
+    if increments:
+        # Для сброшенных ключей INCR не нужен: они пересчитаются целиком
+        pending = Counter({
+            user_id: n for user_id, n in increments.items()
+            if n and (not dirty or user_id not in dirty)
+        })
+        if pending:
+            _spawn(increment(pending))
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session: Session) -> None:
+    session.info.pop(_INCR_INFO_KEY, None)
+    session.info.pop(_DIRTY_INFO_KEY, None)
+
+
+event.listen(models.Notification, "after_insert", _remember_insert)
+event.listen(models.Notification, "after_update", _remember_update)
+event.listen(models.Notification, "after_delete", _remember_delete)
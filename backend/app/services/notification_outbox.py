@@ -0,0 +1,81 @@
+# ===== 📄 ФАЙЛ: backend/app/services/notification_outbox.py =====
+#
+# Push-доставка уведомлений боту через Redis stream notifications:outbox.
+#
+# Каждая вставка в notifications (create_notification, poll_vote, ...)
+# помечается mapper-событием, а после COMMIT id уходят в stream одним XADD
+# на уведомление. Бот читает stream через consumer group (XREADGROUP + XACK)
+# и забирает сами уведомления по id из GET /notifications/queue?ids=...
+#
+# Stream — только сигнал «появилось уведомление», источник правды — таблица.
+# Redis недоступен или бот лежал дольше, чем живёт stream → уведомление
+# остаётся pending и его подберёт редкий fallback-опрос очереди.
+
+import asyncio
+import logging
+from typing import Iterable, Set
+
+from redis.exceptions import RedisError
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from app import models
+from app.config import get_settings
+from app.rate_limiter import get_redis
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = "notifications:outbox"
+# Ограничение длины stream (приблизительное, XADD MAXLEN ~)
+STREAM_MAXLEN = 100_000
+
+_SESSION_INFO_KEY = "notification_outbox_ids"
+
+_background_tasks: Set[asyncio.Task] = set()
+
+
+async def publish(notification_ids: Iterable[int]) -> int:
+    """Положить id уведомлений в stream. Возвращает число опубликованных."""
+    ids = sorted({int(notification_id) for notification_id in notification_ids})
+    if not ids:
+        return 0
+    try:
+        redis = await get_redis()
+        pipe = redis.pipeline(transaction=False)
+        for notification_id in ids:
+            pipe.xadd(STREAM_KEY, {"id": str(notification_id)}, maxlen=STREAM_MAXLEN, approximate=True)
+        await pipe.execute()
+    except (RedisError, OSError) as exc:
+        logger.warning("Notification outbox publish failed (%s ids left to poll): %s", len(ids), exc)
+        return 0
+    return len(ids)
+
+
+def _remember_inserted(mapper, connection, target) -> None:
+    session = object_session(target)
+    if session is None or target.id is None:
+        return
+    session.info.setdefault(_SESSION_INFO_KEY, set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_after_commit(session: Session) -> None:
+    notification_ids = session.info.pop(_SESSION_INFO_KEY, None)
+    if not notification_ids or not get_settings().notification_push_enabled:
+        return
+
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    task = loop.create_task(publish(notification_ids))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session: Session) -> None:
+    session.info.pop(_SESSION_INFO_KEY, None)
+
+
+event.listen(models.Notification, "after_insert", _remember_inserted)
@@ -11,6 +11,7 @@ from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import models
+from app.services import inbox_counter, notification_outbox  # noqa: F401  (хуки после commit)
 
 logger = logging.getLogger(__name__)
 
@@ -45,7 +46,10 @@ def _has_public_telegram_contact(user) -> bool:
 
 
 async def create_notification(db: AsyncSession, recipient_id: int, notif_type: str, payload: dict):
-    """Create a queued notification. Commit is handled by caller transaction."""
+    """Create a queued notification. Commit is handled by caller transaction.
+
+    After the commit the id is pushed to the bot via notification_outbox.
+    """
     notif = models.Notification(
         recipient_id=recipient_id,
         type=notif_type,
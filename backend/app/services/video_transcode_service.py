@@ -0,0 +1,377 @@
+# ===== 📄 ФАЙЛ: backend/app/services/video_transcode_service.py =====
+#
+# Очередь перекодирования видео (таблица video_transcode_jobs).
+#
+# Запрос на создание/редактирование поста или товара сохраняет сырой файл
+# в UPLOADS_DIR/.incoming и сразу проверяет его ffprobe (длительность, поток) —
+# битое или слишком длинное видео по-прежнему получает 400. Затем заводит
+# задачу и кладёт в images pending-запись
+# {"type": "video", "status": "processing", "job_id": ...}.
+# После COMMIT сущности attach_pending() привязывает задачу к посту/товару —
+# только такие задачи берёт воркер.
+#
+# run_video_transcode_loop() забирает задачи через SKIP LOCKED и гоняет
+# video_utils.process_video_file в отдельном пуле процессов
+# (VIDEO_TRANSCODE_WORKERS), так что ffmpeg не занимает threadpool Starlette.
+# Прогресс процесс-воркер пишет в файл рядом с исходником, цикл переносит
+# его в progress задачи. Готовое видео подменяет pending-запись в images;
+# при ошибке запись из images убирается, причина остаётся в задаче.
+# Статус, прогресс и ошибка — GET /media/jobs/{id} (только автору).
+#
+# Воркер упал посреди задачи — аренда протухает через JOB_LEASE_SECONDS
+# и задача выдаётся повторно (не больше MAX_ATTEMPTS раз).
+
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.config import get_settings
+from app.database import AsyncSessionLocal
+from app.services import feed_cache
+from app.video_utils import (
+    FFMPEG_TIMEOUT,
+    VIDEO_INCOMING_DIR,
+    delete_video,
+    process_uploaded_video,
+    process_video_file,
+    read_progress,
+    save_video_upload,
+    validate_video_file,
+)
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = "pending"
+STATUS_PROCESSING = "processing"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+# Аренда с запасом на ffprobe/превью поверх таймаута ffmpeg
+JOB_LEASE_SECONDS = FFMPEG_TIMEOUT + 180
+MAX_ATTEMPTS = 3
+POLL_INTERVAL_SECONDS = 2.0
+PROGRESS_POLL_SECONDS = 2.0
+# Задача без поста/товара (запрос упал после загрузки) — мусор
+UNATTACHED_JOB_TTL = timedelta(hours=1)
+# Файлы в .incoming без задачи (упали до COMMIT) — тоже
+ORPHAN_FILE_TTL_SECONDS = 6 * 3600
+SWEEP_INTERVAL_SECONDS = 600
+
+TARGET_MODELS = {
+    "post": (models.Post, feed_cache.SCOPE_POSTS),
+    "market_item": (models.MarketItem, feed_cache.SCOPE_MARKET),
+}
+
+_wakeup = asyncio.Event()
+
+
+def pending_media(job_id: int) -> dict:
+    """Запись в images, пока видео перекодируется."""
+    return {"type": "video", "status": STATUS_PROCESSING, "job_id": job_id, "url": "", "w": 0, "h": 0}
+
+
+def _pending_job_ids(media: Iterable) -> List[int]:
+    return [
+        item["job_id"]
+        for item in media or []
+        if isinstance(item, dict) and item.get("job_id") and item.get("status") == STATUS_PROCESSING
+    ]
+
+
+# ===== ЗАГРУЗКА (HTTP-запрос) =====
+
+async def prepare_video(db: AsyncSession, file: UploadFile, owner_id: int) -> dict:
+    """
+    Метаданные видео для images.
+    Очередь включена — pending-запись (задача сохранится вместе с постом/товаром),
+    выключена — видео обрабатывается прямо в запросе, как раньше.
+    """
+    if not get_settings().video_transcode_queue_enabled:
+        return await process_uploaded_video(file)
+
+    source_path = await save_video_upload(file)
+    try:
+        # ffprobe — доли секунды; плохой файл отсекаем до публикации
+        await run_in_threadpool(validate_video_file, source_path)
+    except Exception:
+        source_path.unlink(missing_ok=True)
+        raise
+    job = models.VideoTranscodeJob(owner_id=owner_id, source_path=str(source_path), status=STATUS_PENDING)
+    db.add(job)
+    await db.flush()
+    return pending_media(job.id)
+
+
+async def attach_pending(db: AsyncSession, media: Optional[List], target_type: str, target_id: int) -> None:
+    """Привязать задачи из pending-записей к посту/товару (после его COMMIT)."""
+    job_ids = _pending_job_ids(media)
+    if not job_ids:
+        return
+    await db.execute(
+        update(models.VideoTranscodeJob)
+        .where(
+            models.VideoTranscodeJob.id.in_(job_ids),
+            models.VideoTranscodeJob.target_id.is_(None),
+        )
+        .values(target_type=target_type, target_id=target_id)
+    )
+    await db.commit()
+    _wakeup.set()
+
+
+async def get_job(db: AsyncSession, job_id: int) -> Optional[models.VideoTranscodeJob]:
+    return await db.get(models.VideoTranscodeJob, job_id)
+
+
+# ===== ВОРКЕР =====
+
+async def _claim_jobs(limit: int) -> List[Tuple[int, str]]:
+    now = datetime.utcnow()
+    lease_cutoff = now - timedelta(seconds=JOB_LEASE_SECONDS)
+    Job = models.VideoTranscodeJob
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Job.id, Job.source_path)
+            .where(
+                Job.target_id.isnot(None),
+                Job.attempts < MAX_ATTEMPTS,
+                or_(
+                    Job.status == STATUS_PENDING,
+                    and_(Job.status == STATUS_PROCESSING, Job.claimed_at < lease_cutoff),
+                ),
+            )
+            .order_by(Job.created_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        rows = [(row.id, row.source_path) for row in result.all()]
+        if rows:
+            await db.execute(
+                update(Job)
+                .where(Job.id.in_([job_id for job_id, _ in rows]))
+                .values(status=STATUS_PROCESSING, claimed_at=now, attempts=Job.attempts + 1, progress=0)
+            )
+        await db.commit()
+    return rows
+
+
+async def _replace_media(
+    db: AsyncSession,
+    job: models.VideoTranscodeJob,
+    replacement: Optional[dict],
+) -> Tuple[bool, Optional[str]]:
+    """
+    Подменить pending-запись задачи в images сущности (replacement=None — убрать её).
+    -> (нашлась ли, scope ленты).
+    """
+    target = TARGET_MODELS.get(job.target_type)
+    if target is None:
+        return False, None
+    model, scope = target
+    result = await db.execute(
+        select(model).where(model.id == job.target_id).with_for_update()
+    )
+    entity = result.scalar_one_or_none()
+    if entity is None:
+        return False, scope
+
+    replaced = False
+    images = []
+    for item in entity.images or []:
+        if isinstance(item, dict) and item.get("job_id") == job.id and item.get("type") == "video":
+            if replacement is not None:
+                images.append(replacement)
+            replaced = True
+        else:
+            images.append(item)
+    if replaced:
+        # Новый список — иначе JSONB-мутация не попадёт в UPDATE
+        entity.images = images
+    return replaced, scope
+
+
+async def _finish_job(job_id: int, meta: Optional[dict] = None, error: Optional[str] = None) -> None:
+    async with AsyncSessionLocal() as db:
+        job = await db.get(models.VideoTranscodeJob, job_id, with_for_update=True)
+        if job is None:
+            return
+        if meta is not None:
+            replaced, scope = await _replace_media(db, job, meta)
+            job.status, job.progress, job.result, job.error = STATUS_DONE, 100, meta, None
+        else:
+            # Пустая плитка без url никому не нужна — убираем, причину автор видит в задаче
+            replaced, scope = await _replace_media(db, job, None)
+            job.status, job.error = STATUS_FAILED, (error or "")[:500]
+        await db.commit()
+
+    if meta is not None and not replaced:
+        # Видео успели заменить или удалить вместе с постом — результат никому не нужен
+        delete_video(meta)
+    if replaced and scope:
+        await feed_cache.bump_generation(scope)
+
+
+async def _release_job(job_id: int, error: str) -> None:
+    """Сбой воркера (не плохое видео): вернуть задачу в очередь или сдаться."""
+    async with AsyncSessionLocal() as db:
+        job = await db.get(models.VideoTranscodeJob, job_id)
+        if job is None:
+            return
+        attempts = job.attempts
+        if attempts < MAX_ATTEMPTS:
+            job.status, job.claimed_at, job.error = STATUS_PENDING, None, error[:500]
+            await db.commit()
+            return
+    await _finish_job(job_id, error="Не удалось обработать видео")
+
+
+async def _set_progress(job_id: int, progress: int) -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(models.VideoTranscodeJob)
+            .where(models.VideoTranscodeJob.id == job_id, models.VideoTranscodeJob.status == STATUS_PROCESSING)
+            .values(progress=progress)
+        )
+        await db.commit()
+
+
+def _cleanup_source(source_path: Path) -> None:
+    for path in (source_path, _progress_path(source_path)):
+        try:
+            path.unlink(missing_ok=True)
+        except OSError:
+            pass
+
+
+def _progress_path(source_path: Path) -> Path:
+    return source_path.with_name(source_path.name + ".progress")
+
+
+async def run_job(executor, job_id: int, source: str) -> None:
+    source_path = Path(source)
+    progress_path = _progress_path(source_path)
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(executor, process_video_file, source_path, progress_path)
+
+    last_progress = 0
+    while True:
+        done, _ = await asyncio.wait({future}, timeout=PROGRESS_POLL_SECONDS)
+        if done:
+            break
+        progress = read_progress(progress_path)
+        if progress is not None and progress > last_progress:
+            last_progress = progress
+            try:
+                await _set_progress(job_id, progress)
+            except SQLAlchemyError:
+                logger.warning("Video job %s progress update failed", job_id)
+
+    try:
+        meta = future.result()
+    except ValueError as exc:
+        # Плохое видео — повторять бессмысленно
+        await _finish_job(job_id, error=str(exc))
+        _cleanup_source(source_path)
+    except FileNotFoundError:
+        await _finish_job(job_id, error="Исходный файл видео потерян")
+    except Exception as exc:
+        logger.exception("Video job %s crashed", job_id)
+        await _release_job(job_id, str(exc) or exc.__class__.__name__)
+    else:
+        await _finish_job(job_id, meta=meta)
+        _cleanup_source(source_path)
+
+
+async def sweep_stale_jobs() -> None:
+    """Убрать задачи без поста/товара, исчерпавшие попытки, и ничейные файлы в .incoming."""
+    now = datetime.utcnow()
+    Job = models.VideoTranscodeJob
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            update(Job)
+            .where(Job.status == STATUS_PENDING, Job.target_id.is_(None), Job.created_at < now - UNATTACHED_JOB_TTL)
+            .values(status=STATUS_FAILED, error="Видео не привязано к публикации")
+            .returning(Job.source_path)
+        )
+        unattached = result.scalars().all()
+        exhausted = (await db.execute(
+            select(Job.id, Job.source_path).where(
+                Job.status == STATUS_PROCESSING,
+                Job.attempts >= MAX_ATTEMPTS,
+                Job.claimed_at < now - timedelta(seconds=JOB_LEASE_SECONDS),
+            )
+        )).all()
+        active = set((await db.execute(
+            select(Job.source_path).where(Job.status.in_((STATUS_PENDING, STATUS_PROCESSING)))
+        )).scalars().all())
+        await db.commit()
+
+    for source in unattached:
+        _cleanup_source(Path(source))
+    for job_id, source in exhausted:
+        await _finish_job(job_id, error="Не удалось обработать видео")
+        _cleanup_source(Path(source))
+
+    if VIDEO_INCOMING_DIR.exists():
+        cutoff = time.time() - ORPHAN_FILE_TTL_SECONDS
+        for path in VIDEO_INCOMING_DIR.glob("*.upload"):
+            try:
+                if str(path) not in active and path.stat().st_mtime < cutoff:
+                    _cleanup_source(path)
+            except OSError:
+                pass
+
+
+def _make_executor(workers: int) -> ProcessPoolExecutor:
+    # spawn: форк процесса с запущенным event loop и потоками небезопасен
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+async def run_video_transcode_loop(stop_event: asyncio.Event) -> None:
+    settings = get_settings()
+    workers = max(1, int(settings.video_transcode_workers))
+    executor = _make_executor(workers)
+    running: Dict[int, asyncio.Task] = {}
+    last_sweep = 0.0
+
+    try:
+        while not stop_event.is_set():
+            try:
+                free = workers - len(running)
+                if free > 0:
+                    for job_id, source in await _claim_jobs(free):
+                        running[job_id] = asyncio.create_task(run_job(executor, job_id, source))
+                if time.monotonic() - last_sweep >= SWEEP_INTERVAL_SECONDS:
+                    last_sweep = time.monotonic()
+                    await sweep_stale_jobs()
+            except Exception:
+                logger.exception("Video transcode tick failed")
+
+            _wakeup.clear()
+            waiters = {asyncio.create_task(stop_event.wait()), asyncio.create_task(_wakeup.wait())}
+            await asyncio.wait(
+                waiters | set(running.values()),
+                timeout=POLL_INTERVAL_SECONDS,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            for waiter in waiters:
+                waiter.cancel()
+            for job_id in [job_id for job_id, task in running.items() if task.done()]:
+                running.pop(job_id)
+    finally:
+        # Незавершённые задачи не ждём: их аренда протухнет и они уйдут в очередь заново
+        for task in running.values():
+            task.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
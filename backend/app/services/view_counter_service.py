@@ -0,0 +1,92 @@
+# ===== 📄 ФАЙЛ: backend/app/services/view_counter_service.py =====
+#
+# Write-behind счётчики просмотров постов и товаров.
+#
+# GET /posts/{id} и /market/{id} только кладут пару (entity_id, user_id) в
+# буфер воркера. Фоновый цикл раз в VIEW_FLUSH_INTERVAL_SECONDS забирает буфер
+# и пишет его пачкой: INSERT ... ON CONFLICT DO NOTHING в post_views /
+# market_item_views + один UPDATE views_count на сущность.
+# Уникальность «один юзер — один просмотр» держит unique-констрейнт в БД,
+# буфер лишь схлопывает повторы внутри окна.
+
+import asyncio
+import logging
+from typing import Dict, Set, Tuple
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.config import get_settings
+from app.crud import market as market_crud
+from app.crud import posts as posts_crud
+from app.database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Защита памяти, если БД надолго недоступна: лишние просмотры теряем, а не копим
+MAX_PENDING_VIEWS = 100_000
+
+_pending_post_views: Set[Tuple[int, int]] = set()
+_pending_market_item_views: Set[Tuple[int, int]] = set()
+
+
+def _record(bucket: Set[Tuple[int, int]], entity_id: int, user_id: int) -> None:
+    if len(bucket) >= MAX_PENDING_VIEWS:
+        return
+    bucket.add((entity_id, user_id))
+
+
+def record_post_view(post_id: int, user_id: int) -> None:
+    """Засчитать просмотр поста (без обращения к БД)."""
+    _record(_pending_post_views, post_id, user_id)
+
+
+def record_market_item_view(item_id: int, user_id: int) -> None:
+    """Засчитать просмотр товара (без обращения к БД)."""
+    _record(_pending_market_item_views, item_id, user_id)
+
+
+def pending_counts() -> Dict[str, int]:
+    return {"posts": len(_pending_post_views), "market_items": len(_pending_market_item_views)}
+
+
+async def flush_pending_views() -> Dict[str, int]:
+    """Сбросить буфер в БД. Пачка, упавшая с ошибкой, теряется (счётчики best-effort)."""
+    post_views = set(_pending_post_views)
+    _pending_post_views.difference_update(post_views)
+    item_views = set(_pending_market_item_views)
+    _pending_market_item_views.difference_update(item_views)
+
+    flushed = {"posts": 0, "market_items": 0}
+    if not post_views and not item_views:
+        return flushed
+
+    async with AsyncSessionLocal() as db:
+        if post_views:
+            try:
+                flushed["posts"] = await posts_crud.apply_post_views(db, post_views)
+            except SQLAlchemyError:
+                await db.rollback()
+                logger.exception("Post views flush failed (%s views dropped)", len(post_views))
+        if item_views:
+            try:
+                flushed["market_items"] = await market_crud.apply_market_item_views(db, item_views)
+            except SQLAlchemyError:
+                await db.rollback()
+                logger.exception("Market item views flush failed (%s views dropped)", len(item_views))
+    return flushed
+
+
+async def run_view_flush_loop(stop_event: asyncio.Event) -> None:
+    settings = get_settings()
+    interval = max(1, int(settings.view_flush_interval_seconds))
+
+    while not stop_event.is_set():
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+        try:
+            await flush_pending_views()
+        except Exception:
+            logger.exception("View counters flush tick failed")
@@ -1,5 +1,9 @@
+import asyncio
+import hashlib
 import os
 import base64
+import re
+import shutil
 import uuid
 import json
 import posixpath
@@ -13,6 +17,9 @@ from fastapi import UploadFile
 from PIL import Image, ImageOps, UnidentifiedImageError
 from starlette.concurrency import run_in_threadpool
 
+from app.config import get_settings
+from app.services import image_engine
+
 try:
     from pillow_heif import register_heif_opener
 except Exception:
@@ -21,6 +28,8 @@ except Exception:
 # ================= CONFIG =================
 
 UPLOADS_ROOT = Path(os.getenv("UPLOADS_DIR", "uploads")).resolve()
+# Сырые загрузки до обработки (картинки и видео); ничейные файлы чистит video_transcode_service
+INCOMING_DIR = UPLOADS_ROOT / ".incoming"
 ALLOWED_UPLOAD_KINDS = {"images", "avatars", "videos", "thumbs"}
 
 MAX_IMAGE_SIZE = 2048
@@ -131,19 +140,134 @@ def get_storage_key(value: str, kind: str = "images") -> str:
     return relative_path
 
 
-def _make_storage_paths(kind: str) -> Tuple[str, Path, Path]:
+# ================= CONTENT-ADDRESSED STORAGE =================
+#
+# Результат обработки лежит один раз в .blobs/{key[:2]}/{key}/, где key —
+# sha256 исходных байт и параметров обработки. В images/, thumbs/, avatars/
+# на него ставятся жёсткие ссылки с уникальными именами "{key}-{suffix}.webp":
+# повторная загрузка тех же байт не декодирует и не пишет картинку заново.
+# st_nlink файла блоба — счётчик ссылок: delete_images удаляет свою ссылку,
+# а блоб уходит вместе с последней (_release_blob).
+
+BLOB_MAIN = "main.webp"
+BLOB_THUMB = "thumb.webp"
+BLOB_META = "meta.json"
+BLOB_PARAMS_VERSION = 1
+_BLOB_REF_RE = re.compile(r"^([0-9a-f]{64})-")
+
+
+def _blobs_root() -> Path:
+    return UPLOADS_ROOT / ".blobs"
+
+
+def _blob_dir(key: str) -> Path:
+    return _blobs_root() / key[:2] / key
+
+
+def _variant_blob_name(width: int) -> str:
+    return f"w{width}.webp"
+
+
+def _blob_key(content_digest: str, kind: str, max_side: int, variant_widths: List[int]) -> str:
+    """content_digest — sha256 исходных байт (считается потоково при загрузке)."""
+    params = (
+        f"v{BLOB_PARAMS_VERSION}:{kind}:{max_side}:{WEBP_QUALITY}:{THUMB_WEBP_QUALITY}:"
+        f"{MAX_THUMBNAIL_SIZE}:{','.join(str(width) for width in variant_widths)}"
+    )
+    return hashlib.sha256(f"{params}:{content_digest}".encode()).hexdigest()
+
+
+def _link_or_copy(source: Path, target: Path) -> None:
+    try:
+        os.link(source, target)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        # ФС без hard link'ов: без дедупликации, но загрузка работает
+        shutil.copyfile(source, target)
+
+
+def _link_blob(key: str, kind: str) -> Optional[dict]:
+    """Поставить ссылки на готовый блоб. None — блоба нет (или его как раз удалили)."""
+    blob_dir = _blob_dir(key)
+    try:
+        with open(blob_dir / BLOB_META, "r", encoding="utf-8") as f:
+            blob_meta = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
     safe_kind = _kind_or_default(kind)
     now = datetime.utcnow()
     rel_dir = f"{now.year}/{now.month:02d}"
-    filename = f"{uuid.uuid4().hex}.webp"
-    relative_path = f"{rel_dir}/{filename}"
+    name = f"{key}-{uuid.uuid4().hex[:12]}"
+    relative_path = f"{rel_dir}/{name}.webp"
+
+    links = [(BLOB_MAIN, safe_kind, relative_path)]
+    thumb = blob_meta.get("thumbnail")
+    if thumb:
+        links.append((BLOB_THUMB, "thumbs", relative_path))
+    variants = []
+    for variant in blob_meta.get("variants", []):
+        variant_path = f"{rel_dir}/{name}_w{variant['w']}.webp"
+        links.append((_variant_blob_name(variant["w"]), safe_kind, variant_path))
+        variants.append({"url": variant_path, "w": variant["w"], "h": variant["h"]})
+
+    created: List[Path] = []
+    try:
+        for blob_name, link_kind, link_path in links:
+            target = UPLOADS_ROOT / link_kind / link_path
+            target.parent.mkdir(parents=True, exist_ok=True)
+            _link_or_copy(blob_dir / blob_name, target)
+            created.append(target)
+    except FileNotFoundError:
+        for path in created:
+            path.unlink(missing_ok=True)
+        return None
 
-    absolute_dir = UPLOADS_ROOT / safe_kind / rel_dir
-    absolute_dir.mkdir(parents=True, exist_ok=True)
+    meta = {
+        "url": relative_path,
+        "w": blob_meta["w"],
+        "h": blob_meta["h"],
+        "format": "webp",
+        "size_bytes": blob_meta["size_bytes"],
+    }
+    if thumb:
+        meta.update({
+            "thumbnail_url": relative_path,
+            "thumbnail_w": thumb["w"],
+            "thumbnail_h": thumb["h"],
+        })
+    if variants:
+        meta["variants"] = variants
+    return meta
+
+
+def _publish_blob(key: str, staging_dir: Path) -> None:
+    blob_dir = _blob_dir(key)
+    blob_dir.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.rename(staging_dir, blob_dir)
+    except OSError:
+        # Те же байты параллельно загрузил кто-то ещё и успел первым — берём его блоб
+        shutil.rmtree(staging_dir, ignore_errors=True)
 
-    final_path = absolute_dir / filename
-    temp_path = absolute_dir / f".tmp_{uuid.uuid4().hex}.webp"
-    return relative_path, temp_path, final_path
+
+def _release_blob(filename: str) -> None:
+    """Удалить блоб, если на его файлы больше не ссылается ни одна загрузка."""
+    match = _BLOB_REF_RE.match(filename)
+    if not match:
+        return
+    blob_dir = _blob_dir(match.group(1))
+    try:
+        if any(
+            path.stat().st_nlink > 1
+            for path in blob_dir.iterdir()
+            if path.name != BLOB_META
+        ):
+            return
+    except FileNotFoundError:
+        return
+    shutil.rmtree(blob_dir, ignore_errors=True)
 
 
 def _prepare_image(img: Image.Image, max_side: int) -> Image.Image:
@@ -171,6 +295,19 @@ def _prepare_image(img: Image.Image, max_side: int) -> Image.Image:
     return img
 
 
+def _draft_for_max_side(img: Image.Image, max_side: int) -> None:
+    """
+    JPEG: декодировать сразу в 1/2, 1/4 или 1/8 размера (DCT-scaling), если
+    после уменьшения длинная сторона всё ещё >= max_side. Для 24 Мп фото
+    это в разы меньше пикселей на декод и LANCZOS. Вызывать до load().
+    HEIC/PNG/WebP так не умеют — их ужимает reduce() внутри thumbnail().
+    """
+    if img.format != "JPEG" or max(img.size) <= max_side:
+        return
+    ratio = max_side / max(img.size)
+    img.draft(img.mode, (max(1, int(img.width * ratio)), max(1, int(img.height * ratio))))
+
+
 def _save_webp(img: Image.Image, path: Path, quality: int = WEBP_QUALITY) -> None:
     with open(path, "wb") as f:
         img.save(
@@ -183,94 +320,136 @@ def _save_webp(img: Image.Image, path: Path, quality: int = WEBP_QUALITY) -> Non
         )
 
 
-def process_image_sync(content: bytes, kind: str = "images", max_side: int = MAX_IMAGE_SIZE) -> dict:
-    if not verify_magic_bytes(content):
-        raise ValueError("Unsupported image format")
-
-    relative_path, temp_path, final_path = _make_storage_paths(kind)
-    should_make_thumbnail = kind == "images"
-    thumb_relative_path = ""
-    thumb_temp_path: Optional[Path] = None
-    thumb_final_path: Optional[Path] = None
-    clean_img: Optional[Image.Image] = None
-    thumb_img: Optional[Image.Image] = None
+def _render_blob(
+    source: Union[BytesIO, Path],
+    staging_dir: Path,
+    max_side: int,
+    make_derivatives: bool,
+    variant_widths: List[int],
+) -> None:
+    with Image.open(source) as img:
+        _draft_for_max_side(img, max_side)
+        img.load()
+        clean_img = _prepare_image(img, max_side=max_side)
+
+    _save_webp(clean_img, staging_dir / BLOB_MAIN)
+    blob_meta: Dict[str, Any] = {
+        "w": clean_img.width,
+        "h": clean_img.height,
+        "size_bytes": (staging_dir / BLOB_MAIN).stat().st_size,
+    }
+
+    if make_derivatives:
+        thumb_img = clean_img.copy()
+        if thumb_img.width > MAX_THUMBNAIL_SIZE or thumb_img.height > MAX_THUMBNAIL_SIZE:
+            thumb_img.thumbnail((MAX_THUMBNAIL_SIZE, MAX_THUMBNAIL_SIZE), Image.Resampling.LANCZOS)
+        _save_webp(thumb_img, staging_dir / BLOB_THUMB, quality=THUMB_WEBP_QUALITY)
+        blob_meta["thumbnail"] = {"w": thumb_img.width, "h": thumb_img.height}
+
+        # Ширины меньше оригинала — чтобы ленты не качали 2048px ради карточки
+        variants = []
+        for width in variant_widths:
+            if width >= clean_img.width:
+                continue
+            height = max(1, round(clean_img.height * width / clean_img.width))
+            variant_img = clean_img.resize((width, height), Image.Resampling.LANCZOS)
+            _save_webp(variant_img, staging_dir / _variant_blob_name(width))
+            variants.append({"w": width, "h": height})
+        blob_meta["variants"] = variants
+
+    with open(staging_dir / BLOB_META, "w", encoding="utf-8") as f:
+        json.dump(blob_meta, f)
+
+
+def _process_image_source(
+    source: Union[BytesIO, Path],
+    content_digest: str,
+    kind: str,
+    max_side: int,
+) -> dict:
+    make_derivatives = kind == "images"
+    variant_widths = list(get_settings().image_variant_widths) if make_derivatives else []
+    key = _blob_key(content_digest, kind, max_side, variant_widths)
+
+    meta = _link_blob(key, kind)
+    if meta is not None:
+        return meta
 
+    staging_dir = _blobs_root() / ".staging" / uuid.uuid4().hex
+    staging_dir.mkdir(parents=True, exist_ok=True)
     try:
-        with Image.open(BytesIO(content)) as img:
-            img.load()
-            clean_img = _prepare_image(img, max_side=max_side)
-            if should_make_thumbnail:
-                thumb_relative_path, thumb_temp_path, thumb_final_path = _make_storage_paths("thumbs")
-                thumb_img = clean_img.copy()
-                if thumb_img.width > MAX_THUMBNAIL_SIZE or thumb_img.height > MAX_THUMBNAIL_SIZE:
-                    thumb_img.thumbnail((MAX_THUMBNAIL_SIZE, MAX_THUMBNAIL_SIZE), Image.Resampling.LANCZOS)
-
-            _save_webp(clean_img, temp_path)
-            if thumb_img and thumb_temp_path:
-                _save_webp(thumb_img, thumb_temp_path, quality=THUMB_WEBP_QUALITY)
-
-        os.replace(temp_path, final_path)
-        if thumb_temp_path and thumb_final_path:
-            os.replace(thumb_temp_path, thumb_final_path)
-        file_size = final_path.stat().st_size
-        meta = {
-            "url": relative_path,
-            "w": clean_img.width,
-            "h": clean_img.height,
-            "format": "webp",
-            "size_bytes": file_size,
-        }
-        if thumb_img and thumb_relative_path:
-            meta.update({
-                "thumbnail_url": thumb_relative_path,
-                "thumbnail_w": thumb_img.width,
-                "thumbnail_h": thumb_img.height,
-            })
-        return meta
+        _render_blob(source, staging_dir, max_side, make_derivatives, variant_widths)
     except (UnidentifiedImageError, OSError) as exc:
-        if temp_path.exists():
-            temp_path.unlink(missing_ok=True)
-        if thumb_temp_path and thumb_temp_path.exists():
-            thumb_temp_path.unlink(missing_ok=True)
-        if final_path.exists():
-            final_path.unlink(missing_ok=True)
-        if thumb_final_path and thumb_final_path.exists():
-            thumb_final_path.unlink(missing_ok=True)
+        shutil.rmtree(staging_dir, ignore_errors=True)
         raise ValueError("Failed to decode image") from exc
     except ValueError:
-        if temp_path.exists():
-            temp_path.unlink(missing_ok=True)
-        if thumb_temp_path and thumb_temp_path.exists():
-            thumb_temp_path.unlink(missing_ok=True)
-        if final_path.exists():
-            final_path.unlink(missing_ok=True)
-        if thumb_final_path and thumb_final_path.exists():
-            thumb_final_path.unlink(missing_ok=True)
+        shutil.rmtree(staging_dir, ignore_errors=True)
         raise
     except Exception as exc:
-        if temp_path.exists():
-            temp_path.unlink(missing_ok=True)
-        if thumb_temp_path and thumb_temp_path.exists():
-            thumb_temp_path.unlink(missing_ok=True)
-        if final_path.exists():
-            final_path.unlink(missing_ok=True)
-        if thumb_final_path and thumb_final_path.exists():
-            thumb_final_path.unlink(missing_ok=True)
+        shutil.rmtree(staging_dir, ignore_errors=True)
         raise ValueError("Failed to process image") from exc
 
+    _publish_blob(key, staging_dir)
+    meta = _link_blob(key, kind)
+    if meta is None:
+        raise ValueError("Failed to process image")
+    return meta
+
+
+def process_image_sync(content: bytes, kind: str = "images", max_side: int = MAX_IMAGE_SIZE) -> dict:
+    if not verify_magic_bytes(content):
+        raise ValueError("Unsupported image format")
+    content_digest = hashlib.sha256(content).hexdigest()
+    return _process_image_source(BytesIO(content), content_digest, kind, max_side)
+
+
+def process_image_file(
+    path: Path,
+    content_digest: str,
+    kind: str = "images",
+    max_side: int = MAX_IMAGE_SIZE,
+) -> dict:
+    """Как process_image_sync, но Pillow читает файл с диска сам — байты в память целиком не грузятся."""
+    with open(path, "rb") as f:
+        head = f.read(32)
+    if not verify_magic_bytes(head):
+        raise ValueError("Unsupported image format")
+    return _process_image_source(Path(path), content_digest, kind, max_side)
+
+
+def _write_chunk(fh, digest, chunk: bytes) -> None:
+    fh.write(chunk)
+    digest.update(chunk)
+
 
-async def _read_upload_content_limited(file: UploadFile) -> bytes:
+async def _spool_upload_limited(file: UploadFile) -> Tuple[Path, str]:
+    """
+    Записать загрузку в INCOMING_DIR чанками: в памяти не больше одного чанка.
+    Формат проверяется по первому чанку, sha256 для ключа блоба считается по ходу.
+    Возвращает (путь, hex-digest); файл удаляет вызывающий.
+    """
+    INCOMING_DIR.mkdir(parents=True, exist_ok=True)
+    target = INCOMING_DIR / f"{uuid.uuid4().hex}.upload"
+    digest = hashlib.sha256()
     total_size = 0
-    chunks: List[bytes] = []
-    while True:
-        chunk = await file.read(READ_CHUNK_SIZE)
-        if not chunk:
-            break
-        total_size += len(chunk)
-        if total_size > MAX_FILE_SIZE:
-            raise ValueError(f"File {file.filename} is too large (>20MB)")
-        chunks.append(chunk)
-    return b"".join(chunks)
+    try:
+        with open(target, "wb") as fh:
+            while True:
+                chunk = await file.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if total_size == 0 and not verify_magic_bytes(chunk):
+                    raise ValueError("Unsupported image format")
+                total_size += len(chunk)
+                if total_size > MAX_FILE_SIZE:
+                    raise ValueError(f"File {file.filename} is too large (>20MB)")
+                await run_in_threadpool(_write_chunk, fh, digest, chunk)
+        if total_size == 0:
+            raise ValueError("Unsupported image format")
+        return target, digest.hexdigest()
+    except BaseException:
+        target.unlink(missing_ok=True)
+        raise
 
 
 async def process_uploaded_files(
@@ -278,27 +457,43 @@ async def process_uploaded_files(
     kind: str = "images",
     max_side: Optional[int] = None,
 ) -> List[dict]:
-    saved_files_meta: List[dict] = []
+    """
+    Все файлы запроса пишутся на диск потоково и обрабатываются параллельно
+    в пуле image_engine (воркеры читают файлы сами, байты не пиклятся).
+    Очередь пула переполнена — HTTPException 429 ещё до чтения файлов.
+    """
     final_max_side = max_side or (MAX_AVATAR_SIZE if kind == "avatars" else MAX_IMAGE_SIZE)
+    files = [file for file in files if file.filename]
+    if not files:
+        return []
 
-    for file in files:
-        if not file.filename:
-            continue
-
+    with image_engine.reserve(len(files)):
+        spooled: List[Tuple[Path, str]] = []
         try:
-            content = await _read_upload_content_limited(file)
-            meta = await run_in_threadpool(
-                process_image_sync,
-                content,
-                kind=kind,
-                max_side=final_max_side,
+            for file in files:
+                try:
+                    spooled.append(await _spool_upload_limited(file))
+                except Exception as exc:
+                    raise ValueError(f"Error processing {file.filename}: {str(exc)}") from exc
+
+            results = await asyncio.gather(
+                *(
+                    image_engine.run(process_image_file, path, content_digest, kind=kind, max_side=final_max_side)
+                    for path, content_digest in spooled
+                ),
+                return_exceptions=True,
             )
-            saved_files_meta.append(meta)
-        except Exception as exc:
-            delete_images(saved_files_meta, default_kind=kind)
-            raise ValueError(f"Error processing {file.filename}: {str(exc)}") from exc
         finally:
-            await file.close()
+            for file in files:
+                await file.close()
+            for path, _ in spooled:
+                path.unlink(missing_ok=True)
+
+    saved_files_meta = [meta for meta in results if isinstance(meta, dict)]
+    for file, result in zip(files, results):
+        if isinstance(result, BaseException):
+            delete_images(saved_files_meta, default_kind=kind)
+            raise ValueError(f"Error processing {file.filename}: {str(result)}") from result
 
     return saved_files_meta
 
@@ -394,7 +589,8 @@ def _delete_upload_path(raw_path: str, default_kind: str = "images") -> None:
         try:
             target.unlink()
         except Exception:
-            pass
+            return
+        _release_blob(target.name)
 
 
 def delete_images(images_data: Union[List[dict], List[str], str], default_kind: str = "images"):
@@ -414,6 +610,9 @@ def delete_images(images_data: Union[List[dict], List[str], str], default_kind:
             _delete_upload_path(item.get("url", ""), default_kind=default_kind)
             if item.get("thumbnail_url"):
                 _delete_upload_path(item.get("thumbnail_url", ""), default_kind="thumbs")
+            for variant in item.get("variants") or []:
+                if isinstance(variant, dict):
+                    _delete_upload_path(variant.get("url", ""), default_kind=default_kind)
         elif isinstance(item, str):
             _delete_upload_path(item, default_kind=default_kind)
 
@@ -451,6 +650,18 @@ def get_image_urls(images_json: Union[str, List]) -> List[dict]:
                 })
             elif isinstance(item, dict):
                 media_type = item.get("type", "image")
+                if media_type == "video" and item.get("job_id") and not item.get("url"):
+                    # Видео ещё перекодируется — отдаём заглушку со статусом, иначе пропускаем
+                    if item.get("status") == "processing":
+                        result.append({
+                            "type": "video",
+                            "url": "",
+                            "w": 0,
+                            "h": 0,
+                            "status": "processing",
+                            "job_id": item.get("job_id"),
+                        })
+                    continue
                 url_kind = "videos" if media_type == "video" else "images"
                 normalized_url = normalize_uploads_path(item.get("url", ""), url_kind)
                 if not normalized_url:
@@ -476,6 +687,15 @@ def get_image_urls(images_json: Union[str, List]) -> List[dict]:
                     image_meta["thumbnail_h"] = item.get("thumbnail_h")
                 if media_type == "video" and item.get("duration") is not None:
                     image_meta["duration"] = item.get("duration")
+                variants = []
+                for variant in item.get("variants") or []:
+                    if not isinstance(variant, dict):
+                        continue
+                    variant_url = normalize_uploads_path(variant.get("url", ""), url_kind)
+                    if variant_url:
+                        variants.append({"url": variant_url, "w": variant.get("w"), "h": variant.get("h")})
+                if variants:
+                    image_meta["variants"] = variants
                 result.append(image_meta)
 
     return result
@@ -8,6 +8,7 @@ import posixpath
 import shutil
 import subprocess
 import tempfile
+import threading
 import uuid
 from datetime import datetime
 from functools import lru_cache
@@ -17,7 +18,7 @@ from typing import Optional, Tuple
 from fastapi import UploadFile
 from starlette.concurrency import run_in_threadpool
 
-from app.utils import UPLOADS_ROOT, _extract_upload_parts
+from app.utils import INCOMING_DIR, UPLOADS_ROOT, _extract_upload_parts
 
 # ================= CONFIG =================
 
@@ -31,6 +32,14 @@ THUMB_TIMESTAMP = "00:00:01"              # кадр для превью
 THUMB_MAX_SIDE = 720
 READ_CHUNK_SIZE = 1024 * 1024             # 1 MB чанки при чтении
 
+# Сырые загрузки ждут перекодирования здесь (тот же том, что и uploads — переживает рестарт)
+VIDEO_INCOMING_DIR = INCOMING_DIR
+
+# Доли прогресса по этапам пайплайна (в процентах)
+PROGRESS_PROBED = 5
+PROGRESS_TRANSCODED = 90
+PROGRESS_THUMBNAIL = 95
+
 # Поддерживаемые форматы по magic bytes
 # MP4/MOV: bytes[4:8] == b"ftyp"
 # WebM: начинается с EBML header b"\x1a\x45\xdf\xa3"
@@ -207,7 +216,12 @@ def _can_stream_copy(probe: dict) -> bool:
     )
 
 
-def _compress_video(input_path: Path, output_path: Path, probe: dict) -> None:
+def _compress_video(
+    input_path: Path,
+    output_path: Path,
+    probe: dict,
+    progress_path: Optional[Path] = None,
+) -> None:
     """
     Сжимает видео через FFmpeg в H.264/MP4:
     - Stream copy если уже H.264 и в пределах MAX_VIDEO_DIMENSION (быстро)
@@ -215,6 +229,7 @@ def _compress_video(input_path: Path, output_path: Path, probe: dict) -> None:
     - AAC 128k (или -an если аудио нет)
     - -movflags +faststart для стриминга
     - -map_metadata -1 снимает все метаданные (GPS, устройство и т.д.)
+    Если задан progress_path — туда пишется процент готовности.
     """
     use_copy = _can_stream_copy(probe)
 
@@ -247,12 +262,14 @@ def _compress_video(input_path: Path, output_path: Path, probe: dict) -> None:
 
     cmd += ["-y", str(output_path)]
 
+    def _on_progress(seconds_done: float) -> None:
+        if progress_path is not None and probe["duration"] > 0:
+            fraction = min(seconds_done / probe["duration"], 1.0)
+            span = PROGRESS_TRANSCODED - PROGRESS_PROBED
+            _write_progress(progress_path, PROGRESS_PROBED + int(span * fraction))
+
     try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            timeout=FFMPEG_TIMEOUT,
-        )
+        returncode, stderr = _run_ffmpeg(cmd, FFMPEG_TIMEOUT, _on_progress)
     except FileNotFoundError:
         raise ValueError("FFmpeg не установлен на сервере")
     except subprocess.TimeoutExpired:
@@ -260,9 +277,56 @@ def _compress_video(input_path: Path, output_path: Path, probe: dict) -> None:
             f"FFmpeg превысил таймаут ({FFMPEG_TIMEOUT}с) при сжатии видео"
         )
 
-    if result.returncode != 0:
-        stderr = result.stderr.decode(errors="replace")[-400:]
-        raise ValueError(f"Ошибка сжатия видео: {stderr}")
+    if returncode != 0:
+        raise ValueError(f"Ошибка сжатия видео: {stderr[-400:]}")
+
+
+def _run_ffmpeg(cmd: list, timeout: int, on_progress) -> Tuple[int, str]:
+    """
+    Запускает ffmpeg с -progress pipe:1 и отдаёт on_progress(секунд обработано).
+    Таймаут — по таймеру, который убивает процесс, даже если тот ничего не пишет.
+    Возвращает (returncode, stderr).
+    """
+    cmd = cmd[:1] + ["-progress", "pipe:1", "-nostats"] + cmd[1:]
+    with tempfile.TemporaryFile() as stderr_file:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file)
+        timed_out = threading.Event()
+
+        def _kill():
+            timed_out.set()
+            proc.kill()
+
+        timer = threading.Timer(timeout, _kill)
+        timer.start()
+        try:
+            for raw_line in proc.stdout:
+                key, _, value = raw_line.decode(errors="replace").strip().partition("=")
+                # out_time_ms у ffmpeg исторически тоже в микросекундах
+                if key in ("out_time_us", "out_time_ms") and value.isdigit():
+                    on_progress(int(value) / 1_000_000)
+            proc.wait()
+        finally:
+            timer.cancel()
+            proc.stdout.close()
+
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        stderr_file.seek(0)
+        return proc.returncode, stderr_file.read().decode(errors="replace")
+
+
+def _write_progress(progress_path: Path, percent: int) -> None:
+    """Атомарно записать процент в файл — его читает video_transcode_service."""
+    tmp_path = progress_path.with_name(progress_path.name + ".tmp")
+    tmp_path.write_text(str(percent))
+    os.replace(tmp_path, progress_path)
+
+
+def read_progress(progress_path: Path) -> Optional[int]:
+    try:
+        return int(progress_path.read_text())
+    except (OSError, ValueError):
+        return None
 
 
 # ================= THUMBNAIL =================
@@ -328,44 +392,42 @@ def _generate_thumbnail(video_path: Path, thumb_path: Path) -> Tuple[int, int]:
 
 # ================= MAIN PIPELINE =================
 
-def process_video_sync(content: bytes) -> dict:
+def process_video_file(source_path: Path, progress_path: Optional[Path] = None) -> dict:
     """
-    Полный синхронный пайплайн обработки видео.
-    Вызывается через run_in_threadpool из async контекста.
+    Полный синхронный пайплайн обработки видео из файла на диске.
+    Выполняется в процессе-воркере video_transcode_service (или в threadpool,
+    если очередь выключена). Исходный файл не удаляет.
 
     1. Валидация magic bytes
-    2. Запись во временный файл
-    3. ffprobe — проверка duration, размеров
-    4. FFmpeg сжатие → H.264/MP4
-    5. Генерация WebP превью
-    6. Atomic move финальных файлов
-    7. Cleanup временных файлов
+    2. ffprobe — проверка duration, размеров
+    3. FFmpeg сжатие → H.264/MP4
+    4. Генерация WebP превью
+    5. Atomic move финальных файлов
 
     Returns dict:
         {type, url, thumbnail_url, w, h, duration, format, size_bytes, thumbnail_w, thumbnail_h}
     """
-    if not verify_video_magic_bytes(content):
+    with open(source_path, "rb") as fh:
+        head = fh.read(12)
+    if not verify_video_magic_bytes(head):
         raise ValueError("Неподдерживаемый формат видео. Разрешены: MP4, MOV, WebM")
 
-    # Временный файл для входящих данных
-    suffix = ".tmp_input_" + uuid.uuid4().hex
-    tmp_input = Path(tempfile.gettempdir()) / suffix
-
     video_rel, video_temp, video_final = _make_video_storage_paths("videos", "mp4")
     thumb_rel, thumb_temp, thumb_final = _make_video_storage_paths("thumbs", "webp")
 
     try:
-        # 1. Записываем входной файл
-        tmp_input.write_bytes(content)
-
-        # 2. Probe
-        probe = _probe_video(tmp_input)
+        # 1. Probe
+        probe = _probe_video(source_path)
+        if progress_path is not None:
+            _write_progress(progress_path, PROGRESS_PROBED)
 
-        # 3. Сжатие
-        _compress_video(tmp_input, video_temp, probe)
+        # 2. Сжатие
+        _compress_video(source_path, video_temp, probe, progress_path)
 
-        # 4. Превью
-        _generate_thumbnail(video_temp, thumb_temp)
+        # 3. Превью (размеры превью отдаёт сам _generate_thumbnail)
+        thumb_w, thumb_h = _generate_thumbnail(video_temp, thumb_temp)
+        if progress_path is not None:
+            _write_progress(progress_path, PROGRESS_THUMBNAIL)
 
         # Получаем финальные размеры сжатого видео
         compressed_probe = _probe_video(video_temp)
@@ -373,27 +435,7 @@ def process_video_sync(content: bytes) -> dict:
         vid_h = compressed_probe["height"]
         duration = compressed_probe["duration"]
 
-        # Получаем размеры превью
-        try:
-            thumb_probe_result = subprocess.run(
-                [
-                    _resolve_media_binary("ffprobe"), "-v", "quiet",
-                    "-print_format", "json",
-                    "-show_streams", str(thumb_temp),
-                ],
-                capture_output=True, timeout=10, check=True,
-            )
-            thumb_data = json.loads(thumb_probe_result.stdout)
-            thumb_stream = next(
-                (s for s in thumb_data.get("streams", []) if s.get("codec_type") == "video"),
-                {}
-            )
-            thumb_w = int(thumb_stream.get("width", THUMB_MAX_SIDE))
-            thumb_h = int(thumb_stream.get("height", THUMB_MAX_SIDE))
-        except Exception:
-            thumb_w, thumb_h = THUMB_MAX_SIDE, THUMB_MAX_SIDE
-
-        # 5. Atomic move
+        # 4. Atomic move
         os.replace(video_temp, video_final)
         os.replace(thumb_temp, thumb_final)
 
@@ -413,7 +455,7 @@ def process_video_sync(content: bytes) -> dict:
         }
 
     except Exception:
-        # Cleanup всех временных и финальных файлов
+        # Cleanup всех временных файлов
         for p in (video_temp, thumb_temp):
             try:
                 if p.exists():
@@ -421,39 +463,68 @@ def process_video_sync(content: bytes) -> dict:
             except Exception:
                 pass
         raise
-    finally:
-        try:
-            tmp_input.unlink(missing_ok=True)
-        except Exception:
-            pass
 
 
-# ================= ASYNC ENTRY POINT =================
+def validate_video_file(source_path: Path) -> dict:
+    """
+    Быстрая проверка сырой загрузки до постановки в очередь: magic bytes + ffprobe
+    (длительность, наличие видео-потока, размеры). Без перекодирования.
+    Вызывает ValueError — запрос отвечает 400, как при обработке прямо в запросе.
+    """
+    with open(source_path, "rb") as fh:
+        head = fh.read(12)
+    if not verify_video_magic_bytes(head):
+        raise ValueError("Неподдерживаемый формат видео. Разрешены: MP4, MOV, WebM")
+    return _probe_video(source_path)
+
 
-async def process_uploaded_video(file: UploadFile) -> dict:
+# ================= ASYNC ENTRY POINTS =================
+
+async def save_video_upload(file: UploadFile) -> Path:
     """
-    Async обёртка для загрузки и обработки одного видео-файла.
-    Читает файл чанками (лимит 100MB), затем обрабатывает в threadpool.
+    Сохранить загрузку в VIDEO_INCOMING_DIR чанками (лимит 100MB), не держа
+    файл целиком в памяти. Формат проверяется по первому чанку.
+    Возвращает путь к сырому файлу — его забирает очередь перекодирования.
     """
+    VIDEO_INCOMING_DIR.mkdir(parents=True, exist_ok=True)
+    target = VIDEO_INCOMING_DIR / f"{uuid.uuid4().hex}.upload"
     total_size = 0
-    chunks = []
     try:
-        while True:
-            chunk = await file.read(READ_CHUNK_SIZE)
-            if not chunk:
-                break
-            total_size += len(chunk)
-            if total_size > MAX_VIDEO_FILE_SIZE:
-                raise ValueError(
-                    f"Видео слишком большое (>{MAX_VIDEO_FILE_SIZE // (1024*1024)}MB)"
-                )
-            chunks.append(chunk)
-        content = b"".join(chunks)
-        return await run_in_threadpool(process_video_sync, content)
+        with open(target, "wb") as fh:
+            while True:
+                chunk = await file.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if total_size == 0 and not verify_video_magic_bytes(chunk):
+                    raise ValueError("Неподдерживаемый формат видео. Разрешены: MP4, MOV, WebM")
+                total_size += len(chunk)
+                if total_size > MAX_VIDEO_FILE_SIZE:
+                    raise ValueError(
+                        f"Видео слишком большое (>{MAX_VIDEO_FILE_SIZE // (1024*1024)}MB)"
+                    )
+                await run_in_threadpool(fh.write, chunk)
+        if total_size == 0:
+            raise ValueError("Пустой видеофайл")
+        return target
+    except Exception:
+        target.unlink(missing_ok=True)
+        raise
     finally:
         await file.close()
 
 
+async def process_uploaded_video(file: UploadFile) -> dict:
+    """
+    Загрузка и обработка одного видео прямо в запросе (очередь выключена):
+    файл пишется на диск чанками, пайплайн — в threadpool.
+    """
+    source_path = await save_video_upload(file)
+    try:
+        return await run_in_threadpool(process_video_file, source_path)
+    finally:
+        source_path.unlink(missing_ok=True)
+
+
 # ================= DELETE =================
 
 def delete_video(video_meta: dict) -> None:
@@ -0,0 +1,351 @@
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from redis.exceptions import ConnectionError as RedisConnectionError
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import OperationalError
+
+from app.crud import ads as ads_crud
+from app.services import ad_counter_service
+
+
+class _FakePipeline:
+    def __init__(self, redis):
+        self._redis = redis
+        self._ops = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self._ops.append((name, args, kwargs))
+        return queue
+
+    async def execute(self):
+        return [await getattr(self._redis, name)(*args, **kwargs) for name, args, kwargs in self._ops]
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.values = {}
+        self.sets = {}
+        self.hashes = {}
+        self.lists = {}
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.values:
+            return None
+        self.values[key] = str(value)
+        return True
+
+    async def exists(self, key):
+        return int(key in self.values or key in self.sets or key in self.hashes)
+
+    async def expire(self, key, ttl):
+        return True
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+            self.hashes.pop(key, None)
+
+    async def sadd(self, key, *values):
+        self.sets.setdefault(key, set()).update(values)
+
+    async def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    async def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update({k: str(v) for k, v in mapping.items()})
+
+    async def rpush(self, key, *values):
+        self.lists.setdefault(key, []).extend(values)
+
+    async def lrange(self, key, start, end):
+        return self.lists.get(key, [])[start:end + 1]
+
+    async def ltrim(self, key, start, end):
+        self.lists[key] = self.lists.get(key, [])[start:]
+
+    async def eval(self, script, numkeys, *args):
+        keys, argv = args[:numkeys], args[numkeys:]
+        if script == ad_counter_service._RELEASE_LOCK:
+            if self.values.get(keys[0]) == argv[0]:
+                del self.values[keys[0]]
+            return 1
+        users, total, day, pending = keys
+        user_id, limit, cap, _, entry = argv
+        if user_id in self.sets.get(users, set()):
+            return 0
+        if int(limit) > 0 and int(self.values.get(total, 0)) >= int(limit):
+            return -1
+        if int(cap) > 0 and int(self.values.get(day, 0)) >= int(cap):
+            return -2
+        self.sets.setdefault(users, set()).add(user_id)
+        self.values[total] = str(int(self.values.get(total, 0)) + 1)
+        self.values[day] = str(int(self.values.get(day, 0)) + 1)
+        self.lists.setdefault(pending, []).append(entry)
+        return int(self.values[total])
+
+
+class _FakeScalars:
+    def __init__(self, values):
+        self._values = values
+
+    def all(self):
+        return list(self._values)
+
+
+class _FakeResult:
+    def __init__(self, values=()):
+        self._values = values
+
+    def scalars(self):
+        return _FakeScalars(self._values)
+
+
+def _db(ad, seen_user_ids=(), today_count=0):
+    return SimpleNamespace(
+        get=AsyncMock(return_value=ad),
+        execute=AsyncMock(return_value=_FakeResult(seen_user_ids)),
+        scalar=AsyncMock(return_value=today_count),
+        commit=AsyncMock(),
+    )
+
+
+def _ad(ad_id=1, impression_limit=1000, daily_impression_cap=None, impressions_count=0):
+    return SimpleNamespace(
+        id=ad_id,
+        impression_limit=impression_limit,
+        daily_impression_cap=daily_impression_cap,
+        impressions_count=impressions_count,
+    )
+
+
+class AdCounterTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.redis = _FakeRedis()
+        self.bump = AsyncMock()
+        patchers = [
+            patch("app.services.ad_counter_service.get_redis", new=AsyncMock(return_value=self.redis)),
+            patch("app.services.ad_counter_service.ad_serving.mark_seen", new=AsyncMock()),
+            patch("app.services.ad_counter_service.ad_serving.bump_generation", new=self.bump),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_repeat_impression_is_not_counted_and_meta_is_cached(self):
+        db = _db(_ad(), seen_user_ids=[7], today_count=1)
+
+        self.assertFalse(await ad_counter_service.record_impression(db, 1, 7))
+        self.assertTrue(await ad_counter_service.record_impression(db, 1, 8))
+        self.assertFalse(await ad_counter_service.record_impression(db, 1, 8))
+
+        db.get.assert_awaited_once()
+        self.assertEqual(len(self.redis.lists[ad_counter_service.PENDING_IMPRESSIONS_KEY]), 1)
+
+    async def test_generation_bump_reloads_meta(self):
+        db = _db(_ad(impression_limit=1000))
+        await ad_counter_service.record_impression(db, 1, 5)
+
+        self.redis.values[ad_counter_service.ad_serving.GEN_KEY] = "2"
+        db.get.return_value = _ad(impression_limit=1)
+
+        self.assertFalse(await ad_counter_service.record_impression(db, 1, 6))
+        self.assertEqual(db.get.await_count, 2)
+
+    async def test_reaching_limit_completes_ad_immediately(self):
+        db = _db(_ad(impression_limit=2, impressions_count=1))
+
+        self.assertTrue(await ad_counter_service.record_impression(db, 1, 5))
+        self.assertFalse(await ad_counter_service.record_impression(db, 1, 6))
+
+        db.commit.assert_awaited_once()
+        self.bump.assert_awaited_once()
+        sql = str(db.execute.await_args.args[0])
+        self.assertIn("UPDATE ad_posts SET status", sql)
+
+    async def test_daily_cap_is_enforced(self):
+        db = _db(_ad(daily_impression_cap=2), today_count=1)
+
+        self.assertTrue(await ad_counter_service.record_impression(db, 1, 5))
+        self.assertFalse(await ad_counter_service.record_impression(db, 1, 6))
+
+    async def test_missing_ad_is_not_tracked(self):
+        db = _db(None)
+
+        self.assertFalse(await ad_counter_service.record_impression(db, 1, 5))
+        self.assertFalse(await ad_counter_service.record_click(db, 1, 5))
+        db.get.assert_awaited_once()
+
+    async def test_redis_outage_returns_none(self):
+        broken = AsyncMock(side_effect=RedisConnectionError("down"))
+        with patch("app.services.ad_counter_service.get_redis", new=broken):
+            self.assertIsNone(await ad_counter_service.record_impression(_db(_ad()), 1, 5))
+            self.assertIsNone(await ad_counter_service.record_click(_db(_ad()), 1, 5))
+
+    async def test_flush_writes_batches_and_trims(self):
+        db = _db(_ad())
+        await ad_counter_service.record_impression(db, 1, 5)
+        await ad_counter_service.record_click(db, 1, 5)
+        self.redis.lists[ad_counter_service.PENDING_CLICKS_KEY].append("garbage")
+
+        apply_impressions = AsyncMock(return_value=1)
+        apply_clicks = AsyncMock(return_value=1)
+        session = SimpleNamespace(rollback=AsyncMock())
+        with patch.object(ad_counter_service.ads_crud, "apply_ad_impressions", apply_impressions), \
+                patch.object(ad_counter_service.ads_crud, "apply_ad_clicks", apply_clicks), \
+                patch("app.services.ad_counter_service.AsyncSessionLocal", return_value=_Session(session)):
+            flushed = await ad_counter_service.flush_pending_counters()
+
+        self.assertEqual(flushed, {"impressions": 1, "clicks": 1})
+        rows = apply_impressions.await_args.args[1]
+        self.assertEqual([(ad_id, user_id) for ad_id, user_id, _ in rows], [(1, 5)])
+        self.assertIsInstance(rows[0][2], datetime)
+        self.assertEqual(len(apply_clicks.await_args.args[1]), 1)
+        self.assertEqual(self.redis.lists[ad_counter_service.PENDING_IMPRESSIONS_KEY], [])
+        self.assertEqual(self.redis.lists[ad_counter_service.PENDING_CLICKS_KEY], [])
+        self.assertNotIn(ad_counter_service.FLUSH_LOCK_KEY, self.redis.values)
+
+    async def test_failed_flush_keeps_entries(self):
+        await ad_counter_service.record_impression(_db(_ad()), 1, 5)
+
+        failing = AsyncMock(side_effect=OperationalError("INSERT", {}, Exception("db down")))
+        session = SimpleNamespace(rollback=AsyncMock())
+        with patch.object(ad_counter_service.ads_crud, "apply_ad_impressions", failing), \
+                patch("app.services.ad_counter_service.AsyncSessionLocal", return_value=_Session(session)):
+            flushed = await ad_counter_service.flush_pending_counters()
+
+        self.assertEqual(flushed["impressions"], 0)
+        session.rollback.assert_awaited_once()
+        self.assertEqual(len(self.redis.lists[ad_counter_service.PENDING_IMPRESSIONS_KEY]), 1)
+
+    async def test_flush_drains_all_batches_in_one_tick(self):
+        impressions = [f"1:{user_id}:1700000000.000" for user_id in range(1, 6)]
+        clicks = [f"1:{user_id}:1700000000.000" for user_id in range(1, 4)]
+        self.redis.lists[ad_counter_service.PENDING_IMPRESSIONS_KEY] = list(impressions)
+        self.redis.lists[ad_counter_service.PENDING_CLICKS_KEY] = list(clicks)
+
+        apply_impressions = AsyncMock(side_effect=lambda db, rows: len(rows))
+        apply_clicks = AsyncMock(side_effect=lambda db, rows: len(rows))
+        session = SimpleNamespace(rollback=AsyncMock())
+        with patch.object(ad_counter_service, "FLUSH_BATCH_SIZE", 2), \
+                patch.object(ad_counter_service.ads_crud, "apply_ad_impressions", apply_impressions), \
+                patch.object(ad_counter_service.ads_crud, "apply_ad_clicks", apply_clicks), \
+                patch("app.services.ad_counter_service.AsyncSessionLocal", return_value=_Session(session)):
+            flushed = await ad_counter_service.flush_pending_counters()
+
+        self.assertEqual(flushed, {"impressions": 5, "clicks": 3})
+        self.assertEqual(apply_impressions.await_count, 3)
+        self.assertEqual(apply_clicks.await_count, 2)
+        self.assertEqual(self.redis.lists[ad_counter_service.PENDING_IMPRESSIONS_KEY], [])
+        self.assertEqual(self.redis.lists[ad_counter_service.PENDING_CLICKS_KEY], [])
+
+    async def test_flush_stops_at_round_limit(self):
+        self.redis.lists[ad_counter_service.PENDING_IMPRESSIONS_KEY] = [
+            f"1:{user_id}:1700000000.000" for user_id in range(1, 8)
+        ]
+
+        apply_impressions = AsyncMock(side_effect=lambda db, rows: len(rows))
+        session = SimpleNamespace(rollback=AsyncMock())
+        with patch.object(ad_counter_service, "FLUSH_BATCH_SIZE", 2), \
+                patch.object(ad_counter_service.ads_crud, "apply_ad_impressions", apply_impressions), \
+                patch("app.services.ad_counter_service.AsyncSessionLocal", return_value=_Session(session)):
+            flushed = await ad_counter_service.flush_pending_counters(max_rounds=2)
+
+        self.assertEqual(flushed["impressions"], 4)
+        self.assertEqual(len(self.redis.lists[ad_counter_service.PENDING_IMPRESSIONS_KEY]), 3)
+        self.assertNotIn(ad_counter_service.FLUSH_LOCK_KEY, self.redis.values)
+
+    async def test_flush_skips_when_another_worker_holds_lock(self):
+        self.redis.values[ad_counter_service.FLUSH_LOCK_KEY] = "other"
+        apply_impressions = AsyncMock()
+        with patch.object(ad_counter_service.ads_crud, "apply_ad_impressions", apply_impressions):
+            await ad_counter_service.flush_pending_counters()
+
+        apply_impressions.assert_not_awaited()
+
+
+class _Session:
+    def __init__(self, session):
+        self._session = session
+
+    async def __aenter__(self):
+        return self._session
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class ApplyAdImpressionsTests(unittest.IsolatedAsyncioTestCase):
+    async def test_counters_grow_only_by_inserted_rows(self):
+        viewed_at = datetime(2026, 5, 1, 12, 0)
+        db = SimpleNamespace(
+            execute=AsyncMock(side_effect=[
+                _FakeResult([1, 2]),  # существующие кампании
+                _FakeResult([1]),     # RETURNING: вставился только один показ
+                _FakeResult(),
+            ]),
+            commit=AsyncMock(),
+        )
+
+        written = await ads_crud.apply_ad_impressions(
+            db, [(1, 5, viewed_at), (2, 5, viewed_at), (3, 5, viewed_at)],
+        )
+
+        self.assertEqual(written, 1)
+        insert_stmt = db.execute.await_args_list[1].args[0]
+        self.assertEqual(len(insert_stmt.compile().params), 6)
+        update_call = db.execute.await_args_list[2]
+        self.assertEqual(update_call.args[1], [{"b_ad_id": 1, "b_delta": 1}])
+        db.commit.assert_awaited_once()
+
+
+
+class ApplyAdClicksTests(unittest.IsolatedAsyncioTestCase):
+    async def test_replayed_batch_does_not_double_count(self):
+        clicked_at = datetime(2026, 5, 1, 12, 0)
+        db = SimpleNamespace(
+            execute=AsyncMock(side_effect=[
+                _FakeResult([1]),  # существующие кампании
+                _FakeResult([]),   # RETURNING: пачка уже была записана
+            ]),
+            commit=AsyncMock(),
+        )
+
+        written = await ads_crud.apply_ad_clicks(db, [(1, 5, clicked_at), (1, 6, clicked_at)])
+
+        self.assertEqual(written, 0)
+        insert_stmt = db.execute.await_args_list[1].args[0]
+        sql = str(insert_stmt.compile(dialect=postgresql.dialect()))
+        self.assertIn("ON CONFLICT ON CONSTRAINT unique_ad_click DO NOTHING", sql)
+        self.assertEqual(db.execute.await_count, 2)
+        db.commit.assert_awaited_once()
+
+    async def test_clicks_count_grows_by_inserted_rows(self):
+        clicked_at = datetime(2026, 5, 1, 12, 0)
+        db = SimpleNamespace(
+            execute=AsyncMock(side_effect=[
+                _FakeResult([1, 2]),
+                _FakeResult([1, 1]),
+                _FakeResult(),
+            ]),
+            commit=AsyncMock(),
+        )
+
+        written = await ads_crud.apply_ad_clicks(
+            db, [(1, 5, clicked_at), (1, 6, clicked_at), (2, 5, clicked_at)],
+        )
+
+        self.assertEqual(written, 2)
+        self.assertEqual(db.execute.await_args_list[2].args[1], [{"b_ad_id": 1, "b_delta": 2}])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import random
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from app.services import ad_serving
+
+
+class _FakePipeline:
+    def __init__(self, redis):
+        self._redis = redis
+        self._ops = []
+
+    def smembers(self, key):
+        self._ops.append(("smembers", key, ()))
+
+    def sadd(self, key, *values):
+        self._ops.append(("sadd", key, values))
+
+    def expire(self, key, ttl):
+        self._ops.append(("expire", key, ()))
+
+    async def execute(self):
+        results = []
+        for op, key, values in self._ops:
+            if op == "smembers":
+                results.append(set(self._redis.sets.get(key, set())))
+            elif op == "sadd":
+                self._redis.sets.setdefault(key, set()).update(values)
+                results.append(len(values))
+            else:
+                results.append(True)
+        return results
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.values = {}
+        self.sets = {}
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def incr(self, key):
+        self.values[key] = str(int(self.values.get(key, 0)) + 1)
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+
+def _ad(ad_id, scope="all", university=None, priority=5, **overrides):
+    post = SimpleNamespace(
+        id=100 + ad_id, title=f"Ad {ad_id}", body="", images=None, author=None,
+        created_at=datetime(2026, 5, 1), likes_count=0, comments_count=0, views_count=0,
+    )
+    values = dict(
+        id=ad_id, post=post, scope=scope, target_university=university, target_city=None,
+        priority=priority, starts_at=datetime(2026, 1, 1), ends_at=None,
+        impression_limit=None, impressions_count=0,
+        advertiser_name="Shop", advertiser_logo=None, cta_text="Go", cta_url="https://example.com",
+    )
+    values.update(overrides)
+    return SimpleNamespace(**values)
+
+
+class AdServingTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        ad_serving.reset_local_index()
+        self.addCleanup(ad_serving.reset_local_index)
+        self.redis = _FakeRedis()
+        patchers = [
+            patch("app.services.ad_serving.get_redis", new=AsyncMock(return_value=self.redis)),
+            patch(
+                "app.services.ad_serving.get_settings",
+                return_value=SimpleNamespace(ads_index_refresh_seconds=60),
+            ),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_weighted_sample_prefers_higher_priority(self):
+        rng = random.Random(7)
+        candidates = [{"id": 1, "priority": 1}, {"id": 2, "priority": 9}]
+
+        picks = [ad_serving.weighted_sample(candidates, 1, rng)[0]["id"] for _ in range(2000)]
+
+        self.assertGreater(picks.count(2), picks.count(1) * 4)
+
+    async def test_selection_uses_index_and_redis_sets_without_db(self):
+        now = datetime.utcnow()
+        ads = [
+            _ad(1),
+            _ad(2, scope="university", university="MSU"),
+            _ad(3, scope="university", university="SPbU"),
+            _ad(4, ends_at=now - timedelta(hours=1)),
+            _ad(5, impression_limit=10, impressions_count=10),
+            _ad(6),
+            _ad(7),
+        ]
+        self.redis.sets[ad_serving.seen_key(42, now)] = {"0", "6"}
+        self.redis.sets[ad_serving.hidden_key(42)] = {"0", "7"}
+        db = SimpleNamespace(execute=AsyncMock())
+
+        with patch("app.services.ad_serving._load_active_ads", new=AsyncMock(return_value=ads)) as load:
+            first = await ad_serving.get_ads_for_user(db, 42, "MSU", limit=10)
+            second = await ad_serving.get_ads_for_user(db, 42, "MSU", limit=10)
+
+        self.assertEqual({item["ad_id"] for item in first}, {1, 2})
+        self.assertEqual({item["ad_id"] for item in second}, {1, 2})
+        self.assertEqual(load.await_count, 1)
+        db.execute.assert_not_awaited()
+
+    async def test_generation_bump_rebuilds_index(self):
+        db = SimpleNamespace(execute=AsyncMock())
+        self.redis.sets[ad_serving.seen_key(42)] = {"0"}
+        self.redis.sets[ad_serving.hidden_key(42)] = {"0"}
+
+        with patch(
+            "app.services.ad_serving._load_active_ads",
+            new=AsyncMock(side_effect=[[_ad(1)], [_ad(1), _ad(2)]]),
+        ) as load:
+            await ad_serving.get_ads_for_user(db, 42, "MSU")
+            await ad_serving.bump_generation()
+            result = await ad_serving.get_ads_for_user(db, 42, "MSU")
+
+        self.assertEqual(load.await_count, 2)
+        self.assertEqual({item["ad_id"] for item in result}, {1, 2})
+
+    async def test_redis_outage_returns_none_for_db_fallback(self):
+        broken = SimpleNamespace(get=AsyncMock(side_effect=RedisConnectionError("down")))
+
+        with patch("app.services.ad_serving.get_redis", new=AsyncMock(return_value=broken)):
+            result = await ad_serving.get_ads_for_user(SimpleNamespace(), 42, "MSU")
+
+        self.assertIsNone(result)
+
+
+if __name__ == "__main__":
+    unittest.main()
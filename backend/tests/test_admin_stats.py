@@ -0,0 +1,203 @@
+import asyncio
+import json
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from app.routers.moderation import get_admin_stats
+from app.services import admin_stats_service
+
+
+class _FakePipeline:
+    def __init__(self, redis):
+        self._redis = redis
+        self._ops = []
+
+    def hset(self, key, mapping):
+        self._ops.append(("hset", key, mapping))
+
+    def expire(self, key, ttl):
+        self._ops.append(("expire", key, ttl))
+
+    async def execute(self):
+        for op, key, value in self._ops:
+            if op == "hset":
+                self._redis.data.setdefault(key, {}).update(value)
+            else:
+                self._redis.ttls[key] = value
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+        self.locks = {}
+
+    async def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.locks:
+            return None
+        self.locks[key] = value
+        return True
+
+    async def eval(self, script, numkeys, key, token):
+        assert script == admin_stats_service._RELEASE_LOCK
+        if self.locks.get(key) != token:
+            return 0
+        del self.locks[key]
+        return 1
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+
+class _AsyncCM:
+    def __init__(self, value):
+        self._value = value
+
+    async def __aenter__(self):
+        return self._value
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class AdminStatsSnapshotTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.redis = _FakeRedis()
+        patcher = patch("app.services.admin_stats_service.get_redis", new=AsyncMock(return_value=self.redis))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _put(self, key, payload, age_seconds):
+        generated_at = datetime.now(timezone.utc) - timedelta(seconds=age_seconds)
+        self.redis.data[key] = {"payload": json.dumps(payload), "generated_at": generated_at.isoformat()}
+        return generated_at
+
+    def _patch_compute(self, counters=None, usage=None):
+        counters_mock = AsyncMock(return_value=counters or {"total_users": 5})
+        usage_mock = AsyncMock(return_value=usage or {"real_dau": 2})
+        patchers = [
+            patch("app.services.admin_stats_service.compute_counter_stats", new=counters_mock),
+            patch("app.services.admin_stats_service.compute_usage_stats", new=usage_mock),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        return counters_mock, usage_mock
+
+    async def test_snapshot_is_served_with_age_of_older_part(self):
+        self._put(admin_stats_service.SNAPSHOT_KEY, {"total_users": 42}, age_seconds=30)
+        usage_at = self._put(admin_stats_service.USAGE_KEY, {"real_dau": 7}, age_seconds=90)
+        counters, usage = self._patch_compute()
+
+        stats = await admin_stats_service.get_admin_stats(db=object())
+
+        counters.assert_not_awaited()
+        usage.assert_not_awaited()
+        self.assertEqual((stats["total_users"], stats["real_dau"]), (42, 7))
+        self.assertEqual(stats["stats_generated_at"], usage_at)
+        self.assertGreaterEqual(stats["stats_age_seconds"], 90)
+
+    async def test_missing_snapshot_is_computed_and_stored(self):
+        self._patch_compute()
+
+        stats = await admin_stats_service.get_admin_stats(db=object())
+
+        self.assertEqual((stats["total_users"], stats["real_dau"]), (5, 2))
+        self.assertEqual(stats["stats_age_seconds"], 0)
+        stored = self.redis.data[admin_stats_service.SNAPSHOT_KEY]
+        self.assertEqual(json.loads(stored["payload"]), {"total_users": 5})
+        self.assertEqual(self.redis.ttls[admin_stats_service.SNAPSHOT_KEY], 300)
+        self.assertEqual(json.loads(self.redis.data[admin_stats_service.USAGE_KEY]["payload"]), {"real_dau": 2})
+
+    async def test_stale_usage_is_served_and_refreshed_once_in_background(self):
+        self._put(admin_stats_service.SNAPSHOT_KEY, {"total_users": 42}, age_seconds=10)
+        self._put(admin_stats_service.USAGE_KEY, {"real_dau": 7}, age_seconds=3600)
+        _, usage = self._patch_compute(usage={"real_dau": 9})
+        session = SimpleNamespace()
+
+        with patch("app.services.admin_stats_service.AsyncSessionLocal", return_value=_AsyncCM(session)):
+            first = await admin_stats_service.get_admin_stats(db=object())
+            second = await admin_stats_service.get_admin_stats(db=object())
+            await asyncio.gather(*admin_stats_service._usage_tasks)
+
+        # Оба ответа — из старого снимка, пересчёт запущен один раз
+        self.assertEqual((first["real_dau"], second["real_dau"]), (7, 7))
+        usage.assert_awaited_once_with(session)
+        self.assertEqual(json.loads(self.redis.data[admin_stats_service.USAGE_KEY]["payload"]), {"real_dau": 9})
+        self.assertNotIn(admin_stats_service.USAGE_LOCK_KEY, self.redis.locks)
+
+    async def test_overrunning_refresh_keeps_lock_taken_over_by_other_worker(self):
+        self._put(admin_stats_service.SNAPSHOT_KEY, {"total_users": 42}, age_seconds=10)
+        self._put(admin_stats_service.USAGE_KEY, {"real_dau": 7}, age_seconds=3600)
+
+        async def slow_usage(_):
+            # TTL истёк посреди пересчёта, lock взял другой воркер
+            self.redis.locks[admin_stats_service.USAGE_LOCK_KEY] = "other-worker"
+            return {"real_dau": 9}
+
+        self._patch_compute()
+        with patch("app.services.admin_stats_service.compute_usage_stats", side_effect=slow_usage), \
+                patch("app.services.admin_stats_service.AsyncSessionLocal", return_value=_AsyncCM(object())):
+            await admin_stats_service.get_admin_stats(db=object())
+            await asyncio.gather(*admin_stats_service._usage_tasks)
+
+        self.assertEqual(self.redis.locks[admin_stats_service.USAGE_LOCK_KEY], "other-worker")
+
+    async def test_refresh_loop_does_not_compute_usage(self):
+        counters, usage = self._patch_compute()
+        stop_event = asyncio.Event()
+
+        async def stop_after_first_tick(_):
+            stop_event.set()
+            return ({}, datetime.now(timezone.utc))
+
+        with patch("app.services.admin_stats_service.AsyncSessionLocal", return_value=_AsyncCM(object())), \
+                patch("app.services.admin_stats_service.refresh_snapshot", side_effect=stop_after_first_tick) as refresh:
+            await admin_stats_service.run_admin_stats_refresh_loop(stop_event)
+
+        refresh.assert_awaited_once()
+        usage.assert_not_awaited()
+
+    async def test_redis_outage_computes_inline(self):
+        broken = SimpleNamespace(hgetall=AsyncMock(side_effect=RedisConnectionError("down")))
+        broken.pipeline = lambda transaction=True: SimpleNamespace(
+            hset=lambda *a, **kw: None,
+            expire=lambda *a, **kw: None,
+            execute=AsyncMock(side_effect=RedisConnectionError("down")),
+        )
+
+        with (
+            patch("app.services.admin_stats_service.get_redis", new=AsyncMock(return_value=broken)),
+            patch(
+                "app.services.admin_stats_service.compute_counter_stats",
+                new=AsyncMock(return_value={"total_users": 1}),
+            ),
+            patch(
+                "app.services.admin_stats_service.compute_usage_stats",
+                new=AsyncMock(return_value={"real_dau": 1}),
+            ),
+        ):
+            stats = await admin_stats_service.get_admin_stats(db=object())
+
+        self.assertEqual(stats["total_users"], 1)
+
+    async def test_route_refresh_flag_forces_recompute(self):
+        user = SimpleNamespace(role="superadmin")
+        with patch(
+            "app.routers.moderation.admin_stats_service.get_admin_stats",
+            new=AsyncMock(return_value={"total_users": 3}),
+        ) as service:
+            await get_admin_stats(refresh=True, user=user, db=object())
+
+        self.assertTrue(service.await_args.kwargs["force_refresh"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+import unittest
+from datetime import date, datetime
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from redis.exceptions import ConnectionError as RedisConnectionError
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.services import analytics_event_buffer, analytics_service
+
+
+class _FakeSessionFactory:
+    def __init__(self, db):
+        self.db = db
+
+    def __call__(self):
+        return self
+
+    async def __aenter__(self):
+        return self.db
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def _settings(**overrides):
+    values = dict(
+        analytics_salt="salt",
+        analytics_buffer_enabled=True,
+        analytics_flush_batch_size=3,
+        analytics_flush_interval_seconds=2,
+        analytics_redis_stream_enabled=False,
+    )
+    values.update(overrides)
+    return SimpleNamespace(**values)
+
+
+def _row(n):
+    return {
+        "event_name": "feed_open",
+        "event_ts_utc": datetime(2026, 5, 1, 12, 0, n),
+        "event_date_msk": date(2026, 5, 1),
+        "user_hash": "h",
+        "dedup_key": f"req-{n}|feed_open|h|-|-",
+        "properties_json": {},
+    }
+
+
+class AnalyticsEventBufferTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        analytics_event_buffer._buffer.clear()
+        analytics_event_buffer._flush_wakeup.clear()
+        self.addCleanup(analytics_event_buffer._buffer.clear)
+        patcher = patch("app.services.analytics_event_buffer.get_settings", return_value=_settings())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_record_server_event_enqueues_without_touching_db(self):
+        db = SimpleNamespace(execute=AsyncMock(), commit=AsyncMock())
+
+        with patch("app.services.analytics_service.get_settings", return_value=_settings()):
+            ok = await analytics_service.record_server_event(
+                db, 7, "post_open", entity_type="post", entity_id=5,
+            )
+
+        self.assertTrue(ok)
+        db.execute.assert_not_awaited()
+        db.commit.assert_not_awaited()
+        self.assertEqual(analytics_event_buffer.pending_count(), 1)
+        self.assertEqual(analytics_event_buffer._buffer[0]["entity_id"], 5)
+
+    async def test_size_threshold_wakes_flush_loop(self):
+        await analytics_event_buffer.enqueue(_row(1))
+        await analytics_event_buffer.enqueue(_row(2))
+        self.assertFalse(analytics_event_buffer._flush_wakeup.is_set())
+
+        await analytics_event_buffer.enqueue(_row(3))
+
+        self.assertTrue(analytics_event_buffer._flush_wakeup.is_set())
+
+    async def test_drain_writes_batches_with_one_insert_each(self):
+        for n in range(5):
+            await analytics_event_buffer.enqueue(_row(n))
+        db = SimpleNamespace(execute=AsyncMock(), commit=AsyncMock())
+
+        with patch("app.services.analytics_event_buffer.AsyncSessionLocal", new=_FakeSessionFactory(db)):
+            flushed = await analytics_event_buffer.flush_pending_events(drain=True)
+
+        self.assertEqual(flushed, 5)
+        self.assertEqual(db.execute.await_count, 2)
+        sql = str(db.execute.await_args_list[0].args[0].compile(dialect=postgresql.dialect()))
+        self.assertIn("ON CONFLICT (dedup_key) DO NOTHING", sql)
+        self.assertEqual(analytics_event_buffer.pending_count(), 0)
+
+    async def test_large_batch_is_split_under_bind_param_limit(self):
+        rows = [_row(n % 60) for n in range(4500)]
+        db = SimpleNamespace(execute=AsyncMock(), commit=AsyncMock())
+
+        with patch("app.services.analytics_event_buffer.AsyncSessionLocal", new=_FakeSessionFactory(db)):
+            await analytics_event_buffer.insert_rows(rows)
+
+        chunks = [call.args[0].compile(dialect=postgresql.dialect()) for call in db.execute.await_args_list]
+        self.assertEqual(len(chunks), 3)
+        self.assertTrue(all(len(chunk.params) < 32767 for chunk in chunks))
+        db.commit.assert_awaited_once()
+
+    async def test_failed_batch_is_dropped_and_loop_keeps_going(self):
+        for n in range(2):
+            await analytics_event_buffer.enqueue(_row(n))
+        db = SimpleNamespace(execute=AsyncMock(side_effect=SQLAlchemyError("down")), commit=AsyncMock())
+
+        with patch("app.services.analytics_event_buffer.AsyncSessionLocal", new=_FakeSessionFactory(db)):
+            flushed = await analytics_event_buffer.flush_pending_events(drain=True)
+
+        self.assertEqual(flushed, 0)
+        self.assertEqual(analytics_event_buffer.pending_count(), 0)
+
+    async def test_stream_outage_falls_back_to_memory(self):
+        broken = SimpleNamespace(xadd=AsyncMock(side_effect=RedisConnectionError("down")))
+
+        with (
+            patch(
+                "app.services.analytics_event_buffer.get_settings",
+                return_value=_settings(analytics_redis_stream_enabled=True),
+            ),
+            patch("app.services.analytics_event_buffer.get_redis", new=AsyncMock(return_value=broken)),
+        ):
+            ok = await analytics_event_buffer.enqueue(_row(1))
+
+        self.assertTrue(ok)
+        self.assertEqual(analytics_event_buffer.pending_count(), 1)
+
+    async def test_stream_is_read_until_batch_is_not_full(self):
+        batches = AsyncMock(side_effect=[(3, True), (3, True), (1, False)])
+
+        with (
+            patch(
+                "app.services.analytics_event_buffer.get_settings",
+                return_value=_settings(analytics_redis_stream_enabled=True),
+            ),
+            patch("app.services.analytics_event_buffer._flush_stream_batch", new=batches),
+        ):
+            flushed = await analytics_event_buffer.flush_pending_events()
+
+        self.assertEqual(flushed, 7)
+        self.assertEqual(batches.await_count, 3)
+
+    async def test_stream_read_stops_at_tick_budget(self):
+        batches = AsyncMock(return_value=(3, True))
+
+        with (
+            patch(
+                "app.services.analytics_event_buffer.get_settings",
+                return_value=_settings(analytics_redis_stream_enabled=True),
+            ),
+            patch("app.services.analytics_event_buffer._flush_stream_batch", new=batches),
+            patch.object(analytics_event_buffer, "STREAM_TICK_BUDGET_SECONDS", 0),
+        ):
+            flushed = await analytics_event_buffer.flush_pending_events()
+
+        self.assertEqual(flushed, 3)
+        batches.assert_awaited_once()
+        self.assertTrue(analytics_event_buffer._flush_wakeup.is_set())
+
+    def test_stream_row_round_trip(self):
+        row = _row(4)
+
+        decoded = analytics_event_buffer._decode_row(analytics_event_buffer._encode_row(row))
+
+        self.assertEqual(decoded, row)
+
+
+if __name__ == "__main__":
+    unittest.main()
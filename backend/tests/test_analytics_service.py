@@ -1,14 +1,27 @@
 ﻿import json
 import tempfile
 import unittest
-from datetime import date
+from datetime import date, datetime, timedelta
 from pathlib import Path
 from types import SimpleNamespace
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
+
+from sqlalchemy.dialects import postgresql
 
 from app.services import analytics_service
 
 
+class _MappingResult:
+    def __init__(self, row):
+        self._row = row
+
+    def mappings(self):
+        return self
+
+    def one(self):
+        return self._row
+
+
 class AnalyticsServiceTests(unittest.TestCase):
     def test_hash_user_id_is_deterministic(self):
         a = analytics_service.hash_user_id(123, "salt-1")
@@ -79,5 +92,174 @@ class AnalyticsServiceTests(unittest.TestCase):
             self.assertEqual(paths["base_dir"], expected_folder)
 
 
+class DailyEventCountsTests(unittest.IsolatedAsyncioTestCase):
+    def _row(self, **values):
+        keys = list(analytics_service.DAILY_USER_COUNTS) + [
+            analytics_service._event_count_label(name) for name in analytics_service.REQUIRED_EVENT_NAMES
+        ] + ["notifications_acted", "activated_users"]
+        row = {key: 0 for key in keys}
+        row.update(values)
+        return row
+
+    async def test_all_daily_counters_come_from_one_statement(self):
+        db = SimpleNamespace(execute=AsyncMock(return_value=_MappingResult(self._row(
+            active_users=12, activated_users=3, events__notification_open=5, notifications_acted=2,
+        ))))
+
+        counts = await analytics_service.load_daily_event_counts(
+            db, date(2026, 3, 12), new_user_hashes={"a", "b"},
+        )
+
+        db.execute.assert_awaited_once()
+        sql = str(db.execute.await_args.args[0].compile(dialect=postgresql.dialect()))
+        self.assertIn("count(distinct(analytics_events.user_hash)) FILTER (WHERE", sql)
+        self.assertIn("properties_json ->>", sql)
+        self.assertEqual(sql.count("FROM analytics_events"), 1)
+        self.assertEqual(counts["active_users"], 12)
+        self.assertEqual(counts["activated_users"], 3)
+        self.assertEqual(counts["notifications_acted"], 2)
+
+    async def test_without_new_users_activation_falls_back_to_active_users(self):
+        row = self._row(active_users=7)
+        row.pop("activated_users")
+        db = SimpleNamespace(execute=AsyncMock(return_value=_MappingResult(row)))
+
+        counts = await analytics_service.load_daily_event_counts(db, date(2026, 3, 12))
+
+        self.assertEqual(counts["activated_users"], 7)
+        sql = str(db.execute.await_args.args[0].compile(dialect=postgresql.dialect()))
+        self.assertNotIn("activated_users", sql)
+
+
+class _StreamResult:
+    def __init__(self, rows):
+        self._rows = list(rows)
+
+    def __aiter__(self):
+        self._iter = iter(self._rows)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class _RowsResult:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def all(self):
+        return list(self._rows)
+
+    def scalars(self):
+        return self
+
+
+def _online_events(day, base):
+    # u1: лента 60с → пост; пауза > 30 мин → новая сессия из одного события на маркете
+    # u2: одно событие в уведомлениях
+    return [
+        ("u1", base, day, "feed_open", None),
+        ("u1", base + timedelta(seconds=60), day, "post_open", None),
+        ("u1", base + timedelta(hours=2), day, "market_item_open", None),
+        ("u2", base, day, "notification_open", None),
+    ]
+
+
+class OnlineTimeTests(unittest.IsolatedAsyncioTestCase):
+    def test_accumulator_matches_gap_rules(self):
+        day = date(2026, 3, 10)
+        accumulator = analytics_service.OnlineTimeAccumulator()
+        for row in _online_events(day, datetime(2026, 3, 10, 9, 0)):
+            accumulator.add(*row)
+        accumulator.finish()
+
+        self.assertEqual(accumulator.modules["feed"]["active_seconds"], 60)
+        self.assertEqual(accumulator.modules["market"]["active_seconds"], 15)
+        self.assertEqual(accumulator.modules["notifications"]["active_seconds"], 15)
+        self.assertEqual(sum(m["sessions_count"] for m in accumulator.modules.values()), 3)
+        self.assertEqual(accumulator.user_days, 2)
+
+    def test_sessions_are_split_at_msk_midnight(self):
+        accumulator = analytics_service.OnlineTimeAccumulator()
+        accumulator.add("u1", datetime(2026, 3, 10, 20, 59), date(2026, 3, 10), "feed_open", None)
+        accumulator.add("u1", datetime(2026, 3, 10, 21, 1), date(2026, 3, 11), "feed_open", None)
+        accumulator.finish()
+
+        self.assertEqual(accumulator.modules["feed"]["sessions_count"], 2)
+        self.assertEqual(accumulator.modules["feed"]["active_seconds"], 30)
+        self.assertEqual(accumulator.user_days, 2)
+
+    async def test_closed_days_come_from_rollups_and_only_today_is_streamed(self):
+        today = datetime.now(analytics_service.MSK_TZ).date()
+        yesterday = today - timedelta(days=1)
+
+        rollup = analytics_service.OnlineTimeAccumulator()
+        for row in _online_events(yesterday, datetime(2026, 3, 10, 9, 0)):
+            rollup.add(*row)
+        rollup_rows = [
+            (yesterday, row["module"], row["metric_key"], row["value"])
+            for row in rollup.finish().rollup_rows()
+        ]
+
+        db = SimpleNamespace(
+            execute=AsyncMock(side_effect=[
+                _RowsResult(rollup_rows),
+                _RowsResult([yesterday]),
+                _RowsResult([(None, 3), ("feed", 2), ("market", 1), ("notifications", 1)]),
+            ]),
+            stream=AsyncMock(return_value=_StreamResult(_online_events(today, datetime(2026, 3, 11, 9, 0)))),
+        )
+
+        payload = await analytics_service.estimate_online_time_between_dates(db, yesterday, today)
+
+        streamed_sql = str(db.stream.await_args.args[0].compile(compile_kwargs={"literal_binds": True}))
+        self.assertIn(today.isoformat(), streamed_sql)
+        self.assertNotIn(yesterday.isoformat(), streamed_sql)
+        # Уникальные юзеры: вчера — из роллапа, сырые события — только за сегодня
+        users_sql = str(db.execute.await_args_list[2].args[0].compile(
+            dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True},
+        ))
+        self.assertIn("analytics_daily_module_users.date_msk IN ('%s')" % yesterday.isoformat(), users_sql)
+        self.assertIn("analytics_events.event_date_msk IN ('%s')" % today.isoformat(), users_sql)
+        self.assertEqual(payload["method"]["rollup_days"], 1)
+        self.assertEqual(payload["sessions_count"], 6)
+        self.assertEqual(payload["total_active_seconds"], 180)
+        self.assertEqual(payload["avg_daily_user_seconds"], 45)
+        self.assertEqual(payload["users_count"], 3)
+        feed = next(place for place in payload["places"] if place["module"] == "feed")
+        self.assertEqual(feed["active_seconds"], 120)
+        self.assertEqual(feed["avg_user_seconds"], 60)
+
+
+    async def test_rollup_without_module_users_is_streamed(self):
+        today = datetime.now(analytics_service.MSK_TZ).date()
+        yesterday = today - timedelta(days=1)
+        rollup_rows = [(yesterday, "all", "users_count", 2), (yesterday, "feed", "users_count", 2)]
+        db = SimpleNamespace(
+            execute=AsyncMock(side_effect=[_RowsResult(rollup_rows), _RowsResult([])]),
+        )
+
+        rollups = await analytics_service._load_online_time_rollups(db, yesterday, yesterday)
+
+        self.assertEqual(rollups, {})
+
+    async def test_module_users_are_inserted_in_chunks(self):
+        accumulator = analytics_service.OnlineTimeAccumulator(keep_users=True)
+        day = date(2026, 3, 10)
+        for index in range(7):
+            accumulator.add(f"u{index}", datetime(2026, 3, 10, 9, 0), day, "feed_open", None)
+        accumulator.finish()
+        db = SimpleNamespace(execute=AsyncMock())
+
+        with patch.object(analytics_service, "ONLINE_USERS_INSERT_CHUNK", 3):
+            await analytics_service.store_online_time_users(db, day, accumulator)
+
+        # DELETE за день + 3 INSERT по ≤3 строки
+        self.assertEqual(db.execute.await_count, 4)
+        self.assertEqual(len(db.execute.await_args_list[-1].args[0].compile().params), 3)
+
 if __name__ == "__main__":
     unittest.main()
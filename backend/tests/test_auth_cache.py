@@ -0,0 +1,168 @@
+import asyncio
+import json
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from sqlalchemy.orm import Session
+
+from app import auth_cache, auth_service, models
+
+
+class _FakePipeline:
+    def __init__(self, redis):
+        self._redis = redis
+        self._ops = []
+
+    def hset(self, key, field, value):
+        self._ops.append(("hset", key, field, value))
+
+    def expire(self, key, ttl):
+        self._ops.append(("expire", key, ttl))
+
+    async def execute(self):
+        for op in self._ops:
+            if op[0] == "hset":
+                self._redis.data.setdefault(op[1], {})[op[2]] = op[3]
+            else:
+                self._redis.ttls[op[1]] = op[2]
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+
+    async def hget(self, key, field):
+        return self.data.get(key, {}).get(field)
+
+    async def hdel(self, key, field):
+        self.data.get(key, {}).pop(field, None)
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+
+class _FakeResult:
+    def __init__(self, value):
+        self._value = value
+
+    def scalar_one_or_none(self):
+        return self._value
+
+
+def _make_user(**overrides):
+    values = dict(
+        id=1,
+        telegram_id=101,
+        name="Ivan",
+        university="Campus University",
+        role="user",
+        is_shadow_banned_posts=False,
+        interests=["python"],
+        created_at=datetime(2026, 1, 2, 3, 4, 5),
+    )
+    values.update(overrides)
+    return models.User(**values)
+
+
+def _request(sid=77):
+    return SimpleNamespace(
+        state=SimpleNamespace(auth_payload={"tgid": 101, "sub": "1", "sid": sid, "role": "user"})
+    )
+
+
+class AuthCacheTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        auth_cache.clear_local()
+        self.addCleanup(auth_cache.clear_local)
+        self.redis = _FakeRedis()
+        patcher = patch("app.auth_cache.get_redis", new=AsyncMock(return_value=self.redis))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _prod_settings(self):
+        return patch(
+            "app.auth_service.get_settings",
+            return_value=SimpleNamespace(is_prod=True, auth_session_binding_enabled=True),
+        )
+
+    async def test_user_row_round_trip_restores_types(self):
+        row = json.loads(json.dumps(auth_cache.user_to_row(_make_user())))
+
+        user = auth_cache._row_to_user(row)
+
+        self.assertEqual(user.created_at, datetime(2026, 1, 2, 3, 4, 5))
+        self.assertEqual(user.interests, ["python"])
+        self.assertEqual(user.role, "user")
+
+    async def test_miss_populates_cache_and_hit_skips_database(self):
+        user = _make_user()
+        session = SimpleNamespace(
+            id=77, user_id=1, telegram_id=101, expires_at=datetime.utcnow() + timedelta(days=1),
+        )
+        db = AsyncMock()
+        db.execute = AsyncMock(side_effect=[_FakeResult(user), _FakeResult(session)])
+
+        with self._prod_settings():
+            await auth_service.require_user(_request(), db)
+        self.assertEqual(db.execute.await_count, 2)
+        self.assertIn("77", self.redis.data["auth_user:101"])
+
+        # Другой воркер: L1 пуст, запись приходит из Redis
+        auth_cache.clear_local()
+        db = AsyncMock()
+        db.merge = AsyncMock(side_effect=lambda obj, load=True: obj)
+        with self._prod_settings():
+            resolved = await auth_service.require_user(_request(), db)
+
+        db.execute.assert_not_awaited()
+        self.assertEqual(resolved.telegram_id, 101)
+        self.assertEqual(resolved.created_at, datetime(2026, 1, 2, 3, 4, 5))
+
+    async def test_cached_user_for_other_sid_still_checks_session(self):
+        await auth_cache.store_entry(
+            101, 77, {"user": auth_cache.user_to_row(_make_user()), "session_expires_at": None},
+        )
+        db = AsyncMock()
+        db.merge = AsyncMock(side_effect=lambda obj, load=True: obj)
+        db.execute = AsyncMock(side_effect=[_FakeResult(None)])
+
+        with self._prod_settings():
+            with self.assertRaises(auth_service.HTTPException) as ctx:
+                await auth_service.require_user(_request(sid=77), db)
+
+        self.assertEqual(ctx.exception.status_code, 401)
+
+    async def test_committed_user_update_invalidates_cache(self):
+        await auth_cache.store_entry(101, 77, {"user": {}, "session_expires_at": None})
+
+        session = Session()
+        session.info[auth_cache._SESSION_INFO_KEY] = {101}
+        session.begin()
+        session.commit()
+        await asyncio.sleep(0)
+
+        self.assertNotIn("auth_user:101", self.redis.data)
+        self.assertFalse(auth_cache._local)
+
+    async def test_revoke_auth_session_invalidates_that_sid(self):
+        await auth_cache.store_entry(101, 77, {"user": {}, "session_expires_at": None})
+        await auth_cache.store_entry(101, 78, {"user": {}, "session_expires_at": None})
+        session = SimpleNamespace(id=77, telegram_id=101, revoked_at=None)
+        db = AsyncMock()
+        db.execute = AsyncMock(return_value=_FakeResult(session))
+
+        await auth_service.revoke_auth_session(db, "raw-refresh-token")
+
+        self.assertIsNotNone(session.revoked_at)
+        self.assertEqual(list(self.redis.data["auth_user:101"]), ["78"])
+        self.assertIsNone(await auth_cache.get_entry(101, 77))
+
+
+if __name__ == "__main__":
+    unittest.main()
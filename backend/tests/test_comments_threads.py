@@ -0,0 +1,161 @@
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from fastapi import HTTPException
+from sqlalchemy.dialects import postgresql
+
+from app import schemas
+from app.crud import comments as comments_crud
+from app.crud.helpers import decode_cursor, encode_cursor
+from app.main import get_comment_replies_endpoint, get_post_comments_endpoint
+
+
+class _FakeResult:
+    def __init__(self, rows=(), value=None):
+        self._rows = rows
+        self._value = value
+
+    def all(self):
+        return list(self._rows)
+
+    def scalar_one_or_none(self):
+        return self._value
+
+
+def _comment(comment_id, parent_id=None, thread_root_id=None, minutes=0):
+    return SimpleNamespace(
+        id=comment_id,
+        parent_id=parent_id,
+        thread_root_id=thread_root_id,
+        created_at=datetime(2026, 5, 1, 12, 0) + timedelta(minutes=minutes),
+    )
+
+
+def _sql(stmt):
+    return str(stmt.compile(dialect=postgresql.dialect()))
+
+
+class PostCommentsPageTests(unittest.IsolatedAsyncioTestCase):
+    async def test_roots_page_with_reply_previews(self):
+        roots = [_comment(1, minutes=0), _comment(2, minutes=1), _comment(3, minutes=2)]
+        replies = [
+            (_comment(10, parent_id=1, thread_root_id=1, minutes=5), 5),
+            (_comment(11, parent_id=10, thread_root_id=1, minutes=6), 5),
+            (_comment(20, parent_id=2, thread_root_id=2, minutes=7), 1),
+        ]
+        db = SimpleNamespace(execute=AsyncMock(side_effect=[
+            # limit=2 → выбираем 3 корня, третий уходит в has_more
+            _FakeResult([(root, root.created_at, root.id) for root in roots]),
+            _FakeResult(replies),
+            _FakeResult([(11,)]),
+        ]))
+
+        comments, has_more, next_cursor = await comments_crud.get_post_comments(
+            db, 5, user_id=7, limit=2, replies_limit=2,
+        )
+
+        self.assertEqual([c.id for c in comments], [1, 2, 10, 11, 20])
+        self.assertTrue(has_more)
+        self.assertEqual(decode_cursor(next_cursor)["k"], [roots[1].created_at, 2])
+        self.assertEqual(db.execute.await_count, 3)
+
+        first, second = comments[0], comments[1]
+        self.assertEqual(first.replies_count, 5)
+        self.assertEqual(decode_cursor(first.replies_cursor)["k"], [replies[1][0].created_at, 11])
+        self.assertEqual(second.replies_count, 1)
+        self.assertIsNone(second.replies_cursor)
+        self.assertEqual([c.is_liked for c in comments], [False, False, False, True, False])
+
+        preview_sql = _sql(db.execute.await_args_list[1].args[0])
+        self.assertIn("row_number() OVER (PARTITION BY comments.thread_root_id", preview_sql)
+        roots_sql = _sql(db.execute.await_args_list[0].args[0])
+        self.assertIn("comments.parent_id IS NULL", roots_sql)
+
+    async def test_replies_page_uses_thread_root(self):
+        reply = _comment(11, parent_id=10, thread_root_id=1)
+        db = SimpleNamespace(
+            get=AsyncMock(return_value=reply),
+            execute=AsyncMock(side_effect=[
+                _FakeResult([(_comment(12, parent_id=11, thread_root_id=1), None, 12)]),
+            ]),
+        )
+
+        replies, has_more, next_cursor = await comments_crud.get_comment_replies(db, 11, limit=5)
+
+        self.assertEqual([r.id for r in replies], [12])
+        self.assertFalse(has_more)
+        self.assertIsNone(next_cursor)
+        self.assertIn("comments.thread_root_id = %(thread_root_id_1)s", _sql(db.execute.await_args.args[0]))
+        self.assertEqual(db.execute.await_args.args[0].compile().params["thread_root_id_1"], 1)
+
+
+class CommentsCursorRouteTests(unittest.IsolatedAsyncioTestCase):
+    async def test_foreign_cursor_shape_is_a_client_error(self):
+        # Курсор ленты постов: декодируется, но ключей больше, чем у комментариев
+        cursor = encode_cursor({"s": "newest", "k": [False, 1.5, datetime(2026, 5, 1), 3, 4]})
+        db = SimpleNamespace(
+            get=AsyncMock(return_value=_comment(11, parent_id=10, thread_root_id=1)),
+            execute=AsyncMock(side_effect=AssertionError("query must not run")),
+        )
+
+        for call in (
+            lambda: get_post_comments_endpoint(post_id=1, limit=10, cursor=cursor, replies_limit=3, user=None, db=db),
+            lambda: get_comment_replies_endpoint(comment_id=11, cursor=cursor, limit=10, user=None, db=db),
+        ):
+            with self.subTest(call=call):
+                with self.assertRaises(HTTPException) as ctx:
+                    await call()
+                self.assertEqual(ctx.exception.status_code, 400)
+
+
+class AnonymousIndexTests(unittest.IsolatedAsyncioTestCase):
+    async def test_existing_author_keeps_index(self):
+        db = SimpleNamespace(scalar=AsyncMock(return_value=3))
+        self.assertEqual(await comments_crud._get_anonymous_index(db, 5, 7), 3)
+        db.scalar.assert_awaited_once()
+
+    async def test_new_author_takes_next_sequence_value(self):
+        db = SimpleNamespace(scalar=AsyncMock(side_effect=[None, 4, 4]))
+        self.assertEqual(await comments_crud._get_anonymous_index(db, 5, 7), 4)
+
+        update_sql = _sql(db.scalar.await_args_list[1].args[0])
+        self.assertIn("anonymous_comment_seq=(posts.anonymous_comment_seq + ", update_sql)
+        self.assertIn("RETURNING posts.anonymous_comment_seq", update_sql)
+        self.assertIn("ON CONFLICT (post_id, user_id) DO NOTHING", _sql(db.scalar.await_args_list[2].args[0]))
+
+    async def test_concurrent_insert_reuses_winner_index(self):
+        db = SimpleNamespace(scalar=AsyncMock(side_effect=[None, 6, None, 5]))
+        self.assertEqual(await comments_crud._get_anonymous_index(db, 5, 7), 5)
+
+
+class CreateCommentThreadTests(unittest.IsolatedAsyncioTestCase):
+    async def test_reply_inherits_thread_root(self):
+        post = SimpleNamespace(id=5, author_id=1, is_anonymous=False, enable_anonymous_comments=False)
+        parent = SimpleNamespace(id=11, post_id=5, thread_root_id=1)
+        commenter = SimpleNamespace(id=7)
+        added = []
+
+        async def get(model, _id):
+            return parent if model is comments_crud.models.Comment else commenter
+
+        db = SimpleNamespace(
+            execute=AsyncMock(side_effect=[_FakeResult(value=post), _FakeResult()]),
+            get=AsyncMock(side_effect=get),
+            add=added.append,
+            flush=AsyncMock(),
+            commit=AsyncMock(),
+            refresh=AsyncMock(),
+        )
+        payload = schemas.CommentCreate(post_id=5, body="ответ", parent_id=11)
+        with patch.object(comments_crud.notif, "notify_comment_reply", new=AsyncMock()):
+            comment = await comments_crud.create_comment(db, payload, 7)
+
+        self.assertEqual(comment.thread_root_id, 1)
+        self.assertIsNone(comment.anonymous_index)
+        self.assertEqual(added, [comment])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,212 @@
+import json
+import random
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import numpy as np
+
+from app.crud import dating as dating_crud
+from app.routers.dating import get_likes_received
+from app.services import dating_scoring
+
+
+class _ZeroJitter:
+    def integers(self, low, high, size=None, endpoint=False):
+        return np.zeros(size, dtype=np.int64)
+
+
+def _user(user_id, **overrides):
+    values = dict(
+        id=user_id, name=f"User {user_id}", age=20, university="МГУ", campus_id=None,
+        institute=None, course=None, interests=[], last_active_at=datetime.utcnow(),
+        avatar=None, bio=None,
+    )
+    values.update(overrides)
+    return SimpleNamespace(**values)
+
+
+def _profile(user, **overrides):
+    values = dict(
+        user=user, user_id=user.id, goals=[], photos=[{"url": "a.jpg"}],
+        bio="Люблю походы и кино", created_at=datetime.utcnow() - timedelta(days=10),
+        looking_for="all", gender="female", is_active=True,
+    )
+    values.update(overrides)
+    return SimpleNamespace(**values)
+
+
+class VectorizedScoringTests(unittest.TestCase):
+    def test_matches_scalar_score_for_random_pool(self):
+        rnd = random.Random(42)
+        now = datetime.utcnow()
+        interests = ["музыка", "Кино", "спорт", "игры", "книги", "IT", "танцы"]
+        goals = ["Отношения", "Общение", "Дружба"]
+        me = _user(1, age=21, campus_id="mgu", institute="ВМК", course=3, interests=["кино", "спорт", "IT"])
+        me_profile = _profile(me, goals=["отношения"])
+
+        pool = []
+        for user_id in range(2, 300):
+            user = _user(
+                user_id,
+                age=rnd.choice([None, 17, 19, 21, 24, 30, 45]),
+                university=rnd.choice(["МГУ", " мгу ", "ВШЭ", None]),
+                campus_id=rnd.choice(["mgu", "other", None]),
+                institute=rnd.choice(["ВМК", "вмк", "Физфак", None]),
+                course=rnd.choice([None, 1, 3]),
+                interests=rnd.sample(interests, rnd.randint(0, 5)),
+                last_active_at=rnd.choice([None, now - timedelta(hours=rnd.randint(0, 24 * 20))]),
+            )
+            profile = _profile(
+                user,
+                goals=rnd.sample(goals, rnd.randint(0, 2)),
+                photos=rnd.choice([[], [{"url": "p.jpg"}]]),
+                bio=rnd.choice([None, "коротко", "достаточно длинное описание"]),
+                created_at=rnd.choice([None, now - timedelta(hours=rnd.randint(0, 100))]),
+            )
+            pool.append((user, profile))
+        incoming = {5, 17, 40}
+
+        scores = dating_scoring.score_candidates(me, me_profile, pool, incoming, rng=_ZeroJitter())
+
+        with patch("app.services.dating_scoring.random.randint", return_value=0):
+            expected = [
+                dating_scoring.calculate_score(me, me_profile, user, profile, incoming)["score"]
+                for user, profile in pool
+            ]
+        self.assertEqual(scores.tolist(), expected)
+
+    def test_ranking_is_stable_for_equal_scores(self):
+        order = dating_scoring.rank_candidates(np.array([10, 30, 10, 30]))
+        self.assertEqual(order.tolist(), [1, 3, 0, 2])
+
+    def test_describe_match_uses_same_reasons_as_score(self):
+        me = _user(1, institute="ВМК", interests=["кино"])
+        candidate = _user(2, institute="вмк", interests=["Кино"])
+        context = dating_scoring.MatchContext(me, _profile(me))
+        match = dating_scoring.describe_match(context, candidate, _profile(candidate))
+        self.assertEqual(match["match_reason"], "faculty")
+        self.assertEqual(match["common_interests"], ["кино"])
+
+    def test_campus_and_course_do_not_make_faculty_reason(self):
+        me = _user(1, campus_id="mgu", institute="ВМК", course=2)
+        candidate = _user(2, campus_id="mgu", institute="Физфак", course=2)
+        context = dating_scoring.MatchContext(me, None)
+        match = dating_scoring.describe_match(context, candidate, None)
+        self.assertEqual(match["match_reason"], "university")
+        self.assertEqual(match["common_goals"], [])
+
+
+class _FakeScalars:
+    def __init__(self, values):
+        self._values = values
+
+    def all(self):
+        return list(self._values)
+
+
+class _FakeResult:
+    def __init__(self, values=()):
+        self._values = values
+
+    def scalars(self):
+        return _FakeScalars(self._values)
+
+    def all(self):
+        return [(value,) for value in self._values]
+
+    def scalar_one_or_none(self):
+        return self._values[0] if self._values else None
+
+
+class DatingFeedSessionTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.cache = {}
+
+        async def get_ranked(user_id, looking_for):
+            raw = self.cache.get((user_id, looking_for))
+            return json.loads(raw) if raw else None
+
+        async def store_ranked(user_id, looking_for, ranked):
+            self.cache[(user_id, looking_for)] = json.dumps(ranked)
+
+        patchers = [
+            patch("app.services.dating_feed_cache.get_ranked", new=get_ranked),
+            patch("app.services.dating_feed_cache.store_ranked", new=store_ranked),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.me = _user(1)
+        self.profiles = [_profile(_user(user_id)) for user_id in range(2, 8)]
+
+    def _db(self, *results):
+        return SimpleNamespace(
+            get=AsyncMock(return_value=self.me),
+            execute=AsyncMock(side_effect=list(results)),
+        )
+
+    async def test_first_page_scores_pool_and_next_page_reads_session(self):
+        db = self._db(
+            _FakeResult([_profile(self.me)]),  # моя анкета
+            _FakeResult(self.profiles),        # пул
+            _FakeResult([]),                   # входящие лайки
+        )
+        first = await dating_crud.get_dating_feed(db, 1, limit=3, offset=0)
+        self.assertEqual(len(first), 3)
+        ranked_ids = [user_id for user_id, _ in json.loads(self.cache[(1, None)])]
+        self.assertEqual(sorted(ranked_ids), [2, 3, 4, 5, 6, 7])
+        self.assertEqual([card["id"] for card in first], ranked_ids[:3])
+
+        by_id = {profile.user_id: profile for profile in self.profiles}
+        rest = [by_id[user_id] for user_id in reversed(ranked_ids[3:])]
+        db = self._db(_FakeResult([_profile(self.me)]), _FakeResult(rest))
+        with patch("app.services.dating_scoring.score_candidates") as score:
+            second = await dating_crud.get_dating_feed(db, 1, limit=3, offset=3)
+
+        score.assert_not_called()
+        self.assertEqual(db.execute.await_count, 2)
+        self.assertEqual([card["id"] for card in second], ranked_ids[3:])
+
+    async def test_expired_session_rebuilds_pool(self):
+        db = self._db(
+            _FakeResult([_profile(self.me)]),
+            _FakeResult(self.profiles),
+            _FakeResult([]),
+        )
+        page = await dating_crud.get_dating_feed(db, 1, limit=3, offset=3)
+
+        self.assertEqual(len(page), 3)
+        self.assertEqual(db.execute.await_count, 3)
+        self.assertIn((1, None), self.cache)
+
+
+class LikesReceivedTests(unittest.IsolatedAsyncioTestCase):
+    async def test_query_count_does_not_grow_with_page(self):
+        me = _user(1, interests=["кино"], hide_course_group=False, group=None)
+        likers = [
+            _user(user_id, interests=["Кино"], hide_course_group=False, group="А-1")
+            for user_id in range(2, 22)
+        ]
+        profiles = [_profile(liker, goals=["Отношения"]) for liker in likers[::2]]
+        db = SimpleNamespace(execute=AsyncMock(side_effect=[
+            _FakeResult(likers),
+            _FakeResult(profiles),
+            _FakeResult([_profile(me, goals=["отношения"])]),
+        ]))
+
+        result = await get_likes_received(limit=20, offset=0, user=me, db=db)
+
+        self.assertEqual(db.execute.await_count, 3)
+        self.assertEqual(len(result), 20)
+        self.assertEqual(result[0]["common_goals"], ["Отношения"])
+        self.assertEqual(result[1]["common_goals"], [])
+        self.assertEqual(result[1]["bio"], None)
+        self.assertEqual(result[0]["match_reason"], "Из твоего вуза")
+        self.assertEqual(result[0]["common_interests"], ["кино"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -11,6 +11,7 @@ class DeepLinkPublicReadPatternTests(unittest.TestCase):
         allowed_paths = [
             "/posts/123",
             "/posts/123/comments",
+            "/comments/55/replies",
             "/api/requests/77",
             "/market/42",
             "/users/8/rating",
@@ -26,6 +27,7 @@ class DeepLinkPublicReadPatternTests(unittest.TestCase):
             ("POST", "/posts/123"),
             ("GET", "/posts/feed"),
             ("POST", "/posts/123/comments"),
+            ("POST", "/comments/55/like"),
             ("POST", "/api/requests/77/respond"),
             ("POST", "/market/42/contact"),
             ("GET", "/market/feed"),
@@ -0,0 +1,139 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from app.main import get_market_categories_endpoint, get_posts_feed
+from app.services import feed_cache
+
+
+class _FakePipeline:
+    def __init__(self, redis):
+        self._redis = redis
+        self._ops = []
+
+    def incr(self, key):
+        self._ops.append(key)
+
+    async def execute(self):
+        return [await self._redis.incr(key) for key in self._ops]
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+        self.ttls[key] = ex
+
+    async def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, "0")) + 1)
+        return int(self.data[key])
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+
+class FeedCacheServiceTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.redis = _FakeRedis()
+        patcher = patch("app.services.feed_cache.get_redis", new=AsyncMock(return_value=self.redis))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_normalized_params_share_one_entry(self):
+        entry = await feed_cache.lookup("posts_feed", feed_cache.SCOPE_POSTS, {"sort": "newest", "search": " notes "})
+        self.assertFalse(entry.hit)
+        await feed_cache.store(entry, {"items": [], "has_more": False})
+
+        again = await feed_cache.lookup(
+            "posts_feed", feed_cache.SCOPE_POSTS, {"search": "notes", "category": None, "sort": "newest"},
+        )
+
+        self.assertTrue(again.hit)
+        self.assertEqual(again.payload, {"items": [], "has_more": False})
+        self.assertEqual(self.redis.ttls[entry.key], 30)
+
+    async def test_generation_bump_invalidates_only_its_scope(self):
+        posts_entry = await feed_cache.lookup("posts_feed", feed_cache.SCOPE_POSTS, {})
+        await feed_cache.store(posts_entry, {"items": [1]})
+        market_entry = await feed_cache.lookup("market_feed", feed_cache.SCOPE_MARKET, {})
+        await feed_cache.store(market_entry, {"items": [2]})
+
+        await feed_cache.bump_generation(feed_cache.SCOPE_POSTS)
+
+        self.assertFalse((await feed_cache.lookup("posts_feed", feed_cache.SCOPE_POSTS, {})).hit)
+        self.assertTrue((await feed_cache.lookup("market_feed", feed_cache.SCOPE_MARKET, {})).hit)
+
+    async def test_redis_outage_falls_back_to_database(self):
+        broken = SimpleNamespace(get=AsyncMock(side_effect=RedisConnectionError("down")))
+        with patch("app.services.feed_cache.get_redis", new=AsyncMock(return_value=broken)):
+            entry = await feed_cache.lookup("posts_feed", feed_cache.SCOPE_POSTS, {})
+
+        self.assertIsNone(entry)
+        await feed_cache.store(entry, {"items": []})
+
+
+class FeedCacheRouteTests(unittest.IsolatedAsyncioTestCase):
+    async def test_anonymous_feed_hit_skips_database(self):
+        cached = {"items": [], "total": 0, "total_count": None, "has_more": False, "next_cursor": None}
+        entry = feed_cache.FeedCacheEntry(key="feed_cache:posts_feed:0:x", payload=cached)
+
+        with (
+            patch("app.main.check_rate_limit", new=AsyncMock()),
+            patch("app.main.feed_cache.lookup", new=AsyncMock(return_value=entry)),
+            patch("app.main.crud.get_posts", new=AsyncMock()) as get_posts,
+        ):
+            payload = await get_posts_feed(
+                request=SimpleNamespace(), skip=0, limit=20, category=None, university=None,
+                institute=None, campus_id=None, city=None, tags=None, search=None, date_range=None,
+                sort="newest", viewer_city=None, cursor=None, include_total=False, user=None, db=object(),
+            )
+
+        self.assertEqual(payload, cached)
+        get_posts.assert_not_awaited()
+
+    async def test_logged_in_feed_bypasses_cache(self):
+        user = SimpleNamespace(id=7)
+        with (
+            patch("app.main.check_rate_limit", new=AsyncMock()),
+            patch("app.main.analytics_service.record_server_event", new=AsyncMock()),
+            patch("app.main.feed_cache.lookup", new=AsyncMock()) as lookup,
+            patch("app.main.crud.get_posts", new=AsyncMock(return_value={
+                "items": [], "total_count": None, "has_more": False, "next_cursor": None,
+            })),
+            patch("app.main.crud.get_posts_viewer_state", new=AsyncMock(return_value={
+                "liked_post_ids": set(), "poll_votes": {},
+            })),
+        ):
+            await get_posts_feed(
+                request=SimpleNamespace(), skip=0, limit=20, category=None, university=None,
+                institute=None, campus_id=None, city=None, tags=None, search=None, date_range=None,
+                sort="newest", viewer_city=None, cursor=None, include_total=False, user=user, db=object(),
+            )
+
+        lookup.assert_not_awaited()
+
+    async def test_market_categories_miss_is_stored(self):
+        entry = feed_cache.FeedCacheEntry(key="feed_cache:market_categories:0:x")
+        categories = {"standard": ["books"], "popular_custom": []}
+
+        with (
+            patch("app.main.feed_cache.lookup", new=AsyncMock(return_value=entry)),
+            patch("app.main.feed_cache.store", new=AsyncMock()) as store,
+            patch("app.main.crud.get_market_categories", new=AsyncMock(return_value=categories)),
+        ):
+            payload = await get_market_categories_endpoint(item_type=None, db=object())
+
+        self.assertEqual(payload, categories)
+        store.assert_awaited_once_with(entry, categories)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+from fastapi import HTTPException
+from sqlalchemy.dialects import postgresql
+
+from app import models
+from app.crud import helpers
+from app.crud import posts as posts_crud
+from app.main import _decode_feed_cursor
+
+
+def _compile(clause) -> str:
+    return str(clause.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+class _RowsResult:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def all(self):
+        return self._rows
+
+
+class FeedCursorCodecTests(unittest.TestCase):
+    def test_round_trip_keeps_datetimes(self):
+        ref = datetime(2026, 3, 1, 12, 30)
+        cursor = helpers.encode_cursor({"s": "popular", "t": ref, "k": [False, 1.5, ref, 42]})
+
+        payload = helpers.decode_cursor(cursor)
+
+        self.assertEqual(payload, {"s": "popular", "t": ref, "k": [False, 1.5, ref, 42]})
+        self.assertNotIn("=", cursor)
+
+    def test_garbage_cursor_is_rejected(self):
+        for cursor in ("not-base64!", helpers.encode_cursor({"s": "newest"}), "bnVsbA"):
+            with self.subTest(cursor=cursor):
+                with self.assertRaises(ValueError):
+                    helpers.decode_cursor(cursor)
+
+    def test_route_maps_bad_cursor_to_400(self):
+        with self.assertRaises(HTTPException) as ctx:
+            _decode_feed_cursor("%%%")
+        self.assertEqual(ctx.exception.status_code, 400)
+        self.assertIsNone(_decode_feed_cursor(None))
+
+
+class KeysetPredicateTests(unittest.TestCase):
+    def test_mixed_directions_expand_to_or_chain(self):
+        keys = [(models.Post.is_resolved, False), (models.Post.created_at, True), (models.Post.id, True)]
+
+        compiled = _compile(helpers.keyset_after(keys, [False, datetime(2026, 1, 1), 10]))
+
+        self.assertIn("posts.is_resolved > false", compiled)
+        self.assertIn("posts.created_at < '2026-01-01 00:00:00'", compiled)
+        self.assertIn("posts.id < 10", compiled)
+
+    def test_null_values_follow_postgres_null_ordering(self):
+        expr = models.Request.expires_at
+        self.assertIn("IS NOT NULL", _compile(helpers.keyset_after([(expr, True)], [None])))
+        self.assertEqual(_compile(helpers.keyset_after([(expr, False)], [None])), "false")
+
+
+class FetchKeysetPageTests(unittest.IsolatedAsyncioTestCase):
+    async def test_extra_row_sets_has_more_and_next_cursor(self):
+        created = datetime(2026, 1, 2)
+        rows = [
+            ("post-3", created, 3),
+            ("post-2", created, 2),
+            ("post-1", created, 1),
+        ]
+        db = SimpleNamespace(execute=AsyncMock(return_value=_RowsResult(rows)))
+        keys = [(models.Post.created_at, True), (models.Post.id, True)]
+
+        items, has_more, next_cursor = await helpers.fetch_keyset_page(
+            db,
+            posts_crud.select(models.Post),
+            keys,
+            limit=2,
+            cursor_state={"s": "newest"},
+        )
+
+        self.assertEqual(items, ["post-3", "post-2"])
+        self.assertTrue(has_more)
+        self.assertEqual(helpers.decode_cursor(next_cursor), {"s": "newest", "k": [created, 2]})
+        compiled = _compile(db.execute.await_args.args[0])
+        self.assertIn("LIMIT 3", compiled)
+        self.assertNotIn("OFFSET", compiled)
+
+    async def test_cursor_from_other_sort_is_rejected(self):
+        db = SimpleNamespace(execute=AsyncMock(), scalar=AsyncMock())
+
+        with self.assertRaises(ValueError):
+            await posts_crud.get_posts(db, sort="popular", cursor_payload={"s": "newest", "k": [False, False, None, 1]})
+
+        db.execute.assert_not_awaited()
+
+    async def test_popular_cursor_pages_by_hot_score(self):
+        ref = datetime(2026, 2, 3, 4, 5, 6)
+        db = SimpleNamespace(execute=AsyncMock(return_value=_RowsResult([])))
+
+        await posts_crud.get_posts(
+            db,
+            sort="popular",
+            cursor_payload={"s": "popular", "k": [False, True, 14321.5, ref, 7]},
+        )
+
+        compiled = _compile(db.execute.await_args.args[0])
+        self.assertIn("ORDER BY posts.is_resolved ASC, coalesce(posts.is_important, false) DESC, posts.hot_score DESC", compiled)
+        self.assertIn("14321.5", compiled)
+        self.assertNotIn("power", compiled)
+        self.assertNotIn("OFFSET", compiled)
+
+    async def test_popular_cursor_with_reference_time_is_rejected(self):
+        ref = datetime(2026, 2, 3, 4, 5, 6)
+        db = SimpleNamespace(execute=AsyncMock(), scalar=AsyncMock())
+
+        with self.assertRaises(ValueError):
+            await posts_crud.get_posts(
+                db,
+                sort="popular",
+                cursor_payload={"s": "popular", "t": ref, "k": [False, True, 0.5, ref, 7]},
+            )
+
+        db.execute.assert_not_awaited()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+from sqlalchemy.dialects import postgresql
+
+from app.routers.notifications import get_pending_followups
+
+
+class _FakeScalars:
+    def __init__(self, values):
+        self._values = values
+
+    def all(self):
+        return self._values
+
+
+class _FakeResult:
+    def __init__(self, rows=(), scalars=()):
+        self._rows = list(rows)
+        self._scalars = list(scalars)
+
+    def all(self):
+        return self._rows
+
+    def scalars(self):
+        return _FakeScalars(self._scalars)
+
+
+def _followup(followup_id, target_type, target_id, followup_type="market_sold_check"):
+    return SimpleNamespace(
+        id=followup_id,
+        type=followup_type,
+        target_type=target_type,
+        target_id=target_id,
+        attempt=1,
+        payload="{}",
+        status="pending",
+        scheduled_at=datetime(2026, 5, 1),
+    )
+
+
+class PendingFollowupsTests(unittest.IsolatedAsyncioTestCase):
+    async def test_targets_are_prefetched_per_type_and_statuses_decided_in_memory(self):
+        active_item = _followup(1, "market_item", 10)
+        sold_item = _followup(2, "market_item", 11)
+        muted = _followup(3, "request", 20)
+        missing_user = _followup(4, "market_deal", 30)
+        review = _followup(5, "market_deal", 31, followup_type="review_request")
+        rows = [
+            (active_item, 1001, None),
+            (sold_item, 1002, None),
+            (muted, 1003, SimpleNamespace(mute_all=True)),
+            (missing_user, None, None),
+            (review, 1005, None),
+        ]
+        items = [
+            SimpleNamespace(id=10, status="active", is_deleted=False),
+            SimpleNamespace(id=11, status="sold", is_deleted=False),
+        ]
+        db = SimpleNamespace(
+            execute=AsyncMock(side_effect=[
+                _FakeResult(rows=rows),
+                _FakeResult(scalars=items),
+                _FakeResult(scalars=[]),
+                _FakeResult(scalars=[]),
+            ]),
+            commit=AsyncMock(),
+        )
+
+        result = await get_pending_followups(limit=50, claim=True, _=None, db=db)
+
+        self.assertEqual([item["id"] for item in result], [1, 5])
+        self.assertEqual(sold_item.status, "expired")
+        self.assertEqual(muted.status, "skipped")
+        self.assertEqual(missing_user.status, "expired")
+        self.assertGreater(active_item.scheduled_at, datetime.utcnow())
+        # одна выборка follow-up'ов + по одному IN-запросу на target_type
+        self.assertEqual(db.execute.await_count, 4)
+        claim_sql = str(db.execute.await_args_list[0].args[0].compile(dialect=postgresql.dialect()))
+        self.assertIn("FOR UPDATE OF followups SKIP LOCKED", claim_sql)
+
+
+if __name__ == "__main__":
+    unittest.main()
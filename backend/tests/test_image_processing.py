@@ -3,11 +3,14 @@ import tempfile
 import unittest
 from io import BytesIO
 from pathlib import Path
+from types import SimpleNamespace
 from unittest.mock import patch
 
+from fastapi import HTTPException
 from PIL import Image
 
 from app import utils as image_utils
+from app.services import image_engine
 
 
 def make_image_bytes(fmt="JPEG", size=(640, 480), mode="RGB"):
@@ -21,7 +24,7 @@ class ChunkedUpload:
 
     def __init__(self, chunk_count, chunk_size):
         self.remaining = chunk_count
-        self.chunk = b"x" * chunk_size
+        self.chunk = b"\xff\xd8\xff" + b"x" * (chunk_size - 3)
 
     async def read(self, _size):
         if self.remaining <= 0:
@@ -30,6 +33,19 @@ class ChunkedUpload:
         return self.chunk
 
 
+class MemoryUpload:
+    def __init__(self, filename, content):
+        self.filename = filename
+        self._buffer = BytesIO(content)
+        self.closed = False
+
+    async def read(self, size):
+        return self._buffer.read(size)
+
+    async def close(self):
+        self.closed = True
+
+
 class ImageProcessingTests(unittest.TestCase):
     def test_large_jpeg_is_resized_and_saved_as_webp(self):
         content = make_image_bytes(size=(3000, 1500))
@@ -61,14 +77,171 @@ class ImageProcessingTests(unittest.TestCase):
                 self.assertEqual(meta["h"], 240)
                 self.assertGreater(meta["size_bytes"], 0)
 
-    def test_read_upload_rejects_files_over_20mb(self):
+    def test_large_jpeg_is_drafted_before_decode(self):
+        with Image.open(BytesIO(make_image_bytes(size=(4096, 2048)))) as img:
+            image_utils._draft_for_max_side(img, 1024)
+            self.assertEqual(img.size, (1024, 512))
+
+        with Image.open(BytesIO(make_image_bytes(size=(3000, 1500)))) as img:
+            image_utils._draft_for_max_side(img, 2048)
+            self.assertEqual(img.size, (3000, 1500))
+
+        with Image.open(BytesIO(make_image_bytes(fmt="PNG", size=(4096, 2048)))) as img:
+            image_utils._draft_for_max_side(img, 1024)
+            self.assertEqual(img.size, (4096, 2048))
+
+    def test_drafted_avatar_keeps_exact_target_size(self):
+        content = make_image_bytes(size=(4032, 3024))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with patch.object(image_utils, "UPLOADS_ROOT", Path(tmpdir)):
+                meta = image_utils.process_image_sync(content, kind="avatars", max_side=512)
+
+        self.assertEqual((meta["w"], meta["h"]), (512, 384))
+
+    def test_image_gets_width_variants(self):
+        content = make_image_bytes(size=(3000, 1500))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with patch.object(image_utils, "UPLOADS_ROOT", Path(tmpdir)):
+                meta = image_utils.process_image_sync(content)
+
+                self.assertEqual(
+                    [(variant["w"], variant["h"]) for variant in meta["variants"]],
+                    [(320, 160), (640, 320), (1280, 640)],
+                )
+                for variant in meta["variants"]:
+                    with Image.open(Path(tmpdir) / "images" / variant["url"]) as saved:
+                        self.assertEqual(saved.size, (variant["w"], variant["h"]))
+
+                urls = image_utils.get_image_urls([meta])
+                self.assertTrue(urls[0]["variants"][0]["url"].startswith("/uploads/images/"))
+
+    def test_avatar_has_no_variants(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with patch.object(image_utils, "UPLOADS_ROOT", Path(tmpdir)):
+                meta = image_utils.process_image_sync(make_image_bytes(), kind="avatars", max_side=512)
+        self.assertNotIn("variants", meta)
+        self.assertNotIn("thumbnail_url", meta)
+
+    def test_identical_upload_links_existing_blob(self):
+        content = make_image_bytes(size=(1600, 1200))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            root = Path(tmpdir)
+            with patch.object(image_utils, "UPLOADS_ROOT", root):
+                first = image_utils.process_image_sync(content)
+                with patch.object(image_utils, "_render_blob") as render:
+                    second = image_utils.process_image_sync(content)
+                render.assert_not_called()
+
+                self.assertNotEqual(first["url"], second["url"])
+                self.assertEqual(first["variants"][0]["h"], second["variants"][0]["h"])
+                first_path = root / "images" / first["url"]
+                second_path = root / "images" / second["url"]
+                self.assertTrue(first_path.samefile(second_path))
+                self.assertEqual(len(list((root / ".blobs").glob("??/*"))), 1)
+
+                image_utils.delete_images([first])
+                self.assertFalse(first_path.exists())
+                self.assertTrue(second_path.exists())
+                self.assertEqual(len(list((root / ".blobs").glob("??/*"))), 1)
+
+                image_utils.delete_images([second])
+                self.assertEqual(list((root / "images").rglob("*.webp")), [])
+                self.assertEqual(list((root / "thumbs").rglob("*.webp")), [])
+                self.assertEqual(list((root / ".blobs").glob("??/*")), [])
+
+    def test_different_kind_is_stored_separately(self):
+        content = make_image_bytes()
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            root = Path(tmpdir)
+            with patch.object(image_utils, "UPLOADS_ROOT", root):
+                image_utils.process_image_sync(content)
+                image_utils.process_image_sync(content, kind="avatars", max_side=512)
+                self.assertEqual(len(list((root / ".blobs").glob("??/*"))), 2)
+
+    def test_spool_rejects_files_over_20mb(self):
         upload = ChunkedUpload(
             chunk_count=21,
             chunk_size=1024 * 1024,
         )
 
-        with self.assertRaisesRegex(ValueError, ">20MB"):
-            asyncio.run(image_utils._read_upload_content_limited(upload))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            incoming = Path(tmpdir) / ".incoming"
+            with patch.object(image_utils, "INCOMING_DIR", incoming):
+                with self.assertRaisesRegex(ValueError, ">20MB"):
+                    asyncio.run(image_utils._spool_upload_limited(upload))
+            self.assertEqual(list(incoming.iterdir()), [])
+
+    def test_spool_checks_magic_on_first_chunk(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            incoming = Path(tmpdir) / ".incoming"
+            with patch.object(image_utils, "INCOMING_DIR", incoming):
+                with self.assertRaisesRegex(ValueError, "Unsupported image format"):
+                    asyncio.run(image_utils._spool_upload_limited(MemoryUpload("a.jpg", b"x" * 4096)))
+            self.assertEqual(list(incoming.iterdir()), [])
+
+    def test_spooled_file_matches_in_memory_processing(self):
+        content = make_image_bytes(size=(1600, 1200))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            root = Path(tmpdir)
+            with patch.object(image_utils, "UPLOADS_ROOT", root), \
+                    patch.object(image_utils, "INCOMING_DIR", root / ".incoming"):
+                path, content_digest = asyncio.run(
+                    image_utils._spool_upload_limited(MemoryUpload("a.jpg", content))
+                )
+                self.assertEqual(path.read_bytes(), content)
+
+                from_file = image_utils.process_image_file(path, content_digest)
+                from_bytes = image_utils.process_image_sync(content)
+                self.assertTrue(
+                    (root / "images" / from_file["url"]).samefile(root / "images" / from_bytes["url"])
+                )
+
+
+class ProcessUploadedFilesTests(unittest.IsolatedAsyncioTestCase):
+    def _settings(self, image_queue_limit=32):
+        return SimpleNamespace(image_workers=0, image_queue_limit=image_queue_limit)
+
+    async def test_failed_file_removes_already_saved_images(self):
+        uploads = [
+            MemoryUpload("a.jpg", make_image_bytes()),
+            MemoryUpload("b.jpg", b"not an image"),
+            MemoryUpload("c.png", make_image_bytes(fmt="PNG")),
+        ]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with patch.object(image_utils, "UPLOADS_ROOT", Path(tmpdir)), \
+                    patch.object(image_utils, "INCOMING_DIR", Path(tmpdir) / ".incoming"), \
+                    patch("app.services.image_engine.get_settings", return_value=self._settings()):
+                with self.assertRaisesRegex(ValueError, "b.jpg"):
+                    await image_utils.process_uploaded_files(uploads)
+
+                self.assertEqual(list((Path(tmpdir) / "images").rglob("*.webp")), [])
+                self.assertEqual(list((Path(tmpdir) / ".incoming").iterdir()), [])
+        self.assertTrue(all(upload.closed for upload in uploads))
+        self.assertEqual(image_engine._in_flight, 0)
+
+    async def test_saturated_engine_answers_429(self):
+        uploads = [MemoryUpload("a.jpg", make_image_bytes()), MemoryUpload("b.jpg", make_image_bytes())]
+
+        with patch("app.services.image_engine.get_settings", return_value=self._settings(image_queue_limit=2)):
+            with image_engine.reserve(1):
+                with self.assertRaises(HTTPException) as ctx:
+                    await image_utils.process_uploaded_files(uploads)
+
+        self.assertEqual(ctx.exception.status_code, 429)
+        self.assertIn("Retry-After", ctx.exception.headers)
+        self.assertEqual(image_engine._in_flight, 0)
+
+    async def test_idle_engine_accepts_batch_above_limit(self):
+        with patch("app.services.image_engine.get_settings", return_value=self._settings(image_queue_limit=2)):
+            with image_engine.reserve(10):
+                self.assertEqual(image_engine._in_flight, 10)
+        self.assertEqual(image_engine._in_flight, 0)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,215 @@
+import asyncio
+import json
+import unittest
+from collections import Counter
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app import crud, models
+from app.routers.notifications import get_inbox, get_inbox_unread_count
+from app.services import inbox_counter
+
+
+class _FakeResult:
+    def __init__(self, rows=(), scalar=None):
+        self._rows = list(rows)
+        self._scalar = scalar
+
+    def all(self):
+        return self._rows
+
+    def scalar(self):
+        return self._scalar
+
+
+class _FakePipeline:
+    def __init__(self, redis):
+        self._redis = redis
+        self._ops = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self._ops.append((name, args, kwargs))
+        return queue
+
+    async def execute(self):
+        return [await getattr(self._redis, name)(*args, **kwargs) for name, args, kwargs in self._ops]
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.data = {}
+        # Вызывается между чтением поколения и засевом — имитация гонки
+        self.before_seed = None
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = str(value)
+        return True
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    async def eval(self, script, numkeys, *args):
+        keys, argv = args[:numkeys], args[numkeys:]
+        if script == inbox_counter._INCR_IF_EXISTS:
+            if keys[0] in self.data:
+                self.data[keys[0]] = str(int(self.data[keys[0]]) + int(argv[0]))
+                return int(self.data[keys[0]])
+            self._bump(keys[1])
+            return None
+        if script == inbox_counter._INVALIDATE:
+            self.data.pop(keys[0], None)
+            self._bump(keys[1])
+            return 1
+        if script == inbox_counter._SEED_IF_GENERATION:
+            if self.before_seed:
+                await self.before_seed()
+            if self.data.get(keys[1], "0") != argv[2]:
+                return None
+            return await self.set(keys[0], argv[0], nx=True)
+        raise AssertionError("unexpected script")
+
+    def _bump(self, key):
+        self.data[key] = str(int(self.data.get(key, "0")) + 1)
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+
+def _notification(notification_id, notif_type, payload):
+    return SimpleNamespace(
+        id=notification_id,
+        type=notif_type,
+        payload=json.dumps(payload),
+        is_read=False,
+        created_at=datetime(2026, 5, 1, 12, notification_id),
+    )
+
+
+class InboxTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.redis = _FakeRedis()
+        patcher = patch("app.services.inbox_counter.get_redis", new=AsyncMock(return_value=self.redis))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_review_state_is_resolved_with_one_query_per_page(self):
+        page = [
+            _notification(3, "review_request", {"deal_id": 7}),
+            _notification(2, "review_request", {"item_id": 8}),
+            _notification(1, "comment", {"post_id": 9}),
+        ]
+        rows = [(n, n.created_at, n.id) for n in page]
+        db = SimpleNamespace(execute=AsyncMock(side_effect=[
+            _FakeResult(rows=rows),
+            _FakeResult(rows=[(7, 8)]),
+        ]))
+
+        result = await get_inbox(limit=2, cursor=None, user=SimpleNamespace(id=1), db=db)
+
+        self.assertEqual(db.execute.await_count, 2)
+        items = result["items"]
+        self.assertEqual([item["id"] for item in items], [3, 2])
+        self.assertTrue(items[0]["payload"]["is_review_done"])
+        self.assertFalse(items[1]["payload"]["is_review_done"])
+        self.assertTrue(result["has_more"])
+        self.assertEqual(crud.decode_cursor(result["next_cursor"])["k"], [page[1].created_at, 2])
+
+    async def test_unread_count_is_served_from_redis_after_first_call(self):
+        db = SimpleNamespace(execute=AsyncMock(return_value=_FakeResult(scalar=4)))
+        user = SimpleNamespace(id=1)
+
+        first = await get_inbox_unread_count(user=user, db=db)
+        second = await get_inbox_unread_count(user=user, db=db)
+
+        self.assertEqual(first, {"count": 4})
+        self.assertEqual(second, {"count": 4})
+        self.assertEqual(db.execute.await_count, 1)
+
+    async def test_commit_increments_existing_counter_and_drops_dirty_ones(self):
+        self.redis.data = {"inbox_unread:1": "2", "inbox_unread:2": "5"}
+        session = Session()
+        session.begin()
+        session.info[inbox_counter._INCR_INFO_KEY] = Counter({1: 2, 2: 1, 3: 1})
+        session.info[inbox_counter._DIRTY_INFO_KEY] = {2}
+
+        session.commit()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+        # У юзера 3 ключа не было — INCR не создаёт счётчик «с единицы», только бампает поколение
+        self.assertEqual(self.redis.data, {
+            "inbox_unread:1": "4",
+            "inbox_unread_gen:2": "1",
+            "inbox_unread_gen:3": "1",
+        })
+
+    async def test_seed_is_dropped_when_notification_arrives_during_count(self):
+        db = SimpleNamespace(execute=AsyncMock(return_value=_FakeResult(scalar=4)))
+
+        async def new_notification():
+            await inbox_counter.increment(Counter({1: 1}))
+
+        self.redis.before_seed = new_notification
+        count = await inbox_counter.get_unread_count(db, 1)
+
+        self.assertEqual(count, 4)
+        # Устаревший COUNT(*) не закеширован — следующий запрос пересчитает
+        self.assertNotIn("inbox_unread:1", self.redis.data)
+
+
+def _loaded_notification(session, is_read=False, status="pending"):
+    notification = models.Notification(recipient_id=1)
+    session.add(notification)
+    set_committed_value(notification, "is_read", is_read)
+    set_committed_value(notification, "status", status)
+    return notification
+
+
+class RememberUpdateTests(unittest.TestCase):
+    def setUp(self):
+        self.session = Session()
+
+    def test_claim_for_delivery_keeps_counter(self):
+        notification = _loaded_notification(self.session)
+        notification.status = "sending"
+
+        inbox_counter._remember_update(None, None, notification)
+
+        self.assertNotIn(inbox_counter._DIRTY_INFO_KEY, self.session.info)
+        self.assertFalse(self.session.info.get(inbox_counter._INCR_INFO_KEY))
+
+    def test_read_and_skip_decrement_counter(self):
+        read = _loaded_notification(self.session)
+        read.is_read = True
+        skipped = _loaded_notification(self.session, status="sending")
+        skipped.status = "skipped"
+
+        inbox_counter._remember_update(None, None, read)
+        inbox_counter._remember_update(None, None, skipped)
+
+        self.assertEqual(self.session.info[inbox_counter._INCR_INFO_KEY], Counter({1: -2}))
+        self.assertNotIn(inbox_counter._DIRTY_INFO_KEY, self.session.info)
+
+    def test_unknown_previous_value_marks_dirty(self):
+        notification = models.Notification(recipient_id=1)
+        self.session.add(notification)
+        notification.status = "failed"
+
+        inbox_counter._remember_update(None, None, notification)
+
+        self.assertEqual(self.session.info[inbox_counter._DIRTY_INFO_KEY], {1})
+
+
+if __name__ == "__main__":
+    unittest.main()
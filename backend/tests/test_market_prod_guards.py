@@ -4,8 +4,9 @@ from types import SimpleNamespace
 from unittest.mock import AsyncMock, patch
 
 from fastapi import HTTPException
+from redis.exceptions import ConnectionError as RedisConnectionError
 
-from app import auth_service
+from app import auth_cache, auth_service
 from app.crud import market as market_crud
 from app.services import notification_service
 
@@ -19,12 +20,24 @@ class _FakeResult:
 
 
 class RequireUserSessionBindingTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        # Без Redis и с пустым L1 — каждый вызов идёт в БД
+        auth_cache.clear_local()
+        patcher = patch(
+            "app.auth_cache.get_redis",
+            new=AsyncMock(side_effect=RedisConnectionError("down")),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     async def test_prod_requires_active_session(self):
         request = SimpleNamespace(
             state=SimpleNamespace(auth_payload={"tgid": 101, "sub": "1", "sid": 77, "role": "user"})
         )
         user = SimpleNamespace(id=1, telegram_id=101)
-        session = SimpleNamespace(id=77, user_id=1, telegram_id=101)
+        session = SimpleNamespace(
+            id=77, user_id=1, telegram_id=101, expires_at=datetime.utcnow() + timedelta(days=1),
+        )
 
         db = AsyncMock()
         db.execute = AsyncMock(side_effect=[_FakeResult(user), _FakeResult(session)])
@@ -0,0 +1,112 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from redis.exceptions import ConnectionError as RedisConnectionError
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+
+from app.routers.notifications import get_notification_queue
+from app.services import notification_outbox
+
+
+class _FakePipeline:
+    def __init__(self, redis):
+        self._redis = redis
+        self._ops = []
+
+    def xadd(self, key, fields, maxlen=None, approximate=True):
+        self._ops.append((key, fields))
+
+    async def execute(self):
+        self._redis.entries.extend(self._ops)
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.entries = []
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+
+class _FakeScalars:
+    def all(self):
+        return []
+
+
+class _FakeResult:
+    def scalars(self):
+        return _FakeScalars()
+
+    def all(self):
+        return []
+
+
+class NotificationOutboxTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.redis = _FakeRedis()
+        patchers = [
+            patch("app.services.notification_outbox.get_redis", new=AsyncMock(return_value=self.redis)),
+            patch(
+                "app.services.notification_outbox.get_settings",
+                return_value=SimpleNamespace(notification_push_enabled=True),
+            ),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_ids_are_published_only_after_commit(self):
+        session = Session()
+        session.begin()
+        session.info[notification_outbox._SESSION_INFO_KEY] = {5, 3}
+        self.assertEqual(self.redis.entries, [])
+
+        session.commit()
+        await asyncio.sleep(0)
+
+        self.assertEqual(
+            self.redis.entries,
+            [(notification_outbox.STREAM_KEY, {"id": "3"}), (notification_outbox.STREAM_KEY, {"id": "5"})],
+        )
+
+    async def test_rollback_drops_pending_ids(self):
+        session = Session()
+        session.begin()
+        session.info[notification_outbox._SESSION_INFO_KEY] = {7}
+
+        session.rollback()
+        session.begin()
+        session.commit()
+        await asyncio.sleep(0)
+
+        self.assertEqual(self.redis.entries, [])
+
+    async def test_redis_outage_leaves_notifications_to_poll(self):
+        broken = SimpleNamespace(
+            pipeline=lambda transaction=True: SimpleNamespace(
+                xadd=lambda *a, **kw: None,
+                execute=AsyncMock(side_effect=RedisConnectionError("down")),
+            )
+        )
+
+        with patch("app.services.notification_outbox.get_redis", new=AsyncMock(return_value=broken)):
+            published = await notification_outbox.publish([1, 2])
+
+        self.assertEqual(published, 0)
+
+    async def test_queue_filters_by_ids_and_age(self):
+        db = SimpleNamespace(execute=AsyncMock(return_value=_FakeResult()), commit=AsyncMock())
+
+        result = await get_notification_queue(limit=50, ids=[4, 9], min_age_seconds=60, _=None, db=db)
+
+        self.assertEqual(result, [])
+        sql = str(db.execute.await_args.args[0].compile(dialect=postgresql.dialect()))
+        self.assertIn("notifications.id IN", sql)
+        self.assertIn("notifications.created_at <=", sql)
+
+
+if __name__ == "__main__":
+    unittest.main()
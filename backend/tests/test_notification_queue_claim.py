@@ -0,0 +1,100 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+from sqlalchemy.dialects import postgresql
+
+from app import schemas
+from app.services import inbox_counter
+from app.routers.notifications import ack_notification_queue, claim_notification_queue
+
+
+class _FakeScalars:
+    def __init__(self, values):
+        self._values = values
+
+    def all(self):
+        return self._values
+
+
+class _FakeResult:
+    def __init__(self, rows=(), rowcount=0):
+        self._rows = list(rows)
+        self.rowcount = rowcount
+
+    def all(self):
+        return self._rows
+
+    def scalars(self):
+        return _FakeScalars(self._rows)
+
+
+def _notification(notification_id, notif_type="comment"):
+    return SimpleNamespace(
+        id=notification_id,
+        type=notif_type,
+        payload='{"post_id": 1}',
+        status="pending",
+        error=None,
+        claimed_at=None,
+    )
+
+
+def _compiled(statement):
+    return str(statement.compile(dialect=postgresql.dialect()))
+
+
+class NotificationQueueClaimTests(unittest.IsolatedAsyncioTestCase):
+    async def test_claim_locks_rows_and_decides_statuses_in_memory(self):
+        deliver = _notification(1)
+        muted = _notification(2)
+        orphan = _notification(3)
+        rows = [
+            (deliver, 1001, None),
+            (muted, 1002, SimpleNamespace(mute_all=False, comments_enabled=False)),
+            (orphan, None, None),
+        ]
+        db = SimpleNamespace(execute=AsyncMock(return_value=_FakeResult(rows)), commit=AsyncMock())
+
+        result = await claim_notification_queue(
+            schemas.NotificationClaimRequest(limit=10), _=None, db=db,
+        )
+
+        self.assertEqual(db.execute.await_count, 1)
+        sql = _compiled(db.execute.await_args.args[0])
+        self.assertIn("FOR UPDATE OF notifications SKIP LOCKED", sql)
+        self.assertIn("LEFT OUTER JOIN notification_settings", sql)
+
+        self.assertEqual(result, [{"id": 1, "telegram_id": 1001, "type": "comment", "payload": {"post_id": 1}}])
+        self.assertEqual(deliver.status, "sending")
+        self.assertIsNotNone(deliver.claimed_at)
+        self.assertEqual(muted.status, "skipped")
+        self.assertEqual(orphan.status, "failed")
+        db.commit.assert_awaited_once()
+
+    async def test_ack_updates_in_bulk_grouped_by_error(self):
+        db = SimpleNamespace(
+            execute=AsyncMock(return_value=_FakeResult(rows=[501, 502], rowcount=2)),
+            commit=AsyncMock(),
+            info={},
+        )
+        data = schemas.NotificationAckRequest(
+            sent=[1, 2],
+            failed=[
+                {"id": 3, "error": "User blocked the bot"},
+                {"id": 4, "error": "User blocked the bot"},
+            ],
+        )
+
+        result = await ack_notification_queue(data, _=None, db=db)
+
+        self.assertEqual(db.execute.await_count, 2)
+        sent_sql = _compiled(db.execute.await_args_list[0].args[0])
+        self.assertIn("UPDATE notifications SET status=", sent_sql)
+        self.assertEqual(result, {"ok": True, "sent": 2, "failed": 2})
+        self.assertEqual(db.info[inbox_counter._DIRTY_INFO_KEY], {501, 502})
+        db.commit.assert_awaited_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
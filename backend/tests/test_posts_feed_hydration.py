@@ -0,0 +1,150 @@
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from app.main import get_posts_feed
+from app.crud import posts as posts_crud
+
+
+class _RowsResult:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def all(self):
+        return self._rows
+
+
+def _make_post(post_id, poll=None):
+    author = SimpleNamespace(
+        id=100 + post_id,
+        telegram_id=500 + post_id,
+        telegram_username=None,
+        username=None,
+        name=f"Author {post_id}",
+        avatar=None,
+        campus_id=None,
+        university="Campus Uni",
+        institute=None,
+        course=None,
+        city=None,
+        role="user",
+        show_profile=True,
+        show_telegram_id=False,
+    )
+    return SimpleNamespace(
+        id=post_id,
+        author_id=author.id,
+        author=author,
+        category="general",
+        title=None,
+        body="body text",
+        tags=[],
+        images=[],
+        is_anonymous=False,
+        enable_anonymous_comments=False,
+        lost_or_found=None,
+        item_description=None,
+        location=None,
+        reward_type=None,
+        reward_value=None,
+        event_name=None,
+        event_date=None,
+        event_location=None,
+        event_contact=None,
+        is_important=False,
+        scope="university",
+        target_university=None,
+        help_expires_at=None,
+        is_resolved=False,
+        resolved_at=None,
+        likes_count=0,
+        comments_count=0,
+        views_count=0,
+        poll=poll,
+        created_at=datetime(2026, 1, 1),
+        updated_at=datetime(2026, 1, 1),
+    )
+
+
+def _make_poll(poll_id, post_id):
+    return SimpleNamespace(
+        id=poll_id,
+        post_id=post_id,
+        question="?",
+        options=[{"text": "a", "votes": 1}, {"text": "b", "votes": 0}],
+        type="regular",
+        correct_option=None,
+        explanation=None,
+        allow_multiple=False,
+        is_anonymous=True,
+        closes_at=None,
+        total_votes=1,
+    )
+
+
+class PostsViewerStateTests(unittest.IsolatedAsyncioTestCase):
+    async def test_viewer_state_uses_one_query_per_table(self):
+        posts = [_make_post(1), _make_post(2, poll=_make_poll(20, 2)), _make_post(3, poll=_make_poll(30, 3))]
+        db = SimpleNamespace(execute=AsyncMock(side_effect=[
+            _RowsResult([(1,), (3,)]),
+            _RowsResult([(20, [0])]),
+        ]))
+
+        state = await posts_crud.get_posts_viewer_state(db, posts, user_id=7)
+
+        self.assertEqual(db.execute.await_count, 2)
+        self.assertEqual(state["liked_post_ids"], {1, 3})
+        self.assertEqual(state["poll_votes"], {20: [0]})
+
+    async def test_viewer_state_skips_queries_for_anonymous_viewer(self):
+        db = SimpleNamespace(execute=AsyncMock())
+
+        state = await posts_crud.get_posts_viewer_state(db, [_make_post(1)], user_id=None)
+
+        db.execute.assert_not_awaited()
+        self.assertEqual(state, {"liked_post_ids": set(), "poll_votes": {}})
+
+
+class PostsFeedHydrationRouteTests(unittest.IsolatedAsyncioTestCase):
+    async def test_feed_applies_batched_viewer_state(self):
+        posts = [_make_post(1), _make_post(2, poll=_make_poll(20, 2))]
+        user = SimpleNamespace(id=7)
+        viewer_state = {"liked_post_ids": {2}, "poll_votes": {20: [1]}}
+
+        with (
+            patch("app.main.check_rate_limit", new=AsyncMock()),
+            patch("app.main.analytics_service.record_server_event", new=AsyncMock()),
+            patch("app.main.crud.get_posts", new=AsyncMock(return_value={"items": posts, "total_count": 2, "has_more": False, "next_cursor": None})),
+            patch("app.main.crud.get_posts_viewer_state", new=AsyncMock(return_value=viewer_state)) as mocked_state,
+            patch("app.main.crud.is_post_liked_by_user", new=AsyncMock()) as per_post_like,
+        ):
+            payload = await get_posts_feed(
+                request=SimpleNamespace(),
+                skip=0,
+                limit=20,
+                category=None,
+                university=None,
+                institute=None,
+                campus_id=None,
+                city=None,
+                tags=None,
+                search=None,
+                date_range=None,
+                sort="newest",
+                viewer_city=None,
+                cursor=None,
+                include_total=False,
+                user=user,
+                db=object(),
+            )
+
+        mocked_state.assert_awaited_once()
+        per_post_like.assert_not_awaited()
+        self.assertEqual([item["is_liked"] for item in payload["items"]], [False, True])
+        self.assertIsNone(payload["items"][0]["poll"])
+        self.assertEqual(payload["items"][1]["poll"]["user_votes"], [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
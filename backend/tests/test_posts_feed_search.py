@@ -21,7 +21,7 @@ class PostsFeedSearchRouteTests(unittest.IsolatedAsyncioTestCase):
         request = SimpleNamespace()
         db = object()
 
-        with patch('app.main.check_rate_limit', new=AsyncMock()), patch('app.main.crud.get_posts', new=AsyncMock(return_value=[])) as mocked_get_posts:
+        with patch('app.main.check_rate_limit', new=AsyncMock()), patch('app.main.crud.get_posts', new=AsyncMock(return_value={'items': [], 'total_count': 0, 'has_more': False, 'next_cursor': None})) as mocked_get_posts:
             payload = await get_posts_feed(
                 request=request,
                 skip=5,
@@ -36,11 +36,13 @@ class PostsFeedSearchRouteTests(unittest.IsolatedAsyncioTestCase):
                 date_range='week',
                 sort='popular',
                 viewer_city='Moscow',
+                cursor=None,
+                include_total=True,
                 user=None,
                 db=db,
             )
 
-        self.assertEqual(payload, {'items': [], 'total': 0, 'has_more': False})
+        self.assertEqual(payload, {'items': [], 'total': 0, 'total_count': 0, 'has_more': False, 'next_cursor': None})
         mocked_get_posts.assert_awaited_once_with(
             db,
             skip=5,
@@ -56,6 +58,8 @@ class PostsFeedSearchRouteTests(unittest.IsolatedAsyncioTestCase):
             sort='popular',
             current_user_id=None,
             viewer_city='Moscow',
+            cursor_payload=None,
+            include_total=True,
         )
 
 
@@ -80,9 +84,35 @@ class PostsFeedSearchCrudTests(unittest.IsolatedAsyncioTestCase):
             )
         )
 
-        self.assertIn('ILIKE', compiled)
-        self.assertIn('%lecture%', compiled)
+        self.assertIn("posts.search_vector @@ to_tsquery('russian'::regconfig, 'lecture:*')", compiled)
+        self.assertNotIn('ILIKE', compiled)
         self.assertIn('news', compiled)
+        self.assertNotIn('ts_rank_cd', compiled)
+
+    async def test_search_without_explicit_sort_orders_by_relevance(self):
+        fake_db = SimpleNamespace(execute=AsyncMock(return_value=_EmptyScalarResult()))
+
+        result = await posts_crud.get_posts(fake_db, search='Лекции, матан!')
+
+        query = fake_db.execute.await_args.args[0]
+        compiled = str(
+            query.compile(
+                dialect=postgresql.dialect(),
+                compile_kwargs={'literal_binds': True},
+            )
+        )
+
+        self.assertIn("'лекции:* & матан:*'", compiled)
+        self.assertIn('ORDER BY ts_rank_cd(posts.search_vector', compiled)
+        self.assertFalse(result['has_more'])
+
+    async def test_punctuation_only_search_is_ignored(self):
+        fake_db = SimpleNamespace(execute=AsyncMock(return_value=_EmptyScalarResult()))
+
+        await posts_crud.get_posts(fake_db, search=' ?! ')
+
+        compiled = str(fake_db.execute.await_args.args[0].compile(dialect=postgresql.dialect()))
+        self.assertNotIn('to_tsquery', compiled)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,200 @@
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock, patch
+
+from fastapi import HTTPException
+from sqlalchemy.dialects import postgresql
+
+from app import models
+from app.routers.media import get_video_job
+from app.services import video_transcode_service
+from app.utils import get_image_urls
+
+
+class _FakeResult:
+    def __init__(self, value=None, rows=()):
+        self._value = value
+        self._rows = rows
+
+    def scalar_one_or_none(self):
+        return self._value
+
+    def all(self):
+        return list(self._rows)
+
+
+class _Session:
+    def __init__(self, session):
+        self._session = session
+
+    async def __aenter__(self):
+        return self._session
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def _job(**overrides):
+    values = dict(
+        id=7, owner_id=1, source_path="/tmp/x.upload", target_type="post", target_id=3,
+        status="processing", progress=40, attempts=1, error=None, result=None,
+    )
+    values.update(overrides)
+    return SimpleNamespace(**values)
+
+
+VIDEO_META = {
+    "type": "video", "url": "/uploads/videos/2026/10/a.mp4", "w": 720, "h": 1280,
+    "duration": 12.5, "thumbnail_url": "/uploads/thumbs/2026/10/a.jpg",
+}
+
+
+class ClaimJobsTests(unittest.IsolatedAsyncioTestCase):
+    async def test_claim_skips_locked_rows_and_takes_lease(self):
+        session = SimpleNamespace(
+            execute=AsyncMock(side_effect=[
+                _FakeResult(rows=[SimpleNamespace(id=7, source_path="/tmp/x.upload")]),
+                _FakeResult(),
+            ]),
+            commit=AsyncMock(),
+        )
+        with patch("app.services.video_transcode_service.AsyncSessionLocal", return_value=_Session(session)):
+            claimed = await video_transcode_service._claim_jobs(2)
+
+        self.assertEqual(claimed, [(7, "/tmp/x.upload")])
+        select_sql = str(session.execute.await_args_list[0].args[0].compile(dialect=postgresql.dialect()))
+        self.assertIn("SKIP LOCKED", select_sql)
+        update_sql = str(session.execute.await_args_list[1].args[0])
+        self.assertIn("attempts", update_sql)
+        session.commit.assert_awaited_once()
+
+
+class FinishJobTests(unittest.IsolatedAsyncioTestCase):
+    def _session(self, job, entity):
+        return SimpleNamespace(
+            get=AsyncMock(return_value=job),
+            execute=AsyncMock(return_value=_FakeResult(entity)),
+            commit=AsyncMock(),
+        )
+
+    async def test_done_job_replaces_pending_entry(self):
+        job = _job()
+        images = [{"url": "a.jpg", "w": 1, "h": 1}, video_transcode_service.pending_media(7)]
+        post = SimpleNamespace(id=3, images=images)
+        session = self._session(job, post)
+        bump = AsyncMock()
+        with patch("app.services.video_transcode_service.AsyncSessionLocal", return_value=_Session(session)), \
+                patch("app.services.video_transcode_service.feed_cache.bump_generation", new=bump), \
+                patch("app.services.video_transcode_service.delete_video") as delete_video:
+            await video_transcode_service._finish_job(7, meta=VIDEO_META)
+
+        self.assertIsNot(post.images, images)
+        self.assertEqual(post.images, [images[0], VIDEO_META])
+        self.assertEqual((job.status, job.progress, job.result), ("done", 100, VIDEO_META))
+        delete_video.assert_not_called()
+        bump.assert_awaited_once_with(video_transcode_service.feed_cache.SCOPE_POSTS)
+
+    async def test_done_job_without_entry_drops_outputs(self):
+        job = _job(target_type="market_item")
+        item = SimpleNamespace(id=3, images=[{"url": "a.jpg", "w": 1, "h": 1}])
+        session = self._session(job, item)
+        bump = AsyncMock()
+        with patch("app.services.video_transcode_service.AsyncSessionLocal", return_value=_Session(session)), \
+                patch("app.services.video_transcode_service.feed_cache.bump_generation", new=bump), \
+                patch("app.services.video_transcode_service.delete_video") as delete_video:
+            await video_transcode_service._finish_job(7, meta=VIDEO_META)
+
+        delete_video.assert_called_once_with(VIDEO_META)
+        bump.assert_not_awaited()
+        self.assertEqual(job.status, "done")
+
+    async def test_failed_job_removes_entry(self):
+        job = _job()
+        photo = {"url": "a.jpg", "w": 1, "h": 1}
+        post = SimpleNamespace(id=3, images=[photo, video_transcode_service.pending_media(7)])
+        session = self._session(job, post)
+        bump = AsyncMock()
+        with patch("app.services.video_transcode_service.AsyncSessionLocal", return_value=_Session(session)), \
+                patch("app.services.video_transcode_service.feed_cache.bump_generation", new=bump):
+            await video_transcode_service._finish_job(7, error="Видео слишком длинное")
+
+        self.assertEqual((job.status, job.error), ("failed", "Видео слишком длинное"))
+        self.assertEqual(post.images, [photo])
+        bump.assert_awaited_once()
+
+
+class AttachPendingTests(unittest.IsolatedAsyncioTestCase):
+    async def test_only_pending_video_entries_are_attached(self):
+        db = SimpleNamespace(execute=AsyncMock(), commit=AsyncMock())
+        await video_transcode_service.attach_pending(db, [{"url": "a.jpg"}], "post", 3)
+        db.execute.assert_not_awaited()
+
+        await video_transcode_service.attach_pending(
+            db, [{"url": "a.jpg"}, video_transcode_service.pending_media(7)], "post", 3,
+        )
+        stmt = db.execute.await_args.args[0]
+        self.assertIn("video_transcode_jobs.target_id IS NULL", str(stmt))
+        db.commit.assert_awaited_once()
+
+
+class VideoJobEndpointTests(unittest.IsolatedAsyncioTestCase):
+    async def test_other_users_job_is_hidden(self):
+        db = SimpleNamespace(get=AsyncMock(return_value=_job(owner_id=2)))
+        with self.assertRaises(HTTPException) as ctx:
+            await get_video_job(7, user=SimpleNamespace(id=1), db=db)
+        self.assertEqual(ctx.exception.status_code, 404)
+        db.get.assert_awaited_once_with(models.VideoTranscodeJob, 7)
+
+    async def test_done_job_returns_media(self):
+        db = SimpleNamespace(get=AsyncMock(return_value=_job(status="done", progress=100, result=VIDEO_META)))
+        payload = await get_video_job(7, user=SimpleNamespace(id=1), db=db)
+        self.assertEqual(payload["progress"], 100)
+        self.assertEqual(payload["media"]["url"], VIDEO_META["url"])
+
+
+class PrepareVideoTests(unittest.IsolatedAsyncioTestCase):
+    async def test_bad_video_is_rejected_before_job_is_created(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            source = Path(tmpdir) / "x.upload"
+            source.write_bytes(b"raw")
+            db = SimpleNamespace(add=Mock(), flush=AsyncMock())
+            settings = SimpleNamespace(video_transcode_queue_enabled=True)
+            with patch("app.services.video_transcode_service.get_settings", return_value=settings), \
+                    patch("app.services.video_transcode_service.save_video_upload", new=AsyncMock(return_value=source)), \
+                    patch(
+                        "app.services.video_transcode_service.validate_video_file",
+                        side_effect=ValueError("Видео слишком длинное (75.0с). Максимум 60с"),
+                    ):
+                with self.assertRaisesRegex(ValueError, "слишком длинное"):
+                    await video_transcode_service.prepare_video(db, object(), owner_id=1)
+
+            self.assertFalse(source.exists())
+        db.add.assert_not_called()
+
+    async def test_valid_video_gets_pending_entry(self):
+        db = SimpleNamespace(add=Mock(side_effect=lambda job: setattr(job, "id", 9)), flush=AsyncMock())
+        settings = SimpleNamespace(video_transcode_queue_enabled=True)
+        with patch("app.services.video_transcode_service.get_settings", return_value=settings), \
+                patch(
+                    "app.services.video_transcode_service.save_video_upload",
+                    new=AsyncMock(return_value=Path("/tmp/x.upload")),
+                ), \
+                patch("app.services.video_transcode_service.validate_video_file", return_value={"duration": 5.0}):
+            meta = await video_transcode_service.prepare_video(db, object(), owner_id=1)
+
+        self.assertEqual(meta, video_transcode_service.pending_media(9))
+
+
+class PendingMediaUrlsTests(unittest.TestCase):
+    def test_pending_entry_passes_through_and_failed_is_skipped(self):
+        urls = get_image_urls([
+            video_transcode_service.pending_media(7),
+            {"type": "video", "status": "failed", "job_id": 8, "url": "", "w": 0, "h": 0},
+        ])
+        self.assertEqual(urls, [{"type": "video", "url": "", "w": 0, "h": 0, "status": "processing", "job_id": 7}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.crud import market as market_crud
+from app.crud import posts as posts_crud
+from app.services import view_counter_service
+
+
+class _ScalarsResult:
+    def __init__(self, values):
+        self._values = values
+
+    def scalars(self):
+        return self
+
+    def all(self):
+        return list(self._values)
+
+
+class _FakeSessionFactory:
+    def __init__(self, db):
+        self.db = db
+
+    def __call__(self):
+        return self
+
+    async def __aenter__(self):
+        return self.db
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class ViewBufferTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        view_counter_service._pending_post_views.clear()
+        view_counter_service._pending_market_item_views.clear()
+        self.addCleanup(view_counter_service._pending_post_views.clear)
+        self.addCleanup(view_counter_service._pending_market_item_views.clear)
+
+    async def test_repeated_views_collapse_and_flush_in_one_batch(self):
+        view_counter_service.record_post_view(1, 10)
+        view_counter_service.record_post_view(1, 10)
+        view_counter_service.record_post_view(2, 10)
+        view_counter_service.record_market_item_view(5, 11)
+        db = SimpleNamespace(rollback=AsyncMock())
+
+        with (
+            patch("app.services.view_counter_service.AsyncSessionLocal", new=_FakeSessionFactory(db)),
+            patch("app.services.view_counter_service.posts_crud.apply_post_views", new=AsyncMock(return_value=2)) as apply_posts,
+            patch("app.services.view_counter_service.market_crud.apply_market_item_views", new=AsyncMock(return_value=1)) as apply_items,
+        ):
+            flushed = await view_counter_service.flush_pending_views()
+
+        self.assertEqual(flushed, {"posts": 2, "market_items": 1})
+        self.assertEqual(apply_posts.await_args.args[1], {(1, 10), (2, 10)})
+        self.assertEqual(apply_items.await_args.args[1], {(5, 11)})
+        self.assertEqual(view_counter_service.pending_counts(), {"posts": 0, "market_items": 0})
+
+    async def test_failed_batch_is_rolled_back_and_not_retried(self):
+        view_counter_service.record_post_view(1, 10)
+        db = SimpleNamespace(rollback=AsyncMock())
+
+        with (
+            patch("app.services.view_counter_service.AsyncSessionLocal", new=_FakeSessionFactory(db)),
+            patch("app.services.view_counter_service.posts_crud.apply_post_views", new=AsyncMock(side_effect=SQLAlchemyError("boom"))),
+        ):
+            flushed = await view_counter_service.flush_pending_views()
+
+        self.assertEqual(flushed["posts"], 0)
+        db.rollback.assert_awaited_once()
+        self.assertEqual(view_counter_service.pending_counts()["posts"], 0)
+
+    async def test_empty_buffer_does_not_open_a_session(self):
+        factory = MagicMock()
+        with patch("app.services.view_counter_service.AsyncSessionLocal", new=factory):
+            await view_counter_service.flush_pending_views()
+        factory.assert_not_called()
+
+
+class ApplyPostViewsTests(unittest.IsolatedAsyncioTestCase):
+    async def test_counts_only_inserted_rows(self):
+        db = SimpleNamespace(
+            execute=AsyncMock(side_effect=[
+                _ScalarsResult([1, 2]),   # посты существуют и не реклама
+                _ScalarsResult([1, 1]),   # реально вставленные строки post_views
+                None,                     # UPDATE views_count
+            ]),
+            commit=AsyncMock(),
+        )
+
+        counted = await posts_crud.apply_post_views(db, [(1, 10), (1, 11), (2, 10), (3, 10)])
+
+        self.assertEqual(counted, 2)
+        insert_stmt = db.execute.await_args_list[1].args[0]
+        compiled = str(insert_stmt.compile(dialect=postgresql.dialect()))
+        self.assertIn("ON CONFLICT ON CONSTRAINT unique_post_view DO NOTHING", compiled)
+        update_params = db.execute.await_args_list[2].args[1]
+        self.assertEqual(update_params, [{"b_post_id": 1, "b_delta": 2}])
+        db.commit.assert_awaited_once()
+
+
+    async def test_large_batch_is_split_under_bind_param_limit(self):
+        views = [(post_id, 10) for post_id in range(1, 6)]
+        db = SimpleNamespace(
+            execute=AsyncMock(side_effect=[
+                _ScalarsResult([1, 2]), _ScalarsResult([1, 2]),
+                _ScalarsResult([3, 4]), _ScalarsResult([3]),
+                _ScalarsResult([5]), _ScalarsResult([5]),
+                None,
+            ]),
+            commit=AsyncMock(),
+        )
+
+        with patch.object(posts_crud, "VIEW_INSERT_CHUNK_ROWS", 2):
+            counted = await posts_crud.apply_post_views(db, views)
+
+        self.assertEqual(counted, 4)
+        inserts = [call.args[0] for call in db.execute.await_args_list[1:6:2]]
+        self.assertEqual([len(stmt.compile().params) for stmt in inserts], [6, 6, 3])
+        self.assertEqual(
+            db.execute.await_args_list[-1].args[1],
+            [{"b_post_id": post_id, "b_delta": 1} for post_id in (1, 2, 3, 5)],
+        )
+        db.commit.assert_awaited_once()
+
+
+class ApplyMarketItemViewsTests(unittest.IsolatedAsyncioTestCase):
+    async def test_large_batch_is_split_under_bind_param_limit(self):
+        views = [(1, user_id) for user_id in range(1, 4)]
+        db = SimpleNamespace(
+            execute=AsyncMock(side_effect=[
+                _ScalarsResult([1]), _ScalarsResult([1, 1]),
+                _ScalarsResult([1]), _ScalarsResult([]),
+                None,
+            ]),
+            commit=AsyncMock(),
+        )
+
+        with patch.object(market_crud, "VIEW_INSERT_CHUNK_ROWS", 2):
+            counted = await market_crud.apply_market_item_views(db, views)
+
+        self.assertEqual(counted, 2)
+        self.assertEqual(db.execute.await_count, 5)
+        self.assertEqual(db.execute.await_args_list[-1].args[1], [{"b_item_id": 1, "b_delta": 2}])
+        db.commit.assert_awaited_once()
+
+if __name__ == "__main__":
+    unittest.main()
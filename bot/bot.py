@@ -18,15 +18,19 @@ from config import (
     FOLLOWUP_POLL_INTERVAL,
     LOG_LEVEL,
     MASKED_TELEGRAM_PROXY_URL,
+    NOTIFICATION_FALLBACK_POLL_INTERVAL,
     NOTIFICATION_POLL_INTERVAL,
+    NOTIFICATION_STREAM_ENABLED,
     TELEGRAM_PROXY_URL,
 )
 from handlers import callbacks, start
 from services.api_client import api_client
+from services.notification_stream import run_notification_stream
 from services.scheduler import poll_followups, poll_notifications
 
 heartbeat_stop_event: asyncio.Event | None = None
 heartbeat_task: asyncio.Task | None = None
+notification_stream_task: asyncio.Task | None = None
 _original_getaddrinfo = socket.getaddrinfo
 _ipv4_patch_applied = False
 TELEGRAM_API_HOST = "api.telegram.org"
@@ -78,18 +82,24 @@ async def heartbeat_loop(stop_event: asyncio.Event):
 
 
 async def on_startup(bot: Bot):
-    global heartbeat_stop_event, heartbeat_task
+    global heartbeat_stop_event, heartbeat_task, notification_stream_task
 
     me = await bot.get_me()
     heartbeat_stop_event = asyncio.Event()
     heartbeat_task = asyncio.create_task(heartbeat_loop(heartbeat_stop_event))
     logging.info("Bot started: @%s (id: %s)", me.username, me.id)
-    logging.info("Notification polling interval: %ss", NOTIFICATION_POLL_INTERVAL)
+    if NOTIFICATION_STREAM_ENABLED:
+        notification_stream_task = asyncio.create_task(
+            run_notification_stream(bot, heartbeat_stop_event)
+        )
+        logging.info("Notification delivery: Redis stream, fallback poll every %ss", NOTIFICATION_FALLBACK_POLL_INTERVAL)
+    else:
+        logging.info("Notification polling interval: %ss", NOTIFICATION_POLL_INTERVAL)
     logging.info("Follow-up polling interval: %ss", FOLLOWUP_POLL_INTERVAL)
 
 
 async def on_shutdown(bot: Bot):
-    global heartbeat_stop_event, heartbeat_task
+    global heartbeat_stop_event, heartbeat_task, notification_stream_task
 
     logging.info("Stopping bot...")
     if heartbeat_stop_event is not None:
@@ -97,6 +107,12 @@ async def on_shutdown(bot: Bot):
     if heartbeat_task is not None:
         await heartbeat_task
         heartbeat_task = None
+    if notification_stream_task is not None:
+        try:
+            await asyncio.wait_for(notification_stream_task, timeout=10)
+        except asyncio.TimeoutError:
+            notification_stream_task.cancel()
+        notification_stream_task = None
     Path(BOT_HEARTBEAT_FILE).unlink(missing_ok=True)
     heartbeat_stop_event = None
     await api_client.close()
@@ -130,12 +146,20 @@ async def main():
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
 
+    # При push-доставке опрос очереди только подбирает то, что stream пропустил
+    if NOTIFICATION_STREAM_ENABLED:
+        notification_poll_interval = NOTIFICATION_FALLBACK_POLL_INTERVAL
+        notification_min_age = NOTIFICATION_FALLBACK_POLL_INTERVAL
+    else:
+        notification_poll_interval = NOTIFICATION_POLL_INTERVAL
+        notification_min_age = 0
+
     scheduler = AsyncIOScheduler(timezone="UTC")
     scheduler.add_job(
         poll_notifications,
         trigger="interval",
-        seconds=NOTIFICATION_POLL_INTERVAL,
-        args=[bot],
+        seconds=notification_poll_interval,
+        args=[bot, notification_min_age],
         id="poll_notifications",
         max_instances=1,
         replace_existing=True,
@@ -84,6 +84,14 @@ elif not BOT_SECRET:
     BOT_SECRET = "dev-bot-secret"
 
 NOTIFICATION_POLL_INTERVAL = int(os.getenv("NOTIFICATION_POLL_INTERVAL", "20"))
+REDIS_URL = _first_env("REDIS_URL")
+# Push-доставка через Redis stream; опрос очереди остаётся редкой страховкой
+NOTIFICATION_STREAM_ENABLED = _env_bool("NOTIFICATION_STREAM_ENABLED", default=bool(REDIS_URL)) and bool(REDIS_URL)
+NOTIFICATION_FALLBACK_POLL_INTERVAL = int(os.getenv("NOTIFICATION_FALLBACK_POLL_INTERVAL", "60"))
+# Лимиты Telegram: ~30 сообщений/с на бота и ~1 сообщение/с в один чат
+NOTIFICATION_SEND_CONCURRENCY = max(1, int(os.getenv("NOTIFICATION_SEND_CONCURRENCY", "8")))
+TELEGRAM_GLOBAL_RATE = max(1.0, float(os.getenv("TELEGRAM_GLOBAL_RATE", "25")))
+TELEGRAM_CHAT_RATE = max(0.1, float(os.getenv("TELEGRAM_CHAT_RATE", "1")))
 FOLLOWUP_POLL_INTERVAL = int(os.getenv("FOLLOWUP_POLL_INTERVAL", "30"))
 
 MINIAPP_URL = os.getenv("MINIAPP_URL", "https://t.me/MyCampusBot/app")
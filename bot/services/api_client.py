@@ -39,53 +39,67 @@ class ApiClient:
     # Очередь уведомлений
     # =============================================
 
-    async def get_notification_queue(self, limit: int = 50) -> list:
+    async def _claim_notifications(self, payload: dict) -> Optional[list]:
         """
-        Забрать pending уведомления из очереди.
-        Возвращает список: [{id, telegram_id, type, payload}, ...]
+        Арендовать пачку уведомлений (POST /notifications/queue/claim).
+        Бэкенд блокирует строки через SKIP LOCKED — несколько инстансов бота
+        не получат одно и то же уведомление.
+        None — запрос не удался.
         """
         try:
             session = await self._get_session()
-            async with session.get(
-                "/notifications/queue",
+            async with session.post(
+                "/notifications/queue/claim",
                 headers=BOT_HEADERS,
-                params={"limit": limit}
+                json=payload
             ) as resp:
                 if resp.status == 200:
                     return await resp.json()
-                else:
-                    text = await resp.text()
-                    logger.error(f"Ошибка получения очереди: {resp.status} {text}")
-                    return []
+                text = await resp.text()
+                logger.error(f"Ошибка получения очереди: {resp.status} {text}")
+                return None
         except aiohttp.ClientError as e:
-            logger.error(f"Сетевая ошибка get_notification_queue: {e}")
-            return []
+            logger.error(f"Сетевая ошибка claim_notifications: {e}")
+            return None
 
-    async def mark_sent(self, notification_id: int) -> bool:
-        """Подтвердить успешную отправку уведомления"""
-        try:
-            session = await self._get_session()
-            async with session.post(
-                f"/notifications/queue/{notification_id}/sent",
-                headers=BOT_HEADERS
-            ) as resp:
-                return resp.status == 200
-        except aiohttp.ClientError as e:
-            logger.error(f"Ошибка mark_sent({notification_id}): {e}")
-            return False
+    async def get_notification_queue(self, limit: int = 50, min_age_seconds: int = 0) -> list:
+        """
+        Забрать pending уведомления из очереди.
+        min_age_seconds — только уведомления старше N секунд (fallback при stream).
+        Возвращает список: [{id, telegram_id, type, payload}, ...]
+        """
+        queue = await self._claim_notifications({"limit": limit, "min_age_seconds": min_age_seconds})
+        return queue or []
+
+    async def get_notifications_by_ids(self, notification_ids: list) -> Optional[list]:
+        """
+        Забрать конкретные pending уведомления (id пришли из Redis stream).
+        Уже отправленные/пропущенные бэкенд не вернёт.
+        None — запрос не удался, сообщения stream'а не подтверждаем.
+        """
+        return await self._claim_notifications({"limit": len(notification_ids), "ids": notification_ids})
 
-    async def mark_failed(self, notification_id: int, error: str = "unknown") -> bool:
-        """Сообщить об ошибке отправки"""
+    async def ack_notifications(self, sent: list, failed: list) -> bool:
+        """
+        Итоги отправки пачки одним запросом.
+        sent: [id, ...], failed: [{id, error}, ...]
+        """
+        if not sent and not failed:
+            return True
         try:
             session = await self._get_session()
             async with session.post(
-                f"/notifications/queue/{notification_id}/failed",
+                "/notifications/queue/ack",
                 headers=BOT_HEADERS,
-                params={"error": error[:200]}
+                json={"sent": sent, "failed": failed}
             ) as resp:
-                return resp.status == 200
+                if resp.status == 200:
+                    return True
+                text = await resp.text()
+                logger.error(f"Ошибка ack_notifications: {resp.status} {text}")
+                return False
         except aiohttp.ClientError as e:
-            logger.error(f"Ошибка mark_failed({notification_id}): {e}")
+            logger.error(f"Сетевая ошибка ack_notifications: {e}")
             return False
 
     # =============================================
@@ -95,13 +109,16 @@ class ApiClient:
     async def get_pending_followups(self) -> list:
         """
         Забрать follow-up'ы, которые пора отправить.
+        claim=true: бэкенд откладывает выданные, пока не придёт mark_followup_sent,
+        так что несколько инстансов бота не шлют одно и то же.
         Возвращает: [{id, telegram_id, type, target_type, target_id, attempt, payload}, ...]
         """
         try:
             session = await self._get_session()
             async with session.get(
                 "/notifications/followups/pending",
-                headers=BOT_HEADERS
+                headers=BOT_HEADERS,
+                params={"claim": "true"}
             ) as resp:
                 if resp.status == 200:
                     return await resp.json()
@@ -0,0 +1,138 @@
+# ===== 📄 ФАЙЛ: bot/services/notification_stream.py =====
+# Push-доставка уведомлений: чтение Redis stream notifications:outbox.
+#
+# Бэкенд после COMMIT кладёт в stream id новых уведомлений. Бот читает его
+# через consumer group (XREADGROUP BLOCK), забирает уведомления по id,
+# отправляет и только потом делает XACK. Упал посреди пачки — сообщения
+# остаются в PEL и их подбирает XAUTOCLAIM (этот же или другой инстанс бота).
+# Уже отправленные бэкенд повторно не отдаёт, так что повтор безопасен.
+
+import asyncio
+import logging
+import os
+import socket
+import time
+
+from aiogram import Bot
+from redis.asyncio import Redis
+from redis.exceptions import RedisError, ResponseError
+
+from config import REDIS_URL
+from services.api_client import api_client
+from services.sender import NotificationSender
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = "notifications:outbox"
+STREAM_GROUP = "bot_delivery"
+# Сколько ждём новых сообщений одним XREADGROUP (заодно — задержка остановки)
+READ_BLOCK_MS = 5000
+READ_COUNT = 50
+# Сообщения в PEL старше этого считаем брошенными упавшим консьюмером
+CLAIM_IDLE_MS = 60_000
+RETRY_DELAY_SECONDS = 5
+
+
+def _consumer_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+async def _ensure_group(redis: Redis):
+    try:
+        await redis.xgroup_create(STREAM_KEY, STREAM_GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+async def _read_batch(redis: Redis, consumer: str, claim_stale: bool) -> list:
+    messages = []
+    if claim_stale:
+        claimed = await redis.xautoclaim(
+            STREAM_KEY, STREAM_GROUP, consumer,
+            min_idle_time=CLAIM_IDLE_MS, start_id="0-0", count=READ_COUNT,
+        )
+        messages.extend(claimed[1] if claimed else [])
+    if messages:
+        return messages
+
+    response = await redis.xreadgroup(
+        STREAM_GROUP, consumer, {STREAM_KEY: ">"}, count=READ_COUNT, block=READ_BLOCK_MS,
+    )
+    for _, stream_messages in response or []:
+        messages.extend(stream_messages)
+    return messages
+
+
+async def deliver_messages(bot: Bot, redis: Redis, messages: list) -> dict:
+    """Отправить уведомления из пачки сообщений stream'а и подтвердить их."""
+    message_ids = [message_id for message_id, _ in messages]
+    notification_ids = []
+    for _, fields in messages:
+        try:
+            notification_ids.append(int(fields["id"]))
+        except (KeyError, TypeError, ValueError):
+            logger.warning(f"⚠️ Битое сообщение в {STREAM_KEY}: {fields}")
+
+    stats = {"sent": 0, "failed": 0, "total": 0}
+    if notification_ids:
+        queue = await api_client.get_notifications_by_ids(notification_ids)
+        if queue is None:
+            # Бэкенд недоступен — не ACK-аем, заберём через XAUTOCLAIM
+            return stats
+        if queue:
+            stats = await NotificationSender(bot).process_queue(queue)
+
+    await redis.xack(STREAM_KEY, STREAM_GROUP, *message_ids)
+    await redis.xdel(STREAM_KEY, *message_ids)
+    return stats
+
+
+async def _wait(stop_event: asyncio.Event, seconds: float):
+    try:
+        await asyncio.wait_for(stop_event.wait(), timeout=seconds)
+    except asyncio.TimeoutError:
+        pass
+
+
+async def run_notification_stream(bot: Bot, stop_event: asyncio.Event):
+    """Основной цикл консьюмера. Запускается из on_startup в bot.py."""
+    redis = Redis.from_url(REDIS_URL, decode_responses=True)
+    consumer = _consumer_name()
+    group_ready = False
+    last_claim_at = 0.0
+
+    try:
+        while not stop_event.is_set():
+            try:
+                if not group_ready:
+                    await _ensure_group(redis)
+                    group_ready = True
+
+                claim_stale = time.monotonic() - last_claim_at >= CLAIM_IDLE_MS / 1000
+                if claim_stale:
+                    last_claim_at = time.monotonic()
+                messages = await _read_batch(redis, consumer, claim_stale)
+                if not messages:
+                    continue
+
+                stats = await deliver_messages(bot, redis, messages)
+                if stats["total"] > 0:
+                    logger.info(
+                        f"📨 Stream: отправлено {stats['sent']}, "
+                        f"ошибок {stats['failed']}, всего {stats['total']}"
+                    )
+
+            except ResponseError as e:
+                # NOGROUP: stream удалили вместе с группой — пересоздадим
+                group_ready = False
+                logger.warning(f"⚠️ Ошибка чтения {STREAM_KEY}: {e}")
+                await _wait(stop_event, RETRY_DELAY_SECONDS)
+            except (RedisError, OSError) as e:
+                logger.warning(f"⚠️ Redis недоступен, уведомления подберёт опрос очереди: {e}")
+                await _wait(stop_event, RETRY_DELAY_SECONDS)
+            except Exception as e:
+                logger.error(f"❌ Ошибка в run_notification_stream: {e}")
+                await _wait(stop_event, RETRY_DELAY_SECONDS)
+    finally:
+        await redis.aclose()
@@ -14,10 +14,12 @@ _notifications_lock = False
 _followups_lock = False
 
 
-async def poll_notifications(bot: Bot):
+async def poll_notifications(bot: Bot, min_age_seconds: int = 0):
     """
     Забирает pending уведомления из бэкенда и отправляет.
-    Вызывается каждые NOTIFICATION_POLL_INTERVAL секунд.
+    Вызывается каждые NOTIFICATION_POLL_INTERVAL секунд, а при включённом
+    Redis stream — раз в NOTIFICATION_FALLBACK_POLL_INTERVAL как страховка
+    (min_age_seconds: только то, что stream не доставил).
     """
     global _notifications_lock
 
@@ -27,7 +29,7 @@ async def poll_notifications(bot: Bot):
 
     try:
         # Забираем очередь
-        queue = await api_client.get_notification_queue(limit=50)
+        queue = await api_client.get_notification_queue(limit=50, min_age_seconds=min_age_seconds)
 
         if not queue:
             return
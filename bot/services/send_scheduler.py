@@ -0,0 +1,198 @@
+# ===== 📄 ФАЙЛ: bot/services/send_scheduler.py =====
+# Планировщик отправки с учётом лимитов Telegram.
+#
+# Два token bucket'а: общий бюджет бота (TELEGRAM_GLOBAL_RATE сообщений/с)
+# и бюджет на каждый чат (TELEGRAM_CHAT_RATE сообщений/с). Пачка
+# отправляется пулом из NOTIFICATION_SEND_CONCURRENCY воркеров. Чат, которому
+# ещё рано, не блокирует воркер: элемент откладывается и возвращается
+# в очередь позже, а воркер берёт следующий.
+#
+# TelegramRetryAfter (flood wait) Telegram накладывает на весь бот, а не на
+# чат: на время паузы обнуляется и общий бюджет, иначе остальные воркеры
+# продолжат долбить API и продлят бан.
+#
+# Лимитер — один на процесс (send_limiter), так что бюджет чата
+# учитывается и между пачками stream'а, и между опросами очереди.
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Hashable
+
+from config import TELEGRAM_CHAT_RATE, TELEGRAM_GLOBAL_RATE
+
+logger = logging.getLogger(__name__)
+
+# Сколько раз откладываем элемент из-за RetryAfter, прежде чем сдаться
+MAX_RATE_LIMIT_ATTEMPTS = 5
+# Когда словарь бакетов чатов разрастается — выкидываем полностью восстановившиеся
+CHAT_BUCKETS_PRUNE_THRESHOLD = 10_000
+# Погрешность float: после sleep(delay) бакет может набрать 0.999…9 токена
+TOKEN_EPSILON = 1e-9
+
+
+class RetryLater(Exception):
+    """Отправку надо повторить не раньше чем через delay секунд."""
+
+    def __init__(self, delay: float):
+        super().__init__(f"retry after {delay}s")
+        self.delay = delay
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """Взять токен. 0 — взят сейчас, иначе через сколько секунд он появится."""
+        self._refill()
+        if self.tokens >= 1 - TOKEN_EPSILON:
+            self.tokens = max(self.tokens - 1, 0.0)
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def block_for(self, seconds: float):
+        """Обнулить бюджет на seconds секунд (ответ 429 от Telegram)."""
+        self._refill()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class SendRateLimiter:
+    def __init__(
+        self,
+        global_rate: float,
+        chat_rate: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._clock = clock
+        self._chat_rate = chat_rate
+        self._global = TokenBucket(global_rate, max(global_rate, 1), clock)
+        self._chats: dict[Hashable, TokenBucket] = {}
+
+    def _chat_bucket(self, chat_id: Hashable) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= CHAT_BUCKETS_PRUNE_THRESHOLD:
+                self._chats = {key: b for key, b in self._chats.items() if not b.is_full()}
+            bucket = TokenBucket(self._chat_rate, 1, self._clock)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def reserve_chat(self, chat_id: Hashable) -> float:
+        return self._chat_bucket(chat_id).reserve()
+
+    def reserve_global(self) -> float:
+        return self._global.reserve()
+
+    def penalize_chat(self, chat_id: Hashable, seconds: float):
+        self._chat_bucket(chat_id).block_for(seconds)
+
+    def penalize_global(self, seconds: float):
+        self._global.block_for(seconds)
+
+
+send_limiter = SendRateLimiter(TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE)
+
+
+class SendScheduler:
+    """
+    Отправляет пачку элементов конкурентно, соблюдая лимиты.
+    send(item) возвращает None при успехе, текст ошибки при неудаче
+    или бросает RetryLater.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[dict], Awaitable[str | None]],
+        *,
+        limiter: SendRateLimiter,
+        concurrency: int,
+        chat_key: str = "telegram_id",
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ):
+        self._send = send
+        self._limiter = limiter
+        self._concurrency = max(1, concurrency)
+        self._chat_key = chat_key
+        self._sleep = sleep
+
+    async def run(self, items: list) -> list:
+        """Вернуть результаты в порядке items: None — отправлено, str — ошибка."""
+        results: list = [None] * len(items)
+        if not items:
+            return results
+
+        queue: asyncio.Queue = asyncio.Queue()
+        outstanding = len(items)
+        done = asyncio.Event()
+        delayed: set[asyncio.Task] = set()
+
+        async def put_later(entry: tuple, delay: float):
+            await self._sleep(delay)
+            queue.put_nowait(entry)
+
+        def requeue_later(entry: tuple, delay: float):
+            task = asyncio.create_task(put_later(entry, delay))
+            delayed.add(task)
+            task.add_done_callback(delayed.discard)
+
+        def finish(index: int, result: str | None):
+            nonlocal outstanding
+            results[index] = result
+            outstanding -= 1
+            if outstanding == 0:
+                done.set()
+
+        async def worker():
+            while True:
+                index, attempt = await queue.get()
+                item = items[index]
+                chat_id = item.get(self._chat_key)
+
+                chat_delay = self._limiter.reserve_chat(chat_id)
+                if chat_delay > 0:
+                    # Этому чату пока рано — не держим воркер
+                    requeue_later((index, attempt), chat_delay)
+                    continue
+
+                while (global_delay := self._limiter.reserve_global()) > 0:
+                    await self._sleep(global_delay)
+
+                try:
+                    finish(index, await self._send(item))
+                except RetryLater as e:
+                    if attempt + 1 >= MAX_RATE_LIMIT_ATTEMPTS:
+                        finish(index, f"Rate limited: retry after {e.delay}s")
+                        continue
+                    logger.warning(f"⏳ Rate limit для {chat_id}, пауза всех отправок на {e.delay}с")
+                    self._limiter.penalize_chat(chat_id, e.delay)
+                    self._limiter.penalize_global(e.delay)
+                    requeue_later((index, attempt + 1), e.delay)
+                except Exception as e:
+                    finish(index, str(e)[:200])
+
+        for index in range(len(items)):
+            queue.put_nowait((index, 0))
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(self._concurrency, len(items)))]
+        try:
+            await done.wait()
+        finally:
+            pending = list(delayed) + workers
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        return results
@@ -10,10 +10,13 @@ from aiogram.exceptions import (
     TelegramRetryAfter,
 )
 import asyncio
+from typing import Awaitable, Callable
 
 from templates.messages import format_notification, format_followup
 from keyboards.inline import followup_market_kb, followup_request_kb, review_stars_kb
+from config import NOTIFICATION_SEND_CONCURRENCY
 from services.api_client import api_client
+from services.send_scheduler import RetryLater, SendRateLimiter, SendScheduler, send_limiter
 
 logger = logging.getLogger(__name__)
 
@@ -21,18 +24,26 @@ logger = logging.getLogger(__name__)
 class NotificationSender:
     """Отправляет уведомления и follow-up'ы пользователям"""
 
-    def __init__(self, bot: Bot):
+    def __init__(
+        self,
+        bot: Bot,
+        limiter: SendRateLimiter | None = None,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ):
         self.bot = bot
+        self.limiter = limiter or send_limiter
+        self._sleep = sleep
 
     # =============================================
     # Обычные уведомления
     # =============================================
 
-    async def send_notification(self, notif: dict) -> bool:
+    async def _attempt_notification(self, notif: dict) -> str | None:
         """
-        Отправить одно уведомление.
+        Одна попытка отправить уведомление в Telegram, без подтверждения в бэкенд.
         notif: {id, telegram_id, type, payload}
-        Возвращает True если успешно.
+        Возвращает None при успехе или текст ошибки.
+        На TelegramRetryAfter бросает RetryLater — решает вызывающий.
         """
         notif_id = notif["id"]
         telegram_id = notif["telegram_id"]
@@ -53,55 +64,52 @@ class NotificationSender:
                 disable_web_page_preview=True,
             )
 
-            # Подтверждаем отправку
-            await api_client.mark_sent(notif_id)
             logger.info(f"✅ Уведомление #{notif_id} ({notif_type}) → {telegram_id}")
-            return True
+            return None
 
         except TelegramForbiddenError:
             # Юзер заблокировал бота
-            error = "User blocked the bot"
-            await api_client.mark_failed(notif_id, error)
             logger.warning(f"🚫 Бот заблокирован юзером {telegram_id}")
-            return False
+            return "User blocked the bot"
 
         except TelegramRetryAfter as e:
-            # Rate limit — ждём и пробуем снова
-            logger.warning(f"⏳ Rate limit, ждём {e.retry_after}с")
-            await asyncio.sleep(e.retry_after)
-            return await self.send_notification(notif)
+            raise RetryLater(e.retry_after)
 
         except TelegramBadRequest as e:
             error = f"Bad request: {e.message}"
-            await api_client.mark_failed(notif_id, error)
             logger.error(f"❌ Ошибка отправки #{notif_id}: {error}")
-            return False
+            return error
 
         except Exception as e:
             error = str(e)[:200]
-            await api_client.mark_failed(notif_id, error)
             logger.error(f"❌ Неожиданная ошибка #{notif_id}: {error}")
-            return False
+            return error
 
     async def process_queue(self, notifications: list) -> dict:
         """
         Обработать пачку уведомлений из очереди.
+        Отправка конкурентная, в рамках общего и отдельного бюджета на чат
+        (см. send_scheduler). Итоги уходят в бэкенд одним /notifications/queue/ack.
         Возвращает статистику: {sent, failed, total}
         """
-        sent = 0
-        failed = 0
-
-        for notif in notifications:
-            success = await self.send_notification(notif)
-            if success:
-                sent += 1
+        scheduler = SendScheduler(
+            self._attempt_notification,
+            limiter=self.limiter,
+            concurrency=NOTIFICATION_SEND_CONCURRENCY,
+            sleep=self._sleep,
+        )
+        results = await scheduler.run(notifications)
+
+        sent_ids = []
+        failed = []
+        for notif, error in zip(notifications, results):
+            if error is None:
+                sent_ids.append(notif["id"])
             else:
-                failed += 1
-
-            # Небольшая пауза чтобы не упереться в rate limit
-            await asyncio.sleep(0.05)
+                failed.append({"id": notif["id"], "error": error[:200]})
 
-        return {"sent": sent, "failed": failed, "total": len(notifications)}
+        await api_client.ack_notifications(sent_ids, failed)
+        return {"sent": len(sent_ids), "failed": len(failed), "total": len(notifications)}
 
     # =============================================
     # Follow-ups
@@ -0,0 +1,164 @@
+import asyncio
+import heapq
+import itertools
+import os
+import unittest
+from unittest.mock import AsyncMock, patch
+
+os.environ.setdefault("BOT_TOKEN", "123456:test-token")
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from services.send_scheduler import SendRateLimiter, SendScheduler
+from services.sender import NotificationSender
+
+
+class VirtualTime:
+    """Часы и sleep без реального ожидания: время прыгает к ближайшему пробуждению."""
+
+    def __init__(self):
+        self.now = 0.0
+        self._sleepers = []
+        self._seq = itertools.count()
+
+    def clock(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._sleepers, (self.now + max(0.0, seconds), next(self._seq), future))
+        await future
+
+    async def _settle(self):
+        for _ in range(20):
+            await asyncio.sleep(0)
+
+    async def run(self, coro):
+        task = asyncio.ensure_future(coro)
+        while True:
+            await self._settle()
+            if task.done():
+                return task.result()
+            while self._sleepers and self._sleepers[0][2].cancelled():
+                heapq.heappop(self._sleepers)
+            if not self._sleepers:
+                raise AssertionError("scheduler is stuck: nothing to wake up")
+            wake_at, _, future = heapq.heappop(self._sleepers)
+            self.now = max(self.now, wake_at)
+            future.set_result(None)
+
+
+class FakeBot:
+    """send_message пишет (время, чат); flood_waits[chat] — сколько раз ответить RetryAfter."""
+
+    def __init__(self, time: VirtualTime, flood_waits: dict | None = None, retry_after: int = 3):
+        self.time = time
+        self.flood_waits = dict(flood_waits or {})
+        self.retry_after = retry_after
+        self.sent = []
+        self.rejected = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.flood_waits.get(chat_id):
+            self.flood_waits[chat_id] -= 1
+            self.rejected.append((self.time.now, chat_id))
+            raise TelegramRetryAfter(
+                method=SendMessage(chat_id=chat_id, text=text),
+                message="Flood control exceeded",
+                retry_after=self.retry_after,
+            )
+        self.sent.append((self.time.now, chat_id))
+
+
+def _notif(notif_id, telegram_id):
+    return {"id": notif_id, "telegram_id": telegram_id, "type": "generic", "payload": {}}
+
+
+class SendSchedulerTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.time = VirtualTime()
+
+    def _limiter(self, global_rate=30, chat_rate=1):
+        return SendRateLimiter(global_rate, chat_rate, clock=self.time.clock)
+
+    async def test_same_chat_messages_are_spaced_by_chat_rate(self):
+        sends = []
+
+        async def send(item):
+            sends.append((self.time.now, item["telegram_id"]))
+
+        scheduler = SendScheduler(send, limiter=self._limiter(), concurrency=4, sleep=self.time.sleep)
+        items = [{"telegram_id": 1}, {"telegram_id": 1}, {"telegram_id": 2}, {"telegram_id": 1}]
+        results = await self.time.run(scheduler.run(items))
+
+        self.assertEqual(results, [None] * 4)
+        chat_times = [at for at, chat in sends if chat == 1]
+        self.assertEqual(len(chat_times), 3)
+        for earlier, later in zip(chat_times, chat_times[1:]):
+            self.assertGreaterEqual(later - earlier, 1.0 - 1e-9)
+        # Другой чат не ждёт очереди первого
+        self.assertIn((0.0, 2), sends)
+
+    async def test_global_rate_caps_throughput(self):
+        sends = []
+
+        async def send(item):
+            sends.append(self.time.now)
+
+        scheduler = SendScheduler(
+            send, limiter=self._limiter(global_rate=5), concurrency=8, sleep=self.time.sleep,
+        )
+        results = await self.time.run(scheduler.run([{"telegram_id": chat} for chat in range(15)]))
+
+        self.assertEqual(results, [None] * 15)
+        # Ёмкость бакета — 5 сразу, дальше по 1/5 секунды
+        self.assertEqual(sum(1 for at in sends if at == 0.0), 5)
+        self.assertAlmostEqual(max(sends), 2.0, places=6)
+        for index, at in enumerate(sorted(sends)):
+            self.assertGreaterEqual(at + 1e-9, max(0, index - 4) / 5)
+
+
+class NotificationSenderQueueTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.time = VirtualTime()
+        self.ack = AsyncMock()
+        patcher = patch("services.sender.api_client.ack_notifications", new=self.ack)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _sender(self, bot, global_rate=30, chat_rate=1):
+        limiter = SendRateLimiter(global_rate, chat_rate, clock=self.time.clock)
+        return NotificationSender(bot, limiter=limiter, sleep=self.time.sleep)
+
+    async def test_retry_after_requeues_and_pauses_whole_bot(self):
+        bot = FakeBot(self.time, flood_waits={10: 1}, retry_after=3)
+        sender = self._sender(bot)
+        queue = [_notif(1, 10), _notif(2, 20), _notif(3, 30)]
+
+        with patch("services.sender.NOTIFICATION_SEND_CONCURRENCY", 1):
+            stats = await self.time.run(sender.process_queue(queue))
+
+        self.assertEqual(stats, {"sent": 3, "failed": 0, "total": 3})
+        self.ack.assert_awaited_once_with([1, 2, 3], [])
+        self.assertEqual(bot.rejected, [(0.0, 10)])
+        # Во время flood wait не уходит ни одно сообщение, в том числе в другие чаты
+        self.assertTrue(all(at >= 3.0 for at, _ in bot.sent))
+        self.assertEqual(sorted(chat for _, chat in bot.sent), [10, 20, 30])
+
+    async def test_persistent_flood_wait_gives_up(self):
+        bot = FakeBot(self.time, flood_waits={10: 100}, retry_after=1)
+        sender = self._sender(bot)
+
+        stats = await self.time.run(sender.process_queue([_notif(1, 10)]))
+
+        self.assertEqual(stats, {"sent": 0, "failed": 1, "total": 1})
+        sent_ids, failed = self.ack.await_args.args
+        self.assertEqual(sent_ids, [])
+        self.assertEqual(failed[0]["id"], 1)
+        self.assertIn("Rate limited", failed[0]["error"])
+        self.assertEqual(len(bot.rejected), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -340,6 +340,13 @@ export async function getPosts(filters = {}) {
     if (filters.viewer_city) {
       params.viewer_city = filters.viewer_city;
     }
+    // Keyset-пагинация: cursor важнее skip, total считается только по запросу
+    if (filters.cursor) {
+      params.cursor = filters.cursor;
+    }
+    if (filters.includeTotal) {
+      params.include_total = true;
+    }
 
     const response = await api.get('/posts/feed', { params });
     return response.data;
@@ -446,13 +453,40 @@ export async function votePoll(pollId, optionIndices) {
   }
 }
 
-export async function getPostComments(postId) {
+// Статус перекодирования загруженного видео (только автору): status, progress, error
+export async function getVideoJob(jobId) {
+  try {
+    const response = await api.get(`/media/jobs/${jobId}`);
+    return response.data;
+  } catch (error) {
+    console.error('Ошибка получения статуса видео:', error);
+    return null;
+  }
+}
+
+// Страница корневых комментариев + первые ответы веток; next_cursor — следующая страница
+export async function getPostComments(postId, { cursor } = {}) {
   try {
-    const response = await api.get(`/posts/${postId}/comments`);
-    return response.data.items || [];
+    const params = {};
+    if (cursor) params.cursor = cursor;
+    const response = await api.get(`/posts/${postId}/comments`, { params });
+    return response.data;
   } catch (error) {
     console.error('Ошибка получения комментариев:', error);
-    return [];
+    return { items: [], has_more: false, next_cursor: null };
+  }
+}
+
+// Ещё ответы ветки: cursor — replies_cursor корня или next_cursor прошлой страницы
+export async function getCommentReplies(commentId, cursor) {
+  try {
+    const params = {};
+    if (cursor) params.cursor = cursor;
+    const response = await api.get(`/comments/${commentId}/replies`, { params });
+    return response.data;
+  } catch (error) {
+    console.error('Ошибка получения ответов:', error);
+    return { items: [], has_more: false, next_cursor: null };
   }
 }
 
@@ -601,6 +635,9 @@ export async function getRequestsFeed(filters = {}) {
     if (filters.sort && filters.sort !== 'newest') {
       params.sort = filters.sort;
     }
+    if (filters.cursor) {
+      params.cursor = filters.cursor;
+    }
     
     const response = await api.get('/api/requests/feed', { params });
     return response.data;
@@ -727,6 +764,8 @@ export async function getMarketItems(filters = {}) {
     if (filters.city) params.city = filters.city;
     if (filters.sort) params.sort = filters.sort;
     if (filters.search) params.search = filters.search;
+    if (filters.cursor) params.cursor = filters.cursor;
+    if (filters.includeTotal) params.include_total = true;
     
     const response = await api.get('/market/feed', { params });
     return response.data;
@@ -1401,18 +1440,20 @@ export async function updateNotificationSettings(settings) {
   }
 }
 
-/** Получить уведомления из inbox */
-export async function getNotifications() {
+/** Получить страницу уведомлений из inbox: { items, has_more, next_cursor } */
+export async function getNotifications({ cursor } = {}) {
   if (IS_DEV) {
     try {
       const { getDevMockNotifications } = await loadNotificationsMockModule();
-      return getDevMockNotifications();
+      return { items: getDevMockNotifications(), has_more: false, next_cursor: null };
     } catch (error) {
       console.warn('Notifications mock load failed, falling back to API:', error);
     }
   }
 
-  const response = await api.get('/notifications/inbox');
+  const params = {};
+  if (cursor) params.cursor = cursor;
+  const response = await api.get('/notifications/inbox', { params });
   return response.data;
 }
 
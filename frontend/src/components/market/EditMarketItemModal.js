@@ -13,7 +13,7 @@ import { Z_MODAL_MARKET_DETAIL } from '../../constants/zIndex';
 import ConfirmationDialog from '../shared/ConfirmationDialog';
 import { toast } from '../shared/Toast';
 import { useTelegramScreen } from '../shared/telegram/useTelegramScreen';
-import { resolveImageUrl } from '../../utils/mediaUrl';
+import { resolveImageUrl, isReadyMedia } from '../../utils/mediaUrl';
 import { MARKET_CONDITIONS, MARKET_CATEGORIES_MAP } from '../../constants/marketConstants';
 import { modalBoundaryProps, modalTouchBoundaryHandlers } from '../../utils/modalEventBoundary';
 import { useBodyScrollLock } from '../../hooks/useBodyScrollLock';
@@ -47,7 +47,7 @@ function EditMarketItemModal({ item, onClose, onSuccess }) {
 
   // --- Фото ---
   const [images, setImages] = useState(() => {
-    const raw = Array.isArray(item?.images) ? item.images : [];
+    const raw = Array.isArray(item?.images) ? item.images.filter(isReadyMedia) : [];
     return raw.map(img => {
       const filename = typeof img === 'object' ? (img?.url || '') : img;
       return { url: resolveImageUrl(filename, 'images'), filename, isNew: false };
@@ -72,7 +72,7 @@ function EditMarketItemModal({ item, onClose, onSuccess }) {
     price:       Number(item?.price || 0),
     condition:   item?.condition || '',
     location:    (item?.location || '').trim(),
-    imageKeys:   (Array.isArray(item?.images) ? item.images : [])
+    imageKeys:   (Array.isArray(item?.images) ? item.images.filter(isReadyMedia) : [])
       .map(img => extractImageKey(typeof img === 'object' ? img?.url : img))
       .filter(Boolean),
   }), [item]);
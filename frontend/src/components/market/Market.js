@@ -70,6 +70,7 @@ const Market = () => {
   const loadMoreTriggerRef = useRef(null);
   const loadingRef = useRef(false);
   const pageRef = useRef(0);
+  const cursorRef = useRef(null);
 
   // ✅ СТАБИЛИЗАЦИЯ marketFilters
   const stabilizedFilters = useMemo(() => ({
@@ -127,6 +128,8 @@ const Market = () => {
       const filters = {
         ...stabilizedFilters, // ✅ ИСПОЛЬЗУЕМ СТАБИЛИЗИРОВАННЫЙ
         skip: currentPage * limit,
+        cursor: reset ? null : cursorRef.current,
+        includeTotal: reset,
         limit,
         search: searchQuery || undefined,
         category: stabilizedFilters.category !== 'all' ? stabilizedFilters.category : undefined,
@@ -150,6 +153,7 @@ const Market = () => {
         setPage(currentPage + 1);
       }
 
+      cursorRef.current = result.next_cursor || null;
       setHasMore(result.has_more);
 
     } catch (err) {
@@ -271,6 +275,7 @@ const Market = () => {
         category: localFilters.category !== 'all' ? localFilters.category : undefined,
         skip: 0,
         limit: 1,
+        includeTotal: true,
         search: searchQuery || undefined,
       });
       return result.total ?? null;
@@ -18,6 +18,7 @@ import { isEntityOwner, getEntityActionSet } from '../../utils/entityActions';
 import { parseApiDate, formatRelativeRu } from '../../utils/datetime';
 import { buildMiniAppStartappUrl } from '../../utils/deepLinks';
 import { shareMarketItemViaTelegram } from '../../utils/telegramShare';
+import { getReadyMedia } from '../../utils/mediaUrl';
 
 const EMPTY_LOCATION_VALUES = new Set(['none', 'null', 'undefined']);
 
@@ -62,7 +63,7 @@ const MarketCard = ({ item, onClick, index = 0 }) => {
     onDeleted: () => { deleteFromStore(item.id); },
   });
 
-  const coverImage = item.images && item.images.length > 0 ? item.images[0] : null;
+  const coverImage = getReadyMedia(item.images)[0] || null;
   // Для видео используем thumbnail, иначе основной url
   const imageUrl = coverImage?.type === 'video'
     ? (coverImage.thumbnail_url || '')
@@ -27,6 +27,7 @@ import { buildMiniAppStartappUrl } from '../../utils/deepLinks';
 import { shareMarketItemViaTelegram } from '../../utils/telegramShare';
 import { normalizeTelegramUsername } from '../../utils/telegramUsername';
 import { captureSourceRect } from '../../utils/mediaRect';
+import { getReadyMedia } from '../../utils/mediaUrl';
 
 const EMPTY_OPTIONAL_VALUES = new Set(['none', 'null', 'undefined']);
 
@@ -134,7 +135,8 @@ const MarketDetail = ({ item, onClose, onUpdate }) => {
     () => getEntityActionSet('market_item', isOwner, { shareEnabled: true }),
     [isOwner]
   );
-  const images = currentItem.images || [];
+  // Видео, которое ещё перекодируется, появится после обработки
+  const images = getReadyMedia(currentItem.images);
 
   const closeDetail = () => {
     if (isExiting) return;
@@ -549,6 +549,12 @@ function StatsSection() {
     .map(renderWindowDetail)
     .filter(Boolean);
 
+  const formatStatsAge = (seconds) => {
+    if (seconds == null) return null;
+    return Number(seconds) < 60 ? 'только что' : `${formatDuration(seconds)} назад`;
+  };
+  const statsAgeLabel = formatStatsAge(stats.stats_age_seconds);
+
   return (
     <>
       <div style={styles.section}>
@@ -560,6 +566,9 @@ function StatsSection() {
             </div>
           ))}
         </div>
+        {statsAgeLabel && (
+          <div style={styles.usageMeta}>Данные обновлены {statsAgeLabel}</div>
+        )}
       </div>
 
       <div style={styles.section}>
@@ -735,6 +735,8 @@ function NotificationsScreen() {
   const [isExiting, setIsExiting] = useState(false);
   const [notifications, setNotifications] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [activeFilter, setActiveFilter] = useState('all');
 
   const handleClose = useCallback(() => {
@@ -757,7 +759,8 @@ function NotificationsScreen() {
     const load = async () => {
       try {
         const data = await getNotifications();
-        setNotifications(data);
+        setNotifications(data.items || []);
+        setNextCursor(data.has_more ? data.next_cursor : null);
       } catch {
         toast.error('Не удалось загрузить уведомления');
       } finally {
@@ -772,6 +775,23 @@ function NotificationsScreen() {
       .catch(() => {});
   }, [setUnreadNotificationsCount]);
 
+  const handleLoadMore = useCallback(async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const data = await getNotifications({ cursor: nextCursor });
+      setNotifications(prev => {
+        const knownIds = new Set(prev.map(n => n.id));
+        return [...prev, ...(data.items || []).filter(n => !knownIds.has(n.id))];
+      });
+      setNextCursor(data.has_more ? data.next_cursor : null);
+    } catch {
+      toast.error('Не удалось загрузить уведомления');
+    } finally {
+      setLoadingMore(false);
+    }
+  }, [nextCursor, loadingMore]);
+
   const handleMarkAllRead = useCallback(() => {
     hapticFeedback('light');
     setNotifications(prev => prev.map(n => ({ ...n, is_read: true })));
@@ -896,12 +916,28 @@ function NotificationsScreen() {
               </div>
             )}
 
-            <div style={{
-              textAlign: 'center', padding: '32px 16px',
-              color: COLORS.muted, fontSize: 13, fontWeight: 600,
-            }}>
-              Ты просмотрел(а) все уведомления
-            </div>
+            {nextCursor ? (
+              <div style={{ textAlign: 'center', padding: '24px 16px 32px' }}>
+                <button
+                  onClick={handleLoadMore}
+                  disabled={loadingMore}
+                  style={{
+                    background: 'none', border: 'none',
+                    color: COLORS.lime, fontSize: 14, fontWeight: 700,
+                    cursor: 'pointer', padding: '4px 0',
+                  }}
+                >
+                  {loadingMore ? 'Загрузка...' : 'Показать ещё'}
+                </button>
+              </div>
+            ) : (
+              <div style={{
+                textAlign: 'center', padding: '32px 16px',
+                color: COLORS.muted, fontSize: 13, fontWeight: 600,
+              }}>
+                Ты просмотрел(а) все уведомления
+              </div>
+            )}
           </>
         )}
       </div>
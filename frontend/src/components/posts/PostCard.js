@@ -19,7 +19,7 @@ import { useModerationActions } from '../moderation/ModerationMenu';
 import ConfirmationDialog from '../shared/ConfirmationDialog';
 import { toast } from '../shared/Toast';
 import { isEntityOwner, getEntityActionSet } from '../../utils/entityActions';
-import { resolveImageUrl } from '../../utils/mediaUrl';
+import { resolveImageUrl, getReadyMedia } from '../../utils/mediaUrl';
 import { parseApiDate, formatRelativeRu } from '../../utils/datetime';
 import { composeSingleTextFromTitleBody } from '../../utils/contentTextParser';
 import { buildMiniAppStartappUrl } from '../../utils/deepLinks';
@@ -101,10 +101,11 @@ function PostCard({ post, onClick, onLikeUpdate, onPostDeleted, onAdHidden, onPo
   // Определяем, является ли пост рекламой
   const isAd = post.category === 'ad' || post._isAd;
 
+  // Видео в очереди перекодирования в ленте не показываем — до готовности это пустая плитка
   const images = useMemo(() => {
     if (!post.images) return [];
-    if (Array.isArray(post.images)) return post.images;
-    try { return JSON.parse(post.images); } catch { return []; }
+    if (Array.isArray(post.images)) return getReadyMedia(post.images);
+    try { return getReadyMedia(JSON.parse(post.images)); } catch { return []; }
   }, [post.images]);
   const hasTags = Array.isArray(post.tags) && post.tags.length > 0;
 
@@ -4,7 +4,7 @@ import {
   ChevronLeft, ChevronRight,
   Gift, Phone, Link2, Share2, Pencil, Trash2, Flag, CheckCircle
 } from 'lucide-react';
-import { getPost, getPostComments, createComment, likePost, likeComment, deleteComment, updateComment, deletePost, resolvePost, triggerRegistrationPrompt } from '../../api';
+import { getPost, getPostComments, getCommentReplies, getVideoJob, createComment, likePost, likeComment, deleteComment, updateComment, deletePost, resolvePost, triggerRegistrationPrompt } from '../../api';
 import { useStore } from '../../store';
 import { hapticFeedback } from '../../utils/telegram';
 import PostCommentBar from './PostCommentBar';
@@ -25,7 +25,7 @@ import OverflowMenuButton from '../shared/OverflowMenuButton';
 import LinkText from '../shared/LinkText';
 import ConfirmationDialog from '../shared/ConfirmationDialog';
 import { isEntityOwner, getEntityActionSet } from '../../utils/entityActions';
-import { resolveImageUrl } from '../../utils/mediaUrl';
+import { resolveImageUrl, getReadyMedia, isMediaProcessing } from '../../utils/mediaUrl';
 import { parseApiDate, formatRelativeRu } from '../../utils/datetime';
 import { composeSingleTextFromTitleBody } from '../../utils/contentTextParser';
 import { IMAGE_ASPECT_RATIO_MIN, IMAGE_ASPECT_RATIO_MAX } from '../../constants/layoutConstants';
@@ -48,6 +48,20 @@ const parseImages = (value) => {
   return [];
 };
 
+const VIDEO_JOB_POLL_MS = 3000;
+
+const normalizeComments = (items) => (
+  Array.isArray(items) ? items.map((item) => ({ ...item, images: parseImages(item.images) })) : []
+);
+
+const buildCommentLikes = (items) => {
+  const likes = {};
+  items.forEach(comment => {
+    likes[comment.id] = { isLiked: comment.is_liked || false, count: comment.likes || 0 };
+  });
+  return likes;
+};
+
 const getImageUrl = (img) => {
   if (!img) return '';
   if (typeof img === 'object' && img.type === 'video') {
@@ -127,6 +141,9 @@ function PostDetail() {
   const { viewPostId, setViewPostId, user, isRegistered, setUpdatedPost, likedPosts, setPostLiked, setEditingContent, updatePost } = useStore();
   const [post, setPost] = useState(null);
   const [comments, setComments] = useState([]);
+  const [commentsCursor, setCommentsCursor] = useState(null);
+  const [loadingMoreComments, setLoadingMoreComments] = useState(false);
+  const [videoProgress, setVideoProgress] = useState(null);
   const [loading, setLoading] = useState(true);
   const [commentLikes, setCommentLikes] = useState({});
   const [localLikesCount, setLocalLikesCount] = useState(0);
@@ -260,16 +277,10 @@ function PostDetail() {
 
       try {
         const commentsData = await getPostComments(viewPostId);
-        const commentsArray = Array.isArray(commentsData)
-          ? commentsData.map((item) => ({ ...item, images: parseImages(item.images) }))
-          : [];
+        const commentsArray = normalizeComments(commentsData.items);
         setComments(commentsArray);
-
-        const initialLikes = {};
-        commentsArray.forEach(comment => {
-          initialLikes[comment.id] = { isLiked: comment.is_liked || false, count: comment.likes || 0 };
-        });
-        setCommentLikes(initialLikes);
+        setCommentsCursor(commentsData.has_more ? commentsData.next_cursor : null);
+        setCommentLikes(buildCommentLikes(commentsArray));
       } catch (error) {
         console.error('Comments error:', error);
       }
@@ -281,6 +292,36 @@ function PostDetail() {
     }
   };
 
+  const appendComments = (items) => {
+    const loaded = normalizeComments(items);
+    setComments(prev => {
+      const knownIds = new Set(prev.map(c => c.id));
+      return [...prev, ...loaded.filter(c => !knownIds.has(c.id))];
+    });
+    setCommentLikes(prev => ({ ...buildCommentLikes(loaded), ...prev }));
+  };
+
+  const handleLoadMoreComments = async () => {
+    if (!commentsCursor || loadingMoreComments) return;
+    setLoadingMoreComments(true);
+    try {
+      const data = await getPostComments(viewPostId, { cursor: commentsCursor });
+      appendComments(data.items);
+      setCommentsCursor(data.has_more ? data.next_cursor : null);
+    } finally {
+      setLoadingMoreComments(false);
+    }
+  };
+
+  const handleLoadMoreReplies = useCallback(async (rootId, cursor) => {
+    const data = await getCommentReplies(rootId, cursor);
+    appendComments(data.items);
+    setComments(prev => prev.map(c => (
+      c.id === rootId ? { ...c, replies_cursor: data.has_more ? data.next_cursor : null } : c
+    )));
+  // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, []);
+
   const refreshPost = async () => {
     try {
       const freshRaw = await getPost(viewPostId);
@@ -303,10 +344,12 @@ function PostDetail() {
     } catch (e) { console.error('Silent update failed:', e); }
   };
 
-  const images = useMemo(() => {
-    if (!post || !post.images) return [];
-    return post.images;
-  }, [post]);
+  // Заглушки видео из очереди перекодирования в галерею не попадают
+  const images = useMemo(() => getReadyMedia(post?.images), [post]);
+  const pendingVideoJobs = useMemo(
+    () => (Array.isArray(post?.images) ? post.images.filter(isMediaProcessing).map((item) => item.job_id) : []),
+    [post]
+  );
   const mediaSlides = useMemo(
     () => images.map((item) => ({
       item,
@@ -474,6 +517,35 @@ function PostDetail() {
   }, [post?.category, post?.poll?.type]);
 
   const isOwner = useMemo(() => isEntityOwner('post', post, user), [post, user]);
+
+  // Видео автора ещё перекодируется — показываем прогресс и перечитываем пост, когда готово
+  const pendingVideoJobId = isOwner ? pendingVideoJobs[0] || null : null;
+  useEffect(() => {
+    if (!pendingVideoJobId) {
+      setVideoProgress(null);
+      return undefined;
+    }
+    let cancelled = false;
+    let timer = null;
+    const poll = async () => {
+      const job = await getVideoJob(pendingVideoJobId);
+      if (cancelled) return;
+      if (job && (job.status === 'done' || job.status === 'failed')) {
+        if (job.status === 'failed') toast.error(job.error || 'Не удалось обработать видео');
+        setVideoProgress(null);
+        refreshPost();
+        return;
+      }
+      setVideoProgress(job?.progress || 0);
+      timer = setTimeout(poll, VIDEO_JOB_POLL_MS);
+    };
+    poll();
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [pendingVideoJobId]);
   const postActionSet = useMemo(
     () => getEntityActionSet('post', isOwner, { shareEnabled: true }),
     [isOwner]
@@ -968,6 +1040,12 @@ function PostDetail() {
                   </>
                 )}
 
+                {videoProgress !== null && (
+                  <div style={styles.videoProcessing}>
+                    Видео обрабатывается… {videoProgress}%
+                  </div>
+                )}
+
                 {images.length > 0 && (
                   <div
                     style={{
@@ -1062,7 +1140,7 @@ function PostDetail() {
                       onClick={handleScrollToComments}
                     >
                       <MessageCircle size={18} strokeWidth={2.5} />
-                      <span style={styles.statText}>{comments.length}</span>
+                      <span style={styles.statText}>{Math.max(post?.comments_count || 0, comments.length)}</span>
                     </button>
 
                     {/* Likes */}
@@ -1093,7 +1171,7 @@ function PostDetail() {
               </div>
 
               <div ref={commentsSectionRef} style={styles.commentsSection}>
-                <h3 style={styles.commentsTitle}>Комментарии ({comments.length})</h3>
+                <h3 style={styles.commentsTitle}>Комментарии ({Math.max(post?.comments_count || 0, comments.length)})</h3>
                 {commentTree.length === 0 ? (
                   <div style={styles.noComments}>
                     <p>Пока нет комментариев</p>
@@ -1121,8 +1199,19 @@ function PostDetail() {
                         onCancelEdit={() => { setEditingComment(null); setEditText(''); }}
                         onOpenImage={openCommentImageViewer}
                         activeImageViewer={commentViewer}
+                        onLoadMoreReplies={handleLoadMoreReplies}
                       />
                     ))}
+                    {commentsCursor && (
+                      <button
+                        className="pressable"
+                        style={styles.loadMoreComments}
+                        onClick={handleLoadMoreComments}
+                        disabled={loadingMoreComments}
+                      >
+                        {loadingMoreComments ? 'Загрузка...' : 'Показать ещё комментарии'}
+                      </button>
+                    )}
                   </div>
                 )}
               </div>
@@ -1232,10 +1321,11 @@ function PostDetail() {
   );
 }
 
-const Comment = React.memo(({ comment, depth = 0, currentUser, commentLikes, onLike, onReply, onDelete, onEdit, onReport, menuOpen, setMenuOpen, editingComment, editText, setEditText, onSaveEdit, onCancelEdit, onOpenImage, activeImageViewer }) => {
+const Comment = React.memo(({ comment, depth = 0, currentUser, commentLikes, onLike, onReply, onDelete, onEdit, onReport, menuOpen, setMenuOpen, editingComment, editText, setEditText, onSaveEdit, onCancelEdit, onOpenImage, activeImageViewer, onLoadMoreReplies }) => {
   const menuButtonRef = useRef(null);
   const avatarRef = useRef(null);
   const [profileOpen, setProfileOpen] = useState(false);
+  const [loadingReplies, setLoadingReplies] = useState(false);
   const [showUserReportModal, setShowUserReportModal] = useState(false);
   
   const likes = commentLikes[comment.id] || { isLiked: false, count: comment.likes || 0 };
@@ -1427,6 +1517,24 @@ const Comment = React.memo(({ comment, depth = 0, currentUser, commentLikes, onL
           ))}
         </div>
       )}
+
+      {/* Ответы ветки приходят порциями — курсор есть только у корня */}
+      {comment.replies_cursor && onLoadMoreReplies && (
+        <button
+          style={{ ...styles.commentAction, marginLeft: 28, marginTop: theme.spacing.md }}
+          disabled={loadingReplies}
+          onClick={async () => {
+            setLoadingReplies(true);
+            try {
+              await onLoadMoreReplies(comment.id, comment.replies_cursor);
+            } finally {
+              setLoadingReplies(false);
+            }
+          }}
+        >
+          {loadingReplies ? 'Загрузка...' : 'Показать ещё ответы'}
+        </button>
+      )}
       
       {/* ProfileMiniCard для комментариев */}
       {!isAnonymousComment && comment.author && (
@@ -1552,6 +1660,11 @@ const styles = {
   image: {
     width: '100%', height: '100%', objectFit: 'cover', display: 'block', userSelect: 'none', WebkitUserSelect: 'none',
   },
+  videoProcessing: {
+    margin: `${theme.spacing.md}px 0`, padding: `${theme.spacing.sm}px ${theme.spacing.md}px`,
+    borderRadius: theme.radius.md, background: theme.colors.surfaceElevated,
+    color: theme.colors.textSecondary, fontSize: 13, fontWeight: theme.fontWeight.semibold,
+  },
   imageCounter: {
     position: 'absolute', top: theme.spacing.md, right: theme.spacing.md,
     background: theme.colors.overlayDark, color: theme.colors.text,
@@ -1645,6 +1758,11 @@ const styles = {
   commentsList: {
     display: 'flex', flexDirection: 'column', gap: theme.spacing.lg,
   },
+  loadMoreComments: {
+    alignSelf: 'center', background: 'none', border: 'none', cursor: 'pointer',
+    color: theme.colors.accent, fontSize: theme.fontSize.base, fontWeight: theme.fontWeight.semibold,
+    padding: theme.spacing.sm,
+  },
   comment: { display: 'flex', gap: theme.spacing.md },
   commentAvatar: {
     width: 36, height: 36, borderRadius: theme.radius.full,
@@ -49,6 +49,7 @@ function PostFeed() {
   const [searchQuery, setSearchQuery] = useState('');
   const [showFiltersModal, setShowFiltersModal] = useState(false);
   const postsOffsetRef = useRef(0);
+  const postsCursorRef = useRef(null);
   const postsLoadingRef = useRef(false);
   const hasMorePostsRef = useRef(true);
   const lastPostCardRef = useRef(null);
@@ -128,6 +129,7 @@ function PostFeed() {
     try {
       if (reset) {
         postsOffsetRef.current = 0;
+        postsCursorRef.current = null;
         hasMorePostsRef.current = true;
         setHasMorePosts(true);
         setTotalCount(null);
@@ -137,6 +139,8 @@ function PostFeed() {
       const apiFilters = {
         category: stabilizedFilters.category === 'all' ? null : stabilizedFilters.category,
         skip: nextOffset,
+        cursor: reset ? null : postsCursorRef.current,
+        includeTotal: reset,
         limit: POSTS_PAGE_SIZE,
         search: searchQuery || undefined,
       };
@@ -180,6 +184,7 @@ function PostFeed() {
       }
 
       postsOffsetRef.current = nextOffset + postsWithImages.length;
+      postsCursorRef.current = data.next_cursor || null;
       hasMorePostsRef.current = Boolean(data.has_more);
       setHasMorePosts(hasMorePostsRef.current);
       if (data.total_count != null) setTotalCount(data.total_count);
@@ -311,6 +316,7 @@ function PostFeed() {
         category: localFilters.category === 'all' ? null : localFilters.category,
         skip: 0,
         limit: 1,
+        includeTotal: true,
         search: searchQuery || undefined,
       };
       const loc = localFilters.location;
@@ -34,6 +34,7 @@ function RequestsFeed({ category = 'all', searchQuery = '' }) {
   const [showDetailModal, setShowDetailModal] = useState(false);
   
   const offsetRef = useRef(0);
+  const cursorRef = useRef(null);
   const isLoadingRef = useRef(false);
   const observerRef = useRef(null);
   const lastCardRef = useRef(null);
@@ -49,6 +50,7 @@ function RequestsFeed({ category = 'all', searchQuery = '' }) {
 
       if (reset) {
         offsetRef.current = 0;
+        cursorRef.current = null;
         setRequests([]);
       }
 
@@ -57,6 +59,7 @@ function RequestsFeed({ category = 'all', searchQuery = '' }) {
         category: category === 'all' ? null : category,
         limit: 20,
         offset: offsetRef.current,
+        cursor: cursorRef.current,
       };
 
       // Локация
@@ -104,6 +107,7 @@ function RequestsFeed({ category = 'all', searchQuery = '' }) {
 
       setHasMore(response.has_more);
       offsetRef.current += newRequests.length;
+      cursorRef.current = response.next_cursor || null;
 
     } catch (error) {
       console.error('❌ Ошибка загрузки запросов:', error);
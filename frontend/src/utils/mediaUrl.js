@@ -46,3 +46,17 @@ export const resolveImageUrl = (value, kind = 'images') => {
   const folder = kind === 'avatars' || kind === 'thumbs' || kind === 'videos' ? kind : 'images';
   return `/uploads/${folder}/${filename}`;
 };
+
+// Видео, которое ещё перекодируется на сервере: url пустой, есть status/job_id
+export const isMediaProcessing = (item) => (
+  typeof item === 'object' && item !== null && item.status === 'processing'
+);
+
+// Медиа, которое можно показать: без url-less заглушек очереди перекодирования
+export const isReadyMedia = (item) => {
+  if (!item) return false;
+  if (typeof item !== 'object') return true;
+  return !item.status && Boolean(item.url);
+};
+
+export const getReadyMedia = (items) => (Array.isArray(items) ? items.filter(isReadyMedia) : []);